@@ -155,6 +155,9 @@ STATICFILES_DIRS = [
 MEDIA_URL = os.getenv('MEDIA_URL', '/media/')
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# File pre-renderizzati (feed RSS/Atom) condivisi tra web server e monitor
+PRERENDER_ROOT = os.getenv('PRERENDER_ROOT', os.path.join(BASE_DIR, 'prerendered'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -259,6 +262,62 @@ UNIVERSAL_MONITORS = {
     ]
 }
 
+# Coda lavori in background (email, Telegram, rigenerazione feed e sitemap)
+JOB_QUEUE = {
+    'WORKERS': int(os.getenv('JOB_QUEUE_WORKERS', '2')),
+    'MAX_PENDING': int(os.getenv('JOB_QUEUE_MAX_PENDING', '500')),
+    'POLL_INTERVAL': int(os.getenv('JOB_QUEUE_POLL_INTERVAL', '5')),  # seconds
+    'LEASE_TIMEOUT': int(os.getenv('JOB_QUEUE_LEASE_TIMEOUT', '600')),  # seconds
+    'BACKOFF_BASE': int(os.getenv('JOB_QUEUE_BACKOFF_BASE', '30')),  # seconds
+    'BACKOFF_MAX': int(os.getenv('JOB_QUEUE_BACKOFF_MAX', '3600')),  # seconds
+    'RETENTION_DAYS': int(os.getenv('JOB_QUEUE_RETENTION_DAYS', '7')),
+    # Avvia i worker nel processo che accoda il primo lavoro. Disattivato: i
+    # worker girano solo in run_job_workers e nel processo dei monitor
+    # (MonitorManager), mai nei worker gunicorn che servono le pagine
+    'AUTOSTART': os.getenv('JOB_QUEUE_AUTOSTART', 'False').lower() in ['true', '1', 'yes'],
+    # Worker per coda: la generazione AI ha un pool separato per non bloccare email e feed
+    'QUEUES': {
+        'default': {'WORKERS': int(os.getenv('JOB_QUEUE_WORKERS', '2'))},
+        'ai': {'WORKERS': int(os.getenv('AI_GENERATION_WORKERS', '2'))},
+    },
+}
+
+# Priorità della generazione AI per categoria (più alta = generata prima)
+AI_GENERATION_PRIORITIES = {
+    'Cronaca': 30,
+    'Attualità': 20,
+    'Sport': 20,
+    'Comunicati Stampa': 15,
+    "L'Eco del Consiglio": 10,
+    'Eventi': 0,
+}
+AI_GENERATION_DEFAULT_PRIORITY = 10
+
+# Generazione in streaming: la bozza viene salvata appena arriva il titolo
+AI_STREAMING = os.getenv('AI_STREAMING', 'True').lower() in ['true', '1', 'yes']
+
+# Generazione differita con la Message Batches API per le categorie non urgenti
+AI_BATCH = {
+    'BACKEND': os.getenv('AI_BATCH_BACKEND', 'anthropic'),  # 'anthropic' o 'locale' (test)
+    'CATEGORIES': [c for c in os.getenv('AI_BATCH_CATEGORIES', "Eventi,L'Eco del Consiglio").split(',') if c],
+    'COLLECT_SECONDS': int(os.getenv('AI_BATCH_COLLECT_SECONDS', '300')),  # attesa per raccogliere richieste
+    'POLL_SECONDS': int(os.getenv('AI_BATCH_POLL_SECONDS', '300')),  # intervallo di controllo dei batch
+    'MAX_REQUESTS': int(os.getenv('AI_BATCH_MAX_REQUESTS', '1000')),
+}
+
+# Fonti quasi duplicate (stesso comunicato da canali diversi): SimHash del contenuto
+AI_DUPLICATE_THRESHOLD = float(os.getenv('AI_DUPLICATE_THRESHOLD', '0.85'))  # similarità 0-1
+AI_DUPLICATE_WINDOW_DAYS = int(os.getenv('AI_DUPLICATE_WINDOW_DAYS', '7'))
+# 'reuse': salva una copia non approvata collegata all'originale; 'skip': solo log
+AI_DUPLICATE_ACTION = os.getenv('AI_DUPLICATE_ACTION', 'reuse')
+
+# Raggruppamento della stessa storia da fonti diverse (MinHash/LSH in memoria)
+STORY_CLUSTER_ENABLED = os.getenv('STORY_CLUSTER_ENABLED', 'True').lower() in ['true', '1', 'yes']
+STORY_CLUSTER_THRESHOLD = float(os.getenv('STORY_CLUSTER_THRESHOLD', '0.5'))  # Jaccard stimata 0-1
+STORY_CLUSTER_WINDOW_HOURS = int(os.getenv('STORY_CLUSTER_WINDOW_HOURS', '48'))
+STORY_CLUSTER_MAX_ENTRIES = int(os.getenv('STORY_CLUSTER_MAX_ENTRIES', '5000'))
+STORY_CLUSTER_REFRESH_SECONDS = int(os.getenv('STORY_CLUSTER_REFRESH_SECONDS', '30'))  # lettura articoli di altri processi
+
 # CSRF Settings
 CSRF_TRUSTED_ORIGINS = os.getenv('CSRF_TRUSTED_ORIGINS', '').split(',') if os.getenv('CSRF_TRUSTED_ORIGINS') else []
 CSRF_COOKIE_HTTPONLY = False
@@ -280,6 +339,71 @@ if not DEBUG:
 # Anthropic API Configuration
 ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY', '')
 
+# Gateway condiviso per le chiamate a Claude (limiti per processo)
+LLM_GATEWAY = {
+    'MAX_CONCURRENCY': int(os.getenv('LLM_MAX_CONCURRENCY', '4')),
+    'TOKENS_PER_MINUTE': int(os.getenv('LLM_TOKENS_PER_MINUTE', '40000')),
+    'MAX_RETRIES': int(os.getenv('LLM_MAX_RETRIES', '4')),
+    'BACKOFF_BASE': int(os.getenv('LLM_BACKOFF_BASE', '5')),  # seconds
+    'BACKOFF_MAX': int(os.getenv('LLM_BACKOFF_MAX', '120')),  # seconds
+    'TIMEOUT': int(os.getenv('LLM_TIMEOUT', '300')),  # seconds
+    'METRICS_LOG_INTERVAL': int(os.getenv('LLM_METRICS_LOG_INTERVAL', '300')),  # seconds
+}
+
+# Cache persistente (SQLite) per pagine web, ricerche e trascrizioni
+PERSISTENT_CACHE = {
+    'PATH': os.getenv('PERSISTENT_CACHE_PATH', str(BASE_DIR / '.cache' / 'contenuti.sqlite3')),
+    'MAX_ENTRIES': int(os.getenv('PERSISTENT_CACHE_MAX_ENTRIES', '20000')),
+    'MAX_BYTES': int(os.getenv('PERSISTENT_CACHE_MAX_MB', '200')) * 1024 * 1024,
+    'DEFAULT_TTL': int(os.getenv('PERSISTENT_CACHE_TTL', str(7 * 24 * 3600))),  # seconds
+    'STALE_SECONDS': int(os.getenv('PERSISTENT_CACHE_STALE', str(7 * 24 * 3600))),  # seconds
+}
+
+# Estrazione dei PDF: download in streaming con limite e parsing in processi separati
+PDF_EXTRACTION = {
+    'MAX_BYTES': int(os.getenv('PDF_MAX_MB', '25')) * 1024 * 1024,
+    'MAX_PAGES': int(os.getenv('PDF_MAX_PAGES', '20')),
+    'TIMEOUT': int(os.getenv('PDF_TIMEOUT', '60')),  # seconds
+    'WORKERS': int(os.getenv('PDF_WORKERS', '2')),
+}
+
+# Quota Google Custom Search condivisa tra processi (free tier: 100 query al giorno)
+GOOGLE_SEARCH_QUOTA = {
+    'DAILY_LIMIT': int(os.getenv('GOOGLE_SEARCH_DAILY_LIMIT', '100')),
+    'RESERVE': int(os.getenv('GOOGLE_SEARCH_RESERVE', '5')),  # sotto questa soglia si usa il fallback
+    'RATE_PER_SECOND': float(os.getenv('GOOGLE_SEARCH_RATE', '1')),
+    'BURST': int(os.getenv('GOOGLE_SEARCH_BURST', '3')),
+    'MAX_WAIT': int(os.getenv('GOOGLE_SEARCH_MAX_WAIT', '15')),  # seconds
+}
+
+# Risoluzione dei link nelle email (t.co, pagine citate): concorrenza e limiti per dominio
+LINK_RESOLVER = {
+    'WORKERS': int(os.getenv('LINK_RESOLVER_WORKERS', '6')),
+    'PER_HOST': int(os.getenv('LINK_RESOLVER_PER_HOST', '2')),
+    'EXPAND_TTL': int(os.getenv('LINK_RESOLVER_EXPAND_TTL', str(90 * 24 * 3600))),  # seconds
+}
+
+# Ricerca web per la generazione AI: limiti per host, cache e ricerche parallele
+WEB_SEARCH = {
+    'MAX_PER_HOST': int(os.getenv('WEB_SEARCH_MAX_PER_HOST', '2')),
+    'FETCH_WORKERS': int(os.getenv('WEB_SEARCH_FETCH_WORKERS', '6')),
+    'FALLBACK_MIN_DELAY': float(os.getenv('WEB_SEARCH_FALLBACK_MIN_DELAY', '2')),  # seconds
+    'MAX_PARALLEL_TOOLS': int(os.getenv('WEB_SEARCH_MAX_PARALLEL_TOOLS', '4')),
+    'CONTENT_TTL': int(os.getenv('WEB_SEARCH_CONTENT_TTL', str(7 * 24 * 3600))),  # seconds
+    'CACHE_TTL': int(os.getenv('WEB_SEARCH_CACHE_TTL', str(24 * 3600))),  # seconds
+    'FALLBACK_CACHE_TTL': int(os.getenv('WEB_SEARCH_FALLBACK_CACHE_TTL', '3600')),  # seconds
+}
+
+# Trascrizioni YouTube: cache persistente e riassunto a blocchi delle sedute lunghe
+TRANSCRIPTS = {
+    'MAP_REDUCE_THRESHOLD': int(os.getenv('TRANSCRIPT_MAP_REDUCE_THRESHOLD', '60000')),  # caratteri
+    'CHUNK_CHARS': int(os.getenv('TRANSCRIPT_CHUNK_CHARS', '24000')),
+    'WORKERS': int(os.getenv('TRANSCRIPT_WORKERS', '4')),
+}
+
+# Monitor email: connessione IMAP persistente con notifiche push IDLE invece del polling
+EMAIL_IMAP_IDLE = os.getenv('EMAIL_IMAP_IDLE', 'True').lower() in ['true', '1', 'yes']
+
 # Site URL for media files
 SITE_URL = os.getenv('SITE_URL', 'https://ombradelportico.it')
 
@@ -15,7 +15,7 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path
+from django.urls import path, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import TemplateView
@@ -38,6 +38,8 @@ urlpatterns = [
     path('robots.txt', TemplateView.as_view(template_name='robots.txt', content_type='text/plain'), name='robots'),
     path('ads.txt', TemplateView.as_view(template_name='ads.txt', content_type='text/plain'), name='ads'),
     path('sitemap-news.xml', views.news_sitemap, name='news_sitemap'),
+    path('sitemap.xml', views.sitemap_index, name='sitemap_index'),
+    re_path(r'^sitemap-(?P<year>\d{4})-(?P<month>\d{2})\.xml$', views.sitemap_mese, name='sitemap_mese'),
 
     path('admin/', admin.site.urls),
 ]
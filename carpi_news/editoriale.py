@@ -20,7 +20,7 @@ from home.models import Articolo
 from home.logger_config import setup_centralized_logger
 from home.content_polisher import ContentPolisher
 from django.templatetags.static import static
-import anthropic
+from home import llm_gateway
 
 def setup_logging():
     """Configura il logging per l'editoriale"""
@@ -136,18 +136,16 @@ ESEMPIO DI FORMATO RICHIESTO CON LINK:
     
     try:
         # Chiamata all'AI con retry
-        logging.info("Inizializzazione client Anthropic...")
+        logging.info("Chiamata AI tramite gateway condiviso...")
         
         from django.conf import settings
         api_key = settings.ANTHROPIC_API_KEY
         if not api_key:
             logging.error("ANTHROPIC_API_KEY non configurata!")
             return None, None
-            
-        client = anthropic.Anthropic(api_key=api_key)
-        logging.info("Client Anthropic inizializzato con successo")
-        
-        response = client.messages.create(
+
+        response = llm_gateway.create_message(
+            api_key=api_key,
             model="claude-sonnet-4-20250514",
             max_tokens=4000,
             messages=[{"role": "user", "content": prompt_editoriale}]
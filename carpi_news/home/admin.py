@@ -1,12 +1,12 @@
 from django.contrib import admin
 from django.http import HttpResponse
-from django.urls import path
-from django.utils.html import format_html
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
 from django.utils.safestring import mark_safe
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.contrib.admin import SimpleListFilter
-from .models import Articolo
+from .models import Articolo, Job, RichiestaBatch, QuotaServizio, StatoPersistente, TentativoProgrammato
 import threading
 import urllib.parse
 
@@ -28,12 +28,49 @@ class HasWebSourcesFilter(SimpleListFilter):
             return queryset.filter(fonti_web__isnull=True) | queryset.filter(fonti_web__exact=[])
         return queryset
 
+
+class DuplicatoFilter(SimpleListFilter):
+    title = 'Duplicati'
+    parameter_name = 'duplicato'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('yes', 'Duplicati di altri articoli'),
+            ('no', 'Originali'),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.filter(duplicato_di__isnull=False)
+        elif self.value() == 'no':
+            return queryset.filter(duplicato_di__isnull=True)
+        return queryset
+
 @admin.register(Articolo)
 class ArticoloAdmin(admin.ModelAdmin):
     list_display = ("titolo", "approvato", "data_pubblicazione", "views", "fonti_web_count", "condividi_social")
-    list_filter = ['approvato', HasWebSourcesFilter]
-    fields = ('titolo', 'contenuto', 'sommario', 'categoria', 'approvato', 'fonte', 'foto', 'foto_upload', 'views', 'richieste_modifica', 'fonti_web_display', 'rigenera_button')
-    readonly_fields = ('rigenera_button', 'views', 'fonti_web_display')
+    list_filter = ['approvato', 'in_generazione', HasWebSourcesFilter, DuplicatoFilter]
+    fields = ('titolo', 'contenuto', 'sommario', 'categoria', 'approvato', 'fonte', 'foto', 'foto_upload', 'views', 'richieste_modifica', 'fonti_web_display', 'duplicati_display', 'rigenera_button')
+    readonly_fields = ('rigenera_button', 'views', 'fonti_web_display', 'duplicati_display')
+
+    def duplicati_display(self, obj):
+        """Collegamenti tra un articolo e le fonti quasi duplicate"""
+        if not obj.pk:
+            return '-'
+        if obj.duplicato_di_id:
+            return format_html(
+                '<p>📎 Duplicato di <a href="{}">#{} {}</a></p>',
+                reverse('admin:home_articolo_change', args=[obj.duplicato_di_id]),
+                obj.duplicato_di_id, obj.duplicato_di.titolo
+            )
+        duplicati = list(obj.duplicati.only('id', 'fonte'))
+        if not duplicati:
+            return format_html('<span style="color: #999;">Nessun duplicato</span>')
+        return format_html_join(
+            '', '<p>📎 <a href="{}">#{}</a> da {}</p>',
+            ((reverse('admin:home_articolo_change', args=[d.id]), d.id, d.fonte or '-') for d in duplicati)
+        )
+    duplicati_display.short_description = 'Duplicati'
     
     def rigenera_button(self, obj):
         if obj.pk:  # Solo per oggetti già salvati
@@ -283,18 +320,15 @@ class ArticoloAdmin(admin.ModelAdmin):
         
         try:
             logger.info(f"Inizio rigenerazione articolo: {articolo.titolo} (ID: {articolo.id})")
-            import anthropic
-            
-            # Inizializza il client Anthropic
+            from .llm_gateway import create_message
+
             from django.conf import settings
             api_key = settings.ANTHROPIC_API_KEY
             if not api_key:
                 logger.error("ERRORE: ANTHROPIC_API_KEY non configurata!")
                 print("ERRORE: ANTHROPIC_API_KEY non configurata!")
                 return
-                
-            client = anthropic.Anthropic(api_key=api_key)
-            
+
             # Prepara il prompt per la rigenerazione
             prompt_base = f"""Sei un giornalista esperto che deve riscrivere e migliorare questo articolo di news locale per Ombra del Portico.
 
@@ -315,8 +349,9 @@ ISTRUZIONI:
             
             prompt_base += "\n\nFornisci SOLO il contenuto dell'articolo riscritto, senza commenti aggiuntivi:"
             
-            # Chiamata all'API Anthropic
-            response = client.messages.create(
+            # Chiamata all'API Anthropic tramite il gateway condiviso
+            response = create_message(
+                api_key=api_key,
                 model="claude-sonnet-4-20250514",
                 max_tokens=4000,
                 temperature=0.3,
@@ -346,4 +381,77 @@ ISTRUZIONI:
             # Log dell'errore (il sistema di logging dovrebbe catturarlo)
             logger.error(f"Errore nella rigenerazione background: {str(e)}")
             print(f"Errore nella rigenerazione background: {str(e)}")
-            # Puoi aggiungere logging più sofisticato qui se necessario 
\ No newline at end of file
+            # Puoi aggiungere logging più sofisticato qui se necessario 
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("tipo", "coda", "stato", "priorita", "tentativi", "max_tentativi", "disponibile_da", "data_aggiornamento")
+    list_filter = ['stato', 'coda', 'tipo']
+    search_fields = ['tipo', 'chiave']
+    readonly_fields = ('tentativi', 'bloccato_da', 'bloccato_il', 'ultimo_errore', 'data_creazione', 'data_aggiornamento')
+    actions = ['riprova_lavori']
+
+    @admin.action(description="Rimetti in coda i lavori selezionati")
+    def riprova_lavori(self, request, queryset):
+        from django.utils import timezone
+        from .job_queue import get_worker_pool
+        queryset = queryset.exclude(stato=Job.STATO_IN_CORSO)
+        code = set(queryset.values_list('coda', flat=True))
+        updated = queryset.update(
+            stato=Job.STATO_IN_ATTESA,
+            tentativi=0,
+            disponibile_da=timezone.now(),
+        )
+        for coda in code:
+            get_worker_pool(coda).wake()
+        messages.success(request, f"{updated} lavori rimessi in coda")
+
+
+@admin.register(RichiestaBatch)
+class RichiestaBatchAdmin(admin.ModelAdmin):
+    list_display = ("custom_id", "config", "stato", "batch_id", "articolo", "data_creazione", "data_aggiornamento")
+    list_filter = ['stato', 'config']
+    search_fields = ['custom_id', 'batch_id']
+    readonly_fields = ('custom_id', 'batch_id', 'articolo', 'errore', 'data_creazione', 'data_aggiornamento')
+
+
+@admin.register(QuotaServizio)
+class QuotaServizioAdmin(admin.ModelAdmin):
+    list_display = ("servizio", "giorno", "richieste", "rimanenti_display", "esaurita", "data_aggiornamento")
+    readonly_fields = ('servizio', 'giorno', 'richieste', 'esaurita', 'token', 'ultimo_rifornimento', 'data_aggiornamento')
+
+    def rimanenti_display(self, obj):
+        from .search_quota import get_search_governor, GOOGLE_SEARCH
+        if obj.servizio != GOOGLE_SEARCH:
+            return '-'
+        metrics = get_search_governor().get_metrics()
+        return f"{metrics['rimanenti']} / {metrics['limite']}"
+    rimanenti_display.short_description = 'Rimanenti oggi'
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(StatoPersistente)
+class StatoPersistenteAdmin(admin.ModelAdmin):
+    """Sola lettura: una modifica al cursore UID salterebbe o rileggerebbe la casella email"""
+    list_display = ("chiave", "valore", "data_aggiornamento")
+    search_fields = ("chiave",)
+    readonly_fields = ('chiave', 'valore', 'data_aggiornamento')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(TentativoProgrammato)
+class TentativoProgrammatoAdmin(admin.ModelAdmin):
+    list_display = ("tipo", "chiave", "tentativi", "max_tentativi", "scadenza", "data_aggiornamento")
+    list_filter = ("tipo",)
+    search_fields = ("chiave",)
+    readonly_fields = ('tentativi', 'ultimo_errore', 'data_creazione', 'data_aggiornamento')
@@ -0,0 +1,257 @@
+"""
+Generazione AI differita tramite la Message Batches API di Anthropic
+
+Le categorie non urgenti (Eventi, trascrizioni del consiglio comunale) non
+hanno bisogno di un articolo in pochi secondi: invece di occupare il gateway
+in tempo reale, le richieste vengono salvate come RichiestaBatch, raccolte per
+BATCH_COLLECT_SECONDS e inviate insieme in un unico batch. Un lavoro in coda
+controlla periodicamente lo stato del batch e, al termine, salva gli articoli.
+
+Il flusso usa solo la coda di lavori esistente:
+- queue_request() salva la richiesta e accoda INVIA_BATCH con un ritardo
+- submit_pending() invia le richieste in attesa e accoda CONTROLLA_BATCH
+- check_batch() riaccoda se stesso finché il batch non è terminato, poi
+  salva i risultati; le richieste scadute o in errore tornano alla
+  generazione in tempo reale
+
+Con AI_BATCH['BACKEND'] = 'locale' i batch vengono completati subito in
+memoria, senza chiamate all'API (sviluppo e test).
+"""
+import hashlib
+import logging
+import threading
+import uuid
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'BACKEND': 'anthropic',
+    'CATEGORIES': ['Eventi', "L'Eco del Consiglio"],
+    'COLLECT_SECONDS': 300,
+    'POLL_SECONDS': 300,
+    'MAX_REQUESTS': 1000,
+}
+
+
+def get_batch_setting(name: str):
+    """Legge un'impostazione da settings.AI_BATCH con fallback ai default"""
+    return getattr(settings, 'AI_BATCH', {}).get(name, DEFAULT_SETTINGS[name])
+
+
+# Esito di una richiesta: (custom_id, testo generato o None, errore o None, da ritentare)
+BatchResult = Tuple[str, Optional[str], Optional[str], bool]
+
+
+class AnthropicBatchBackend:
+    """Invio e lettura dei batch tramite la Message Batches API"""
+
+    def _client(self):
+        from .llm_gateway import get_client
+        return get_client()
+
+    def submit(self, requests: List[dict]) -> str:
+        batch = self._client().messages.batches.create(requests=requests)
+        return batch.id
+
+    def is_ended(self, batch_id: str) -> bool:
+        return self._client().messages.batches.retrieve(batch_id).processing_status == 'ended'
+
+    def results(self, batch_id: str) -> Iterator[BatchResult]:
+        for item in self._client().messages.batches.results(batch_id):
+            result = item.result
+            if result.type == 'succeeded':
+                text = ''.join(block.text for block in result.message.content if block.type == 'text')
+                yield item.custom_id, text, None, False
+            elif result.type == 'errored':
+                yield item.custom_id, None, str(getattr(result, 'error', 'errore')), True
+            else:
+                # expired / canceled: la richiesta non è stata elaborata
+                yield item.custom_id, None, result.type, True
+
+
+class LocalBatchBackend:
+    """
+    Backend in memoria che completa i batch immediatamente
+
+    Il testo generato è prodotto da `responder(params)`; il default restituisce
+    il titolo originale e il contenuto del messaggio utente.
+    """
+
+    def __init__(self, responder: Callable[[dict], str] = None):
+        self.responder = responder or self.default_responder
+        self._batches: Dict[str, List[dict]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def default_responder(params: dict) -> str:
+        content = params['messages'][-1]['content']
+        title = 'Articolo'
+        for line in content.splitlines():
+            if line.startswith('Titolo originale:'):
+                title = line.split(':', 1)[1].strip()
+                break
+        return f"{title}\n\n{content}"
+
+    def submit(self, requests: List[dict]) -> str:
+        batch_id = f"locale_{uuid.uuid4().hex}"
+        with self._lock:
+            self._batches[batch_id] = list(requests)
+        return batch_id
+
+    def is_ended(self, batch_id: str) -> bool:
+        return True
+
+    def results(self, batch_id: str) -> Iterator[BatchResult]:
+        with self._lock:
+            requests = self._batches.pop(batch_id, [])
+        for request in requests:
+            try:
+                yield request['custom_id'], self.responder(request['params']), None, False
+            except Exception as e:
+                yield request['custom_id'], None, str(e), True
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Backend configurato in AI_BATCH['BACKEND'] ('anthropic' o 'locale')"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if get_batch_setting('BACKEND') == 'locale':
+                _backend = LocalBatchBackend()
+            else:
+                _backend = AnthropicBatchBackend()
+        return _backend
+
+
+def set_backend(backend):
+    """Sostituisce il backend (es. LocalBatchBackend con un responder di test)"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def should_use_batch(config, category: str) -> bool:
+    """Indica se la generazione per questa configurazione/categoria va differita"""
+    if 'ai_batch_mode' in config.config:
+        return bool(config.config['ai_batch_mode'])
+    return category in get_batch_setting('CATEGORIES')
+
+
+def queue_request(config_name: str, article_data: dict, params: dict):
+    """
+    Registra una generazione differita e pianifica l'invio del prossimo batch
+
+    La richiesta è idempotente sull'URL sorgente: la stessa notizia non viene
+    messa in batch due volte.
+    """
+    from .job_queue import dispatch
+    from .jobs import INVIA_BATCH
+    from .models import RichiestaBatch
+
+    custom_id = hashlib.md5(article_data['url'].encode('utf-8')).hexdigest()
+    richiesta, created = RichiestaBatch.objects.get_or_create(
+        custom_id=custom_id,
+        defaults={'config': config_name, 'article_data': article_data, 'parametri': params},
+    )
+    if not created:
+        logger.debug(f"Richiesta batch {custom_id} già registrata ({richiesta.stato})")
+        return richiesta
+
+    # Un solo invio pianificato alla volta: le richieste si accumulano nel batch
+    dispatch(INVIA_BATCH, chiave=INVIA_BATCH, ritardo=get_batch_setting('COLLECT_SECONDS'))
+    return richiesta
+
+
+def submit_pending() -> Optional[str]:
+    """Invia in un unico batch le richieste in attesa; restituisce l'id del batch"""
+    from .job_queue import dispatch
+    from .jobs import CONTROLLA_BATCH
+    from .models import RichiestaBatch
+
+    pending = list(
+        RichiestaBatch.objects.filter(stato=RichiestaBatch.STATO_IN_ATTESA)
+        .order_by('data_creazione')[:get_batch_setting('MAX_REQUESTS')]
+    )
+    if not pending:
+        return None
+
+    requests = []
+    for richiesta in pending:
+        params = {k: v for k, v in richiesta.parametri.items() if v is not None}
+        requests.append({'custom_id': richiesta.custom_id, 'params': params})
+
+    batch_id = get_backend().submit(requests)
+    RichiestaBatch.objects.filter(pk__in=[r.pk for r in pending]).update(
+        stato=RichiestaBatch.STATO_INVIATA, batch_id=batch_id
+    )
+    logger.info(f"Inviato batch {batch_id} con {len(pending)} richieste di generazione")
+
+    dispatch(CONTROLLA_BATCH, {'batch_id': batch_id}, chiave=f"{CONTROLLA_BATCH}:{batch_id}",
+             ritardo=get_batch_setting('POLL_SECONDS'))
+
+    # Oltre MAX_REQUESTS: le restanti partono in un batch successivo
+    if RichiestaBatch.objects.filter(stato=RichiestaBatch.STATO_IN_ATTESA).exists():
+        from .jobs import INVIA_BATCH
+        dispatch(INVIA_BATCH, chiave=INVIA_BATCH)
+    return batch_id
+
+
+def check_batch(batch_id: str) -> bool:
+    """
+    Controlla un batch e, se terminato, salva gli articoli generati
+
+    Returns:
+        True se il batch era terminato ed è stato elaborato
+    """
+    from .job_queue import dispatch
+    from .jobs import CONTROLLA_BATCH
+    from .models import RichiestaBatch
+    from .universal_news_monitor import UniversalNewsMonitor
+    from . import content_fingerprint
+
+    backend = get_backend()
+    if not backend.is_ended(batch_id):
+        logger.debug(f"Batch {batch_id} ancora in elaborazione")
+        dispatch(CONTROLLA_BATCH, {'batch_id': batch_id}, chiave=f"{CONTROLLA_BATCH}:{batch_id}",
+                 ritardo=get_batch_setting('POLL_SECONDS'))
+        return False
+
+    completed = failed = 0
+    for custom_id, text, error, retry in backend.results(batch_id):
+        richiesta = RichiestaBatch.objects.filter(custom_id=custom_id, batch_id=batch_id).first()
+        if richiesta is None or richiesta.stato != RichiestaBatch.STATO_INVIATA:
+            continue
+
+        try:
+            monitor = UniversalNewsMonitor.get_for_config(richiesta.config)
+            article_data = richiesta.article_data
+            if text:
+                impronta = content_fingerprint.simhash(f"{article_data['title']}\n{article_data['full_content']}")
+                richiesta.articolo = monitor.save_generated_article(article_data, text, [], impronta)
+                richiesta.stato = RichiestaBatch.STATO_COMPLETATA
+                completed += 1
+            else:
+                richiesta.stato = RichiestaBatch.STATO_FALLITA
+                richiesta.errore = error
+                failed += 1
+                if retry:
+                    # La notizia non va persa: si ripiega sulla generazione in tempo reale
+                    logger.warning(f"Richiesta batch {custom_id} non elaborata ({error}), "
+                                   f"passo alla generazione in tempo reale")
+                    monitor.enqueue_ai_generation(article_data)
+        except Exception as e:
+            richiesta.stato = RichiestaBatch.STATO_FALLITA
+            richiesta.errore = str(e)
+            failed += 1
+            logger.error(f"Errore nel salvataggio del risultato batch {custom_id}: {e}")
+        richiesta.save()
+
+    logger.info(f"Batch {batch_id} terminato: {completed} articoli salvati, {failed} richieste fallite")
+    return True
@@ -22,8 +22,9 @@ class HomeConfig(AppConfig):
     
     def ready(self):
         """Chiamato quando l'app è pronta - avvia il monitor playlist e registra segnali"""
-        # Registra i segnali
+        # Registra i segnali e gli handler della coda lavori
         import home.signals
+        import home.jobs
         
         # Evita di avviare durante le migrazioni o in altri contesti non appropriati
         import sys
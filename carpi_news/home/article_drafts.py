@@ -0,0 +1,133 @@
+"""
+Bozze salvate durante la generazione AI in streaming
+
+Mentre la risposta arriva, il titolo viene estratto dalla prima riga completa
+e l'articolo viene salvato subito come bozza (in_generazione=True, mai
+approvata); il contenuto parziale viene aggiornato periodicamente. L'operatore
+vede la bozza in admin prima della fine della generazione e, se il processo si
+interrompe, il testo già ricevuto resta nel database. Al termine la bozza viene
+completata da save_generated_article con titolo e contenuto rifiniti.
+
+Nelle conversazioni con ricerca web i primi turni contengono solo qualche
+frase prima della chiamata al tool ("Cercherò informazioni…"): la bozza parte
+solo quando il corpo supera MIN_BODY_CHARS e, se nel turno arriva un blocco
+tool_use, il turno viene ignorato e la bozza creata in quel turno eliminata.
+"""
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from .content_polisher import content_polisher
+from .models import Articolo
+
+logger = logging.getLogger(__name__)
+
+# Frequenza degli aggiornamenti della bozza durante lo streaming
+SAVE_EVERY_CHARS = 1500
+SAVE_EVERY_SECONDS = 10
+
+# Corpo minimo per salvare la bozza: le frasi prima di una ricerca web non sono articoli
+MIN_BODY_CHARS = 200
+
+
+def streaming_enabled() -> bool:
+    return getattr(settings, 'AI_STREAMING', True)
+
+
+def find_draft(url: str) -> Optional[Articolo]:
+    """Bozza rimasta da una generazione interrotta per la stessa fonte"""
+    return Articolo.objects.filter(fonte=url, in_generazione=True).order_by('-id').first()
+
+
+class StreamingDraft:
+    """Riceve il testo in streaming e lo persiste come bozza di Articolo"""
+
+    def __init__(self, fields: Dict[str, Any], articolo: Optional[Articolo] = None):
+        """
+        Args:
+            fields: Campi della bozza oltre a titolo e contenuto (fonte, categoria, foto...)
+            articolo: Bozza esistente da riprendere (generazione ritentata)
+        """
+        self.fields = fields
+        self.articolo = articolo
+        self._saved_len = 0
+        self._saved_at = 0.0
+        self._created_in_turn = False
+        self._tool_turn = False
+
+    @staticmethod
+    def split_title(text: str):
+        """Titolo (prima riga completa) e corpo del testo ricevuto, o None se la riga non è finita"""
+        text = text.lstrip()
+        if '\n' not in text:
+            return None
+        title, body = text.split('\n', 1)
+        title = content_polisher.clean_title_plain(title.replace('#', '').replace('*', '').strip())[:200]
+        if not title:
+            return None
+        return title, body.strip()
+
+    def on_text(self, text: str):
+        """Callback per llm_gateway.stream_message; gli errori non interrompono lo streaming"""
+        if not text:
+            # Nuovo turno della conversazione o tentativo ripetuto
+            self._saved_len = 0
+            self._created_in_turn = False
+            self._tool_turn = False
+            return
+        if self._tool_turn:
+            return
+        try:
+            parsed = self.split_title(text)
+            if parsed is None or len(parsed[1]) < MIN_BODY_CHARS:
+                return
+            title, body = parsed
+            if self.articolo is None:
+                self._create(title, body)
+                self._created_in_turn = True
+            elif (len(text) - self._saved_len >= SAVE_EVERY_CHARS
+                  or time.monotonic() - self._saved_at >= SAVE_EVERY_SECONDS):
+                self._update(title, body)
+            else:
+                return
+            self._saved_len = len(text)
+            self._saved_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"Errore nel salvataggio della bozza in streaming: {e}")
+
+    def on_tool_use(self):
+        """
+        Callback per llm_gateway.stream_message: il turno corrente chiama un tool,
+        quindi il suo testo non è l'articolo
+        """
+        self._tool_turn = True
+        if not (self._created_in_turn and self.articolo is not None):
+            return
+        try:
+            Articolo.objects.filter(pk=self.articolo.pk, in_generazione=True).delete()
+            logger.info(f"Bozza {self.articolo.pk} eliminata: il testo precedeva una chiamata a tool")
+        except Exception as e:
+            logger.error(f"Errore nell'eliminazione della bozza {self.articolo.pk}: {e}")
+        self.articolo = None
+        self._created_in_turn = False
+
+    def _create(self, title: str, body: str):
+        self.articolo = Articolo(
+            titolo=title,
+            contenuto=body or '…',
+            approvato=False,
+            in_generazione=True,
+            data_pubblicazione=timezone.now(),
+            **self.fields
+        )
+        self.articolo.save()
+        logger.info(f"Bozza salvata in streaming (ID: {self.articolo.id}): {title}")
+
+    def _update(self, title: str, body: str):
+        # UPDATE diretto: nessun segnale per gli aggiornamenti intermedi
+        Articolo.objects.filter(pk=self.articolo.pk, in_generazione=True).update(
+            titolo=title, contenuto=body or '…'
+        )
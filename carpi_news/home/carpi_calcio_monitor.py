@@ -9,7 +9,7 @@ from django.utils import timezone
 from urllib.parse import urljoin
 
 from home.models import Articolo
-from django.conf import settings
+from home import llm_gateway
 
 # Configura logging
 logger = logging.getLogger(__name__)
@@ -267,12 +267,6 @@ class CarpiCalcioMonitor:
     def genera_articolo_sportivo(self, article_data):
         """Genera un articolo sportivo rielaborato usando AI"""
         try:
-            from anthropic import Anthropic
-            
-            client = Anthropic(
-                api_key=settings.ANTHROPIC_API_KEY
-            )
-            
             # Prompt ottimizzato per evitare ripetizioni
             system_prompt = """Sei Gianni Brera giornalista sportivo per "Ombra del Portico". Rielabora la notizia del Carpi Calcio con stile professionale, appassionato e ironico. 
             
@@ -289,7 +283,7 @@ class CarpiCalcioMonitor:
 
 Fonte: {article_data['url']}"""
             
-            message = client.messages.create(
+            message = llm_gateway.create_message(
                 system=system_prompt,
                 max_tokens=4096,
                 messages=[{
@@ -0,0 +1,249 @@
+"""
+Estrazione del contenuto principale di una pagina HTML per densità di testo
+
+Le pagine dei siti istituzionali hanno layout molto annidati: calcolare
+get_text() e find_all('p') per ogni div/section costa quanto la dimensione
+del sottoalbero, e sommato su tutti i contenitori annidati diventa quadratico.
+Qui le statistiche (lunghezza del testo, testo nei link, virgole) vengono
+calcolate una sola volta, dal basso verso l'alto, visitando i nodi in ordine
+inverso di documento: ogni figlio è elaborato prima del proprio padre.
+
+Il punteggio segue lo schema di readability: ogni paragrafo assegna un
+punteggio al contenitore padre e metà al nonno; il contenitore con il
+punteggio più alto, scalato per la densità di link e corretto con gli indizi
+di class/id, è il contenuto principale. Navigazione, header, footer, form e
+script non contribuiscono al testo dei contenitori, senza modificare la soup.
+"""
+import logging
+import re
+from typing import Dict, Iterable, Optional
+
+from bs4 import BeautifulSoup, Comment, NavigableString, Tag
+
+logger = logging.getLogger(__name__)
+
+# Tag il cui testo non conta mai per i contenitori che li includono
+SKIP_TAGS = frozenset(['script', 'style', 'noscript', 'template', 'svg', 'iframe', 'head', 'title'])
+BOILERPLATE_TAGS = frozenset(['nav', 'footer', 'header', 'aside', 'menu', 'form', 'button', 'select'])
+
+PARAGRAPH_TAGS = frozenset(['p', 'pre', 'blockquote'])
+CANDIDATE_TAGS = frozenset(['div', 'section', 'main', 'article', 'td', 'body'])
+
+TAG_BONUS = {
+    'article': 10, 'main': 8, 'div': 5, 'section': 3, 'td': 3, 'blockquote': 3, 'pre': 3,
+    'body': -5,
+}
+
+POSITIVE_RE = re.compile(
+    r'article|body|content|entry|main|page|post|text|blog|story|testo|notizia|articolo|contenuto',
+    re.IGNORECASE
+)
+NEGATIVE_RE = re.compile(
+    r'comment|sidebar|widget|footer|menu|nav|share|social|related|correlat|cookie|banner|'
+    r'promo|advert|ads?\b|breadcrumb|meta|tag|pagination|popup|modal|newsletter',
+    re.IGNORECASE
+)
+
+MIN_PARAGRAPH_LENGTH = 25
+MIN_CONTENT_LENGTH = 200
+
+
+class _Stats:
+    __slots__ = ('text', 'links', 'own_text', 'commas', 'score')
+
+    def __init__(self):
+        self.text = 0
+        self.links = 0
+        self.own_text = 0
+        self.commas = 0
+        self.score = 0.0
+
+
+def _class_weight(tag: Tag) -> int:
+    """Indizi di class e id: +25 per nomi da contenuto, -25 per nomi da boilerplate"""
+    weight = 0
+    for value in (' '.join(tag.get('class') or []), tag.get('id') or ''):
+        if not value:
+            continue
+        if NEGATIVE_RE.search(value):
+            weight -= 25
+        if POSITIVE_RE.search(value):
+            weight += 25
+    return weight
+
+
+def _paragraph_score(text_length: int, commas: int) -> float:
+    return 1 + commas + min(text_length // 100, 3)
+
+
+class ContentDensity:
+    """
+    Statistiche di testo per ogni elemento di una soup, calcolate in un solo passaggio
+
+    Dopo la costruzione text_length(), link_density() e best_candidate() sono O(1)
+    o O(numero di candidati), senza nuove visite dell'albero.
+    """
+
+    def __init__(self, soup: BeautifulSoup):
+        self.soup = soup
+        self._stats: Dict[int, _Stats] = {}
+        self._candidates: Dict[int, Tag] = {}
+        self._compute()
+
+    def _get(self, tag: Tag) -> _Stats:
+        stats = self._stats.get(id(tag))
+        if stats is None:
+            stats = self._stats[id(tag)] = _Stats()
+        return stats
+
+    def _add_score(self, tag: Optional[Tag], score: float):
+        if tag is None or not isinstance(tag, Tag) or tag.name not in CANDIDATE_TAGS:
+            return
+        stats = self._get(tag)
+        if id(tag) not in self._candidates:
+            self._candidates[id(tag)] = tag
+            stats.score += TAG_BONUS.get(tag.name, 0) + _class_weight(tag)
+        stats.score += score
+
+    def _compute(self):
+        nodes = list(self.soup.descendants)
+
+        # Primo passaggio, in ordine di documento: i nodi dentro script o
+        # boilerplate (il padre è sempre visitato prima del figlio)
+        excluded = set()
+        for node in nodes:
+            parent = node.parent
+            if id(parent) in excluded or (isinstance(node, Tag) and
+                                          (node.name in SKIP_TAGS or node.name in BOILERPLATE_TAGS)):
+                excluded.add(id(node))
+
+        # Secondo passaggio, in ordine inverso: statistiche dal basso verso l'alto
+        for node in reversed(nodes):
+            parent = node.parent
+            if parent is None or id(node) in excluded:
+                continue
+
+            if isinstance(node, NavigableString):
+                if isinstance(node, Comment):
+                    continue
+                length = len(node.strip())
+                if length:
+                    stats = self._get(parent)
+                    stats.text += length
+                    stats.own_text += length
+                    stats.commas += node.count(',')
+                continue
+
+            if not isinstance(node, Tag):
+                continue
+
+            stats = self._get(node)
+            if node.name == 'a':
+                stats.links = stats.text
+
+            if node.name in PARAGRAPH_TAGS and stats.text >= MIN_PARAGRAPH_LENGTH:
+                score = _paragraph_score(stats.text, stats.commas)
+                self._add_score(parent, score)
+                self._add_score(parent.parent, score / 2)
+            elif node.name in CANDIDATE_TAGS and stats.own_text >= MIN_PARAGRAPH_LENGTH:
+                # Testo diretto in un contenitore (paragrafi separati da <br>)
+                score = _paragraph_score(stats.own_text, stats.commas)
+                self._add_score(node, score)
+                self._add_score(parent, score / 2)
+
+            parent_stats = self._get(parent)
+            parent_stats.text += stats.text
+            parent_stats.links += stats.links
+            parent_stats.commas += stats.commas
+
+    def text_length(self, tag: Tag) -> int:
+        """Caratteri di testo (senza spazi ai bordi) esclusi script e boilerplate"""
+        stats = self._stats.get(id(tag))
+        return stats.text if stats else 0
+
+    def link_density(self, tag: Tag) -> float:
+        stats = self._stats.get(id(tag))
+        if not stats or not stats.text:
+            return 0.0
+        return min(stats.links / stats.text, 1.0)
+
+    def score(self, tag: Tag) -> float:
+        """Punteggio finale di un candidato scalato per la densità di link"""
+        stats = self._stats.get(id(tag))
+        if not stats:
+            return 0.0
+        return stats.score * (1 - self.link_density(tag))
+
+    def best_candidate(self, min_length: int = MIN_CONTENT_LENGTH) -> Optional[Tag]:
+        """Contenitore con il punteggio più alto e almeno min_length caratteri di testo"""
+        best, best_score = None, 0.0
+        for tag in self._candidates.values():
+            if self.text_length(tag) < min_length:
+                continue
+            score = self.score(tag)
+            if score > best_score:
+                best, best_score = tag, score
+        return best
+
+    def first_matching(self, selectors: Iterable[str], min_length: int = MIN_CONTENT_LENGTH) -> Optional[Tag]:
+        """Primo elemento dei selettori, in ordine, con almeno min_length caratteri di testo"""
+        for selector in selectors:
+            try:
+                elements = self.soup.select(selector)
+            except Exception as e:
+                logger.debug(f"Selettore non valido '{selector}': {e}")
+                continue
+            for element in elements:
+                if self.text_length(element) >= min_length:
+                    return element
+        return None
+
+
+def find_main_content(soup: BeautifulSoup, selectors: Iterable[str] = (),
+                      min_length: int = MIN_CONTENT_LENGTH) -> Optional[Tag]:
+    """
+    Elemento con il contenuto principale della pagina
+
+    Args:
+        soup: Documento (non viene modificato)
+        selectors: Selettori CSS da provare prima dell'analisi per densità
+        min_length: Testo minimo perché un elemento sia considerato contenuto
+
+    Returns:
+        L'elemento trovato, o None
+    """
+    density = ContentDensity(soup)
+    return density.first_matching(selectors, min_length) or density.best_candidate(min_length)
+
+
+def element_text(element: Tag) -> str:
+    """Testo normalizzato di un elemento, senza script e boilerplate"""
+    parts = []
+    stack = [element]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, NavigableString):
+            if not isinstance(node, Comment):
+                text = node.strip()
+                if text:
+                    parts.append(text)
+        elif isinstance(node, Tag):
+            if node is not element and (node.name in SKIP_TAGS or node.name in BOILERPLATE_TAGS):
+                continue
+            stack.extend(reversed(node.contents))
+    return re.sub(r'\s+', ' ', ' '.join(parts)).strip()
+
+
+def extract_main_text(html, selectors: Iterable[str] = (), min_length: int = MIN_CONTENT_LENGTH) -> Optional[str]:
+    """
+    Testo del contenuto principale di una pagina
+
+    Args:
+        html: HTML (str o bytes) o BeautifulSoup già costruita
+    """
+    soup = html if isinstance(html, BeautifulSoup) else BeautifulSoup(html, 'html.parser')
+    element = find_main_content(soup, selectors, min_length)
+    if element is None:
+        return None
+    text = element_text(element)
+    return text if len(text) >= min_length else None
@@ -0,0 +1,135 @@
+"""
+Impronte SimHash del contenuto sorgente per riconoscere notizie quasi duplicate
+
+Lo stesso comunicato arriva spesso da più fonti (email, GraphQL del Comune,
+WordPress di Terre d'Argine) con intestazioni e formattazione diverse. Il testo
+viene normalizzato, spezzato in shingle di parole e ridotto a un SimHash a 64 bit:
+testi quasi uguali producono impronte che differiscono in pochi bit, quindi il
+confronto è una distanza di Hamming invece di una nuova generazione AI.
+"""
+import hashlib
+import html
+import logging
+import re
+import unicodedata
+from datetime import timedelta
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 4
+
+# Sotto questa lunghezza l'impronta non è affidabile (titoli, brevi avvisi)
+MIN_WORDS = 30
+
+_MASK = (1 << SIMHASH_BITS) - 1
+_TAG_RE = re.compile(r'<[^>]+>')
+_URL_RE = re.compile(r'https?://\S+|www\.\S+')
+_NON_WORD_RE = re.compile(r'[^\w\s]|_')
+
+
+def get_duplicate_threshold() -> float:
+    """Similarità minima (0-1) perché due fonti siano considerate duplicate"""
+    return getattr(settings, 'AI_DUPLICATE_THRESHOLD', 0.85)
+
+
+def normalize_text(text: str) -> str:
+    """Testo in minuscolo senza HTML, URL, accenti e punteggiatura"""
+    text = html.unescape(_TAG_RE.sub(' ', text or ''))
+    text = _URL_RE.sub(' ', text.lower())
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = _NON_WORD_RE.sub(' ', text)
+    return ' '.join(text.split())
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE):
+    """Insieme degli shingle di `size` parole consecutive del testo normalizzato"""
+    words = normalize_text(text).split()
+    if len(words) < size:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def simhash(text: str) -> Optional[int]:
+    """
+    SimHash a 64 bit del testo, come intero con segno (compatibile con BigIntegerField)
+
+    Returns:
+        L'impronta, o None se il testo è troppo corto per un confronto affidabile
+    """
+    if len(normalize_text(text).split()) < MIN_WORDS:
+        return None
+
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles(text):
+        value = _hash64(shingle)
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+
+    # Da unsigned a signed 64 bit per il database
+    if fingerprint >= 1 << (SIMHASH_BITS - 1):
+        fingerprint -= 1 << SIMHASH_BITS
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Numero di bit diversi tra due impronte"""
+    return bin((a ^ b) & _MASK).count('1')
+
+
+def similarity(a: int, b: int) -> float:
+    """Similarità tra due impronte (1.0 = identiche)"""
+    return 1.0 - hamming_distance(a, b) / SIMHASH_BITS
+
+
+def find_near_duplicate(fingerprint: Optional[int], threshold: float = None,
+                        window_days: int = None) -> Optional[Tuple[object, float]]:
+    """
+    Cerca un articolo recente generato da una fonte quasi identica
+
+    Vengono confrontati solo gli originali (non i duplicati già collegati)
+    creati negli ultimi AI_DUPLICATE_WINDOW_DAYS giorni.
+
+    Returns:
+        (articolo, similarità) del candidato più simile sopra soglia, altrimenti None
+    """
+    if fingerprint is None:
+        return None
+
+    from .models import Articolo
+
+    if threshold is None:
+        threshold = get_duplicate_threshold()
+    if window_days is None:
+        window_days = getattr(settings, 'AI_DUPLICATE_WINDOW_DAYS', 7)
+
+    candidates = Articolo.objects.filter(
+        impronta_fonte__isnull=False,
+        duplicato_di__isnull=True,
+        in_generazione=False,
+        data_creazione__gte=timezone.now() - timedelta(days=window_days),
+    ).values_list('id', 'impronta_fonte')
+
+    best_id, best_similarity = None, threshold
+    for article_id, other in candidates:
+        score = similarity(fingerprint, other)
+        if score >= best_similarity:
+            best_id, best_similarity = article_id, score
+
+    if best_id is None:
+        return None
+    return Articolo.objects.get(pk=best_id), best_similarity
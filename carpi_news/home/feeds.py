@@ -1,99 +1,123 @@
 from django.contrib.syndication.views import Feed
 from django.urls import reverse
-from django.utils.feedgenerator import Rss201rev2Feed
+from django.utils.feedgenerator import Rss201rev2Feed, Atom1Feed
 from django.conf import settings
-from django.core.cache import cache
 from .models import Articolo
-from datetime import datetime
-import requests
+from .image_health import get_image_source
+from .prerender import serve_prerendered, write_prerendered, delete_prerendered, build_site_request
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-def validate_image_url(url):
+def get_enclosure_url(item):
     """
-    Valida se un URL immagine è accessibile
-    
-    Args:
-        url: URL dell'immagine da validare
-        
-    Returns:
-        bool: True se l'immagine è accessibile, False altrimenti
+    URL assoluto dell'immagine da usare come enclosure, o None
+
+    Non esegue richieste HTTP: usa l'esito della verifica in background
+    salvato sull'articolo (vedi image_health). L'immagine è la stessa che
+    image_health verifica: l'upload ha priorità sull'URL.
+    """
+    source = get_image_source(item)
+    if not source:
+        return None
+
+    # Se l'immagine è il logo fallback, non includerla nel feed
+    if 'portico_logo_nopayoff.png' in source:
+        return None
+
+    # Immagine verificata e non raggiungibile: meglio nessuna enclosure
+    if item.foto_verificata_url == source and item.foto_valida is False:
+        return None
+
+    # Costruisci URL assoluto
+    if source.startswith('http://') or source.startswith('https://'):
+        return source
+    elif source.startswith('/media/'):
+        return f"https://ombradelportico.it{source}"
+    elif not source.startswith('/'):
+        return f"https://ombradelportico.it/media/{source}"
+    return f"https://ombradelportico.it{source}"
+
+
+def _is_verified(item):
+    """True se i metadati registrati si riferiscono all'immagine attuale"""
+    source = get_image_source(item)
+    return bool(source) and item.foto_verificata_url == source
+
+
+def get_enclosure_length(item):
+    """Dimensione in byte dell'immagine, registrata all'acquisizione"""
+    if item.foto_bytes and _is_verified(item):
+        return str(item.foto_bytes)
+    return "0"
+
+
+def get_enclosure_mime_type(item):
+    """Tipo MIME dell'immagine, registrato all'acquisizione o dedotto dall'estensione"""
+    if item.foto_mime and _is_verified(item):
+        return item.foto_mime
+    source = get_image_source(item)
+    if source:
+        foto = source.lower()
+        if foto.endswith(('.jpg', '.jpeg')):
+            return "image/jpeg"
+        elif foto.endswith('.png'):
+            return "image/png"
+        elif foto.endswith('.gif'):
+            return "image/gif"
+        elif foto.endswith('.webp'):
+            return "image/webp"
+    return "image/jpeg"  # Default
+
+
+class PrerenderedFeed(Feed):
+    """
+    Feed renderizzato una sola volta per ogni modifica e servito da file
+
+    Il polling (IFTTT, aggregatori) legge il file pre-renderizzato con supporto
+    ETag/Last-Modified e 304, senza query al database. Il file viene rigenerato
+    dal segnale di approvazione tramite regenerate_feeds(), oppure alla prima
+    richiesta dopo l'invalidazione o dopo prerender_max_age secondi.
     """
-    if not url:
-        return False
-    
-    # Usa la cache per evitare troppe richieste HTTP
-    cache_key = f"image_validation_{url}"
-    cached_result = cache.get(cache_key)
-    if cached_result is not None:
-        return cached_result
-    
-    try:
-        # Usa gli stessi header del monitor universale per evitare blocchi
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'it-IT,it;q=0.8,en-US;q=0.5,en;q=0.3',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
-        
-        # Usa HEAD request per non scaricare l'immagine completa
-        response = requests.head(url, timeout=10, allow_redirects=True, headers=headers)
-        is_valid = response.status_code == 200
-        
-        # Se HEAD non funziona, prova con GET (alcuni server non supportano HEAD)
-        if not is_valid:
-            response = requests.get(url, timeout=10, stream=True, headers=headers)
-            is_valid = response.status_code == 200
-            
-        # Cache il risultato per 1 ora
-        cache.set(cache_key, is_valid, 3600)
-        
-        if not is_valid:
-            logger.warning(f"Immagine non accessibile per RSS feed: {url} (status: {response.status_code})")
-            
-        return is_valid
-        
-    except requests.RequestException as e:
-        logger.warning(f"Errore validazione immagine RSS: {url} - {str(e)}")
-        # Cache il risultato negativo per 30 minuti (meno tempo per retry)
-        cache.set(cache_key, False, 1800)
-        return False
 
+    prerender_name = None
+    prerender_max_age = None  # Secondi; None = rigenera solo su invalidazione
 
-class ArticoliFeedRSS(Feed):
+    def render_feed(self, request) -> bytes:
+        """Renderizza il feed XML usando il framework syndication di Django"""
+        return super().__call__(request).content
+
+    def __call__(self, request, *args, **kwargs):
+        return serve_prerendered(
+            request,
+            self.prerender_name,
+            lambda: self.render_feed(request),
+            content_type=self.feed_type.content_type,
+            max_age=self.prerender_max_age,
+        )
+
+
+class ArticoliFeedRSS(PrerenderedFeed):
     """Feed RSS per gli articoli approvati - utilizzato per IFTTT"""
     
     title = "Ombra del Portico - Notizie di Carpi"
     link = "https://ombradelportico.it/"
+    feed_url = "https://ombradelportico.it/feed/rss/"
     description = "Le ultime notizie della città di Carpi - Feed RSS per condivisione automatica sui social"
     
     # Configurazioni RSS - ottimizzate per aggiornamenti immediati
     feed_type = Rss201rev2Feed
     ttl = 1  # Time to live ridotto a 1 minuto per aggiornamenti rapidi
+    prerender_name = 'feed_rss.xml'
     
     def items(self):
         """Restituisce gli ultimi 10 articoli approvati"""
+        # lastBuildDate viene calcolato da Django sulla data più recente degli item
         return Articolo.objects.filter(
             approvato=True
         ).order_by('-data_pubblicazione')[:10]
     
-    def feed_extra_kwargs(self, obj):
-        """Aggiungi metadati extra al feed basati sull'ultimo articolo approvato"""
-        # Usa la data dell'ultimo articolo approvato come lastBuildDate
-        # invece di datetime.now() per evitare falsi aggiornamenti
-        latest_article = Articolo.objects.filter(approvato=True).order_by('-data_pubblicazione').first()
-        last_build = latest_article.data_pubblicazione if latest_article else datetime.now()
-        
-        return {
-            'lastBuildDate': last_build,
-            'generator': 'Ombra del Portico RSS Generator v2.0'
-        }
-    
     def item_title(self, item):
         return item.titolo
     
@@ -126,54 +150,28 @@ class ArticoliFeedRSS(Feed):
         return categories
     
     def item_enclosure_url(self, item):
-        """URL dell'immagine associata (solo se presente)"""
-        if not item.foto:
-            return None
-
-        # Se l'immagine è il logo fallback, non includerla nel feed
-        if 'portico_logo_nopayoff.png' in item.foto:
-            return None
-
-        # Costruisci URL assoluto
-        if item.foto.startswith('http://') or item.foto.startswith('https://'):
-            image_url = item.foto
-        elif item.foto.startswith('/media/'):
-            image_url = f"https://ombradelportico.it{item.foto}"
-        elif not item.foto.startswith('/'):
-            image_url = f"https://ombradelportico.it/media/{item.foto}"
-        else:
-            image_url = f"https://ombradelportico.it{item.foto}"
-
-        # Restituisci l'URL dell'immagine senza validazione per evitare fallback a logo_nopayoff
-        # La validazione può bloccare immagini valide di siti esterni
-        return image_url
+        """URL dell'immagine associata (solo se presente e non segnalata come rotta)"""
+        return get_enclosure_url(item)
     
     def item_enclosure_length(self, item):
-        """Lunghezza del file (richiesto per enclosure, usiamo 0 come placeholder)"""
-        return "0"
+        """Lunghezza del file in byte (0 se non ancora nota)"""
+        return get_enclosure_length(item)
     
     def item_enclosure_mime_type(self, item):
         """Tipo MIME dell'immagine"""
-        if item.foto:
-            if item.foto.lower().endswith('.jpg') or item.foto.lower().endswith('.jpeg'):
-                return "image/jpeg"
-            elif item.foto.lower().endswith('.png'):
-                return "image/png"
-            elif item.foto.lower().endswith('.gif'):
-                return "image/gif"
-            elif item.foto.lower().endswith('.webp'):
-                return "image/webp"
-        return "image/jpeg"  # Default
+        return get_enclosure_mime_type(item)
 
 
-class ArticoliFeedAtom(Feed):
+class ArticoliFeedAtom(PrerenderedFeed):
     """Feed Atom alternativo"""
     
     title = "Ombra del Portico - Notizie di Carpi"
     link = "https://ombradelportico.it/"
+    feed_url = "https://ombradelportico.it/feed/atom/"
     description = "Le ultime notizie della città di Carpi - Feed Atom per condivisione automatica sui social"
     
-    feed_type = 'atom'
+    feed_type = Atom1Feed
+    prerender_name = 'feed_atom.xml'
     
     def items(self):
         return Articolo.objects.filter(
@@ -193,43 +191,31 @@ class ArticoliFeedAtom(Feed):
         return item.data_pubblicazione
 
 
-class ArticoliRecentiFeed(Feed):
+class ArticoliRecentiFeed(PrerenderedFeed):
     """Feed RSS solo per gli articoli delle ultime 24 ore (utile per IFTTT)"""
     
     title = "Ombra del Portico - Ultime 24 ore"
     link = "https://ombradelportico.it/"
+    feed_url = "https://ombradelportico.it/feed/recenti/"
     description = "Articoli pubblicati nelle ultime 24 ore - Feed ottimizzato per IFTTT"
     
     # Ottimizzazioni per IFTTT
     ttl = 1  # Aggiornamento ogni minuto
+    prerender_name = 'feed_recenti.xml'
+    # La finestra di 24 ore scorre anche senza nuove approvazioni:
+    # rigenera al massimo ogni 15 minuti per far uscire gli articoli vecchi
+    prerender_max_age = 900
     
     def items(self):
-        from datetime import datetime, timedelta
-        ieri = datetime.now() - timedelta(days=1)
+        from datetime import timedelta
+        from django.utils import timezone
+        ieri = timezone.now() - timedelta(days=1)
         
         return Articolo.objects.filter(
             approvato=True,
             data_pubblicazione__gte=ieri
         ).order_by('-data_pubblicazione')
     
-    def feed_extra_kwargs(self, obj):
-        """Forza aggiornamento solo quando ci sono nuovi articoli nelle ultime 24 ore"""
-        from datetime import datetime, timedelta
-        ieri = datetime.now() - timedelta(days=1)
-        
-        # Usa la data dell'ultimo articolo nelle ultime 24 ore
-        latest_article = Articolo.objects.filter(
-            approvato=True,
-            data_pubblicazione__gte=ieri
-        ).order_by('-data_pubblicazione').first()
-        
-        last_build = latest_article.data_pubblicazione if latest_article else datetime.now() - timedelta(days=2)
-        
-        return {
-            'lastBuildDate': last_build,
-            'generator': 'Ombra del Portico IFTTT Feed v2.0'
-        }
-    
     def item_title(self, item):
         # Aggiungi emoji per categoria per migliorare la condivisione social
         emoji = "📰"
@@ -265,39 +251,35 @@ class ArticoliRecentiFeed(Feed):
         return item.data_pubblicazione
     
     def item_enclosure_url(self, item):
-        """URL dell'immagine per feed IFTTT (solo se presente e valida)"""
-        if not item.foto:
-            return None
-        
-        # Se l'immagine è il logo fallback, non includerla nel feed IFTTT
-        if 'portico_logo_nopayoff.png' in item.foto:
-            return None
-        
-        # Costruisci URL assoluto
-        if item.foto.startswith('http://') or item.foto.startswith('https://'):
-            image_url = item.foto
-        elif item.foto.startswith('/media/'):
-            image_url = f"https://ombradelportico.it{item.foto}"
-        elif not item.foto.startswith('/'):
-            image_url = f"https://ombradelportico.it/media/{item.foto}"
-        else:
-            image_url = f"https://ombradelportico.it{item.foto}"
-        
-        # Restituisci l'URL dell'immagine senza validazione per IFTTT
-        # La validazione può bloccare immagini valide di siti esterni
-        return image_url
+        """URL dell'immagine per feed IFTTT (solo se presente e non segnalata come rotta)"""
+        return get_enclosure_url(item)
     
     def item_enclosure_length(self, item):
-        return "0"
+        return get_enclosure_length(item)
     
     def item_enclosure_mime_type(self, item):
-        if item.foto:
-            if item.foto.lower().endswith(('.jpg', '.jpeg')):
-                return "image/jpeg"
-            elif item.foto.lower().endswith('.png'):
-                return "image/png"
-            elif item.foto.lower().endswith('.gif'):
-                return "image/gif"
-            elif item.foto.lower().endswith('.webp'):
-                return "image/webp"
-        return "image/jpeg"
\ No newline at end of file
+        return get_enclosure_mime_type(item)
+
+
+# Feed pre-renderizzati: (istanza, path URL) usati per la rigenerazione
+PRERENDERED_FEEDS = [
+    (ArticoliFeedRSS(), '/feed/rss/'),
+    (ArticoliFeedAtom(), '/feed/atom/'),
+    (ArticoliRecentiFeed(), '/feed/recenti/'),
+]
+
+
+def regenerate_feeds():
+    """
+    Rigenera tutti i feed pre-renderizzati
+
+    Chiamata quando cambia l'insieme degli articoli approvati. Se la rigenerazione
+    di un feed fallisce il file viene rimosso, così verrà renderizzato alla
+    prossima richiesta invece di servire contenuto obsoleto.
+    """
+    for feed, path in PRERENDERED_FEEDS:
+        try:
+            write_prerendered(feed.prerender_name, feed.render_feed(build_site_request(path)))
+        except Exception as e:
+            logger.warning(f"Rigenerazione feed {feed.prerender_name} fallita, verrà renderizzato alla prossima richiesta: {e}")
+            delete_prerendered(feed.prerender_name)
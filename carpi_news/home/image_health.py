@@ -0,0 +1,384 @@
+"""
+Verifica dello stato delle immagini degli articoli
+
+Le immagini vengono verificate dalla coda dei lavori (VERIFICA_IMMAGINE) dopo
+il salvataggio dell'articolo e l'esito viene memorizzato sul modello
+(foto_valida / foto_verificata_url), insieme ai metadati dell'immagine (dimensione in byte, MIME, larghezza e
+altezza). In questo modo la renderizzazione di pagine e feed non esegue mai
+richieste HTTP: legge solo il risultato già salvato.
+
+Le immagini locali (scaricate dai monitor o caricate dall'admin) vengono
+descritte direttamente al salvataggio dell'articolo, senza verifica in
+background.
+"""
+import hashlib
+import io
+import logging
+import mimetypes
+import os
+import re
+from typing import Dict, Optional
+from urllib.parse import quote
+
+import requests
+from PIL import Image, ImageFile
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Stessi header del monitor universale per evitare blocchi
+REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'image/avif,image/webp,image/apng,image/*,*/*;q=0.8',
+    'Accept-Language': 'it-IT,it;q=0.8,en-US;q=0.5,en;q=0.3',
+}
+
+# Domini con problemi noti di connessione dal server: non vengono verificati
+TRUSTED_DOMAINS = ['voce.it', 'ombradelportico.it']
+
+CHECK_TIMEOUT = 10
+CACHE_PREFIX = 'image_health'
+CACHE_TIMEOUT_OK = 3600
+CACHE_TIMEOUT_FAIL = 1800
+
+# Byte massimi letti da un'immagine remota per ricavarne le dimensioni
+DIMENSION_PROBE_BYTES = 64 * 1024
+
+METADATA_FIELDS = ('foto_bytes', 'foto_mime', 'foto_larghezza', 'foto_altezza')
+
+
+def normalize_image_url(url: str) -> str:
+    """
+    Corregge doppi slash e spazi negli URL delle immagini
+
+    Args:
+        url: URL originale dell'immagine
+
+    Returns:
+        URL normalizzato
+    """
+    if not url:
+        return url
+
+    normalized = url
+
+    # Fix per doppi slash negli URL (es. voce.it/upload//articolo)
+    if '://' in normalized:
+        protocol, rest = normalized.split('://', 1)
+        # Rimuovi doppi slash nel path ma mantieni quelli dopo il protocollo
+        rest = re.sub(r'/+', '/', rest)
+        normalized = f"{protocol}://{rest}"
+
+    if ' ' in normalized:
+        # Codifica solo la parte del path, mantenendo lo schema e host
+        if normalized.startswith('http'):
+            parts = normalized.split('/', 3)  # ['http:', '', 'domain.com', 'path/with spaces.jpg']
+            if len(parts) > 3:
+                encoded_path = quote(parts[3], safe='/')
+                normalized = f"{parts[0]}//{parts[2]}/{encoded_path}"
+        else:
+            normalized = quote(normalized, safe='/:?#[]@!$&\'()*+,;=')
+
+    return normalized
+
+
+def is_trusted_url(url: str) -> bool:
+    """True se l'URL appartiene a un dominio che non viene verificato"""
+    return any(domain in url for domain in TRUSTED_DOMAINS)
+
+
+def _cache_key(url: str) -> str:
+    return f"{CACHE_PREFIX}_{hashlib.sha1(url.encode('utf-8')).hexdigest()}"
+
+
+def describe_image_bytes(content: bytes, content_type: str = None) -> Dict[str, Optional[int]]:
+    """
+    Ricava i metadati di un'immagine già in memoria
+
+    Args:
+        content: Contenuto dell'immagine
+        content_type: Content-Type noto (usato se PIL non riconosce il formato)
+
+    Returns:
+        Dizionario con chiavi foto_bytes, foto_mime, foto_larghezza, foto_altezza
+    """
+    metadata = {
+        'foto_bytes': len(content),
+        'foto_mime': _clean_mime(content_type),
+        'foto_larghezza': None,
+        'foto_altezza': None,
+    }
+    try:
+        with Image.open(io.BytesIO(content)) as img:
+            metadata['foto_larghezza'], metadata['foto_altezza'] = img.size
+            metadata['foto_mime'] = Image.MIME.get(img.format) or metadata['foto_mime']
+    except Exception as e:
+        logger.debug(f"Impossibile leggere le dimensioni dell'immagine: {e}")
+    return metadata
+
+
+def describe_image_file(path: str) -> Optional[Dict[str, Optional[int]]]:
+    """
+    Ricava i metadati di un'immagine su disco (legge solo l'intestazione)
+
+    Returns:
+        Dizionario dei metadati, o None se il file non esiste
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return None
+
+    metadata = {
+        'foto_bytes': size,
+        'foto_mime': mimetypes.guess_type(path)[0],
+        'foto_larghezza': None,
+        'foto_altezza': None,
+    }
+    try:
+        with Image.open(path) as img:
+            metadata['foto_larghezza'], metadata['foto_altezza'] = img.size
+            metadata['foto_mime'] = Image.MIME.get(img.format) or metadata['foto_mime']
+    except Exception as e:
+        logger.debug(f"Impossibile leggere le dimensioni di {path}: {e}")
+    return metadata
+
+
+def _clean_mime(content_type: Optional[str]) -> Optional[str]:
+    """Estrae il tipo MIME da un header Content-Type (senza parametri)"""
+    if not content_type:
+        return None
+    mime = content_type.split(';', 1)[0].strip().lower()
+    return mime if mime.startswith('image/') else None
+
+
+def remember_image_metadata(url: str, metadata: Dict[str, Optional[int]]):
+    """
+    Registra i metadati di un'immagine appena scaricata
+
+    Usato da chi scarica le immagini (es. download_and_save_image), così il
+    salvataggio dell'articolo non deve rileggere il file.
+    """
+    cache.set(f"{CACHE_PREFIX}_meta_{_url_hash(url)}", metadata, CACHE_TIMEOUT_OK)
+
+
+def _url_hash(url: str) -> str:
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def _local_path(url: str) -> str:
+    """Percorso su disco di un'immagine locale in /media/"""
+    relative_path = url[len(settings.MEDIA_URL):] if url.startswith(settings.MEDIA_URL) else url.lstrip('/')
+    return os.path.join(settings.MEDIA_ROOT, relative_path)
+
+
+def _probe_dimensions(url: str, metadata: Dict[str, Optional[int]]):
+    """Legge le dimensioni di un'immagine remota scaricando solo l'inizio del file"""
+    parser = ImageFile.Parser()
+    read = 0
+    with requests.get(url, timeout=CHECK_TIMEOUT, stream=True, headers=REQUEST_HEADERS) as response:
+        if response.status_code != 200:
+            return
+        for chunk in response.iter_content(chunk_size=8192):
+            parser.feed(chunk)
+            read += len(chunk)
+            if parser.image or read >= DIMENSION_PROBE_BYTES:
+                break
+    if parser.image:
+        metadata['foto_larghezza'], metadata['foto_altezza'] = parser.image.size
+        metadata['foto_mime'] = metadata['foto_mime'] or Image.MIME.get(parser.image.format)
+
+
+def _metadata_from_headers(response) -> Dict[str, Optional[int]]:
+    content_length = response.headers.get('content-length')
+    return {
+        'foto_bytes': int(content_length) if content_length and content_length.isdigit() else None,
+        'foto_mime': _clean_mime(response.headers.get('content-type')),
+        'foto_larghezza': None,
+        'foto_altezza': None,
+    }
+
+
+def _probe_remote_url(url: str) -> Optional[Dict[str, Optional[int]]]:
+    """
+    Verifica un'immagine remota con HEAD e, se non supportato, con GET
+
+    Returns:
+        Metadati dell'immagine se raggiungibile, None altrimenti
+    """
+    response = requests.head(url, timeout=CHECK_TIMEOUT, allow_redirects=True, headers=REQUEST_HEADERS)
+    if response.status_code != 200:
+        # Alcuni server non supportano HEAD: riprova con GET senza scaricare il corpo
+        with requests.get(url, timeout=CHECK_TIMEOUT, stream=True, headers=REQUEST_HEADERS) as response:
+            if response.status_code != 200:
+                logger.warning(f"Immagine non accessibile: {url} (status: {response.status_code})")
+                return None
+
+    metadata = _metadata_from_headers(response)
+    try:
+        _probe_dimensions(url, metadata)
+    except requests.RequestException as e:
+        logger.debug(f"Dimensioni non disponibili per {url}: {e}")
+    return metadata
+
+
+def probe_image(url: str) -> Optional[Dict[str, Optional[int]]]:
+    """
+    Verifica se un'immagine è raggiungibile e ne ricava i metadati (operazione bloccante)
+
+    Il risultato viene condiviso in cache tra articoli che usano la stessa
+    immagine. Da non chiamare durante la renderizzazione di pagine o feed.
+
+    Args:
+        url: URL dell'immagine (assoluto o locale /media/, /static/)
+
+    Returns:
+        Metadati dell'immagine (chiavi di METADATA_FIELDS, valori anche None)
+        se l'immagine è accessibile, None altrimenti
+    """
+    if not url:
+        return None
+
+    if not url.startswith(('http://', 'https://')):
+        # Immagini locali: /static/ è gestito da whitenoise, /media/ si verifica su disco
+        if url.startswith('/static/'):
+            return dict.fromkeys(METADATA_FIELDS)
+        return describe_image_file(_local_path(url))
+    if is_trusted_url(url):
+        return dict.fromkeys(METADATA_FIELDS)
+
+    url = normalize_image_url(url)
+    cache_key = _cache_key(url)
+    cached_result = cache.get(cache_key)
+    if cached_result is not None:
+        return cached_result or None
+
+    try:
+        metadata = _probe_remote_url(url)
+    except requests.RequestException as e:
+        logger.warning(f"Errore verifica immagine: {url} - {str(e)}")
+        metadata = None
+
+    if metadata is not None:
+        cache.set(cache_key, metadata, CACHE_TIMEOUT_OK)
+    else:
+        cache.set(cache_key, False, CACHE_TIMEOUT_FAIL)
+    return metadata
+
+
+def check_image_url(url: str) -> bool:
+    """True se l'immagine è raggiungibile (vedi probe_image)"""
+    return probe_image(url) is not None
+
+
+def get_image_source(articolo) -> Optional[str]:
+    """Immagine effettiva dell'articolo: l'upload ha priorità sull'URL"""
+    if articolo.foto_upload:
+        return articolo.foto_upload.url
+    return articolo.foto or None
+
+
+def apply_local_metadata(articolo):
+    """
+    Descrive l'immagine locale dell'articolo prima del salvataggio
+
+    Chiamata da Articolo.save: per upload e immagini in /media/ i metadati sono
+    ricavati subito dal disco (o da quanto registrato al download) e l'immagine
+    risulta già verificata. Per immagini remote i metadati vengono azzerati e
+    compilati dalla verifica in background.
+    """
+    source = get_image_source(articolo)
+    if not source or articolo.foto_verificata_url == source:
+        return
+
+    metadata = None
+    pending_upload = bool(articolo.foto_upload) and not articolo.foto_upload._committed
+    is_local = not source.startswith(('http://', 'https://'))
+    if pending_upload:
+        # Upload non ancora salvato su disco: leggi dal file caricato. Il nome
+        # definitivo è noto solo dopo il salvataggio, quindi l'URL verificato
+        # viene confermato dalla verifica in background
+        upload = articolo.foto_upload.file
+        upload.seek(0)
+        metadata = describe_image_bytes(upload.read(), getattr(upload, 'content_type', None))
+        upload.seek(0)
+    elif is_local and not source.startswith('/static/'):
+        metadata = cache.get(f"{CACHE_PREFIX}_meta_{_url_hash(source)}")
+        if metadata is None:
+            metadata = describe_image_file(_local_path(source))
+
+    for field in METADATA_FIELDS:
+        setattr(articolo, field, metadata.get(field) if metadata else None)
+
+    if metadata is not None and not pending_upload:
+        articolo.foto_valida = True
+        articolo.foto_verificata_url = source
+
+
+def needs_check(articolo) -> bool:
+    """True se l'immagine corrente dell'articolo non è ancora stata verificata"""
+    source = get_image_source(articolo)
+    return bool(source) and articolo.foto_verificata_url != source
+
+
+def verify_article_image(article_id: int):
+    """
+    Verifica l'immagine di un articolo e salva l'esito sul modello
+
+    L'aggiornamento avviene con un UPDATE condizionato all'URL verificato, così
+    un cambio di immagine nel frattempo non viene sovrascritto da un esito vecchio.
+    """
+    from .models import Articolo
+
+    try:
+        articolo = Articolo.objects.get(pk=article_id)
+    except Articolo.DoesNotExist:
+        return None
+
+    source = get_image_source(articolo)
+    if not source:
+        return None
+
+    metadata = probe_image(source)
+    is_valid = metadata is not None
+    fields = {field: (metadata or {}).get(field) for field in METADATA_FIELDS}
+    # Condizione sull'immagine verificata: un cambio nel frattempo non va sovrascritto
+    queryset = Articolo.objects.filter(pk=article_id, foto=articolo.foto)
+    if articolo.foto_upload:
+        queryset = queryset.filter(foto_upload=articolo.foto_upload.name)
+    updated = queryset.update(
+        foto_valida=is_valid,
+        foto_verificata_url=source,
+        **fields,
+    )
+
+    if updated and not is_valid:
+        logger.warning(f"Immagine non valida per articolo ID {article_id}: {source}")
+        if articolo.approvato:
+            # I feed pubblicati includevano l'immagine come enclosure: aggiornali
+            from .signals import invalidate_rss_feeds
+            invalidate_rss_feeds()
+
+    return is_valid
+
+
+def schedule_image_check(articolo):
+    """
+    Accoda la verifica dell'immagine di un articolo (lavoro VERIFICA_IMMAGINE)
+
+    Il lavoro è persistente e ritentato dalla coda, e diventa eseguibile solo
+    dopo il commit della transazione corrente, quindi non blocca il salvataggio.
+    Una sola verifica in attesa per articolo: salvataggi ripetuti non
+    moltiplicano le richieste HTTP.
+    """
+    from .job_queue import dispatch
+    from .jobs import VERIFICA_IMMAGINE
+
+    if not needs_check(articolo):
+        return
+
+    try:
+        dispatch(VERIFICA_IMMAGINE, {'articolo_id': articolo.pk}, chiave=f"{VERIFICA_IMMAGINE}:{articolo.pk}")
+    except Exception as e:
+        logger.error(f"Errore nell'accodamento della verifica immagine per articolo ID {articolo.pk}: {e}")
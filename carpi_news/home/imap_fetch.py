@@ -0,0 +1,314 @@
+"""
+Scaricamento selettivo dei messaggi IMAP: prima gli header, poi solo la parte di testo
+
+Scaricare RFC822 porta con sé allegati (PDF, immagini dei comunicati) anche
+per i messaggi che i filtri su mittente e oggetto scartano subito. Qui:
+
+- fetch_summaries() chiede con un solo FETCH, per tutti i messaggi, gli
+  header usati dai filtri e la BODYSTRUCTURE, senza marcarli come letti
+- select_text_part() sceglie dalla BODYSTRUCTURE la parte text/html (o
+  text/plain in mancanza) con la stessa precedenza dell'analisi MIME completa
+- fetch_body() scarica solo quella parte e la decodifica in un EmailBody,
+  analizzato una volta e condiviso da chi estrae il testo e chi cerca
+  immagini e link nell'HTML
+
+Se il server non restituisce una BODYSTRUCTURE utilizzabile si torna al
+messaggio completo (BODY.PEEK[]), analizzato comunque una sola volta.
+"""
+import base64
+import email
+import logging
+import quopri
+import re
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Header necessari per filtri e dati dell'articolo
+HEADER_FIELDS = ('SUBJECT', 'FROM', 'DATE')
+
+SUMMARY_ITEMS = f"(BODY.PEEK[HEADER.FIELDS ({' '.join(HEADER_FIELDS)})] BODYSTRUCTURE)"
+
+_LITERAL_RE = re.compile(rb'\{(\d+)\}$')
+
+
+class EmailBody:
+    """Parti di testo di un messaggio, estratte una sola volta"""
+
+    __slots__ = ('html', 'text')
+
+    def __init__(self, html: str = '', text: str = ''):
+        self.html = html
+        self.text = text
+
+    @classmethod
+    def from_message(cls, message) -> 'EmailBody':
+        """Prima parte text/html e prima text/plain di un messaggio completo, in una visita"""
+        html = text = ''
+        for part in message.walk():
+            content_type = part.get_content_type()
+            if content_type == 'text/html' and not html:
+                html = _decode_payload(part.get_payload(decode=True), part.get_content_charset())
+            elif content_type == 'text/plain' and not text:
+                text = _decode_payload(part.get_payload(decode=True), part.get_content_charset())
+            if html and text:
+                break
+        return cls(html, text)
+
+
+class TextPart(NamedTuple):
+    section: str       # es. '1', '1.2' (BODY[section])
+    subtype: str       # 'html' o 'plain'
+    charset: Optional[str]
+    encoding: str      # '7bit', 'base64', 'quoted-printable', ...
+
+
+class MessageSummary(NamedTuple):
+    headers: Any                  # email.message.Message con i soli HEADER_FIELDS
+    bodystructure: Optional[list]
+
+
+def _decode_payload(payload: Optional[bytes], charset: Optional[str]) -> str:
+    if not payload:
+        return ''
+    try:
+        return payload.decode(charset or 'utf-8', errors='replace')
+    except LookupError:
+        # Charset sconosciuto a Python
+        return payload.decode('utf-8', errors='replace')
+
+
+# --- Analisi delle risposte FETCH -------------------------------------------
+
+def _segments(data: Iterable) -> List[Any]:
+    """Risposta di imaplib come sequenza di testo (bytes) e letterali (bytearray)"""
+    segments = []
+    for element in data:
+        if isinstance(element, tuple):
+            prefix, literal = element
+            segments.append(_LITERAL_RE.sub(b'', prefix))
+            segments.append(bytearray(literal))
+        elif element:
+            segments.append(element)
+    return segments
+
+
+def _tokens(data: Iterable):
+    """Token di una risposta: '(' ')' atomi/stringhe (bytes), None per NIL, letterali"""
+    for segment in _segments(data):
+        if isinstance(segment, bytearray):
+            yield bytes(segment)
+            continue
+        i, n = 0, len(segment)
+        while i < n:
+            char = segment[i:i + 1]
+            if char in b' \r\n':
+                i += 1
+            elif char in b'()':
+                yield char.decode()
+                i += 1
+            elif char == b'"':
+                j = i + 1
+                value = bytearray()
+                while j < n and segment[j:j + 1] != b'"':
+                    if segment[j:j + 1] == b'\\':
+                        j += 1
+                    value += segment[j:j + 1]
+                    j += 1
+                yield bytes(value)
+                i = j + 1
+            else:
+                # Atomo; le sezioni tra [] (BODY[HEADER.FIELDS (...)]) restano unite
+                j = i
+                depth = 0
+                while j < n:
+                    c = segment[j:j + 1]
+                    if c == b'[':
+                        depth += 1
+                    elif c == b']':
+                        depth -= 1
+                    elif depth == 0 and c in b' ()\r\n':
+                        break
+                    j += 1
+                atom = segment[i:j]
+                yield None if atom.upper() == b'NIL' else atom
+                i = j
+
+
+def _parse_list(tokens) -> list:
+    items = []
+    for token in tokens:
+        if token == '(':
+            items.append(_parse_list(tokens))
+        elif token == ')':
+            return items
+        else:
+            items.append(token)
+    return items
+
+
+def parse_fetch_response(data: Iterable) -> Dict[bytes, Dict[str, Any]]:
+    """
+    Elementi di una risposta FETCH per numero di sequenza
+
+    Returns:
+        {b'12': {'UID': b'345', 'BODYSTRUCTURE': [...], 'BODY[HEADER.FIELDS (...)]': b'...'}}
+    """
+    messages = {}
+    tokens = _tokens(data)
+    number = None
+    for token in tokens:
+        if token == '(' and number is not None:
+            values = _parse_list(tokens)
+            items = messages.setdefault(number, {})
+            for name, value in zip(values[0::2], values[1::2]):
+                if isinstance(name, bytes):
+                    items[name.decode(errors='replace').upper()] = value
+            number = None
+        elif isinstance(token, bytes):
+            number = token
+    return messages
+
+
+def _item(items: Dict[str, Any], prefix: str) -> Any:
+    for name, value in items.items():
+        if name.startswith(prefix):
+            return value
+    return None
+
+
+# --- BODYSTRUCTURE ----------------------------------------------------------
+
+def _text(value) -> str:
+    return value.decode(errors='replace').lower() if isinstance(value, bytes) else ''
+
+
+def _params(value) -> Dict[str, str]:
+    if not isinstance(value, list):
+        return {}
+    return {_text(k): v.decode(errors='replace') for k, v in zip(value[0::2], value[1::2])
+            if isinstance(k, bytes) and isinstance(v, bytes)}
+
+
+def _is_attachment(structure: list) -> bool:
+    # Estensioni di una parte testuale: md5, (disposizione parametri), lingua, ...
+    for extension in structure[8:]:
+        if isinstance(extension, list) and extension and _text(extension[0]) == 'attachment':
+            return True
+    return False
+
+
+def _text_parts(structure: list, section: str):
+    """Parti text/* in ordine di documento, come Message.walk()"""
+    if structure and isinstance(structure[0], list):
+        # Multipart: le parti figlie, poi il sottotipo e le estensioni
+        index = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            index += 1
+            yield from _text_parts(child, f'{section}.{index}' if section else str(index))
+        return
+    if len(structure) < 6 or _text(structure[0]) != 'text':
+        return
+    yield TextPart(
+        section=section or '1',
+        subtype=_text(structure[1]),
+        charset=_params(structure[2]).get('charset'),
+        encoding=_text(structure[5]) or '7bit',
+    ), _is_attachment(structure)
+
+
+def select_text_part(bodystructure: Optional[list]) -> Optional[TextPart]:
+    """Prima parte text/html non allegata, altrimenti la prima text/plain"""
+    if not bodystructure:
+        return None
+    plain = None
+    for part, attachment in _text_parts(bodystructure, ''):
+        if attachment:
+            continue
+        if part.subtype == 'html':
+            return part
+        if part.subtype == 'plain' and plain is None:
+            plain = part
+    return plain
+
+
+def _decode_transfer(payload: bytes, encoding: str) -> bytes:
+    if encoding == 'base64':
+        return base64.b64decode(payload, validate=False)
+    if encoding == 'quoted-printable':
+        return quopri.decodestring(payload)
+    return payload
+
+
+# --- Comandi ----------------------------------------------------------------
+
+def _fetch(mail, message_set: bytes, items: str, uid: bool):
+    if uid:
+        return mail.uid('FETCH', message_set, items)
+    return mail.fetch(message_set, items)
+
+
+def fetch_summaries(mail, ids: List[bytes], uid: bool = False) -> Dict[bytes, MessageSummary]:
+    """
+    Header dei filtri e BODYSTRUCTURE di più messaggi con un solo FETCH
+
+    Args:
+        ids: Numeri di sequenza (o UID con uid=True)
+
+    Returns:
+        {id: MessageSummary}; i messaggi non restituiti dal server mancano
+    """
+    if not ids:
+        return {}
+    status, data = _fetch(mail, b','.join(ids), SUMMARY_ITEMS, uid)
+    if status != 'OK':
+        logger.warning(f"FETCH degli header fallito: {status}")
+        return {}
+
+    summaries = {}
+    for number, items in parse_fetch_response(data).items():
+        key = items.get('UID') if uid else number
+        header_bytes = _item(items, 'BODY[HEADER')
+        if key is None or header_bytes is None:
+            continue
+        structure = items.get('BODYSTRUCTURE')
+        summaries[key] = MessageSummary(
+            headers=email.message_from_bytes(header_bytes),
+            bodystructure=structure if isinstance(structure, list) else None,
+        )
+    return summaries
+
+
+def fetch_body(mail, message_id: bytes, bodystructure: Optional[list], uid: bool = False) -> Optional[EmailBody]:
+    """
+    Testo di un messaggio: solo la parte scelta dalla BODYSTRUCTURE, o il
+    messaggio completo se la struttura non è disponibile
+
+    Nessuno dei due comandi marca il messaggio come letto.
+    """
+    part = select_text_part(bodystructure)
+    if bodystructure and part is None:
+        # Struttura valida ma senza parti di testo (solo allegati)
+        return EmailBody()
+
+    if part is not None:
+        section = f'BODY[{part.section}]'
+        status, data = _fetch(mail, message_id, f'(BODY.PEEK[{part.section}])', uid)
+        if status == 'OK':
+            for items in parse_fetch_response(data).values():
+                payload = items.get(section)
+                if isinstance(payload, bytes):
+                    decoded = _decode_payload(_decode_transfer(payload, part.encoding), part.charset)
+                    return EmailBody(html=decoded) if part.subtype == 'html' else EmailBody(text=decoded)
+        logger.debug(f"Parte {part.section} del messaggio {message_id} non disponibile, scarico il messaggio completo")
+
+    status, data = _fetch(mail, message_id, '(BODY.PEEK[])', uid)
+    if status != 'OK':
+        return None
+    for items in parse_fetch_response(data).values():
+        payload = items.get('BODY[]')
+        if isinstance(payload, bytes):
+            return EmailBody.from_message(email.message_from_bytes(payload))
+    return None
@@ -0,0 +1,144 @@
+"""
+Notifiche push IMAP (RFC 2177, comando IDLE) su una connessione imaplib
+
+imaplib (fino a Python 3.13) non implementa IDLE. Il comando viene inviato
+direttamente sul socket e le risposte sono lette senza passare dal file
+bufferizzato di imaplib, con select(): così l'attesa può scadere senza
+lasciare la connessione in uno stato inconsistente e, dopo DONE, imaplib
+riprende a usarla normalmente per SEARCH, FETCH e STORE.
+
+wait_for_mail() ritorna appena il server segnala nuovi messaggi (EXISTS o
+RECENT) o allo scadere del timeout; il chiamante poi cerca le email UNSEEN
+come nel polling. I server chiudono le sessioni IDLE dopo 30 minuti di
+inattività: il timeout deve restare sotto questa soglia.
+"""
+import logging
+import re
+import select
+import time
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+# Massimo consigliato dalla RFC 2177 per una singola sessione IDLE
+MAX_IDLE_SECONDS = 29 * 60
+
+NEW_MAIL_RE = re.compile(rb'^\* ([1-9]\d*) (EXISTS|RECENT)\b', re.IGNORECASE)
+
+# Attesa massima della conferma del server all'avvio e alla fine di IDLE
+RESPONSE_TIMEOUT = 30
+
+
+class IdleError(Exception):
+    """Sessione IDLE fallita: la connessione va chiusa e riaperta"""
+
+
+def supports_idle(mail) -> bool:
+    """True se il server dichiara la capability IDLE"""
+    return 'IDLE' in getattr(mail, 'capabilities', ())
+
+
+def has_pending_mail(mail) -> bool:
+    """
+    NOOP e controllo delle risposte non richieste già ricevute da imaplib
+
+    Svuota anche il buffer di imaplib, che durante IDLE non viene letto.
+    """
+    mail.noop()
+    for kind in ('EXISTS', 'RECENT'):
+        _, data = mail._untagged_response('OK', [None], kind)
+        if any(value and value != b'0' for value in data):
+            return True
+    return False
+
+
+class _LineReader:
+    """Righe di risposta lette direttamente dal socket, con scadenza"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = b''
+
+    def _readable(self, timeout: float) -> bool:
+        # Il socket SSL può avere dati già decifrati che select() non vede
+        pending = getattr(self.sock, 'pending', None)
+        if pending and pending():
+            return True
+        readable, _, _ = select.select([self.sock], [], [], max(timeout, 0))
+        return bool(readable)
+
+    def lines(self, deadline: float) -> List[bytes]:
+        """Righe complete arrivate entro deadline (lista vuota se scade)"""
+        while b'\r\n' not in self.buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._readable(remaining):
+                return []
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                raise IdleError("Connessione chiusa dal server")
+            self.buffer += chunk
+        *complete, self.buffer = self.buffer.split(b'\r\n')
+        return complete
+
+
+def wait_for_mail(mail, timeout: float) -> bool:
+    """
+    Attende in IDLE fino a timeout secondi l'arrivo di nuovi messaggi
+
+    Args:
+        mail: Connessione imaplib autenticata con una mailbox selezionata
+        timeout: Attesa massima, limitata a MAX_IDLE_SECONDS
+
+    Returns:
+        True se il server ha segnalato nuovi messaggi, False se l'attesa è scaduta
+
+    Raises:
+        IdleError: Il server rifiuta IDLE o la connessione cade
+    """
+    timeout = min(timeout, MAX_IDLE_SECONDS)
+    tag = mail._new_tag()
+    reader = _LineReader(mail.sock)
+    mail.send(tag + b' IDLE\r\n')
+
+    # Attesa della continuazione "+ idling"
+    deadline = time.monotonic() + RESPONSE_TIMEOUT
+    started = False
+    new_mail = False
+    while not started:
+        lines = reader.lines(deadline)
+        if not lines:
+            raise IdleError("Nessuna risposta del server al comando IDLE")
+        for line in lines:
+            if line.startswith(b'+'):
+                started = True
+            elif line.startswith(tag):
+                raise IdleError(f"IDLE rifiutato: {line.decode(errors='replace')}")
+            elif NEW_MAIL_RE.match(line):
+                new_mail = True
+
+    # Notifiche fino al primo nuovo messaggio o alla scadenza
+    deadline = time.monotonic() + timeout
+    while not new_mail:
+        lines = reader.lines(deadline)
+        if not lines:
+            break
+        for line in lines:
+            if line.upper().startswith(b'* BYE'):
+                raise IdleError(f"Il server ha chiuso la sessione: {line.decode(errors='replace')}")
+            if NEW_MAIL_RE.match(line):
+                new_mail = True
+
+    # Fine IDLE: le risposte fino a quella con il nostro tag
+    mail.send(b'DONE\r\n')
+    deadline = time.monotonic() + RESPONSE_TIMEOUT
+    while True:
+        lines = reader.lines(deadline)
+        if not lines:
+            raise IdleError("Nessuna conferma del server alla fine di IDLE")
+        for line in lines:
+            if line.startswith(tag):
+                if line[len(tag):].split()[:1] != [b'OK']:
+                    raise IdleError(f"IDLE terminato con errore: {line.decode(errors='replace')}")
+                return new_mail
+            if NEW_MAIL_RE.match(line):
+                new_mail = True
@@ -0,0 +1,123 @@
+"""
+Sincronizzazione incrementale di una casella IMAP per UID
+
+Il flag \\Seen non è un buon cursore: una email aperta da un client di posta
+non risulta più UNSEEN e viene persa, e prendere solo gli ultimi N messaggi
+non smaltisce mai un arretrato. Qui il cursore è l'ultimo UID elaborato,
+valido finché la casella mantiene lo stesso UIDVALIDITY (RFC 3501, 2.3.1.1),
+salvato in StatoPersistente:
+
+- i nuovi messaggi sono quelli con UID maggiore del cursore, in ordine
+- il monitor avanza il cursore solo dopo aver elaborato i messaggi
+  (acknowledge): dopo un crash i messaggi vengono riletti e scartati dal
+  controllo dei duplicati sulla fonte, quindi ogni email produce un solo articolo
+- alla prima sincronizzazione, o se UIDVALIDITY cambia, si riparte dalle
+  email UNSEEN esistenti (bootstrap_until) come faceva il polling
+"""
+import logging
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def cursor_key(email_address: str, server: str, mailbox: str) -> str:
+    return f"imap:{email_address}@{server}/{mailbox}"
+
+
+def mailbox_status(mail) -> Tuple[Optional[int], Optional[int]]:
+    """UIDVALIDITY e UIDNEXT dalle risposte al SELECT (None se il server non li ha inviati)"""
+    values = []
+    for code in ('UIDVALIDITY', 'UIDNEXT'):
+        _, data = mail.response(code)
+        value = data[-1] if data else None
+        values.append(int(value) if value and value.isdigit() else None)
+    return values[0], values[1]
+
+
+def uid_set(uids: Iterable[int]) -> bytes:
+    """Sequence set compatto di UID ordinati: [1, 2, 3, 7] -> b'1:3,7'"""
+    ranges = []
+    for uid in sorted(set(uids)):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ','.join(f'{a}:{b}' if a != b else f'{a}' for a, b in ranges).encode()
+
+
+def search_uids(mail, *criteria: str) -> List[int]:
+    status, data = mail.uid('SEARCH', None, *criteria)
+    if status != 'OK' or not data or not data[0]:
+        return []
+    return sorted(int(uid) for uid in data[0].split())
+
+
+class MailboxCursor:
+    """Ultimo UID elaborato di una casella, persistito in StatoPersistente"""
+
+    def __init__(self, key: str, uidvalidity: Optional[int] = None, last_uid: int = 0,
+                 bootstrap_until: Optional[int] = None):
+        self.key = key
+        self.uidvalidity = uidvalidity
+        self.last_uid = last_uid
+        self.bootstrap_until = bootstrap_until
+
+    @classmethod
+    def load(cls, key: str) -> 'MailboxCursor':
+        from .models import StatoPersistente
+
+        stato = StatoPersistente.objects.filter(chiave=key).first()
+        valore = stato.valore if stato else {}
+        return cls(
+            key,
+            uidvalidity=valore.get('uidvalidity'),
+            last_uid=valore.get('last_uid', 0),
+            bootstrap_until=valore.get('bootstrap_until'),
+        )
+
+    def save(self):
+        from .models import StatoPersistente
+
+        StatoPersistente.objects.update_or_create(chiave=self.key, defaults={'valore': {
+            'uidvalidity': self.uidvalidity,
+            'last_uid': self.last_uid,
+            'bootstrap_until': self.bootstrap_until,
+        }})
+
+    def for_mailbox(self, mail, uidvalidity: Optional[int], uidnext: Optional[int]) -> 'MailboxCursor':
+        """
+        Il cursore se valido per la casella selezionata, altrimenti un nuovo
+        cursore di bootstrap (non ancora salvato)
+        """
+        if uidvalidity is not None and self.uidvalidity == uidvalidity:
+            return self
+
+        if self.uidvalidity is not None:
+            logger.warning(f"UIDVALIDITY cambiato per {self.key} ({self.uidvalidity} -> {uidvalidity}), "
+                           f"ripartenza dalle email non lette")
+        if uidnext is not None:
+            highest = uidnext - 1
+        else:
+            uids = search_uids(mail, 'ALL')
+            highest = uids[-1] if uids else 0
+        return MailboxCursor(self.key, uidvalidity, last_uid=0, bootstrap_until=highest)
+
+    def pending_uids(self, mail) -> List[int]:
+        """UID da elaborare, in ordine crescente"""
+        uids = []
+        start = self.last_uid + 1
+        if self.bootstrap_until and start <= self.bootstrap_until:
+            # Messaggi già presenti alla prima sincronizzazione: solo quelli non letti
+            uids.extend(search_uids(mail, 'UID', f'{start}:{self.bootstrap_until}', 'UNSEEN'))
+            start = self.bootstrap_until + 1
+        # "n:*" include sempre l'ultimo UID della casella, anche se minore di n
+        uids.extend(uid for uid in search_uids(mail, 'UID', f'{start}:*') if uid >= start)
+        return uids
+
+    def advanced(self, uid: int) -> 'MailboxCursor':
+        """Copia del cursore dopo l'elaborazione dei messaggi fino a uid compreso"""
+        last_uid = max(self.last_uid, uid)
+        bootstrap_until = self.bootstrap_until
+        if bootstrap_until is not None and last_uid >= bootstrap_until:
+            bootstrap_until = None
+        return MailboxCursor(self.key, self.uidvalidity, last_uid, bootstrap_until)
@@ -0,0 +1,472 @@
+"""
+Coda di lavori persistente su database con pool di worker
+
+Permette di spostare fuori dal salvataggio degli articoli le operazioni lente
+(email, Telegram, rigenerazione feed) senza un broker esterno:
+
+- enqueue() inserisce un Job nel database nella stessa transazione del chiamante,
+  quindi il lavoro esiste se e solo se il salvataggio che lo ha generato è confermato
+- i worker prendono in carico i lavori con un UPDATE condizionato, quindi più
+  processi (gunicorn, monitor, comando run_job_workers) possono condividere la coda
+- i pool di worker partono solo nel comando run_job_workers e nel processo dei
+  monitor (start_all_pools); i processi web accodano soltanto, salvo AUTOSTART
+- i lavori falliti vengono ritentati con backoff esponenziale fino a max_tentativi
+- i lavori rimasti "in corso" oltre LEASE_TIMEOUT (worker morto) tornano in coda;
+  mentre l'handler è in esecuzione un heartbeat rinnova il lease ogni
+  LEASE_TIMEOUT/3 secondi, quindi un lavoro lungo (generazione AI) non viene
+  ripreso da un altro worker finché il suo worker è vivo
+- oltre MAX_PENDING lavori in attesa enqueue() solleva QueueFull; dispatch()
+  in quel caso salva comunque il lavoro, segnalando la coda piena nel log
+- la deduplica per chiave è garantita dal database: al massimo un lavoro in
+  attesa e uno in corso per chiave (vincoli unici condizionati sullo stato),
+  quindi due processi non accodano né eseguono insieme lo stesso lavoro
+- ogni tipo di lavoro appartiene a una coda con il proprio pool di worker, così
+  i lavori lenti (generazione AI) non bloccano quelli rapidi (email, feed)
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'WORKERS': 2,
+    'MAX_PENDING': 500,
+    'POLL_INTERVAL': 5,
+    'LEASE_TIMEOUT': 600,
+    'BACKOFF_BASE': 30,
+    'BACKOFF_MAX': 3600,
+    'RETENTION_DAYS': 7,
+    'AUTOSTART': False,
+}
+
+CODA_DEFAULT = 'default'
+
+# Handler registrati: tipo -> callable(payload), e coda di appartenenza del tipo
+_handlers: Dict[str, Callable[[dict], None]] = {}
+_handler_queues: Dict[str, str] = {}
+
+
+class QueueFull(Exception):
+    """La coda ha raggiunto il numero massimo di lavori in attesa"""
+
+
+def get_queue_setting(name: str):
+    """Legge un'impostazione da settings.JOB_QUEUE con fallback ai default"""
+    return getattr(settings, 'JOB_QUEUE', {}).get(name, DEFAULT_SETTINGS[name])
+
+
+def get_queue_workers(coda: str) -> int:
+    """Numero di worker per una coda (JOB_QUEUE['QUEUES'][coda]['WORKERS'])"""
+    queues = getattr(settings, 'JOB_QUEUE', {}).get('QUEUES', {})
+    return queues.get(coda, {}).get('WORKERS', get_queue_setting('WORKERS'))
+
+
+def register_handler(tipo: str, coda: str = CODA_DEFAULT):
+    """
+    Decoratore che registra l'handler per un tipo di lavoro
+
+    L'handler riceve il payload e deve sollevare un'eccezione per richiedere
+    un nuovo tentativo. I lavori del tipo vengono eseguiti dal pool della coda.
+    """
+    def decorator(func):
+        _handlers[tipo] = func
+        _handler_queues[tipo] = coda
+        return func
+    return decorator
+
+
+def get_handler(tipo: str) -> Optional[Callable[[dict], None]]:
+    return _handlers.get(tipo)
+
+
+def enqueue(tipo: str, payload: dict = None, priorita: int = 0, chiave: str = None,
+            ritardo: int = 0, max_tentativi: int = None, dedup_in_corso: bool = False,
+            oltre_limite: bool = False):
+    """
+    Inserisce un lavoro in coda
+
+    Args:
+        tipo: Tipo di lavoro (deve avere un handler registrato)
+        payload: Dati serializzabili in JSON passati all'handler
+        priorita: Priorità (più alta = eseguito prima)
+        chiave: Chiave di deduplica: se esiste già un lavoro in attesa con la
+                stessa chiave non ne viene creato un altro (il lavoro in attesa
+                leggerà comunque lo stato aggiornato quando verrà eseguito)
+        dedup_in_corso: Considera duplicati anche i lavori in corso con la stessa
+                chiave (per lavori non idempotenti o costosi come la generazione AI)
+        ritardo: Secondi prima che il lavoro diventi eseguibile
+        max_tentativi: Numero massimo di tentativi (default del modello se None)
+        oltre_limite: Salva il lavoro anche se la coda ha superato MAX_PENDING
+
+    Returns:
+        Job creato (o quello esistente con la stessa chiave)
+
+    Raises:
+        QueueFull: se i lavori in attesa nella coda superano MAX_PENDING (e non oltre_limite)
+    """
+    from .models import Job
+
+    if tipo not in _handlers:
+        raise ValueError(f"Nessun handler registrato per il tipo di lavoro '{tipo}'")
+
+    coda = _handler_queues[tipo]
+
+    if chiave:
+        stati = [Job.STATO_IN_ATTESA, Job.STATO_IN_CORSO] if dedup_in_corso else [Job.STATO_IN_ATTESA]
+        existing = Job.objects.filter(chiave=chiave, stato__in=stati).first()
+        if existing:
+            logger.debug(f"Lavoro {tipo} con chiave '{chiave}' già in coda (#{existing.pk})")
+            return existing
+
+    pending = Job.objects.filter(coda=coda, stato=Job.STATO_IN_ATTESA).count()
+    if pending >= get_queue_setting('MAX_PENDING') and not oltre_limite:
+        raise QueueFull(f"Coda '{coda}' piena: {pending} lavori in attesa")
+
+    fields = {
+        'tipo': tipo,
+        'coda': coda,
+        'payload': payload or {},
+        'priorita': priorita,
+        'chiave': chiave,
+        'disponibile_da': timezone.now() + timedelta(seconds=ritardo),
+    }
+    if max_tentativi is not None:
+        fields['max_tentativi'] = max_tentativi
+    try:
+        with transaction.atomic():
+            job = Job.objects.create(**fields)
+    except IntegrityError:
+        # Un altro processo ha accodato nel frattempo un lavoro con la stessa chiave
+        existing = Job.objects.filter(chiave=chiave, stato=Job.STATO_IN_ATTESA).first() if chiave else None
+        if existing is None:
+            raise
+        logger.debug(f"Lavoro {tipo} con chiave '{chiave}' accodato in parallelo (#{existing.pk})")
+        return existing
+
+    pool = get_worker_pool(coda)
+    if get_queue_setting('AUTOSTART'):
+        pool.start()
+    # Il lavoro è visibile ai worker solo dopo il commit della transazione corrente
+    transaction.on_commit(pool.wake)
+    return job
+
+
+def dispatch(tipo: str, payload: dict = None, **kwargs):
+    """
+    Accoda un lavoro anche se la coda ha superato MAX_PENDING
+
+    È il punto di ingresso da usare nei segnali e nei monitor: il lavoro è
+    sempre salvato (e quindi ritentato dai worker), mai eseguito nel thread
+    chiamante, dove una generazione AI bloccherebbe il polling. Una coda
+    piena viene solo segnalata nel log.
+    """
+    try:
+        return enqueue(tipo, payload, **kwargs)
+    except QueueFull as e:
+        logger.warning(f"{e} - accodo '{tipo}' oltre il limite")
+        return enqueue(tipo, payload, oltre_limite=True, **kwargs)
+
+
+def _backoff_seconds(tentativi: int) -> float:
+    """Backoff esponenziale con jitter: base * 2^(tentativi-1), limitato a BACKOFF_MAX"""
+    delay = min(get_queue_setting('BACKOFF_BASE') * (2 ** max(tentativi - 1, 0)), get_queue_setting('BACKOFF_MAX'))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_job(worker_id: str, coda: str = CODA_DEFAULT):
+    """
+    Prende in carico il prossimo lavoro eseguibile
+
+    La presa in carico usa un UPDATE condizionato sullo stato: se un altro
+    worker (anche in un altro processo) ha già preso il lavoro l'UPDATE non
+    modifica righe e si passa al candidato successivo. Anche un lavoro con la
+    stessa chiave di uno già in corso viene saltato (vincolo unico): partirà
+    quando l'altro è terminato.
+    """
+    from .models import Job
+
+    now = timezone.now()
+    candidates = list(
+        Job.objects.filter(coda=coda, stato=Job.STATO_IN_ATTESA, disponibile_da__lte=now)
+        .order_by('-priorita', 'disponibile_da', 'pk')
+        .values_list('pk', flat=True)[:10]
+    )
+    for job_id in candidates:
+        try:
+            with transaction.atomic():
+                claimed = Job.objects.filter(pk=job_id, stato=Job.STATO_IN_ATTESA).update(
+                    stato=Job.STATO_IN_CORSO,
+                    bloccato_da=worker_id,
+                    bloccato_il=now,
+                    tentativi=F('tentativi') + 1,
+                    data_aggiornamento=now,
+                )
+        except IntegrityError:
+            continue
+        if claimed:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+class LeaseHeartbeat:
+    """
+    Rinnova bloccato_il di un lavoro in corso finché l'handler è in esecuzione
+
+    Il thread scrive solo se il lavoro è ancora di questo worker: se il lease
+    è già scaduto ed è stato ripreso da un altro worker, lo segnala (lost)
+    e si ferma.
+    """
+
+    def __init__(self, job_id: int, worker_id: str, interval: float = None):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.interval = interval or max(get_queue_setting('LEASE_TIMEOUT') / 3, 1)
+        self.lost = False
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        from .models import Job
+
+        try:
+            while not self._stop_event.wait(self.interval):
+                now = timezone.now()
+                renewed = Job.objects.filter(
+                    pk=self.job_id, stato=Job.STATO_IN_CORSO, bloccato_da=self.worker_id,
+                ).update(bloccato_il=now, data_aggiornamento=now)
+                if not renewed:
+                    self.lost = True
+                    logger.warning(f"Lease del lavoro #{self.job_id} perso dal worker {self.worker_id}")
+                    break
+        except Exception as e:
+            logger.error(f"Errore nel rinnovo del lease del lavoro #{self.job_id}: {e}")
+        finally:
+            connection.close()
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name=f"job-lease-{self.job_id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop_event.set()
+        self._thread.join(timeout=self.interval)
+        return False
+
+
+def run_job(job, worker_id: str) -> bool:
+    """
+    Esegue un lavoro già preso in carico e ne registra l'esito
+
+    Returns:
+        True se il lavoro è stato completato
+    """
+    from .models import Job
+
+    handler = _handlers.get(job.tipo)
+    now = timezone.now()
+    mine = Job.objects.filter(pk=job.pk, stato=Job.STATO_IN_CORSO, bloccato_da=worker_id)
+
+    if handler is None:
+        logger.error(f"Nessun handler per il lavoro {job}")
+        mine.update(stato=Job.STATO_FALLITO, ultimo_errore="Handler non registrato",
+                    bloccato_da=None, bloccato_il=None, data_aggiornamento=now)
+        return False
+
+    try:
+        with LeaseHeartbeat(job.pk, worker_id):
+            handler(job.payload or {})
+    except Exception as e:
+        error = f"{e}\n{traceback.format_exc()}"
+        now = timezone.now()
+        if job.tentativi >= job.max_tentativi:
+            logger.error(f"Lavoro {job} fallito definitivamente dopo {job.tentativi} tentativi: {e}")
+            updated = mine.update(stato=Job.STATO_FALLITO, ultimo_errore=error,
+                                  bloccato_da=None, bloccato_il=None, data_aggiornamento=now)
+        else:
+            delay = _backoff_seconds(job.tentativi)
+            logger.warning(f"Lavoro {job} fallito (tentativo {job.tentativi}/{job.max_tentativi}), nuovo tentativo tra {delay:.0f}s: {e}")
+            updated = _requeue(mine, error, now, disponibile_da=now + timedelta(seconds=delay))
+        if not updated:
+            logger.warning(f"Esito del lavoro {job} non registrato: lease non più di {worker_id}")
+        return False
+
+    if not mine.update(stato=Job.STATO_COMPLETATO, bloccato_da=None, bloccato_il=None,
+                       data_aggiornamento=timezone.now()):
+        # Il lavoro è stato ripreso da un altro worker: il suo esito prevale
+        logger.warning(f"Lavoro {job} completato ma non registrato: lease non più di {worker_id}")
+        return False
+    return True
+
+
+def _requeue(queryset, error: str, now, **fields) -> int:
+    """
+    Rimette in attesa un lavoro in corso
+
+    Se con la stessa chiave c'è già un lavoro in attesa (vincolo unico) sarà
+    quello a ripetere il lavoro: questo viene chiuso come fallito.
+    """
+    from .models import Job
+
+    try:
+        with transaction.atomic():
+            return queryset.update(stato=Job.STATO_IN_ATTESA, ultimo_errore=error,
+                                   bloccato_da=None, bloccato_il=None, data_aggiornamento=now, **fields)
+    except IntegrityError:
+        return queryset.update(stato=Job.STATO_FALLITO,
+                               ultimo_errore=f"{error}\nSostituito dal lavoro in attesa con la stessa chiave",
+                               bloccato_da=None, bloccato_il=None, data_aggiornamento=now)
+
+
+def reclaim_expired_jobs() -> int:
+    """Rimette in coda i lavori il cui worker non ha risposto entro LEASE_TIMEOUT"""
+    from .models import Job
+
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=get_queue_setting('LEASE_TIMEOUT'))
+    reclaimed = 0
+    expired = Job.objects.filter(stato=Job.STATO_IN_CORSO, bloccato_il__lt=cutoff)
+    for job_id in expired.values_list('pk', flat=True):
+        reclaimed += _requeue(expired.filter(pk=job_id), "Lease scaduto: worker non più attivo", now)
+    if reclaimed:
+        logger.warning(f"Rimessi in coda {reclaimed} lavori con lease scaduto")
+    return reclaimed
+
+
+def purge_finished_jobs() -> int:
+    """Elimina i lavori completati più vecchi di RETENTION_DAYS"""
+    from .models import Job
+
+    cutoff = timezone.now() - timedelta(days=get_queue_setting('RETENTION_DAYS'))
+    deleted, _ = Job.objects.filter(stato=Job.STATO_COMPLETATO, data_aggiornamento__lt=cutoff).delete()
+    return deleted
+
+
+class JobWorkerPool:
+    """Pool di thread che eseguono i lavori di una coda"""
+
+    MAINTENANCE_INTERVAL = 60
+
+    def __init__(self, coda: str = CODA_DEFAULT, workers: int = None):
+        self.coda = coda
+        self.workers = workers
+        self.threads = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._last_maintenance = 0.0
+        self.id_prefix = f"{socket.gethostname()}:{os.getpid()}:{coda}"
+
+    @property
+    def is_running(self) -> bool:
+        return any(thread.is_alive() for thread in self.threads)
+
+    def start(self):
+        """Avvia i worker (idempotente)"""
+        with self._lock:
+            if self.is_running:
+                return
+            self._stop_event.clear()
+            worker_count = self.workers or get_queue_workers(self.coda)
+            self.threads = []
+            for index in range(worker_count):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    args=(f"{self.id_prefix}:{index}",),
+                    name=f"job-worker-{self.coda}-{index}",
+                    daemon=True,
+                )
+                thread.start()
+                self.threads.append(thread)
+            logger.info(f"Pool lavori '{self.coda}' avviato con {worker_count} worker")
+
+    def stop(self, timeout: float = 10):
+        """Ferma i worker al termine del lavoro corrente"""
+        self._stop_event.set()
+        self._wake_event.set()
+        for thread in self.threads:
+            thread.join(timeout=timeout)
+        self.threads = []
+        logger.info(f"Pool lavori '{self.coda}' fermato")
+
+    def wake(self):
+        """Sveglia i worker in attesa (chiamato dopo enqueue)"""
+        self._wake_event.set()
+
+    def _maintenance(self):
+        now = time.monotonic()
+        if now - self._last_maintenance < self.MAINTENANCE_INTERVAL:
+            return
+        self._last_maintenance = now
+        reclaim_expired_jobs()
+        purge_finished_jobs()
+
+    def run_pending(self, worker_id: str = None) -> int:
+        """Esegue tutti i lavori eseguibili in questo thread e restituisce quanti"""
+        worker_id = worker_id or f"{self.id_prefix}:sync"
+        processed = 0
+        while not self._stop_event.is_set():
+            job = claim_job(worker_id, self.coda)
+            if job is None:
+                break
+            run_job(job, worker_id)
+            processed += 1
+        return processed
+
+    def _worker_loop(self, worker_id: str):
+        poll_interval = get_queue_setting('POLL_INTERVAL')
+        try:
+            while not self._stop_event.is_set():
+                close_old_connections()
+                try:
+                    self._maintenance()
+                    processed = self.run_pending(worker_id)
+                except Exception as e:
+                    logger.error(f"Errore nel worker {worker_id}: {e}")
+                    processed = 0
+
+                if not processed:
+                    self._wake_event.wait(poll_interval)
+                    self._wake_event.clear()
+        finally:
+            connection.close()
+
+
+# Pool per coda nel processo corrente
+_pools: Dict[str, JobWorkerPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_worker_pool(coda: str = CODA_DEFAULT) -> JobWorkerPool:
+    """Restituisce (creandolo se serve) il pool di worker di una coda"""
+    with _pools_lock:
+        if coda not in _pools:
+            _pools[coda] = JobWorkerPool(coda)
+        return _pools[coda]
+
+
+def get_registered_queues():
+    """Code che hanno almeno un handler registrato"""
+    return sorted(set(_handler_queues.values()))
+
+
+def start_all_pools():
+    """Avvia i pool di tutte le code con handler registrati"""
+    for coda in get_registered_queues():
+        get_worker_pool(coda).start()
+
+
+# Istanza globale del pool della coda di default
+worker_pool = get_worker_pool(CODA_DEFAULT)
@@ -0,0 +1,133 @@
+"""
+Handler dei lavori in background eseguiti dalla coda (vedi job_queue)
+
+Ogni handler riceve il payload del lavoro e solleva un'eccezione per chiedere
+un nuovo tentativo con backoff.
+"""
+import logging
+
+from django.utils.dateparse import parse_datetime
+
+from .job_queue import register_handler
+from .models import Articolo
+
+logger = logging.getLogger(__name__)
+
+# Tipi di lavoro
+NOTIFICA_EMAIL = 'notifica_email'
+CONDIVIDI_SOCIAL = 'condividi_social'
+RIGENERA_FEED = 'rigenera_feed'
+RIGENERA_SITEMAP = 'rigenera_sitemap'
+VERIFICA_IMMAGINE = 'verifica_immagine'
+GENERA_ARTICOLO = 'genera_articolo'
+PREPARA_BATCH = 'prepara_batch'
+INVIA_BATCH = 'invia_batch'
+CONTROLLA_BATCH = 'controlla_batch'
+
+# Coda con pool dedicato per i lavori lenti di generazione AI
+CODA_AI = 'ai'
+
+
+@register_handler(NOTIFICA_EMAIL)
+def notifica_email(payload):
+    """Invia l'email di notifica per un nuovo articolo da approvare"""
+    from .email_notifications import send_article_approval_notification
+
+    try:
+        articolo = Articolo.objects.get(pk=payload['articolo_id'])
+    except Articolo.DoesNotExist:
+        logger.warning(f"Articolo ID {payload['articolo_id']} eliminato, notifica email annullata")
+        return
+
+    if articolo.approvato:
+        logger.info(f"Articolo ID {articolo.id} già approvato, notifica email non necessaria")
+        return
+
+    if not send_article_approval_notification(articolo):
+        raise RuntimeError(f"Invio notifica email fallito per articolo ID {articolo.id}")
+    logger.info(f"Notifica email inviata per articolo ID {articolo.id}")
+
+
+@register_handler(CONDIVIDI_SOCIAL)
+def condividi_social(payload):
+    """Condivide sui social un articolo appena approvato"""
+    from .social_sharing import social_manager
+
+    try:
+        articolo = Articolo.objects.get(pk=payload['articolo_id'])
+    except Articolo.DoesNotExist:
+        logger.error(f"Articolo con ID {payload['articolo_id']} non trovato durante condivisione")
+        return
+
+    # Verifica che sia ancora approvato (potrebbe essere stato ritirato nel frattempo)
+    if not articolo.approvato:
+        logger.warning(f"Articolo {articolo.titolo} non più approvato, annullo condivisione")
+        return
+
+    results = social_manager.share_article_on_approval(articolo)
+
+    successful_platforms = [platform for platform, success in results.items() if success]
+    failed_platforms = [platform for platform, success in results.items() if not success]
+
+    if successful_platforms:
+        logger.info(f"Condivisione completata con successo per '{articolo.titolo}' su: {', '.join(successful_platforms)}")
+
+    if failed_platforms:
+        raise RuntimeError(f"Condivisione fallita per '{articolo.titolo}' su: {', '.join(failed_platforms)}")
+
+
+@register_handler(RIGENERA_FEED)
+def rigenera_feed(payload):
+    """Rigenera i feed RSS/Atom pre-renderizzati"""
+    from .feeds import regenerate_feeds
+    regenerate_feeds()
+    logger.info("Feed RSS rigenerati per aggiornamento immediato")
+
+
+@register_handler(RIGENERA_SITEMAP)
+def rigenera_sitemap(payload):
+    """Rigenera le sitemap dei mesi indicati (date ISO nel payload), news e indice"""
+    from .sitemaps import regenerate_sitemaps
+    dates = [parse_datetime(value) for value in payload.get('date', []) if value]
+    regenerate_sitemaps(dates)
+    logger.info("Sitemap rigenerate")
+
+
+@register_handler(VERIFICA_IMMAGINE)
+def verifica_immagine(payload):
+    """Verifica l'immagine di un articolo e ne salva esito e metadati"""
+    from .image_health import verify_article_image
+
+    verify_article_image(payload['articolo_id'])
+
+
+@register_handler(GENERA_ARTICOLO, coda=CODA_AI)
+def genera_articolo(payload):
+    """Genera con AI l'articolo di una notizia trovata da un monitor"""
+    from .universal_news_monitor import UniversalNewsMonitor
+
+    monitor = UniversalNewsMonitor.get_for_config(payload['config'])
+    monitor.generate_queued_article(payload['article_data'])
+
+
+@register_handler(PREPARA_BATCH, coda=CODA_AI)
+def prepara_batch(payload):
+    """Condensa la trascrizione di un video e ne registra la generazione differita in batch"""
+    from .universal_news_monitor import UniversalNewsMonitor
+
+    monitor = UniversalNewsMonitor.get_for_config(payload['config'])
+    monitor.queue_batch_request(payload['article_data'])
+
+
+@register_handler(INVIA_BATCH)
+def invia_batch(payload):
+    """Invia in un batch le generazioni AI differite in attesa"""
+    from .ai_batch import submit_pending
+    submit_pending()
+
+
+@register_handler(CONTROLLA_BATCH)
+def controlla_batch(payload):
+    """Controlla un batch inviato e salva gli articoli quando è terminato"""
+    from .ai_batch import check_batch
+    check_batch(payload['batch_id'])
@@ -0,0 +1,152 @@
+"""
+Risoluzione concorrente dei link con limiti per dominio
+
+Le email (tweet via IFTTT, comunicati) contengono link accorciati t.co e link
+a pagine esterne da scaricare. Risolverli uno alla volta con HEAD/GET seriali
+rende un controllo IMAP lento quanto la somma di tutte le richieste. Qui:
+
+- HostLimiter limita le richieste contemporanee e la frequenza per dominio,
+  così la concorrenza non si traduce in raffiche verso lo stesso sito
+- expand() risolve gli URL brevi e salva la destinazione nella cache
+  persistente: un t.co punta sempre allo stesso URL, quindi la risoluzione
+  vale per tutti i processi e sopravvive ai riavvii
+- map_concurrent() esegue una funzione su più URL in parallelo mantenendo
+  l'ordine dei risultati
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, TypeVar
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'WORKERS': 6,
+    'PER_HOST': 2,
+    'MIN_DELAY': 0.2,
+    'EXPAND_TTL': 90 * 24 * 3600,
+    'TIMEOUT': 10,
+}
+
+# Namespace della cache persistente per gli URL brevi risolti
+SHORT_URL_NAMESPACE = 'url_brevi'
+
+T = TypeVar('T')
+
+
+def get_resolver_setting(name: str):
+    """Legge un'impostazione da settings.LINK_RESOLVER con fallback ai default"""
+    return getattr(settings, 'LINK_RESOLVER', {}).get(name, DEFAULT_SETTINGS[name])
+
+
+class HostLimiter:
+    """Richieste contemporanee e intervallo minimo per host; thread-safe"""
+
+    def __init__(self, per_host: int, min_delay: float):
+        self.per_host = per_host
+        self.min_delay = min_delay
+        self._lock = threading.Lock()
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._next_slot: Dict[str, float] = {}
+
+    def _wait_turn(self, host: str):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, 0.0))
+            self._next_slot[host] = slot + self.min_delay
+        if slot > now:
+            time.sleep(slot - now)
+
+    @contextmanager
+    def slot(self, url: str):
+        """Contesto per una richiesta verso l'host di `url`"""
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = self._semaphores[host] = threading.BoundedSemaphore(self.per_host)
+        with semaphore:
+            self._wait_turn(host)
+            yield
+
+
+class LinkResolver:
+    """Espansione di URL brevi con cache e download concorrenti limitati per dominio"""
+
+    def __init__(self, workers: int, per_host: int, min_delay: float, expand_ttl: int, timeout: int):
+        self.workers = workers
+        self.expand_ttl = expand_ttl
+        self.timeout = timeout
+        self.hosts = HostLimiter(per_host, min_delay)
+
+    def expand(self, short_url: str) -> Optional[str]:
+        """URL finale di un link accorciato (t.co e simili), dalla cache se già risolto"""
+        from .persistent_cache import get_cache
+
+        cached = get_cache().get(SHORT_URL_NAMESPACE, short_url)
+        if cached is not None:
+            return cached
+
+        try:
+            with self.hosts.slot(short_url):
+                response = requests.head(short_url, allow_redirects=True, timeout=self.timeout)
+            final_url = response.url
+        except Exception as e:
+            logger.debug(f"Errore espansione URL {short_url}: {e}")
+            return None
+
+        if final_url and final_url != short_url:
+            get_cache().set(SHORT_URL_NAMESPACE, short_url, final_url, ttl=self.expand_ttl)
+        return final_url
+
+    def expand_many(self, short_urls: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Espande più URL brevi in parallelo: {url breve: url finale o None}"""
+        urls = list(dict.fromkeys(short_urls))
+        return dict(zip(urls, self.map_concurrent(self.expand, urls)))
+
+    def map_concurrent(self, func: Callable[[str], T], urls: List[str]) -> List[Optional[T]]:
+        """
+        Esegue func(url) per ogni URL in parallelo, con i limiti per dominio
+
+        func deve usare self.hosts.slot() per le proprie richieste (expand lo fa
+        già). Le eccezioni diventano None; l'ordine dei risultati è quello degli URL.
+        """
+        if not urls:
+            return []
+
+        def run(url):
+            try:
+                return func(url)
+            except Exception as e:
+                logger.warning(f"Errore risoluzione link {url}: {e}")
+                return None
+
+        if len(urls) == 1:
+            return [run(urls[0])]
+        with ThreadPoolExecutor(max_workers=min(len(urls), self.workers), thread_name_prefix='link') as executor:
+            return list(executor.map(run, urls))
+
+
+_resolver: Optional[LinkResolver] = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver() -> LinkResolver:
+    """Resolver del processo, condiviso da tutti gli scraper email"""
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = LinkResolver(
+                workers=get_resolver_setting('WORKERS'),
+                per_host=get_resolver_setting('PER_HOST'),
+                min_delay=get_resolver_setting('MIN_DELAY'),
+                expand_ttl=get_resolver_setting('EXPAND_TTL'),
+                timeout=get_resolver_setting('TIMEOUT'),
+            )
+        return _resolver
@@ -0,0 +1,429 @@
+"""
+Gateway condiviso verso l'API Anthropic
+
+Tutte le chiamate a Claude del processo (monitor, rigenerazione da admin,
+editoriale, trascrizioni) passano da qui invece di creare un client per chiamata:
+
+- un client Anthropic per API key, riusato tra i thread (connessioni HTTP in pool)
+- un semaforo globale limita le richieste contemporanee (MAX_CONCURRENCY)
+- un token bucket limita i token al minuto (TOKENS_PER_MINUTE): le richieste
+  attendono il proprio turno invece di andare in 429
+- su 429/529 l'attesa indicata da retry-after viene applicata a tutto il
+  gateway, così i thread in coda non ritentano in contemporanea
+- stream_message() riceve la risposta in streaming con gli stessi limiti
+- prompt caching opzionale (cache=True): breakpoint su system prompt, tool e
+  ultimo messaggio, con conteggio di hit/miss della cache
+- metriche di coda (in attesa, in corso, tempi di attesa, token) consultabili
+  con get_metrics() e riassunte periodicamente nel log
+
+I limiti valgono per processo: monitor e web hanno ciascuno il proprio gateway.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'MAX_CONCURRENCY': 4,
+    'TOKENS_PER_MINUTE': 40000,
+    'MAX_RETRIES': 4,
+    'BACKOFF_BASE': 5,
+    'BACKOFF_MAX': 120,
+    'TIMEOUT': 300,
+    'METRICS_LOG_INTERVAL': 300,
+}
+
+DEFAULT_MODEL = 'claude-sonnet-4-20250514'
+
+# Stima grossolana per il testo italiano; l'eccesso viene corretto con l'usage reale
+CHARS_PER_TOKEN = 3
+
+
+def get_gateway_setting(name: str):
+    """Legge un'impostazione da settings.LLM_GATEWAY con fallback ai default"""
+    return getattr(settings, 'LLM_GATEWAY', {}).get(name, DEFAULT_SETTINGS[name])
+
+
+_clients: Dict[str, object] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key: Optional[str] = None):
+    """
+    Restituisce il client Anthropic condiviso per una API key
+
+    I retry automatici dell'SDK sono disattivati: li gestisce il gateway,
+    che conosce lo stato di tutte le richieste del processo.
+    """
+    api_key = api_key or settings.ANTHROPIC_API_KEY
+    if not api_key:
+        raise ValueError("ANTHROPIC_API_KEY non configurata")
+
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            from anthropic import Anthropic
+            client = Anthropic(
+                api_key=api_key,
+                max_retries=0,
+                timeout=get_gateway_setting('TIMEOUT'),
+            )
+            _clients[api_key] = client
+        return client
+
+
+def estimate_tokens(**request) -> int:
+    """Stima i token di input di una richiesta (system, messaggi e tool)"""
+    parts = [request.get('system'), request.get('messages'), request.get('tools')]
+    size = sum(len(json.dumps(p, default=str, ensure_ascii=False)) for p in parts if p)
+    return max(1, size // CHARS_PER_TOKEN)
+
+
+CACHE_CONTROL = {'type': 'ephemeral'}
+
+
+def _with_cache_control(block):
+    """Copia di un blocco di contenuto con il breakpoint di cache"""
+    if isinstance(block, str):
+        return {'type': 'text', 'text': block, 'cache_control': CACHE_CONTROL}
+    if isinstance(block, dict):
+        return {**block, 'cache_control': CACHE_CONTROL}
+    # Blocchi dell'SDK (es. risposte assistant riusate nella conversazione)
+    if hasattr(block, 'model_dump'):
+        return {**block.model_dump(exclude_none=True), 'cache_control': CACHE_CONTROL}
+    return block
+
+
+def apply_prompt_cache(request: dict) -> dict:
+    """
+    Aggiunge i breakpoint di prompt caching a una richiesta messages.create
+
+    Il prefisso tool + system viene messo in cache alla prima chiamata e riletto
+    dalle successive (stessa configurazione o iterazioni dei tool); il breakpoint
+    sull'ultimo messaggio permette a ogni iterazione di riusare la conversazione
+    precedente. La richiesta originale non viene modificata, così i breakpoint
+    non si accumulano oltre il limite di 4 tra un'iterazione e l'altra.
+    """
+    request = dict(request)
+
+    system = request.get('system')
+    if isinstance(system, str) and system:
+        request['system'] = [_with_cache_control(system)]
+    elif isinstance(system, list) and system:
+        request['system'] = system[:-1] + [_with_cache_control(system[-1])]
+
+    tools = request.get('tools')
+    if tools:
+        request['tools'] = list(tools[:-1]) + [_with_cache_control(tools[-1])]
+
+    messages = request.get('messages')
+    if messages:
+        last = dict(messages[-1])
+        content = last.get('content')
+        if isinstance(content, str) and content:
+            last['content'] = [_with_cache_control(content)]
+        elif isinstance(content, (list, tuple)) and content:
+            last['content'] = list(content[:-1]) + [_with_cache_control(content[-1])]
+        request['messages'] = list(messages[:-1]) + [last]
+
+    return request
+
+
+class TokenBucket:
+    """Token bucket thread-safe con ricarica continua"""
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = max(1, int(tokens_per_minute))
+        self.rate = self.capacity / 60.0
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: int):
+        """Attende finché non sono disponibili i token richiesti e li preleva"""
+        # Una richiesta più grande del bucket non deve attendere per sempre
+        amount = min(max(1, amount), self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(min(wait, 5))
+
+    def adjust(self, delta: int):
+        """Corregge il saldo dopo la risposta (delta > 0 consuma, < 0 restituisce)"""
+        with self.lock:
+            self._refill()
+            # Il saldo può andare in negativo: le richieste successive attendono il recupero
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class LLMGateway:
+    """Punto unico di accesso all'API Anthropic per il processo"""
+
+    def __init__(self, max_concurrency: int, tokens_per_minute: int):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self.bucket = TokenBucket(tokens_per_minute)
+        self._paused_until = 0.0
+        self._metrics_lock = threading.Lock()
+        self._last_metrics_log = time.monotonic()
+        self._metrics = {
+            'in_attesa': 0,
+            'in_corso': 0,
+            'max_in_attesa': 0,
+            'richieste': 0,
+            'errori': 0,
+            'rate_limited': 0,
+            'retry': 0,
+            'token_input': 0,
+            'token_output': 0,
+            'cache_hit': 0,
+            'cache_miss': 0,
+            'token_cache_letti': 0,
+            'token_cache_scritti': 0,
+            'attesa_totale': 0.0,
+            'attesa_max': 0.0,
+        }
+
+    def _incr(self, **values):
+        with self._metrics_lock:
+            for name, value in values.items():
+                self._metrics[name] += value
+            self._metrics['max_in_attesa'] = max(self._metrics['max_in_attesa'], self._metrics['in_attesa'])
+
+    def get_metrics(self) -> dict:
+        """Istantanea delle metriche del gateway"""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics['attesa_media'] = metrics['attesa_totale'] / metrics['richieste'] if metrics['richieste'] else 0.0
+        metrics['max_concorrenza'] = self.max_concurrency
+        metrics['token_disponibili'] = int(self.bucket.tokens)
+        metrics['pausa_residua'] = max(0.0, self._paused_until - time.monotonic())
+        return metrics
+
+    def _maybe_log_metrics(self):
+        interval = get_gateway_setting('METRICS_LOG_INTERVAL')
+        now = time.monotonic()
+        with self._metrics_lock:
+            if now - self._last_metrics_log < interval:
+                return
+            self._last_metrics_log = now
+        m = self.get_metrics()
+        logger.info(
+            f"LLM gateway: {m['richieste']} richieste, {m['in_corso']} in corso, "
+            f"{m['in_attesa']} in attesa (max {m['max_in_attesa']}), "
+            f"attesa media {m['attesa_media']:.1f}s (max {m['attesa_max']:.1f}s), "
+            f"429: {m['rate_limited']}, errori: {m['errori']}, "
+            f"token in/out: {m['token_input']}/{m['token_output']}, "
+            f"cache hit/miss: {m['cache_hit']}/{m['cache_miss']} "
+            f"(token letti {m['token_cache_letti']}, scritti {m['token_cache_scritti']})"
+        )
+
+    def _pause(self, seconds: float):
+        """Sospende l'invio di nuove richieste per tutto il processo"""
+        with self._metrics_lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _wait_pause(self):
+        while True:
+            remaining = self._paused_until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 5))
+
+    def _retry_delay(self, error, attempt: int) -> float:
+        """Attesa prima del prossimo tentativo: retry-after se presente, altrimenti backoff"""
+        response = getattr(error, 'response', None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get('retry-after'))
+                if retry_after > 0:
+                    return retry_after
+            except (TypeError, ValueError):
+                pass
+        delay = get_gateway_setting('BACKOFF_BASE') * (2 ** attempt)
+        delay = min(delay, get_gateway_setting('BACKOFF_MAX'))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _is_retryable(self, error) -> bool:
+        import anthropic
+
+        if isinstance(error, (anthropic.RateLimitError, anthropic.APIConnectionError,
+                              anthropic.InternalServerError)):
+            return True
+        # 529 overloaded
+        return isinstance(error, anthropic.APIStatusError) and getattr(error, 'status_code', 0) >= 500
+
+    def _record_usage(self, usage, estimated: int, cached: bool):
+        """Aggiorna metriche e token bucket con l'usage reale della risposta"""
+        input_tokens = getattr(usage, 'input_tokens', 0) or 0
+        output_tokens = getattr(usage, 'output_tokens', 0) or 0
+        cache_read = getattr(usage, 'cache_read_input_tokens', 0) or 0
+        cache_write = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+
+        values = {
+            'token_input': input_tokens,
+            'token_output': output_tokens,
+            'token_cache_letti': cache_read,
+            'token_cache_scritti': cache_write,
+        }
+        if cached:
+            # Miss: prefisso scritto in cache o troppo corto per essere messo in cache
+            values['cache_hit' if cache_read else 'cache_miss'] = 1
+        self._incr(**values)
+
+        # Le letture dalla cache non contano nel limite di token in input al minuto
+        self.bucket.adjust(input_tokens + cache_write + output_tokens - estimated)
+
+    def create_message(self, api_key: Optional[str] = None, cache: bool = False, **request):
+        """
+        Esegue client.messages.create rispettando concorrenza e token al minuto
+
+        Args:
+            api_key: API key da usare (default settings.ANTHROPIC_API_KEY)
+            cache: Se True aggiunge i breakpoint di prompt caching (apply_prompt_cache)
+            **request: Parametri di messages.create (model ha un default)
+
+        Returns:
+            Il Message restituito dall'API
+
+        Raises:
+            Le eccezioni dell'SDK dopo MAX_RETRIES tentativi per errori temporanei,
+            subito per gli altri errori
+        """
+        return self._execute(api_key, cache, request, lambda client, params: client.messages.create(**params))
+
+    def stream_message(self, on_text: Callable[[str], None], api_key: Optional[str] = None,
+                       cache: bool = False, on_tool_use: Optional[Callable[[], None]] = None, **request):
+        """
+        Come create_message, ma riceve la risposta in streaming
+
+        Args:
+            on_text: Chiamata con il testo accumulato finora a ogni frammento
+                     ricevuto; se la richiesta viene ritentata riparte da ''
+            on_tool_use: Chiamata all'inizio di ogni blocco tool_use della risposta
+
+        Returns:
+            Il Message completo (come create_message), con usage e blocchi tool_use
+        """
+        def send(client, params):
+            text = ''
+            on_text(text)
+            with client.messages.stream(**params) as stream:
+                for event in stream:
+                    if event.type == 'text':
+                        text += event.text
+                        on_text(text)
+                    elif (event.type == 'content_block_start' and on_tool_use is not None
+                          and event.content_block.type in ('tool_use', 'server_tool_use')):
+                        on_tool_use()
+                return stream.get_final_message()
+
+        return self._execute(api_key, cache, request, send)
+
+    def _execute(self, api_key: Optional[str], cache: bool, request: dict, send):
+        """Esegue send(client, params) con coda, limiti, retry e metriche del gateway"""
+        import anthropic
+
+        client = get_client(api_key)
+        request.setdefault('model', DEFAULT_MODEL)
+        request = {k: v for k, v in request.items() if v is not None}
+        estimated = estimate_tokens(**request)
+        if cache:
+            request = apply_prompt_cache(request)
+        max_retries = get_gateway_setting('MAX_RETRIES')
+        attempt = 0
+
+        while True:
+            queued_at = time.monotonic()
+            self._incr(in_attesa=1)
+            try:
+                self._wait_pause()
+                self.bucket.acquire(estimated)
+                self.semaphore.acquire()
+            finally:
+                self._incr(in_attesa=-1)
+
+            waited = time.monotonic() - queued_at
+            self._incr(in_corso=1, richieste=1, attesa_totale=waited)
+            with self._metrics_lock:
+                self._metrics['attesa_max'] = max(self._metrics['attesa_max'], waited)
+
+            error = None
+            try:
+                message = send(client, request)
+            except Exception as e:
+                error = e
+            finally:
+                self.semaphore.release()
+                self._incr(in_corso=-1)
+
+            if error is not None:
+                self._incr(errori=1)
+                if not self._is_retryable(error) or attempt >= max_retries:
+                    raise error
+                delay = self._retry_delay(error, attempt)
+                attempt += 1
+                self._incr(retry=1)
+                logger.warning(f"Richiesta LLM fallita ({type(error).__name__}), nuovo tentativo "
+                               f"{attempt}/{max_retries} tra {delay:.0f}s")
+                if isinstance(error, anthropic.RateLimitError) or getattr(error, 'status_code', 0) == 529:
+                    # Tutte le richieste del processo attendono, non solo questa
+                    self._incr(rate_limited=1)
+                    self._pause(delay)
+                else:
+                    time.sleep(delay)
+                continue
+
+            usage = getattr(message, 'usage', None)
+            if usage is not None:
+                self._record_usage(usage, estimated, cache)
+
+            self._maybe_log_metrics()
+            return message
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """Gateway del processo, creato al primo utilizzo con i limiti da settings"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway(
+                max_concurrency=get_gateway_setting('MAX_CONCURRENCY'),
+                tokens_per_minute=get_gateway_setting('TOKENS_PER_MINUTE'),
+            )
+        return _gateway
+
+
+def create_message(api_key: Optional[str] = None, cache: bool = False, **request):
+    """Scorciatoia per get_gateway().create_message()"""
+    return get_gateway().create_message(api_key=api_key, cache=cache, **request)
+
+
+def stream_message(on_text: Callable[[str], None], api_key: Optional[str] = None, cache: bool = False,
+                   on_tool_use: Optional[Callable[[], None]] = None, **request):
+    """Scorciatoia per get_gateway().stream_message()"""
+    return get_gateway().stream_message(on_text, api_key=api_key, cache=cache, on_tool_use=on_tool_use, **request)
+
+
+def get_metrics() -> dict:
+    """Metriche del gateway del processo"""
+    return get_gateway().get_metrics()
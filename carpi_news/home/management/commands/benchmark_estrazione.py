@@ -0,0 +1,154 @@
+from django.core.management.base import BaseCommand, CommandError
+from bs4 import BeautifulSoup
+from home.content_extractor import ContentDensity, element_text
+import glob
+import hashlib
+import os
+import random
+import requests
+import time
+from urllib.parse import urlparse
+
+# Pagine reali salvate con --url ... --salva, misurate di default
+PAGES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pagine_benchmark')
+
+REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36',
+    'Accept-Language': 'it-IT,it;q=0.9',
+}
+
+
+def legacy_heuristic(soup):
+    """Euristica precedente di WebSearchTool: get_text() e find_all('p') per ogni contenitore"""
+    candidates = []
+    for tag in soup.find_all(['div', 'section', 'main']):
+        text = tag.get_text(strip=True)
+        if len(text) > 200:
+            paragraphs = len(tag.find_all('p'))
+            candidates.append((len(text) + paragraphs * 50, tag))
+    if not candidates:
+        return None
+    candidates.sort(key=lambda x: x[0], reverse=True)
+    return candidates[0][1]
+
+
+def build_fixture_page(depth, paragraphs, menu_items, seed=0):
+    """
+    Pagina sintetica nello stile dei siti istituzionali: layout annidato per
+    `depth` livelli, menu e footer ricchi di link, articolo con `paragraphs` paragrafi
+    """
+    rng = random.Random(seed)
+    words = ('comune consiglio delibera cittadini servizi scuola bilancio progetto '
+             'assessore lavori pubblici manutenzione quartiere sindaco giunta').split()
+
+    def sentence(n):
+        return ' '.join(rng.choice(words) for _ in range(n)).capitalize()
+
+    menu = ''.join(f'<li><a href="/voce-{i}">{sentence(3)}</a></li>' for i in range(menu_items))
+    body = ''.join(f'<p>{sentence(25)}, {sentence(20)}.</p>' for _ in range(paragraphs))
+    related = ''.join(f'<div class="card"><a href="/n/{i}">{sentence(8)}</a></div>' for i in range(menu_items // 4))
+
+    article = f'<article class="notizia"><h1>{sentence(8)}</h1>{body}</article>'
+    for level in range(depth):
+        article = f'<div class="row level-{level}"><div class="col">{article}</div></div>'
+
+    return (
+        '<html><head><title>Comune</title><script>var x = 1;</script></head><body>'
+        f'<header><nav><ul>{menu}</ul></nav></header>'
+        f'<div id="wrapper"><div class="container">{article}'
+        f'<div class="correlati">{related}</div></div></div>'
+        f'<footer><ul>{menu}</ul></footer>'
+        '</body></html>'
+    )
+
+
+class Command(BaseCommand):
+    help = "Confronta i tempi dell'estrazione del contenuto principale (euristica precedente e densità di testo)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            action='append',
+            default=[],
+            help='Pagina HTML da misurare (ripetibile)',
+        )
+        parser.add_argument(
+            '--url',
+            action='append',
+            default=[],
+            help='Pagina da scaricare e misurare (ripetibile), es. un articolo di un sito monitorato',
+        )
+        parser.add_argument(
+            '--salva',
+            action='store_true',
+            help=f'Salva le pagine scaricate con --url in {PAGES_DIR} per le esecuzioni successive',
+        )
+        parser.add_argument(
+            '--sintetiche',
+            action='store_true',
+            help='Aggiunge le pagine sintetiche (solo per confronti relativi, non rappresentative dei siti reali)',
+        )
+        parser.add_argument(
+            '--ripetizioni',
+            type=int,
+            default=3,
+            help='Ripetizioni per pagina (default: 3, conta il tempo migliore)',
+        )
+
+    def handle(self, *args, **options):
+        pages = []
+        for path in options['file']:
+            with open(path, 'rb') as f:
+                pages.append((path, f.read()))
+        for url in options['url']:
+            pages.append((url, self._download(url, options['salva'])))
+        if not pages:
+            # Pagine reali salvate in precedenza
+            for path in sorted(glob.glob(os.path.join(PAGES_DIR, '*.html'))):
+                with open(path, 'rb') as f:
+                    pages.append((os.path.basename(path), f.read()))
+        if options['sintetiche'] or not pages:
+            if not pages:
+                self.stdout.write(self.style.WARNING(
+                    f'Nessuna pagina reale ({PAGES_DIR} è vuota): misuro solo pagine sintetiche, '
+                    'i tempi non sono rappresentativi dei siti monitorati. Usare --url ... --salva'))
+            for depth, paragraphs, menu_items in [(5, 10, 40), (15, 30, 120), (30, 60, 300), (60, 120, 600)]:
+                name = f'sintetica profondità={depth} paragrafi={paragraphs} link={menu_items * 2}'
+                pages.append((name, build_fixture_page(depth, paragraphs, menu_items)))
+
+        for name, html in pages:
+            soup = BeautifulSoup(html, 'html.parser')
+            legacy_time, legacy = self._measure(lambda: legacy_heuristic(soup), options['ripetizioni'])
+            density_time, density = self._measure(lambda: ContentDensity(soup).best_candidate(), options['ripetizioni'])
+
+            legacy_len = len(element_text(legacy)) if legacy else 0
+            density_len = len(element_text(density)) if density else 0
+            self.stdout.write(f'{name}')
+            self.stdout.write(f'  precedente: {legacy_time * 1000:8.1f} ms  <{getattr(legacy, "name", None)}> {legacy_len} caratteri')
+            self.stdout.write(f'  densità:    {density_time * 1000:8.1f} ms  <{getattr(density, "name", None)}> {density_len} caratteri')
+            if density_time:
+                self.stdout.write(self.style.SUCCESS(f'  {legacy_time / density_time:.1f}x'))
+
+    def _download(self, url, save):
+        try:
+            response = requests.get(url, headers=REQUEST_HEADERS, timeout=20)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise CommandError(f'Download di {url} fallito: {e}')
+        if save:
+            os.makedirs(PAGES_DIR, exist_ok=True)
+            name = f"{urlparse(url).netloc}-{hashlib.md5(url.encode()).hexdigest()[:8]}.html"
+            with open(os.path.join(PAGES_DIR, name), 'wb') as f:
+                f.write(response.content)
+            self.stdout.write(f'Salvata {url} come {name}')
+        return response.content
+
+    @staticmethod
+    def _measure(func, repetitions):
+        best, result = None, None
+        for _ in range(max(repetitions, 1)):
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from home.persistent_cache import get_cache
+
+
+class Command(BaseCommand):
+    help = 'Mostra lo stato della cache persistente dei contenuti, applica i limiti o la svuota'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--evict',
+            action='store_true',
+            help='Elimina le voci scadute e quelle oltre i limiti di dimensione',
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Svuota la cache (tutta o solo il namespace indicato)',
+        )
+        parser.add_argument(
+            '--namespace',
+            help='Namespace su cui operare con --clear (es. pagine)',
+        )
+
+    def handle(self, *args, **options):
+        cache = get_cache()
+
+        if options['clear']:
+            cache.clear(options['namespace'])
+            self.stdout.write(self.style.SUCCESS(f"Cache svuotata: {options['namespace'] or 'tutti i namespace'}"))
+        elif options['evict']:
+            removed = cache.evict()
+            self.stdout.write(self.style.SUCCESS(f'Voci eliminate: {removed}'))
+
+        stats = cache.stats()
+        if not stats['namespace']:
+            self.stdout.write(f'Cache vuota ({cache.path})')
+            return
+        self.stdout.write(f'Cache: {cache.path}')
+        for namespace, info in sorted(stats['namespace'].items()):
+            self.stdout.write(f"  {namespace}: {info['voci']} voci, {info['byte'] / 1024:.1f} KB")
@@ -8,6 +8,7 @@ from bs4 import BeautifulSoup
 import urllib.parse
 from home.monitor_configs import get_config
 from home.universal_news_monitor import UniversalNewsMonitor
+from home.content_extractor import find_main_content
 
 
 logger = logging.getLogger(__name__)
@@ -303,24 +304,22 @@ class Command(BaseCommand):
             elif 'ansa.it' in fonte_url:
                 config_name = 'ansa_carpi'
             
-            # METODO 1: Usa configurazione specifica del monitor
+            # METODO 1: Contenuto principale (selettori del monitor, poi densità di testo)
+            content_selectors = []
             if config_name:
                 try:
                     config = get_config(config_name)
                     content_selectors = config.config.get('content_selectors', [])
-                    
-                    # Cerca nel contenuto principale
-                    for selector in content_selectors:
-                        content_elem = soup.select_one(selector)
-                        if content_elem:
-                            for img in content_elem.find_all('img'):
-                                extracted_url = self._extract_image_using_monitor_logic(img, base_url)
-                                if extracted_url:
-                                    candidate_images.append(('monitor_content', extracted_url))
-                            break  # Usa solo il primo contenuto trovato
-                            
                 except Exception as e:
                     logger.debug(f"Errore configurazione monitor {config_name}: {e}")
+
+            # Nessun minimo di testo: qui interessano anche i contenitori con sole immagini
+            content_elem = find_main_content(soup, content_selectors, min_length=0)
+            if content_elem:
+                for img in content_elem.find_all('img'):
+                    extracted_url = self._extract_image_using_monitor_logic(img, base_url)
+                    if extracted_url:
+                        candidate_images.append(('monitor_content', extracted_url))
             
             # METODO 2: Meta tag Open Graph e Twitter (priorità alta)
             og_image = soup.find('meta', property='og:image')
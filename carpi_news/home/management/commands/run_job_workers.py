@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from home.job_queue import JobWorkerPool, reclaim_expired_jobs, get_registered_queues
+import signal
+import time
+
+
+class Command(BaseCommand):
+    help = 'Esegue i worker della coda lavori (email, Telegram, feed, sitemap e generazione AI)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--coda',
+            action='append',
+            help='Coda da servire (ripetibile, default: tutte le code registrate)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Numero di worker per coda (default: JOB_QUEUE)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Esegue i lavori pronti e termina',
+        )
+
+    def handle(self, *args, **options):
+        code = options['coda'] or get_registered_queues()
+        pools = [JobWorkerPool(coda, workers=options['workers']) for coda in code]
+
+        if options['once']:
+            reclaim_expired_jobs()
+            for pool in pools:
+                processed = pool.run_pending()
+                self.stdout.write(self.style.SUCCESS(f"Coda '{pool.coda}': lavori eseguiti {processed}"))
+            return
+
+        stopping = []
+
+        def signal_handler(signum, frame):
+            stopping.append(signum)
+
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
+
+        for pool in pools:
+            pool.start()
+        self.stdout.write(self.style.SUCCESS(f"Worker avviati per le code: {', '.join(code)}. Premi Ctrl+C per fermarli."))
+        while not stopping:
+            time.sleep(1)
+
+        self.stdout.write('Arresto dei worker in corso...')
+        for pool in pools:
+            pool.stop()
+        self.stdout.write(self.style.SUCCESS('Worker fermati'))
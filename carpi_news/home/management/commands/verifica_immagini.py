@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import models
+from home.models import Articolo
+from home.image_health import verify_article_image
+
+
+class Command(BaseCommand):
+    help = 'Verifica le immagini degli articoli e salva l\'esito (usato da pagine e feed senza richieste HTTP)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Verifica di nuovo anche le immagini già verificate',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Limita il numero di articoli da processare',
+        )
+
+    def handle(self, *args, **options):
+        queryset = Articolo.objects.exclude(
+            models.Q(foto__isnull=True) | models.Q(foto='')
+        )
+        if not options['all']:
+            # Solo immagini mai verificate o cambiate dopo l'ultima verifica
+            queryset = queryset.exclude(foto_verificata_url=models.F('foto'))
+
+        queryset = queryset.order_by('-data_pubblicazione')
+        if options['limit']:
+            queryset = queryset[:options['limit']]
+
+        article_ids = list(queryset.values_list('id', flat=True))
+        if not article_ids:
+            self.stdout.write(self.style.SUCCESS('Nessuna immagine da verificare.'))
+            return
+
+        self.stdout.write(f'Verifica immagini per {len(article_ids)} articoli...')
+
+        broken = 0
+        for processed, article_id in enumerate(article_ids, 1):
+            if verify_article_image(article_id) is False:
+                broken += 1
+            if processed % 10 == 0:
+                self.stdout.write(f'Processati {processed}/{len(article_ids)} articoli...')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Verifica completata: {len(article_ids) - broken} valide, {broken} non raggiungibili'
+        ))
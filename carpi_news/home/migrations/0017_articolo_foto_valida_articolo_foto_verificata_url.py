@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2025-10-02 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0016_add_fonti_web_field'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='articolo',
+            name='foto_valida',
+            field=models.BooleanField(blank=True, help_text="Esito dell'ultima verifica dell'immagine (vuoto = non ancora verificata)", null=True),
+        ),
+        migrations.AddField(
+            model_name='articolo',
+            name='foto_verificata_url',
+            field=models.TextField(blank=True, help_text="URL dell'immagine a cui si riferisce l'esito della verifica", null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2025-10-03 09:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0017_articolo_foto_valida_articolo_foto_verificata_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='articolo',
+            name='foto_bytes',
+            field=models.PositiveIntegerField(blank=True, help_text="Dimensione dell'immagine in byte", null=True),
+        ),
+        migrations.AddField(
+            model_name='articolo',
+            name='foto_mime',
+            field=models.CharField(blank=True, help_text="Tipo MIME dell'immagine", max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='articolo',
+            name='foto_larghezza',
+            field=models.PositiveIntegerField(blank=True, help_text="Larghezza dell'immagine in pixel", null=True),
+        ),
+        migrations.AddField(
+            model_name='articolo',
+            name='foto_altezza',
+            field=models.PositiveIntegerField(blank=True, help_text="Altezza dell'immagine in pixel", null=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2025-10-06 11:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0018_articolo_foto_metadati'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(help_text="Tipo di lavoro (nome dell'handler registrato)", max_length=50)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('stato', models.CharField(choices=[('in_attesa', 'In attesa'), ('in_corso', 'In corso'), ('completato', 'Completato'), ('fallito', 'Fallito')], default='in_attesa', max_length=20)),
+                ('priorita', models.SmallIntegerField(default=0, help_text='Priorità più alta = eseguito prima')),
+                ('tentativi', models.PositiveSmallIntegerField(default=0)),
+                ('max_tentativi', models.PositiveSmallIntegerField(default=5)),
+                ('disponibile_da', models.DateTimeField(default=django.utils.timezone.now, help_text='Il lavoro non viene eseguito prima di questa data (backoff)')),
+                ('bloccato_da', models.CharField(blank=True, help_text='Worker che sta eseguendo il lavoro', max_length=100, null=True)),
+                ('bloccato_il', models.DateTimeField(blank=True, null=True)),
+                ('ultimo_errore', models.TextField(blank=True, null=True)),
+                ('chiave', models.CharField(blank=True, db_index=True, help_text='Chiave di deduplica tra lavori attivi', max_length=200, null=True)),
+                ('data_creazione', models.DateTimeField(auto_now_add=True)),
+                ('data_aggiornamento', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Lavoro in coda',
+                'verbose_name_plural': 'Lavori in coda',
+                'indexes': [models.Index(fields=['stato', 'disponibile_da'], name='home_job_stato_disp_idx')],
+            },
+        ),
+    ]
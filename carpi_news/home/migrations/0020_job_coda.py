@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2025-10-08 15:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0019_job'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='job',
+            name='home_job_stato_disp_idx',
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='coda',
+            field=models.CharField(default='default', help_text='Coda (pool di worker) che esegue il lavoro', max_length=30),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['coda', 'stato', 'disponibile_da'], name='home_job_coda_stato_idx'),
+        ),
+    ]
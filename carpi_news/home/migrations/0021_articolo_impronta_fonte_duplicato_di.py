@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2025-10-09 10:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0020_job_coda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='articolo',
+            name='impronta_fonte',
+            field=models.BigIntegerField(blank=True, db_index=True, help_text='SimHash del contenuto sorgente, per riconoscere le notizie duplicate', null=True),
+        ),
+        migrations.AddField(
+            model_name='articolo',
+            name='duplicato_di',
+            field=models.ForeignKey(blank=True, help_text='Articolo originale di cui questa fonte è un quasi duplicato', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicati', to='home.articolo'),
+        ),
+    ]
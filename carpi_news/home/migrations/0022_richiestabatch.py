@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2025-10-10 09:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0021_articolo_impronta_fonte_duplicato_di'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RichiestaBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('custom_id', models.CharField(help_text="Identificativo della richiesta all'interno del batch", max_length=64, unique=True)),
+                ('config', models.CharField(help_text='Configurazione del monitor che ha prodotto la notizia', max_length=100)),
+                ('article_data', models.JSONField(default=dict, help_text='Dati della notizia sorgente')),
+                ('parametri', models.JSONField(default=dict, help_text='Parametri di messages.create')),
+                ('stato', models.CharField(choices=[('in_attesa', 'In attesa di invio'), ('inviata', 'Inviata'), ('completata', 'Completata'), ('fallita', 'Fallita')], default='in_attesa', max_length=20)),
+                ('batch_id', models.CharField(blank=True, db_index=True, max_length=100, null=True)),
+                ('errore', models.TextField(blank=True, null=True)),
+                ('data_creazione', models.DateTimeField(auto_now_add=True)),
+                ('data_aggiornamento', models.DateTimeField(auto_now=True)),
+                ('articolo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='richieste_batch', to='home.articolo')),
+            ],
+            options={
+                'verbose_name': 'Richiesta AI differita',
+                'verbose_name_plural': 'Richieste AI differite',
+                'indexes': [models.Index(fields=['stato', 'data_creazione'], name='home_batch_stato_idx')],
+            },
+        ),
+    ]
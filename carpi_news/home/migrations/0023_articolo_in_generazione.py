@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2025-10-10 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0022_richiestabatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='articolo',
+            name='in_generazione',
+            field=models.BooleanField(default=False, help_text='Bozza salvata durante la generazione AI in streaming, non ancora completa'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2025-10-11 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0023_articolo_in_generazione'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuotaServizio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('servizio', models.CharField(max_length=50, unique=True)),
+                ('giorno', models.DateField(help_text='Giorno di quota (fuso orario del fornitore)')),
+                ('richieste', models.PositiveIntegerField(default=0, help_text='Richieste effettuate nel giorno')),
+                ('esaurita', models.BooleanField(default=False, help_text='Quota segnalata come esaurita dal fornitore (429)')),
+                ('token', models.FloatField(default=0, help_text='Richieste disponibili subito (token bucket)')),
+                ('ultimo_rifornimento', models.FloatField(default=0, help_text="Timestamp dell'ultimo ricalcolo dei token")),
+                ('data_aggiornamento', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Quota API',
+                'verbose_name_plural': 'Quote API',
+            },
+        ),
+    ]
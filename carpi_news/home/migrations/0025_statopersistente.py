@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2025-10-12 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0024_quotaservizio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatoPersistente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chiave', models.CharField(max_length=200, unique=True)),
+                ('valore', models.JSONField(blank=True, default=dict)),
+                ('data_aggiornamento', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Stato persistente',
+                'verbose_name_plural': 'Stati persistenti',
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2025-10-12 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0025_statopersistente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TentativoProgrammato',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(help_text='Tipo di tentativo (es. trascrizione di una diretta YouTube)', max_length=50)),
+                ('chiave', models.CharField(help_text="Elemento da ritentare (es. ID del video)", max_length=200)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('tentativi', models.PositiveSmallIntegerField(default=0, help_text='Tentativi falliti finora')),
+                ('max_tentativi', models.PositiveSmallIntegerField(default=6)),
+                ('ritardo_base', models.PositiveIntegerField(default=3600, help_text='Attesa prima del primo tentativo, in secondi; raddoppia a ogni fallimento')),
+                ('scadenza', models.DateTimeField(help_text='Il tentativo non viene eseguito prima di questa data')),
+                ('ultimo_errore', models.TextField(blank=True, null=True)),
+                ('data_creazione', models.DateTimeField(auto_now_add=True)),
+                ('data_aggiornamento', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Tentativo programmato',
+                'verbose_name_plural': 'Tentativi programmati',
+                'indexes': [models.Index(fields=['tipo', 'scadenza'], name='home_tentativo_scadenza_idx')],
+                'constraints': [models.UniqueConstraint(fields=('tipo', 'chiave'), name='home_tentativo_tipo_chiave_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2025-10-13 09:40
+
+from django.db import migrations, models
+
+
+def remove_duplicate_jobs(apps, schema_editor):
+    """Chiude i lavori attivi con chiave duplicata prima di aggiungere i vincoli"""
+    Job = apps.get_model('home', 'Job')
+    for stato in ('in_attesa', 'in_corso'):
+        seen = set()
+        for job in Job.objects.filter(stato=stato, chiave__isnull=False).order_by('pk'):
+            if job.chiave in seen:
+                Job.objects.filter(pk=job.pk).update(
+                    stato='fallito', ultimo_errore='Duplicato rimosso dalla migrazione 0027'
+                )
+            else:
+                seen.add(job.chiave)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0026_tentativoprogrammato'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(('stato', 'in_attesa')), fields=('chiave',), name='home_job_chiave_in_attesa_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(('stato', 'in_corso')), fields=('chiave',), name='home_job_chiave_in_corso_uniq'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2025-10-13 10:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0027_job_chiave_uniq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='articolo',
+            name='firma_fonte',
+            field=models.JSONField(blank=True, help_text='Firma MinHash del contenuto sorgente, per raggruppare le notizie della stessa storia', null=True),
+        ),
+    ]
@@ -2,11 +2,9 @@ from django.db import models
 from django.utils.text import slugify
 from django.utils import timezone
 from django.templatetags.static import static
-from django.core.cache import cache
 from django.conf import settings
-from urllib.parse import quote
+from .image_health import normalize_image_url, is_trusted_url, apply_local_metadata, get_image_source
 import re
-import requests
 import json
 
 class Articolo(models.Model):
@@ -21,10 +19,58 @@ class Articolo(models.Model):
     foto_upload = models.ImageField(upload_to='images/uploaded/', blank=True, null=True, help_text="Upload di un'immagine per l'articolo")
     richieste_modifica = models.TextField(blank=True, null=True, help_text="Richieste specifiche per la rigenerazione AI dell'articolo")
     fonti_web = models.JSONField(blank=True, null=True, help_text="Fonti web utilizzate durante la generazione AI con ricerca web")
+    foto_valida = models.BooleanField(blank=True, null=True, help_text="Esito dell'ultima verifica dell'immagine (vuoto = non ancora verificata)")
+    foto_verificata_url = models.TextField(blank=True, null=True, help_text="URL dell'immagine a cui si riferisce l'esito della verifica")
+    foto_bytes = models.PositiveIntegerField(blank=True, null=True, help_text="Dimensione dell'immagine in byte")
+    foto_mime = models.CharField(max_length=50, blank=True, null=True, help_text="Tipo MIME dell'immagine")
+    foto_larghezza = models.PositiveIntegerField(blank=True, null=True, help_text="Larghezza dell'immagine in pixel")
+    foto_altezza = models.PositiveIntegerField(blank=True, null=True, help_text="Altezza dell'immagine in pixel")
+    firma_fonte = models.JSONField(blank=True, null=True, help_text="Firma MinHash del contenuto sorgente, per raggruppare le notizie della stessa storia")
+    impronta_fonte = models.BigIntegerField(blank=True, null=True, db_index=True, help_text="SimHash del contenuto sorgente, per riconoscere le notizie duplicate")
+    in_generazione = models.BooleanField(default=False, help_text="Bozza salvata durante la generazione AI in streaming, non ancora completa")
+    duplicato_di = models.ForeignKey('self', on_delete=models.SET_NULL, blank=True, null=True, related_name='duplicati', help_text="Articolo originale di cui questa fonte è un quasi duplicato")
     views = models.PositiveIntegerField(default=0, help_text="Numero di visualizzazioni dell'articolo")
     data_creazione = models.DateTimeField(auto_now_add=True)
     data_pubblicazione = models.DateTimeField(blank=True, null=True,default=timezone.now)
 
+    # Campi di cui si conserva il valore caricato dal database, per rilevare
+    # le modifiche nei segnali senza query aggiuntive (vedi from_db)
+    CAMPI_TRACCIATI = ('approvato', 'data_pubblicazione', 'titolo', 'sommario', 'slug', 'categoria', 'foto', 'in_generazione')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.salva_stato_caricato()
+        return instance
+
+    def salva_stato_caricato(self, valori=None):
+        """
+        Memorizza i valori attuali dei campi tracciati come stato "salvato"
+
+        Args:
+            valori: Valori da usare al posto di quelli dell'istanza (es. letti dal DB)
+        """
+        # I campi differiti non sono in __dict__: non vengono tracciati
+        valori = self.__dict__ if valori is None else valori
+        self._valori_caricati = {
+            name: valori[name] for name in self.CAMPI_TRACCIATI if name in valori
+        }
+
+    def ha_stato_caricato(self, name: str) -> bool:
+        """True se è noto il valore salvato del campo"""
+        return name in getattr(self, '_valori_caricati', {})
+
+    def valore_precedente(self, name: str, default=None):
+        """Valore del campo all'ultimo caricamento/salvataggio (default se non noto)"""
+        return getattr(self, '_valori_caricati', {}).get(name, default)
+
+    def campi_modificati(self) -> set:
+        """Campi tracciati il cui valore è cambiato dall'ultimo caricamento/salvataggio"""
+        return {
+            name for name, value in getattr(self, '_valori_caricati', {}).items()
+            if self.__dict__.get(name, value) != value
+        }
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.titolo)
@@ -34,7 +80,11 @@ class Articolo(models.Model):
             # Pulisci spazi multipli e normalizza
             contenuto_pulito = re.sub(r'\s+', ' ', contenuto_pulito).strip()
             self.sommario = contenuto_pulito[:200] + '...' if len(contenuto_pulito) > 200 else contenuto_pulito
+        # Metadati dell'immagine (byte, MIME, dimensioni) per feed e anteprime social
+        apply_local_metadata(self)
         super().save(*args, **kwargs)
+        # I segnali post_save hanno già visto lo stato precedente: ora è quello salvato
+        self.salva_stato_caricato()
 
     def get_image_url(self):
         """Restituisce l'URL dell'immagine o il fallback se non disponibile/raggiungibile"""
@@ -55,53 +105,164 @@ class Articolo(models.Model):
             site_url = getattr(settings, 'SITE_URL', 'https://ombradelportico.it')
             return f"{site_url}{self.foto}"
         
-        # Fix per URL con spazi e doppi slash prima della validazione
-        validated_url = self.foto
-
-        # Fix per doppi slash negli URL (es. voce.it/upload//articolo)
-        if '://' in validated_url:
-            protocol, rest = validated_url.split('://', 1)
-            # Rimuovi doppi slash nel path ma mantieni quelli dopo il protocollo
-            rest = re.sub(r'/+', '/', rest)
-            validated_url = f"{protocol}://{rest}"
-
-        if ' ' in validated_url:
-            # Codifica solo la parte del path, mantenendo lo schema e host
-            if validated_url.startswith('http'):
-                parts = validated_url.split('/', 3)  # ['http:', '', 'domain.com', 'path/with spaces.jpg']
-                if len(parts) > 3:
-                    # Codifica solo il path mantenendo il resto
-                    encoded_path = quote(parts[3], safe='/')
-                    validated_url = f"{parts[0]}//{parts[2]}/{encoded_path}"
-            else:
-                validated_url = quote(validated_url, safe='/:?#[]@!$&\'()*+,;=')
-        
+        validated_url = normalize_image_url(self.foto)
+
         # Per alcuni domini noti che hanno problemi di connessione, salta la validazione
-        trusted_domains = ['voce.it', 'ombradelportico.it']
-        if any(domain in validated_url for domain in trusted_domains):
+        if is_trusted_url(validated_url):
             return validated_url
-        
-        # Per URL esterni, mantieni la validazione con cache
-        cache_key = f"image_valid_{hash(validated_url)}"
-        cached_result = cache.get(cache_key)
-        
-        if cached_result is not None:
-            return validated_url if cached_result else fallback_image
-        
-        try:
-            # Controlla se l'URL è raggiungibile
-            response = requests.head(validated_url, timeout=3, allow_redirects=True)
-            is_valid = response.status_code == 200
-            
-            # Cache il risultato per 1 ora
-            cache.set(cache_key, is_valid, 3600)
-            
-            return validated_url if is_valid else fallback_image
-        except:
-            # Se c'è qualsiasi errore, cache fallimento e usa il fallback
-            cache.set(cache_key, False, 1800)  # Cache errori per 30 min
+
+        # Per URL esterni usa l'esito della verifica in background (image_health):
+        # finché la verifica non è completata l'immagine è considerata valida
+        if self.foto_verificata_url == get_image_source(self) and self.foto_valida is False:
             return fallback_image
 
+        return validated_url
+
     def __str__(self):
         return self.titolo
 # Create your models here.
+
+
+class Job(models.Model):
+    """Lavoro in coda eseguito in background dal pool di worker (vedi job_queue)"""
+
+    STATO_IN_ATTESA = 'in_attesa'
+    STATO_IN_CORSO = 'in_corso'
+    STATO_COMPLETATO = 'completato'
+    STATO_FALLITO = 'fallito'
+    STATI = [
+        (STATO_IN_ATTESA, 'In attesa'),
+        (STATO_IN_CORSO, 'In corso'),
+        (STATO_COMPLETATO, 'Completato'),
+        (STATO_FALLITO, 'Fallito'),
+    ]
+
+    tipo = models.CharField(max_length=50, help_text="Tipo di lavoro (nome dell'handler registrato)")
+    coda = models.CharField(max_length=30, default='default', help_text="Coda (pool di worker) che esegue il lavoro")
+    payload = models.JSONField(default=dict, blank=True)
+    stato = models.CharField(max_length=20, choices=STATI, default=STATO_IN_ATTESA)
+    priorita = models.SmallIntegerField(default=0, help_text="Priorità più alta = eseguito prima")
+    tentativi = models.PositiveSmallIntegerField(default=0)
+    max_tentativi = models.PositiveSmallIntegerField(default=5)
+    disponibile_da = models.DateTimeField(default=timezone.now, help_text="Il lavoro non viene eseguito prima di questa data (backoff)")
+    bloccato_da = models.CharField(max_length=100, blank=True, null=True, help_text="Worker che sta eseguendo il lavoro")
+    bloccato_il = models.DateTimeField(blank=True, null=True)
+    ultimo_errore = models.TextField(blank=True, null=True)
+    chiave = models.CharField(max_length=200, blank=True, null=True, db_index=True, help_text="Chiave di deduplica tra lavori attivi")
+    data_creazione = models.DateTimeField(auto_now_add=True)
+    data_aggiornamento = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Lavoro in coda'
+        verbose_name_plural = 'Lavori in coda'
+        indexes = [
+            models.Index(fields=['coda', 'stato', 'disponibile_da'], name='home_job_coda_stato_idx'),
+        ]
+        constraints = [
+            # Deduplica: al massimo un lavoro in attesa e uno in corso per chiave
+            models.UniqueConstraint(fields=['chiave'], condition=models.Q(stato='in_attesa'),
+                                    name='home_job_chiave_in_attesa_uniq'),
+            models.UniqueConstraint(fields=['chiave'], condition=models.Q(stato='in_corso'),
+                                    name='home_job_chiave_in_corso_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} #{self.pk} ({self.stato})"
+
+
+class RichiestaBatch(models.Model):
+    """Generazione AI differita inviata con la Message Batches API (vedi ai_batch)"""
+
+    STATO_IN_ATTESA = 'in_attesa'
+    STATO_INVIATA = 'inviata'
+    STATO_COMPLETATA = 'completata'
+    STATO_FALLITA = 'fallita'
+    STATI = [
+        (STATO_IN_ATTESA, 'In attesa di invio'),
+        (STATO_INVIATA, 'Inviata'),
+        (STATO_COMPLETATA, 'Completata'),
+        (STATO_FALLITA, 'Fallita'),
+    ]
+
+    custom_id = models.CharField(max_length=64, unique=True, help_text="Identificativo della richiesta all'interno del batch")
+    config = models.CharField(max_length=100, help_text="Configurazione del monitor che ha prodotto la notizia")
+    article_data = models.JSONField(default=dict, help_text="Dati della notizia sorgente")
+    parametri = models.JSONField(default=dict, help_text="Parametri di messages.create")
+    stato = models.CharField(max_length=20, choices=STATI, default=STATO_IN_ATTESA)
+    batch_id = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    articolo = models.ForeignKey(Articolo, on_delete=models.SET_NULL, blank=True, null=True, related_name='richieste_batch')
+    errore = models.TextField(blank=True, null=True)
+    data_creazione = models.DateTimeField(auto_now_add=True)
+    data_aggiornamento = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Richiesta AI differita'
+        verbose_name_plural = 'Richieste AI differite'
+        indexes = [
+            models.Index(fields=['stato', 'data_creazione'], name='home_batch_stato_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.custom_id} ({self.stato})"
+
+
+class QuotaServizio(models.Model):
+    """Quota giornaliera e token bucket di un'API esterna, condivisi tra processi (vedi search_quota)"""
+
+    servizio = models.CharField(max_length=50, unique=True)
+    giorno = models.DateField(help_text="Giorno di quota (fuso orario del fornitore)")
+    richieste = models.PositiveIntegerField(default=0, help_text="Richieste effettuate nel giorno")
+    esaurita = models.BooleanField(default=False, help_text="Quota segnalata come esaurita dal fornitore (429)")
+    token = models.FloatField(default=0, help_text="Richieste disponibili subito (token bucket)")
+    ultimo_rifornimento = models.FloatField(default=0, help_text="Timestamp dell'ultimo ricalcolo dei token")
+    data_aggiornamento = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Quota API'
+        verbose_name_plural = 'Quote API'
+
+    def __str__(self):
+        return f"{self.servizio} {self.giorno}: {self.richieste}"
+
+
+class StatoPersistente(models.Model):
+    """Valore JSON per chiave, per lo stato dei monitor che deve sopravvivere ai riavvii (es. cursori IMAP)"""
+
+    chiave = models.CharField(max_length=200, unique=True)
+    valore = models.JSONField(default=dict, blank=True)
+    data_aggiornamento = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Stato persistente'
+        verbose_name_plural = 'Stati persistenti'
+
+    def __str__(self):
+        return self.chiave
+
+
+class TentativoProgrammato(models.Model):
+    """Nuovo tentativo differito di un'operazione di uno scraper (vedi retry_queue)"""
+
+    tipo = models.CharField(max_length=50, help_text="Tipo di tentativo (es. trascrizione di una diretta YouTube)")
+    chiave = models.CharField(max_length=200, help_text="Elemento da ritentare (es. ID del video)")
+    payload = models.JSONField(default=dict, blank=True)
+    tentativi = models.PositiveSmallIntegerField(default=0, help_text="Tentativi falliti finora")
+    max_tentativi = models.PositiveSmallIntegerField(default=6)
+    ritardo_base = models.PositiveIntegerField(default=3600, help_text="Attesa prima del primo tentativo, in secondi; raddoppia a ogni fallimento")
+    scadenza = models.DateTimeField(help_text="Il tentativo non viene eseguito prima di questa data")
+    ultimo_errore = models.TextField(blank=True, null=True)
+    data_creazione = models.DateTimeField(auto_now_add=True)
+    data_aggiornamento = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Tentativo programmato'
+        verbose_name_plural = 'Tentativi programmati'
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'chiave'], name='home_tentativo_tipo_chiave_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['tipo', 'scadenza'], name='home_tentativo_scadenza_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} {self.chiave} ({self.scadenza:%d/%m %H:%M})"
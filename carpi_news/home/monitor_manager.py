@@ -4,6 +4,7 @@ from typing import Dict, List, Optional
 from home.universal_news_monitor import UniversalNewsMonitor, SiteConfig
 from home.monitor_configs import MONITOR_CONFIGS, get_config
 from home.logger_config import get_monitor_logger
+from home.job_queue import start_all_pools
 
 # Logger per il manager
 logger = get_monitor_logger('monitor_manager')
@@ -77,7 +78,8 @@ class MonitorManager:
         return True
     
     def start_all_monitors(self) -> Dict[str, bool]:
-        """Avvia tutti i monitor configurati"""
+        """Avvia tutti i monitor configurati e i pool dei lavori in background"""
+        start_all_pools()
         results = {}
         for config_name in self.monitors:
             results[config_name] = self.start_monitor(config_name)
@@ -0,0 +1,224 @@
+"""
+Estrazione del testo dai PDF fuori dal processo principale
+
+I PDF dei siti istituzionali (verbali del consiglio, bandi, delibere) possono
+pesare decine di MB e richiedere secondi di parsing. Invece di caricarli in
+memoria con response.content e analizzarli nel thread della conversazione AI:
+
+- il download è in streaming su un file temporaneo, interrotto oltre MAX_BYTES
+- l'hash SHA-256 è calcolato durante il download: lo stesso documento
+  (anche da URL diversi) viene estratto una sola volta, poi letto dalla
+  cache persistente
+- il parsing (pdfplumber, con PyPDF2 come fallback, al massimo MAX_PAGES
+  pagine) avviene in un processo separato, al massimo WORKERS alla volta, che
+  viene terminato dopo TIMEOUT secondi
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from typing import Any, Dict, NamedTuple, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'MAX_BYTES': 25 * 1024 * 1024,
+    'MAX_PAGES': 20,
+    'TIMEOUT': 60,
+    'WORKERS': 2,
+    'CACHE_TTL': 30 * 24 * 3600,
+}
+
+# Namespace della cache persistente per il testo estratto, per hash del contenuto
+PDF_CACHE_NAMESPACE = 'pdf'
+
+CHUNK_SIZE = 64 * 1024
+
+
+def get_pdf_setting(name: str):
+    """Legge un'impostazione da settings.PDF_EXTRACTION con fallback ai default"""
+    return getattr(settings, 'PDF_EXTRACTION', {}).get(name, DEFAULT_SETTINGS[name])
+
+
+class DownloadedPDF(NamedTuple):
+    path: str
+    sha256: str
+    size: int
+
+
+def download_pdf(response, url: str, max_bytes: Optional[int] = None) -> Optional[DownloadedPDF]:
+    """
+    Salva il corpo di una risposta (requests con stream=True) in un file temporaneo
+
+    Returns:
+        Il file scaricato, o None se supera max_bytes o il download fallisce.
+        Il chiamante deve eliminare il file con discard().
+    """
+    if max_bytes is None:
+        max_bytes = get_pdf_setting('MAX_BYTES')
+
+    declared = response.headers.get('Content-Length')
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        logger.warning(f"PDF troppo grande ({int(declared) // 1024} KB), ignorato: {url}")
+        return None
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(prefix='carpi_pdf_', suffix='.pdf')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                if not chunk:
+                    continue
+                size += len(chunk)
+                if size > max_bytes:
+                    logger.warning(f"PDF oltre il limite di {max_bytes // 1024} KB, download interrotto: {url}")
+                    discard(path)
+                    return None
+                digest.update(chunk)
+                f.write(chunk)
+    except Exception as e:
+        logger.warning(f"Errore download PDF {url}: {e}")
+        discard(path)
+        return None
+
+    return DownloadedPDF(path, digest.hexdigest(), size)
+
+
+def discard(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def parse_pdf(path: str, max_pages: int) -> Dict[str, Any]:
+    """
+    Estrae titolo e testo delle prime max_pages pagine (eseguita nel processo figlio)
+
+    Returns:
+        {'title': prima riga o titolo dei metadati, 'text': testo delle pagine}
+    """
+    try:
+        # Prova prima con pdfplumber (migliore per testo strutturato)
+        import pdfplumber
+
+        text_parts = []
+        title = None
+        with pdfplumber.open(path) as pdf:
+            for page_num, page in enumerate(pdf.pages[:max_pages]):
+                page_text = page.extract_text()
+                if page_text:
+                    text_parts.append(page_text)
+                    if page_num == 0:
+                        # Prima riga come titolo
+                        title = page_text.split('\n')[0].strip()
+        return {'title': title, 'text': '\n\n'.join(text_parts)}
+
+    except ImportError:
+        # Fallback a PyPDF2 se pdfplumber non disponibile
+        import PyPDF2
+
+        reader = PyPDF2.PdfReader(path)
+        text_parts = []
+        title = None
+
+        # Prova a ottenere il titolo dai metadati
+        if reader.metadata and reader.metadata.get('/Title'):
+            title = str(reader.metadata['/Title'])
+
+        for page_num, page in enumerate(reader.pages[:max_pages]):
+            page_text = page.extract_text()
+            if page_text:
+                text_parts.append(page_text)
+                if page_num == 0 and not title:
+                    title = page_text.split('\n')[0].strip()
+        return {'title': title, 'text': '\n\n'.join(text_parts)}
+
+
+def _parse_in_child(path: str, max_pages: int, conn):
+    try:
+        conn.send(('ok', parse_pdf(path, max_pages)))
+    except Exception as e:
+        conn.send(('errore', f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+class PDFProcessPool:
+    """
+    Esegue parse_pdf in processi separati, al massimo `workers` contemporanei
+
+    Ogni documento ha il proprio processo, così un PDF che supera il timeout può
+    essere terminato senza coinvolgere gli altri in corso.
+    """
+
+    def __init__(self, workers: int, timeout: int):
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers)
+        # forkserver: i figli non ereditano thread e connessioni del processo web/monitor
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self._context = multiprocessing.get_context(method)
+
+    def parse(self, path: str, max_pages: int, url: str = '') -> Optional[Dict[str, Any]]:
+        with self._slots:
+            receiver, sender = self._context.Pipe(duplex=False)
+            process = self._context.Process(target=_parse_in_child, args=(path, max_pages, sender), daemon=True)
+            process.start()
+            sender.close()
+            try:
+                if not receiver.poll(self.timeout):
+                    logger.warning(f"Estrazione PDF oltre {self.timeout}s, processo terminato: {url}")
+                    process.kill()
+                    return None
+                status, payload = receiver.recv()
+            except EOFError:
+                logger.warning(f"Processo di estrazione PDF terminato senza risultato: {url}")
+                return None
+            finally:
+                receiver.close()
+                process.join(5)
+
+        if status != 'ok':
+            logger.error(f"Errore estrazione PDF da {url}: {payload}")
+            return None
+        return payload
+
+
+_pool: Optional[PDFProcessPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> PDFProcessPool:
+    """Pool del processo, creato al primo utilizzo con i limiti da settings"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PDFProcessPool(workers=get_pdf_setting('WORKERS'), timeout=get_pdf_setting('TIMEOUT'))
+        return _pool
+
+
+def extract_text(download: DownloadedPDF, url: str = '') -> Optional[Dict[str, Any]]:
+    """
+    Titolo e testo di un PDF scaricato, dalla cache per hash o dal pool di processi
+
+    Il file temporaneo viene eliminato in ogni caso.
+    """
+    from .persistent_cache import get_cache
+
+    try:
+        cached = get_cache().get(PDF_CACHE_NAMESPACE, download.sha256)
+        if cached is not None:
+            logger.info(f"PDF già estratto (sha256 {download.sha256[:12]}): {url}")
+            return cached
+
+        result = get_pool().parse(download.path, get_pdf_setting('MAX_PAGES'), url)
+        if result is not None:
+            get_cache().set(PDF_CACHE_NAMESPACE, download.sha256, result, ttl=get_pdf_setting('CACHE_TTL'))
+        return result
+    finally:
+        discard(download.path)
@@ -0,0 +1,247 @@
+"""
+Cache persistente su SQLite condivisa tra processi
+
+I contenuti scaricati dal web (pagine per il fact-checking, risultati di
+ricerca, trascrizioni) restano validi per giorni e vengono richiesti di nuovo
+da processi diversi: monitor, web e worker. Una cache in memoria cresce senza
+limiti nei processi di lunga durata e si perde a ogni riavvio; qui i valori
+sono salvati in un file SQLite separato dal database principale:
+
+- chiavi divise per namespace ('pagine', 'ricerche', ...)
+- scadenza per voce (TTL); le voci scadute restano leggibili con
+  allow_expired=True per STALE_SECONDS, poi vengono eliminate
+- limiti di numero di voci e di byte totali con eviction LRU
+- valori serializzati in JSON e compressi con zlib sopra COMPRESS_MIN_BYTES
+
+Gli errori di SQLite non interrompono mai il chiamante: la lettura diventa un
+miss e la scrittura viene ignorata.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'PATH': os.path.join(str(settings.BASE_DIR), '.cache', 'contenuti.sqlite3'),
+    'MAX_ENTRIES': 20000,
+    'MAX_BYTES': 200 * 1024 * 1024,
+    'DEFAULT_TTL': 7 * 24 * 3600,
+    'STALE_SECONDS': 7 * 24 * 3600,
+    'COMPRESS_MIN_BYTES': 512,
+}
+
+# Ogni quante scritture controllare i limiti di dimensione
+EVICT_EVERY_WRITES = 50
+
+# L'ultimo accesso viene aggiornato al massimo una volta in questo intervallo
+TOUCH_INTERVAL = 60
+
+
+def get_cache_setting(name: str):
+    """Legge un'impostazione da settings.PERSISTENT_CACHE con fallback ai default"""
+    return getattr(settings, 'PERSISTENT_CACHE', {}).get(name, DEFAULT_SETTINGS[name])
+
+
+class PersistentCache:
+    """Cache chiave/valore su SQLite con TTL, LRU e compressione; thread-safe"""
+
+    def __init__(self, path: str, max_entries: int, max_bytes: int,
+                 default_ttl: int, stale_seconds: int, compress_min_bytes: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.stale_seconds = stale_seconds
+        self.compress_min_bytes = compress_min_bytes
+
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._init_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Una connessione per thread; WAL permette letture concorrenti tra processi"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS voci (
+                namespace TEXT NOT NULL,
+                chiave TEXT NOT NULL,
+                valore BLOB NOT NULL,
+                compresso INTEGER NOT NULL,
+                dimensione INTEGER NOT NULL,
+                scadenza REAL NOT NULL,
+                ultimo_accesso REAL NOT NULL,
+                PRIMARY KEY (namespace, chiave)
+            )
+        """)
+        conn.execute('CREATE INDEX IF NOT EXISTS voci_ultimo_accesso ON voci (ultimo_accesso)')
+        conn.execute('CREATE INDEX IF NOT EXISTS voci_scadenza ON voci (scadenza)')
+
+    def _encode(self, value: Any):
+        data = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        if len(data) >= self.compress_min_bytes:
+            return zlib.compress(data, 6), 1
+        return data, 0
+
+    @staticmethod
+    def _decode(blob: bytes, compressed: int) -> Any:
+        if compressed:
+            blob = zlib.decompress(blob)
+        return json.loads(blob.decode('utf-8'))
+
+    def get_entry(self, namespace: str, key: str, allow_expired: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Legge una voce con i suoi metadati
+
+        Returns:
+            {'value', 'expired'} o None se assente (o scaduta e allow_expired=False)
+        """
+        try:
+            now = time.time()
+            conn = self._connection()
+            row = conn.execute(
+                'SELECT valore, compresso, scadenza, ultimo_accesso FROM voci WHERE namespace = ? AND chiave = ?',
+                (namespace, key)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            blob, compressed, expires_at, last_access = row
+            expired = expires_at <= now
+            if expired and not allow_expired:
+                self.misses += 1
+                return None
+            if now - last_access >= TOUCH_INTERVAL:
+                conn.execute('UPDATE voci SET ultimo_accesso = ? WHERE namespace = ? AND chiave = ?',
+                             (now, namespace, key))
+            self.hits += 1
+            return {'value': self._decode(blob, compressed), 'expired': expired}
+        except Exception as e:
+            logger.warning(f"Errore lettura cache persistente {namespace}/{key[:80]}: {e}")
+            self.misses += 1
+            return None
+
+    def get(self, namespace: str, key: str, default: Any = None, allow_expired: bool = False) -> Any:
+        """Valore in cache, o `default` se assente o scaduto"""
+        entry = self.get_entry(namespace, key, allow_expired=allow_expired)
+        return default if entry is None else entry['value']
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[int] = None):
+        """Salva un valore serializzabile in JSON con scadenza `ttl` secondi"""
+        try:
+            blob, compressed = self._encode(value)
+            now = time.time()
+            ttl = self.default_ttl if ttl is None else ttl
+            self._connection().execute(
+                'INSERT OR REPLACE INTO voci (namespace, chiave, valore, compresso, dimensione, scadenza, ultimo_accesso) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (namespace, key, blob, compressed, len(blob), now + ttl, now)
+            )
+        except Exception as e:
+            logger.warning(f"Errore scrittura cache persistente {namespace}/{key[:80]}: {e}")
+            return
+
+        with self._writes_lock:
+            self._writes += 1
+            check = self._writes % EVICT_EVERY_WRITES == 0
+        if check:
+            self.evict()
+
+    def delete(self, namespace: str, key: str):
+        try:
+            self._connection().execute('DELETE FROM voci WHERE namespace = ? AND chiave = ?', (namespace, key))
+        except Exception as e:
+            logger.warning(f"Errore eliminazione cache persistente {namespace}/{key[:80]}: {e}")
+
+    def clear(self, namespace: Optional[str] = None):
+        """Svuota un namespace o l'intera cache"""
+        conn = self._connection()
+        if namespace is None:
+            conn.execute('DELETE FROM voci')
+        else:
+            conn.execute('DELETE FROM voci WHERE namespace = ?', (namespace,))
+
+    def evict(self) -> int:
+        """
+        Elimina le voci scadute da oltre STALE_SECONDS e, oltre i limiti,
+        quelle usate meno di recente
+
+        Returns:
+            Numero di voci eliminate
+        """
+        try:
+            conn = self._connection()
+            removed = conn.execute('DELETE FROM voci WHERE scadenza < ?',
+                                   (time.time() - self.stale_seconds,)).rowcount
+
+            count, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(dimensione), 0) FROM voci').fetchone()
+            if count > self.max_entries or total > self.max_bytes:
+                # Scorre dalla meno recente finché numero e byte rientrano nei limiti
+                to_delete = []
+                for rowid, size in conn.execute('SELECT rowid, dimensione FROM voci ORDER BY ultimo_accesso'):
+                    if count <= self.max_entries and total <= self.max_bytes:
+                        break
+                    to_delete.append((rowid,))
+                    count -= 1
+                    total -= size
+                conn.executemany('DELETE FROM voci WHERE rowid = ?', to_delete)
+                removed += len(to_delete)
+
+            if removed:
+                logger.info(f"Cache persistente: eliminate {removed} voci")
+            return removed
+        except Exception as e:
+            logger.warning(f"Errore eviction cache persistente: {e}")
+            return 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Numero di voci e byte per namespace, più hit/miss del processo"""
+        rows = self._connection().execute(
+            'SELECT namespace, COUNT(*), COALESCE(SUM(dimensione), 0) FROM voci GROUP BY namespace'
+        ).fetchall()
+        return {
+            'namespace': {ns: {'voci': count, 'byte': size} for ns, count, size in rows},
+            'hit': self.hits,
+            'miss': self.misses,
+        }
+
+
+_cache: Optional[PersistentCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> PersistentCache:
+    """Cache del processo, creata al primo utilizzo con i limiti da settings"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PersistentCache(
+                path=str(get_cache_setting('PATH')),
+                max_entries=get_cache_setting('MAX_ENTRIES'),
+                max_bytes=get_cache_setting('MAX_BYTES'),
+                default_ttl=get_cache_setting('DEFAULT_TTL'),
+                stale_seconds=get_cache_setting('STALE_SECONDS'),
+                compress_min_bytes=get_cache_setting('COMPRESS_MIN_BYTES'),
+            )
+        return _cache
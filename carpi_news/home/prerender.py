@@ -0,0 +1,143 @@
+"""
+File pre-renderizzati (feed RSS/Atom, sitemap) serviti con ETag/Last-Modified
+
+I contenuti vengono generati una volta per ogni modifica e scritti su disco,
+così il polling di IFTTT e dei crawler non tocca il database. I file su disco
+sono condivisi tra processi (gunicorn e monitor), a differenza della cache
+LocMem di default.
+"""
+import logging
+import os
+import tempfile
+import time
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response, patch_response_headers
+from django.utils.http import http_date
+
+logger = logging.getLogger(__name__)
+
+
+def get_prerender_root() -> str:
+    """Directory in cui vengono salvati i file pre-renderizzati"""
+    root = getattr(settings, 'PRERENDER_ROOT', os.path.join(settings.BASE_DIR, 'prerendered'))
+    os.makedirs(root, exist_ok=True)
+    return root
+
+
+def get_prerender_path(name: str) -> str:
+    """Percorso assoluto del file pre-renderizzato con nome dato"""
+    return os.path.join(get_prerender_root(), name)
+
+
+def write_prerendered(name: str, content: bytes) -> str:
+    """
+    Scrive atomicamente un file pre-renderizzato
+
+    Il contenuto viene scritto su un file temporaneo nella stessa directory e poi
+    rinominato, così i lettori concorrenti non vedono mai un file parziale.
+    """
+    path = get_prerender_path(name)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f'.{name}.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return path
+
+
+def delete_prerendered(name: str):
+    """Rimuove un file pre-renderizzato (verrà rigenerato alla prossima richiesta)"""
+    try:
+        os.unlink(get_prerender_path(name))
+    except FileNotFoundError:
+        pass
+
+
+def _etag_for_stat(stat_result) -> str:
+    """ETag debole calcolato da mtime e dimensione, senza rileggere il file"""
+    return f'W/"{int(stat_result.st_mtime_ns):x}-{stat_result.st_size:x}"'
+
+
+class _SiteRequest(HttpRequest):
+    """Richiesta sintetica con host e schema presi da SITE_URL"""
+
+    def __init__(self, site_url):
+        super().__init__()
+        self._site_url = site_url
+
+    def get_host(self):
+        # L'host viene dalla configurazione, non da un client: nessuna validazione ALLOWED_HOSTS
+        return self._site_url.netloc
+
+    def _get_scheme(self):
+        return self._site_url.scheme or 'https'
+
+
+def build_site_request(path: str) -> HttpRequest:
+    """
+    Crea una richiesta sintetica verso SITE_URL
+
+    Serve per rigenerare i contenuti fuori dal ciclo request/response
+    (es. dai lavori in coda dopo un'approvazione).
+    """
+    site_url = urlparse(getattr(settings, 'SITE_URL', 'https://ombradelportico.it'))
+    request = _SiteRequest(site_url)
+    request.method = 'GET'
+    request.path = request.path_info = path
+    request.META['HTTP_HOST'] = site_url.netloc
+    request.META['SERVER_NAME'] = site_url.hostname or 'ombradelportico.it'
+    request.META['SERVER_PORT'] = str(site_url.port or (443 if site_url.scheme == 'https' else 80))
+    return request
+
+
+def serve_prerendered(request, name: str, render, content_type: str, max_age: int = None,
+                      cache_timeout: int = 60) -> HttpResponse:
+    """
+    Serve un file pre-renderizzato, generandolo se mancante o scaduto
+
+    Args:
+        request: Richiesta HTTP corrente
+        name: Nome del file pre-renderizzato
+        render: Callable senza argomenti che restituisce il contenuto in bytes
+        content_type: Content-Type della risposta
+        max_age: Età massima del file in secondi prima di rigenerarlo (None = solo su invalidazione)
+        cache_timeout: max-age comunicato ai client nell'header Cache-Control
+
+    Returns:
+        HttpResponse con il contenuto o 304 Not Modified
+    """
+    path = get_prerender_path(name)
+
+    try:
+        stat_result = os.stat(path)
+        if max_age is not None and time.time() - stat_result.st_mtime > max_age:
+            stat_result = None
+    except FileNotFoundError:
+        stat_result = None
+
+    if stat_result is None:
+        logger.info(f"File pre-renderizzato '{name}' mancante o scaduto, rigenero")
+        write_prerendered(name, render())
+        stat_result = os.stat(path)
+
+    etag = _etag_for_stat(stat_result)
+    last_modified = int(stat_result.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        with open(path, 'rb') as f:
+            response = HttpResponse(f.read(), content_type=content_type)
+
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified)
+    patch_response_headers(response, cache_timeout=cache_timeout)
+    return response
@@ -0,0 +1,136 @@
+"""
+Coda persistente di tentativi differiti per gli scraper
+
+Prima i video YouTube in diretta venivano ritentati con un file
+youtube_retry_<id>.txt nella cartella temporanea: ogni controllo leggeva
+tutta la cartella e un riavvio cancellava i tentativi. Qui ogni tentativo è
+una riga TentativoProgrammato, unica per (tipo, chiave):
+
+- schedule() programma un elemento dopo ritardo_base secondi (se è già in
+  coda non lo sposta e non conta un nuovo tentativo)
+- claim_due() prende gli elementi scaduti con l'indice (tipo, scadenza), in
+  ordine di scadenza, e ne sposta la scadenza di LEASE secondi con un UPDATE
+  condizionato: un processo che muore a metà non perde l'elemento, e due
+  processi non lo prendono entrambi
+- complete() lo toglie dalla coda; retry_later() lo riprogramma con backoff
+  esponenziale (ritardo_base * 2^tentativi, al massimo BACKOFF_MAX) e lo
+  abbandona dopo max_tentativi
+"""
+import logging
+import random
+from datetime import timedelta
+from typing import TYPE_CHECKING, List, Optional
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+
+if TYPE_CHECKING:
+    from .models import TentativoProgrammato
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'MAX_ATTEMPTS': 6,
+    'BACKOFF_MAX': 24 * 3600,
+    'LEASE': 900,
+    'CLAIM_LIMIT': 20,
+}
+
+# Tipi di tentativo
+YOUTUBE_TRANSCRIPT = 'youtube_trascrizione'
+
+
+def get_retry_setting(name: str):
+    """Legge un'impostazione da settings.RETRY_QUEUE con fallback ai default"""
+    return getattr(settings, 'RETRY_QUEUE', {}).get(name, DEFAULT_SETTINGS[name])
+
+
+def _backoff_seconds(ritardo_base: int, tentativi: int) -> float:
+    """ritardo_base * 2^tentativi con jitter, limitato a BACKOFF_MAX"""
+    delay = min(ritardo_base * (2 ** tentativi), get_retry_setting('BACKOFF_MAX'))
+    return delay * random.uniform(0.9, 1.1)
+
+
+def schedule(tipo: str, chiave: str, delay: int, payload: dict = None,
+             max_tentativi: Optional[int] = None) -> bool:
+    """
+    Programma un tentativo tra delay secondi
+
+    Returns:
+        True se l'elemento è stato aggiunto, False se era già in coda
+    """
+    from .models import TentativoProgrammato
+
+    try:
+        _, created = TentativoProgrammato.objects.get_or_create(
+            tipo=tipo,
+            chiave=chiave,
+            defaults={
+                'payload': payload or {},
+                'ritardo_base': delay,
+                'max_tentativi': max_tentativi or get_retry_setting('MAX_ATTEMPTS'),
+                'scadenza': timezone.now() + timedelta(seconds=delay),
+            },
+        )
+    except IntegrityError:
+        # Inserito nel frattempo da un altro processo
+        created = False
+    if created:
+        logger.info(f"Tentativo {tipo} per {chiave} programmato tra {delay} secondi")
+    return created
+
+
+def claim_due(tipo: str, limit: Optional[int] = None) -> List['TentativoProgrammato']:
+    """Prende in carico gli elementi di un tipo la cui scadenza è passata"""
+    from .models import TentativoProgrammato
+
+    now = timezone.now()
+    lease_until = now + timedelta(seconds=get_retry_setting('LEASE'))
+    candidates = list(
+        TentativoProgrammato.objects.filter(tipo=tipo, scadenza__lte=now)
+        .order_by('scadenza')[:limit or get_retry_setting('CLAIM_LIMIT')]
+    )
+
+    claimed = []
+    for item in candidates:
+        if TentativoProgrammato.objects.filter(pk=item.pk, scadenza=item.scadenza).update(
+                scadenza=lease_until, data_aggiornamento=now):
+            item.scadenza = lease_until
+            claimed.append(item)
+    return claimed
+
+
+def complete(item: 'TentativoProgrammato'):
+    """Tentativo riuscito (o non più necessario): l'elemento esce dalla coda"""
+    from .models import TentativoProgrammato
+
+    TentativoProgrammato.objects.filter(pk=item.pk).delete()
+
+
+def retry_later(item: 'TentativoProgrammato', error: str = '') -> bool:
+    """
+    Tentativo fallito: riprogramma con backoff esponenziale
+
+    Returns:
+        False se l'elemento ha esaurito max_tentativi ed è stato abbandonato
+    """
+    from .models import TentativoProgrammato
+
+    tentativi = item.tentativi + 1
+    if tentativi >= item.max_tentativi:
+        logger.warning(f"Tentativo {item.tipo} per {item.chiave} abbandonato dopo {tentativi} tentativi: {error}")
+        complete(item)
+        return False
+
+    delay = _backoff_seconds(item.ritardo_base, tentativi)
+    now = timezone.now()
+    TentativoProgrammato.objects.filter(pk=item.pk).update(
+        tentativi=tentativi,
+        scadenza=now + timedelta(seconds=delay),
+        ultimo_errore=error or None,
+        data_aggiornamento=now,
+    )
+    logger.info(f"Tentativo {item.tipo} per {item.chiave} fallito ({tentativi}/{item.max_tentativi}), "
+                f"nuovo tentativo tra {delay:.0f} secondi")
+    return True
@@ -0,0 +1,199 @@
+"""
+Governatore di quota e frequenza per Google Custom Search
+
+Il singleton WebSearchTool è condiviso da tutti i thread dei monitor, e
+monitor, web e worker sono processi diversi: un limite in memoria non vede le
+richieste degli altri e la quota esaurita si scopre solo con un 429. Qui lo
+stato è una riga QuotaServizio nel database:
+
+- token bucket (RATE_PER_SECOND, BURST) per la frequenza delle richieste
+- contatore giornaliero delle richieste, azzerato alla mezzanotte del
+  Pacifico come la quota di Google
+- quando restano RESERVE richieste o meno la ricerca passa subito al
+  fallback, senza consumare le ultime chiamate né attendere il 429
+
+Gli aggiornamenti usano un controllo ottimistico (UPDATE condizionato sui
+valori letti): funziona tra processi senza lock del database.
+"""
+import logging
+import threading
+import time
+from datetime import date, datetime
+from typing import Any, Dict, Optional
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'DAILY_LIMIT': 100,
+    'RESERVE': 5,
+    'RATE_PER_SECOND': 1.0,
+    'BURST': 3,
+    'MAX_WAIT': 15,
+}
+
+GOOGLE_SEARCH = 'google_search'
+
+# La quota di Google si azzera a mezzanotte, ora del Pacifico
+QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')
+
+# Tentativi di aggiornamento ottimistico prima di rinunciare
+MAX_CONFLICTS = 20
+
+
+def get_quota_setting(name: str):
+    """Legge un'impostazione da settings.GOOGLE_SEARCH_QUOTA con fallback ai default"""
+    return getattr(settings, 'GOOGLE_SEARCH_QUOTA', {}).get(name, DEFAULT_SETTINGS[name])
+
+
+def quota_day() -> date:
+    return datetime.now(QUOTA_TIMEZONE).date()
+
+
+class QuotaGovernor:
+    """Token bucket e quota giornaliera persistiti, thread-safe e condivisi tra processi"""
+
+    def __init__(self, servizio: str, daily_limit: int, reserve: int,
+                 rate_per_second: float, burst: int, max_wait: float):
+        self.servizio = servizio
+        self.daily_limit = daily_limit
+        self.reserve = reserve
+        self.rate = rate_per_second
+        self.burst = burst
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self.rifiutate = 0  # richieste mandate al fallback dal processo
+
+    def _row(self):
+        from .models import QuotaServizio
+
+        today = quota_day()
+        try:
+            row, _ = QuotaServizio.objects.get_or_create(
+                servizio=self.servizio,
+                defaults={'giorno': today, 'token': self.burst, 'ultimo_rifornimento': time.time()},
+            )
+        except IntegrityError:
+            row = QuotaServizio.objects.get(servizio=self.servizio)
+        return row
+
+    def _state(self, row, now: float):
+        """Stato corrente calcolato dalla riga: (richieste oggi, esaurita, token disponibili)"""
+        if row.giorno != quota_day():
+            richieste, esaurita = 0, False
+        else:
+            richieste, esaurita = row.richieste, row.esaurita
+        token = min(self.burst, row.token + max(0.0, now - row.ultimo_rifornimento) * self.rate)
+        return richieste, esaurita, token
+
+    def _save(self, row, richieste: int, esaurita: bool, token: float, now: float) -> bool:
+        """UPDATE condizionato: False se un altro processo ha modificato la riga nel frattempo"""
+        from .models import QuotaServizio
+
+        updated = QuotaServizio.objects.filter(
+            pk=row.pk, giorno=row.giorno, richieste=row.richieste, ultimo_rifornimento=row.ultimo_rifornimento,
+        ).update(giorno=quota_day(), richieste=richieste, esaurita=esaurita, token=token, ultimo_rifornimento=now)
+        return updated == 1
+
+    def remaining(self) -> int:
+        """Richieste ancora disponibili oggi (0 se la quota è stata segnalata esaurita)"""
+        richieste, esaurita, _ = self._state(self._row(), time.time())
+        return 0 if esaurita else max(0, self.daily_limit - richieste)
+
+    def has_budget(self) -> bool:
+        """True se restano più di RESERVE richieste nella quota giornaliera"""
+        return self.remaining() > self.reserve
+
+    def acquire(self, max_wait: Optional[float] = None) -> bool:
+        """
+        Prenota una richiesta, attendendo il token bucket al massimo max_wait secondi
+
+        Returns:
+            True se la richiesta può partire; False se la quota è sotto la riserva
+            o l'attesa supererebbe max_wait (il chiamante usa il fallback)
+        """
+        if max_wait is None:
+            max_wait = self.max_wait
+        deadline = time.monotonic() + max_wait
+
+        conflicts = 0
+        while True:
+            with self._lock:
+                row = self._row()
+                now = time.time()
+                richieste, esaurita, token = self._state(row, now)
+
+                if esaurita or self.daily_limit - richieste <= self.reserve:
+                    self.rifiutate += 1
+                    return False
+
+                if token >= 1:
+                    if self._save(row, richieste + 1, esaurita, token - 1, now):
+                        return True
+                    conflicts += 1
+                    if conflicts >= MAX_CONFLICTS:
+                        logger.warning(f"Quota {self.servizio}: troppi conflitti di aggiornamento")
+                        return False
+                    continue
+
+            # Attesa del prossimo token fuori dal lock
+            wait = (1 - token) / self.rate
+            if time.monotonic() + wait > deadline:
+                logger.info(f"Quota {self.servizio}: attesa di {wait:.1f}s oltre il limite, uso fallback")
+                self.rifiutate += 1
+                return False
+            time.sleep(wait)
+
+    def mark_exhausted(self):
+        """Registra un 429 del fornitore: nessuna richiesta fino al prossimo giorno di quota"""
+        with self._lock:
+            for _ in range(MAX_CONFLICTS):
+                row = self._row()
+                now = time.time()
+                richieste, _, token = self._state(row, now)
+                if self._save(row, max(richieste, self.daily_limit), True, token, now):
+                    break
+        logger.warning(f"Quota {self.servizio} esaurita fino alla mezzanotte (ora del Pacifico)")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Stato della quota di oggi, per log e admin"""
+        richieste, esaurita, token = self._state(self._row(), time.time())
+        return {
+            'servizio': self.servizio,
+            'giorno': quota_day().isoformat(),
+            'richieste': richieste,
+            'limite': self.daily_limit,
+            'rimanenti': 0 if esaurita else max(0, self.daily_limit - richieste),
+            'riserva': self.reserve,
+            'esaurita': esaurita,
+            'token': round(token, 2),
+            'rifiutate_processo': self.rifiutate,
+        }
+
+
+_governor: Optional[QuotaGovernor] = None
+_governor_lock = threading.Lock()
+
+
+def get_search_governor() -> QuotaGovernor:
+    """Governatore di Google Custom Search, creato al primo utilizzo con i limiti da settings"""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = QuotaGovernor(
+                GOOGLE_SEARCH,
+                daily_limit=get_quota_setting('DAILY_LIMIT'),
+                reserve=get_quota_setting('RESERVE'),
+                rate_per_second=get_quota_setting('RATE_PER_SECOND'),
+                burst=get_quota_setting('BURST'),
+                max_wait=get_quota_setting('MAX_WAIT'),
+            )
+        return _governor
+
+
+def get_metrics() -> Dict[str, Any]:
+    """Scorciatoia per get_search_governor().get_metrics()"""
+    return get_search_governor().get_metrics()
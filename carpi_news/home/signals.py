@@ -1,90 +1,91 @@
 import logging
-import threading
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
-from django.core.cache import cache
 from django.core.cache.utils import make_template_fragment_key
+from django.utils import timezone
 from .models import Articolo
-from .email_notifications import send_article_approval_notification
-from .social_sharing import social_manager
+from .image_health import schedule_image_check
+from .story_clustering import story_index
+from .job_queue import dispatch
+from . import jobs
 
 logger = logging.getLogger(__name__)
 
+# Priorità dei lavori in coda: i feed servono a IFTTT, quindi prima di tutto
+PRIORITA_FEED = 20
+PRIORITA_NOTIFICHE = 10
+
 
 def invalidate_rss_feeds():
     """
-    Invalida la cache dei feed RSS per forzare l'aggiornamento immediato
+    Accoda la rigenerazione dei feed RSS/Atom pre-renderizzati
+
+    Più richieste ravvicinate vengono accorpate in un unico lavoro in attesa.
     """
     try:
-        # Django syndication framework usa cache interno per i feed
-        # Invalidiamo le chiavi di cache comuni per i feed RSS
-        cache_keys_to_invalidate = [
-            'syndication:rss-feed',
-            'syndication:atom-feed', 
-            'syndication:recenti-feed',
-            'feeds:ArticoliFeedRSS',
-            'feeds:ArticoliFeedAtom',
-            'feeds:ArticoliRecentiFeed',
-        ]
-        
-        for key in cache_keys_to_invalidate:
-            cache.delete(key)
-        
-        # Invalida anche eventuali cache con timestamp
-        from datetime import datetime
-        today = datetime.now().strftime('%Y%m%d')
-        cache.delete(f'rss_feed_{today}')
-        cache.delete(f'rss_recenti_{today}')
-        
-        logger.info("Cache dei feed RSS invalidata per aggiornamento immediato")
-        
+        dispatch(jobs.RIGENERA_FEED, chiave=jobs.RIGENERA_FEED, priorita=PRIORITA_FEED)
     except Exception as e:
-        logger.error(f"Errore nell'invalidazione cache RSS: {e}")
+        logger.error(f"Errore nell'accodamento della rigenerazione dei feed RSS: {e}")
+
+
+def invalidate_sitemaps(*dates):
+    """
+    Accoda la rigenerazione delle sitemap dei mesi con le date indicate
+    """
+    dates = [d for d in dates if d]
+    months = sorted({timezone.localtime(d).strftime('%Y-%m') for d in dates})
+    try:
+        dispatch(
+            jobs.RIGENERA_SITEMAP,
+            {'date': [d.isoformat() for d in dates]},
+            chiave=f"{jobs.RIGENERA_SITEMAP}:{','.join(months)}",
+        )
+    except Exception as e:
+        logger.error(f"Errore nell'accodamento della rigenerazione delle sitemap: {e}")
 
 
 @receiver(pre_save, sender=Articolo)
 def track_approval_change(sender, instance, **kwargs):
-    """Traccia i cambiamenti dello stato di approvazione prima del salvataggio"""
-    if instance.pk:
-        try:
-            # Ottieni lo stato precedente dall'oggetto esistente
-            old_instance = Articolo.objects.get(pk=instance.pk)
-            # Salva lo stato precedente in cache per il post_save
-            cache.set(f'article_approval_state_{instance.pk}', {
-                'was_approved': old_instance.approvato,
-                'is_approved': instance.approvato
-            }, 60)  # Cache per 1 minuto
-        except Articolo.DoesNotExist:
-            # Caso edge: pk esiste ma oggetto non trovato
-            cache.set(f'article_approval_state_{instance.pk}', {
-                'was_approved': False,
-                'is_approved': instance.approvato
-            }, 60)
-    else:
-        # Nuovo articolo (pk è None) - usa l'id dell'oggetto Python temporaneamente
-        cache.set(f'article_approval_state_new_{id(instance)}', {
-            'was_approved': False,
-            'is_approved': instance.approvato
-        }, 60)
+    """
+    Garantisce che sia noto lo stato salvato dell'articolo prima del salvataggio
+
+    Le istanze caricate dal database hanno già lo stato in memoria (Articolo.from_db),
+    quindi non serve nessuna query. Solo per istanze costruite a mano con una pk
+    o caricate con approvato differito si legge lo stato dal database.
+    """
+    if instance.pk and not instance.ha_stato_caricato('approvato'):
+        valori = Articolo.objects.filter(pk=instance.pk).values(*Articolo.CAMPI_TRACCIATI).first()
+        if valori:
+            instance.salva_stato_caricato(valori)
+
+
+def _is_new_article(instance, created):
+    """
+    Vero per un articolo appena creato o per una bozza in streaming appena completata
+
+    Le bozze (in_generazione) non generano notifiche né indicizzazione finché
+    la generazione non è terminata.
+    """
+    if created:
+        return not instance.in_generazione
+    return instance.valore_precedente('in_generazione', False) and not instance.in_generazione
 
 
 @receiver(post_save, sender=Articolo)
 def article_created_notification(sender, instance, created, **kwargs):
     """
-    Invia notifica email quando viene creato un nuovo articolo non approvato
+    Accoda la notifica email quando viene creato un nuovo articolo non approvato
     """
-    if created and not instance.approvato:
-        logger.info(f"Nuovo articolo creato (ID: {instance.id}) - Invio notifica email")
-        
-        # Invia email di notifica in modo asincrono per non bloccare il salvataggio
+    if _is_new_article(instance, created) and not instance.approvato:
+        if instance.duplicato_di_id:
+            # L'originale è già stato notificato; il duplicato resta visibile in admin
+            logger.info(f"Nuovo duplicato (ID: {instance.id}) dell'articolo {instance.duplicato_di_id} - nessuna notifica")
+            return
+        logger.info(f"Nuovo articolo creato (ID: {instance.id}) - Notifica email accodata")
         try:
-            success = send_article_approval_notification(instance)
-            if success:
-                logger.info(f"Notifica email inviata per articolo ID {instance.id}")
-            else:
-                logger.warning(f"Impossibile inviare notifica email per articolo ID {instance.id}")
+            dispatch(jobs.NOTIFICA_EMAIL, {'articolo_id': instance.id}, priorita=PRIORITA_NOTIFICHE)
         except Exception as e:
-            logger.error(f"Errore nell'invio notifica per articolo ID {instance.id}: {e}")
+            logger.error(f"Errore nell'accodamento della notifica per articolo ID {instance.id}: {e}")
 
 
 @receiver(post_save, sender=Articolo)
@@ -92,77 +93,66 @@ def handle_article_approval(sender, instance, created, **kwargs):
     """
     Gestisce la condivisione automatica quando un articolo viene approvato
     """
-    # Recupera lo stato di approvazione dalla cache
-    approval_state = cache.get(f'article_approval_state_{instance.pk}')
-    
-    # Per articoli nuovi, controlla anche la cache temporanea
-    if not approval_state and created:
-        approval_state = cache.get(f'article_approval_state_new_{id(instance)}')
-        if approval_state:
-            cache.delete(f'article_approval_state_new_{id(instance)}')
-    
-    if not approval_state:
-        # Se non c'è cache, assumiamo sia un nuovo articolo
-        was_approved = False
-        is_approved = instance.approvato
-    else:
-        was_approved = approval_state['was_approved']
-        is_approved = approval_state['is_approved']
-        # Pulizia cache
-        if instance.pk:
-            cache.delete(f'article_approval_state_{instance.pk}')
-    
+    is_approved = instance.approvato
+    was_approved = False if created else instance.valore_precedente('approvato', False)
+
     # Condividi se:
     # 1. L'articolo è passato da non approvato ad approvato (approvazione manuale)
     # 2. L'articolo è nuovo e già approvato (auto-approvazione)
     if (not was_approved and is_approved) or (created and is_approved):
         logger.info(f"Articolo '{instance.titolo}' appena approvato, aggiorno feed RSS e avvio condivisione automatica")
         
-        # Invalida immediatamente la cache RSS per IFTTT
+        # Rigenera i feed RSS per IFTTT e le sitemap, poi condividi sui social
         invalidate_rss_feeds()
-        
-        # Avvia la condivisione in background per non bloccare la request
-        thread = threading.Thread(
-            target=_share_article_background,
-            args=(instance.pk, instance.titolo)
-        )
-        thread.daemon = True
-        thread.start()
-        
-        logger.info(f"Feed RSS aggiornato e thread di condivisione avviato per articolo: {instance.titolo}")
+        _invalidate_article_sitemaps(instance)
+        try:
+            dispatch(
+                jobs.CONDIVIDI_SOCIAL,
+                {'articolo_id': instance.pk},
+                chiave=f"{jobs.CONDIVIDI_SOCIAL}:{instance.pk}",
+                priorita=PRIORITA_NOTIFICHE,
+            )
+        except Exception as e:
+            logger.error(f"Errore nell'accodamento della condivisione per '{instance.titolo}': {e}")
 
+        logger.info(f"Aggiornamento feed e condivisione accodati per articolo: {instance.titolo}")
+
+    elif (was_approved or is_approved) and (created or instance.campi_modificati()):
+        # Articolo già pubblicato modificato o ritirato: feed e sitemap vanno aggiornati
+        invalidate_rss_feeds()
+        _invalidate_article_sitemaps(instance)
+
+
+@receiver(post_save, sender=Articolo)
+def check_article_image(sender, instance, **kwargs):
+    """Pianifica la verifica in background dell'immagine se è cambiata"""
+    schedule_image_check(instance)
+
+
+@receiver(post_save, sender=Articolo)
+def index_article_story(sender, instance, created, **kwargs):
+    """Aggiunge i nuovi articoli originali all'indice delle storie"""
+    if _is_new_article(instance, created) and not instance.duplicato_di_id and instance.firma_fonte:
+        try:
+            story_index.add(instance.id, instance.firma_fonte, urls=[instance.fonte])
+        except Exception as e:
+            logger.error(f"Errore nell'indicizzazione della storia per articolo ID {instance.id}: {e}")
+
+
+@receiver(post_delete, sender=Articolo)
+def remove_article_story(sender, instance, **kwargs):
+    story_index.remove(instance.id)
+
+
+@receiver(post_delete, sender=Articolo)
+def handle_article_deletion(sender, instance, **kwargs):
+    """Rigenera feed e sitemap quando viene eliminato un articolo pubblicato"""
+    if instance.approvato:
+        invalidate_rss_feeds()
+        _invalidate_article_sitemaps(instance)
+
+
+def _invalidate_article_sitemaps(instance):
+    """Accoda la rigenerazione delle sitemap dei mesi (vecchio e nuovo) dell'articolo"""
+    invalidate_sitemaps(instance.valore_precedente('data_pubblicazione'), instance.data_pubblicazione)
 
-def _share_article_background(article_id, article_title):
-    """
-    Esegue la condivisione sui social in background
-    """
-    try:
-        # Piccolo ritardo per evitare race conditions con la transazione di approvazione
-        import time
-        time.sleep(1)
-        
-        # Ricarica l'articolo dal database per sicurezza
-        articolo = Articolo.objects.get(pk=article_id)
-        
-        # Verifica che sia ancora approvato (doppio controllo)
-        if not articolo.approvato:
-            logger.warning(f"Articolo {article_title} non più approvato, annullo condivisione. Controllare signals, potrebbe essere un race condition.")
-            return
-        
-        # Esegui la condivisione
-        results = social_manager.share_article_on_approval(articolo)
-        
-        # Log dei risultati
-        successful_platforms = [platform for platform, success in results.items() if success]
-        failed_platforms = [platform for platform, success in results.items() if not success]
-        
-        if successful_platforms:
-            logger.info(f"Condivisione completata con successo per '{article_title}' su: {', '.join(successful_platforms)}")
-        
-        if failed_platforms:
-            logger.warning(f"Condivisione fallita per '{article_title}' su: {', '.join(failed_platforms)}")
-            
-    except Articolo.DoesNotExist:
-        logger.error(f"Articolo con ID {article_id} non trovato durante condivisione")
-    except Exception as e:
-        logger.error(f"Errore durante condivisione background per articolo '{article_title}': {str(e)}")
\ No newline at end of file
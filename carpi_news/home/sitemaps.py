@@ -0,0 +1,170 @@
+"""
+Sitemap pre-renderizzate: Google News e archivio completo
+
+- sitemap-news.xml: articoli approvati degli ultimi 2 giorni (Google News)
+- sitemap.xml: indice con una sitemap per ogni mese di pubblicazione
+- sitemap-AAAA-MM.xml: articoli approvati pubblicati nel mese
+
+I file vengono rigenerati in modo incrementale quando un articolo viene
+approvato, modificato o rimosso (solo i mesi coinvolti e l'indice) e serviti
+da disco con ETag/Last-Modified tramite prerender, senza query al database.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Max
+from django.db.models.functions import TruncMonth
+from django.http import Http404
+from django.template import loader
+from django.utils import timezone
+
+from .models import Articolo
+from .prerender import serve_prerendered, write_prerendered, delete_prerendered
+
+logger = logging.getLogger(__name__)
+
+NEWS_SITEMAP_NAME = 'sitemap_news.xml'
+INDEX_SITEMAP_NAME = 'sitemap_index.xml'
+NEWS_SITEMAP_DAYS = 2
+
+# La finestra di 2 giorni scorre anche senza nuove approvazioni
+NEWS_SITEMAP_MAX_AGE = 900
+SITEMAP_CONTENT_TYPE = 'application/xml'
+
+
+def _site_url() -> str:
+    return getattr(settings, 'SITE_URL', 'https://ombradelportico.it').rstrip('/')
+
+
+def month_sitemap_name(year: int, month: int) -> str:
+    """Nome del file pre-renderizzato per la sitemap di un mese"""
+    return f'sitemap-{year:04d}-{month:02d}.xml'
+
+
+def _month_bounds(year: int, month: int):
+    """Inizio (incluso) e fine (esclusa) del mese nel fuso orario corrente"""
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime(year, month, 1), tz)
+    if month == 12:
+        end = timezone.make_aware(datetime(year + 1, 1, 1), tz)
+    else:
+        end = timezone.make_aware(datetime(year, month + 1, 1), tz)
+    return start, end
+
+
+def render_news_sitemap() -> bytes:
+    """Renderizza la sitemap Google News con una sola query"""
+    cutoff_date = timezone.now() - timedelta(days=NEWS_SITEMAP_DAYS)
+    articles = list(
+        Articolo.objects.filter(
+            approvato=True,
+            data_pubblicazione__gte=cutoff_date
+        ).only('titolo', 'slug', 'data_pubblicazione').order_by('-data_pubblicazione')
+    )
+
+    logger.info(f"Generata sitemap news con {len(articles)} articoli")
+
+    template = loader.get_template('sitemap_news.xml')
+    return template.render({'articles': articles, 'site_url': _site_url()}).encode('utf-8')
+
+
+def render_month_sitemap(year: int, month: int) -> bytes:
+    """
+    Renderizza la sitemap degli articoli approvati pubblicati in un mese
+
+    Raises:
+        Http404: se nel mese non ci sono articoli approvati
+    """
+    start, end = _month_bounds(year, month)
+    articles = list(
+        Articolo.objects.filter(
+            approvato=True,
+            data_pubblicazione__gte=start,
+            data_pubblicazione__lt=end,
+        ).only(
+            'slug', 'data_pubblicazione', 'foto', 'foto_upload',
+            'foto_valida', 'foto_verificata_url',
+        ).order_by('data_pubblicazione')
+    )
+    if not articles:
+        raise Http404(f"Nessun articolo per {year:04d}-{month:02d}")
+
+    template = loader.get_template('sitemap_month.xml')
+    return template.render({'articles': articles, 'site_url': _site_url()}).encode('utf-8')
+
+
+def render_sitemap_index() -> bytes:
+    """Renderizza l'indice delle sitemap mensili con una query aggregata"""
+    months = (
+        Articolo.objects.filter(approvato=True, data_pubblicazione__isnull=False)
+        .annotate(mese=TruncMonth('data_pubblicazione'))
+        .values('mese')
+        .annotate(lastmod=Max('data_pubblicazione'))
+        .order_by('-mese')
+    )
+    sitemaps = [
+        {
+            'name': month_sitemap_name(row['mese'].year, row['mese'].month),
+            'lastmod': row['lastmod'],
+        }
+        for row in months
+    ]
+
+    template = loader.get_template('sitemap_index.xml')
+    return template.render({'sitemaps': sitemaps, 'site_url': _site_url()}).encode('utf-8')
+
+
+def regenerate_month_sitemap(year: int, month: int):
+    """Rigenera la sitemap di un mese, rimuovendola se il mese è rimasto vuoto"""
+    name = month_sitemap_name(year, month)
+    try:
+        write_prerendered(name, render_month_sitemap(year, month))
+    except Http404:
+        delete_prerendered(name)
+
+
+def regenerate_sitemaps(dates=()):
+    """
+    Rigenera in modo incrementale le sitemap coinvolte da una modifica
+
+    Args:
+        dates: Date di pubblicazione degli articoli modificati (vecchie e nuove);
+               vengono rigenerati solo i mesi corrispondenti, più news e indice
+    """
+    months = {
+        (local.year, local.month)
+        for local in (timezone.localtime(d) for d in dates if d)
+    }
+
+    for year, month in sorted(months):
+        try:
+            regenerate_month_sitemap(year, month)
+        except Exception as e:
+            logger.warning(f"Rigenerazione sitemap {year:04d}-{month:02d} fallita: {e}")
+            delete_prerendered(month_sitemap_name(year, month))
+
+    for name, render in ((NEWS_SITEMAP_NAME, render_news_sitemap), (INDEX_SITEMAP_NAME, render_sitemap_index)):
+        try:
+            write_prerendered(name, render())
+        except Exception as e:
+            logger.warning(f"Rigenerazione {name} fallita, verrà renderizzata alla prossima richiesta: {e}")
+            delete_prerendered(name)
+
+
+def serve_news_sitemap(request):
+    return serve_prerendered(request, NEWS_SITEMAP_NAME, render_news_sitemap,
+                             content_type=SITEMAP_CONTENT_TYPE, max_age=NEWS_SITEMAP_MAX_AGE)
+
+
+def serve_sitemap_index(request):
+    return serve_prerendered(request, INDEX_SITEMAP_NAME, render_sitemap_index,
+                             content_type=SITEMAP_CONTENT_TYPE, cache_timeout=3600)
+
+
+def serve_month_sitemap(request, year: int, month: int):
+    if not 1 <= month <= 12:
+        raise Http404("Mese non valido")
+    return serve_prerendered(request, month_sitemap_name(year, month),
+                             lambda: render_month_sitemap(year, month),
+                             content_type=SITEMAP_CONTENT_TYPE, cache_timeout=3600)
@@ -0,0 +1,300 @@
+"""
+Raggruppamento delle notizie quasi duplicate provenienti da fonti diverse
+
+La stessa storia pubblicata da ANSA, Voce di Carpi e TempoNews ha URL e testi
+diversi, quindi l'hash dell'URL non la riconosce. Qui ogni notizia viene ridotta
+a una firma MinHash sulle parole significative di titolo e testo, indicizzata
+con LSH (bande di righe della firma): la ricerca tocca solo i bucket della
+notizia in arrivo ed è indipendente dal numero di articoli indicizzati.
+
+La firma è calcolata sul testo della fonte, non sull'articolo riscritto
+dall'AI, e salvata sull'articolo (firma_fonte): si confrontano sempre testi
+sorgente tra loro.
+
+Se una notizia in arrivo appartiene alla storia di un articolo già approvato,
+la fonte viene aggiunta a fonti_web di quell'articolo invece di generarne uno
+nuovo; un articolo ancora in revisione potrebbe essere eliminato, e con lui
+la fonte. L'indice è in memoria, aggiornato a ogni articolo creato e limitato
+a una finestra mobile (STORY_CLUSTER_WINDOW_HOURS); al primo utilizzo viene
+ricostruito dal database e al massimo ogni STORY_CLUSTER_REFRESH_SECONDS
+legge gli articoli con id successivo all'ultimo visto, così include quelli
+salvati da altri processi (monitor, worker, admin).
+"""
+import hashlib
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .content_fingerprint import normalize_text
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS  # soglia LSH ~ (1/16)^(1/4) = 0.5
+
+MIN_TOKENS = 15
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1979)  # permutazioni fisse: le firme restano confrontabili tra processi
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+# Parole frequenti di almeno 4 lettere che non caratterizzano una notizia
+STOPWORDS = frozenset("""
+    alla alle allo anche ancora aveva avere come con cosa dall dalla dalle dallo degli
+    dell della delle dello dopo dove essere fare hanno loro molto nell nella nelle nello
+    negli però perché poco prima quale quali quando quanto quella quelle quello questa
+    queste questo sarà sono stata state stati stato sulla sulle sullo sugli tutta tutte
+    tutti tutto verso viene mentre oltre senza circa ogni fino presso sempre carpi
+""".split())
+
+
+def get_cluster_setting(name: str, default):
+    return getattr(settings, f'STORY_CLUSTER_{name}', default)
+
+
+def tokenize(title: str, text: str) -> set:
+    """Parole significative (almeno 4 lettere, non stopword) di titolo e testo"""
+    words = normalize_text(f"{title or ''} {text or ''}").split()
+    return {w for w in words if len(w) >= 4 and w not in STOPWORDS and not w.isdigit()}
+
+
+def _hash_token(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def minhash(tokens: Iterable[str]) -> Optional[Tuple[int, ...]]:
+    """Firma MinHash di NUM_PERM valori, None se i token sono troppo pochi"""
+    hashes = [_hash_token(t) for t in tokens]
+    if len(hashes) < MIN_TOKENS:
+        return None
+    return tuple(min([(a * h + b) % _PRIME for h in hashes]) for a, b in _PERMUTATIONS)
+
+
+def source_signature(title: str, text: str) -> Optional[List[int]]:
+    """Firma della fonte da salvare in Articolo.firma_fonte (None se il testo è troppo breve)"""
+    signature = minhash(tokenize(title, text))
+    return list(signature) if signature is not None else None
+
+
+def estimated_jaccard(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    """Stima della similarità di Jaccard dalla frazione di valori uguali"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def _band_keys(signature: Tuple[int, ...]) -> List[Tuple[int, int]]:
+    return [(band, hash(signature[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+
+
+class StoryIndex:
+    """Indice MinHash/LSH degli articoli recenti, thread-safe"""
+
+    def __init__(self, window_hours: int, max_entries: int, refresh_seconds: float = 30):
+        self.window = window_hours * 3600
+        self.max_entries = max_entries
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()  # id -> (firma, timestamp, urls)
+        self._buckets: Dict[Tuple[int, int], set] = defaultdict(set)
+        self._urls: Dict[str, int] = {}
+        self._last_id = 0            # ultimo id letto dal database
+        self._drafts: set = set()    # bozze in generazione da rileggere
+        self._refreshed = 0.0
+        self._loaded = False
+
+    def _load(self):
+        """Ricostruisce l'indice dagli articoli della finestra (una volta per processo)"""
+        from .models import Articolo
+
+        since = timezone.now() - timedelta(seconds=self.window)
+        count = self._index_rows_locked(Articolo.objects.filter(data_creazione__gte=since))
+        self._loaded = True
+        self._refreshed = time.monotonic()
+        logger.info(f"Indice storie caricato con {count} articoli")
+
+    def _refresh_locked(self):
+        """
+        Aggiunge gli articoli salvati da altri processi dopo l'ultimo letto
+
+        Una query sulla chiave primaria: gli id successivi all'ultimo visto e
+        le bozze in generazione, che entrano nell'indice quando sono complete.
+        """
+        from django.db.models import Q
+        from .models import Articolo
+
+        self._index_rows_locked(Articolo.objects.filter(Q(pk__gt=self._last_id) | Q(pk__in=self._drafts)))
+        self._refreshed = time.monotonic()
+
+    def _index_rows_locked(self, queryset) -> int:
+        articles = (
+            queryset.filter(duplicato_di__isnull=True)
+            .only('id', 'firma_fonte', 'fonte', 'fonti_web', 'data_creazione', 'in_generazione')
+            .order_by('pk')
+        )
+        drafts = set()
+        count = 0
+        for articolo in articles.iterator():
+            self._last_id = max(self._last_id, articolo.id)
+            if articolo.in_generazione:
+                drafts.add(articolo.id)
+            elif articolo.firma_fonte and articolo.id not in self._entries and self._add_locked(
+                    articolo.id, articolo.firma_fonte,
+                    articolo.data_creazione.timestamp(), _article_urls(articolo)):
+                count += 1
+        # Le bozze non più restituite sono state eliminate o marcate come duplicati
+        self._drafts = drafts
+        return count
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self._load()
+        elif time.monotonic() - self._refreshed >= self.refresh_seconds:
+            self._refresh_locked()
+
+    def _remove_locked(self, article_id: int):
+        entry = self._entries.pop(article_id, None)
+        if entry is None:
+            return
+        signature, _, urls = entry
+        for key in _band_keys(signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(article_id)
+                if not bucket:
+                    del self._buckets[key]
+        for url in urls:
+            if self._urls.get(url) == article_id:
+                del self._urls[url]
+
+    def _evict_locked(self):
+        cutoff = time.time() - self.window
+        while self._entries:
+            oldest_id, (_, timestamp, _) = next(iter(self._entries.items()))
+            if timestamp >= cutoff and len(self._entries) <= self.max_entries:
+                break
+            self._remove_locked(oldest_id)
+
+    def _add_locked(self, article_id: int, signature: Iterable[int], timestamp: float, urls: Iterable[str]) -> bool:
+        signature = tuple(signature or ())
+        if len(signature) != NUM_PERM:
+            return False
+        urls = set(u for u in urls if u)
+        self._remove_locked(article_id)
+        self._entries[article_id] = (signature, timestamp, urls)
+        for url in urls:
+            self._urls[url] = article_id
+        for key in _band_keys(signature):
+            self._buckets[key].add(article_id)
+        self._evict_locked()
+        return True
+
+    def add(self, article_id: int, signature: Iterable[int], urls: Iterable[str] = (), timestamp: float = None):
+        """Aggiunge (o aggiorna) un articolo nell'indice con la firma della sua fonte"""
+        with self._lock:
+            if not self._loaded:
+                # Verrà incluso dal caricamento iniziale
+                return
+            self._add_locked(article_id, signature, timestamp or time.time(), urls)
+
+    def add_url(self, article_id: int, url: str):
+        """Registra una fonte aggiuntiva unita a un articolo già indicizzato"""
+        with self._lock:
+            entry = self._entries.get(article_id)
+            if entry is not None and url:
+                entry[2].add(url)
+                self._urls[url] = article_id
+
+    def remove(self, article_id: int):
+        with self._lock:
+            self._remove_locked(article_id)
+
+    def article_for_url(self, url: str) -> Optional[int]:
+        """Articolo che ha già questa fonte (principale o aggiuntiva), se nella finestra"""
+        with self._lock:
+            self._ensure_loaded()
+            return self._urls.get(url)
+
+    def matches(self, title: str, text: str, threshold: float = None) -> List[Tuple[int, float]]:
+        """
+        Articoli della stessa storia
+
+        Returns:
+            (id articolo, similarità stimata) dei candidati sopra soglia, dal più simile
+        """
+        if threshold is None:
+            threshold = get_cluster_setting('THRESHOLD', 0.5)
+        signature = minhash(tokenize(title, text))
+        if signature is None:
+            return []
+
+        with self._lock:
+            self._ensure_loaded()
+            self._evict_locked()
+            candidates = set()
+            for key in _band_keys(signature):
+                candidates.update(self._buckets.get(key, ()))
+            scored = [(article_id, estimated_jaccard(signature, self._entries[article_id][0]))
+                      for article_id in candidates]
+        return sorted((match for match in scored if match[1] >= threshold), key=lambda match: -match[1])
+
+    def find(self, title: str, text: str, threshold: float = None) -> Optional[Tuple[int, float]]:
+        """Candidato migliore di matches(), o None"""
+        found = self.matches(title, text, threshold)
+        return found[0] if found else None
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _article_urls(articolo) -> List[str]:
+    urls = [articolo.fonte]
+    for fonte in articolo.fonti_web or []:
+        if isinstance(fonte, dict) and fonte.get('fonte_aggiuntiva'):
+            urls.append(fonte.get('url'))
+    return urls
+
+
+def merge_source(article_id: int, article_data: dict) -> Optional[bool]:
+    """
+    Aggiunge una fonte a fonti_web dell'articolo approvato della stessa storia
+
+    Returns:
+        True se la fonte è stata aggiunta, False se era già presente, None se
+        l'articolo non è approvato (o non esiste più) e la fonte non va unita
+    """
+    from .models import Articolo
+
+    url = article_data['url']
+    with transaction.atomic():
+        articolo = Articolo.objects.select_for_update().filter(pk=article_id, approvato=True).first()
+        if articolo is None:
+            return None
+        fonti = list(articolo.fonti_web or [])
+        if articolo.fonte == url or any(isinstance(f, dict) and f.get('url') == url for f in fonti):
+            return False
+        fonti.append({
+            'url': url,
+            'title': article_data.get('title', ''),
+            'query_used': 'Stessa notizia da altra fonte',
+            'fonte_aggiuntiva': True,
+        })
+        articolo.fonti_web = fonti
+        articolo.save(update_fields=['fonti_web'])
+
+    story_index.add_url(article_id, url)
+    return True
+
+
+story_index = StoryIndex(
+    window_hours=get_cluster_setting('WINDOW_HOURS', 48),
+    max_entries=get_cluster_setting('MAX_ENTRIES', 5000),
+    refresh_seconds=get_cluster_setting('REFRESH_SECONDS', 30),
+)
@@ -0,0 +1,129 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from home import ai_batch
+from home.ai_batch import LocalBatchBackend, check_batch, queue_request, submit_pending
+from home.jobs import CONTROLLA_BATCH, INVIA_BATCH
+from home.models import Articolo, Job, RichiestaBatch
+
+
+def params(content):
+    return {'model': 'modello', 'max_tokens': 100, 'system': None,
+            'messages': [{'role': 'user', 'content': content}]}
+
+
+def notizia(n):
+    return {'url': f'https://example.com/eventi/{n}', 'title': f'Evento {n}',
+            'full_content': f'Descrizione evento {n}', 'source_type': 'test'}
+
+
+class LocalBatchBackendTests(SimpleTestCase):
+    def test_default_responder_uses_original_title(self):
+        backend = LocalBatchBackend()
+        batch_id = backend.submit([{'custom_id': 'a', 'params': params('Titolo originale: Sagra\nTesto')}])
+
+        self.assertTrue(backend.is_ended(batch_id))
+        self.assertEqual(list(backend.results(batch_id)),
+                         [('a', 'Sagra\n\nTitolo originale: Sagra\nTesto', None, False)])
+        # I risultati vengono consegnati una sola volta
+        self.assertEqual(list(backend.results(batch_id)), [])
+
+    def test_responder_errors_are_retryable(self):
+        def responder(request_params):
+            if 'rotto' in request_params['messages'][0]['content']:
+                raise RuntimeError('risposta non valida')
+            return 'ok'
+
+        backend = LocalBatchBackend(responder)
+        batch_id = backend.submit([{'custom_id': 'a', 'params': params('rotto')},
+                                   {'custom_id': 'b', 'params': params('sano')}])
+
+        self.assertEqual(list(backend.results(batch_id)),
+                         [('a', None, 'risposta non valida', True), ('b', 'ok', None, False)])
+
+    def test_batches_are_independent(self):
+        backend = LocalBatchBackend(lambda request_params: 'ok')
+        first = backend.submit([{'custom_id': 'a', 'params': params('x')}])
+        second = backend.submit([{'custom_id': 'b', 'params': params('y')}])
+
+        self.assertNotEqual(first, second)
+        self.assertEqual([r[0] for r in backend.results(second)], ['b'])
+        self.assertEqual([r[0] for r in backend.results(first)], ['a'])
+
+
+@override_settings(JOB_QUEUE={'AUTOSTART': False}, AI_BATCH={'MAX_REQUESTS': 2, 'COLLECT_SECONDS': 60, 'POLL_SECONDS': 60})
+class BatchFlowTests(TestCase):
+    def setUp(self):
+        self.backend = LocalBatchBackend(lambda request_params: 'Titolo\n\nArticolo generato')
+        previous = ai_batch._backend
+        ai_batch.set_backend(self.backend)
+        self.addCleanup(ai_batch.set_backend, previous)
+
+    def test_queue_request_is_idempotent_and_schedules_one_submit(self):
+        first = queue_request('eventi', notizia(1), params('a'))
+        self.assertEqual(queue_request('eventi', notizia(1), params('a')), first)
+        queue_request('eventi', notizia(2), params('b'))
+
+        self.assertEqual(RichiestaBatch.objects.count(), 2)
+        self.assertEqual(Job.objects.filter(tipo=INVIA_BATCH).count(), 1)
+
+    def test_submit_respects_max_requests(self):
+        for n in range(3):
+            queue_request('eventi', notizia(n), params(str(n)))
+
+        batch_id = submit_pending()
+
+        sent = RichiestaBatch.objects.filter(stato=RichiestaBatch.STATO_INVIATA)
+        self.assertEqual(sent.count(), 2)
+        self.assertEqual(set(sent.values_list('batch_id', flat=True)), {batch_id})
+        self.assertTrue(Job.objects.filter(tipo=CONTROLLA_BATCH, chiave=f"{CONTROLLA_BATCH}:{batch_id}").exists())
+        # La richiesta rimasta parte con il batch successivo
+        self.assertEqual(RichiestaBatch.objects.filter(stato=RichiestaBatch.STATO_IN_ATTESA).count(), 1)
+        self.assertIsNotNone(submit_pending())
+        self.assertIsNone(submit_pending())
+
+    def test_submit_drops_none_params(self):
+        queue_request('eventi', notizia(1), params('a'))
+        with mock.patch.object(self.backend, 'submit', wraps=self.backend.submit) as submit:
+            submit_pending()
+
+        self.assertNotIn('system', submit.call_args[0][0][0]['params'])
+
+    def test_check_batch_saves_articles(self):
+        queue_request('eventi', notizia(1), params('a'))
+        batch_id = submit_pending()
+        articolo = Articolo.objects.create(titolo='Titolo', slug='titolo', contenuto='Articolo generato')
+        monitor = mock.Mock(**{'save_generated_article.return_value': articolo})
+
+        with mock.patch('home.universal_news_monitor.UniversalNewsMonitor.get_for_config', return_value=monitor):
+            self.assertTrue(check_batch(batch_id))
+
+        richiesta = RichiestaBatch.objects.get()
+        self.assertEqual((richiesta.stato, richiesta.articolo), (RichiestaBatch.STATO_COMPLETATA, articolo))
+        data, text = monitor.save_generated_article.call_args[0][:2]
+        self.assertEqual((data['url'], text), (notizia(1)['url'], 'Titolo\n\nArticolo generato'))
+
+    def test_check_batch_falls_back_to_realtime_generation(self):
+        self.backend.responder = mock.Mock(side_effect=RuntimeError('scaduta'))
+        queue_request('eventi', notizia(1), params('a'))
+        batch_id = submit_pending()
+        monitor = mock.Mock()
+
+        with mock.patch('home.universal_news_monitor.UniversalNewsMonitor.get_for_config', return_value=monitor):
+            check_batch(batch_id)
+
+        richiesta = RichiestaBatch.objects.get()
+        self.assertEqual((richiesta.stato, richiesta.errore), (RichiestaBatch.STATO_FALLITA, 'scaduta'))
+        monitor.enqueue_ai_generation.assert_called_once_with(notizia(1))
+
+    def test_check_batch_not_ended_is_polled_again(self):
+        queue_request('eventi', notizia(1), params('a'))
+        batch_id = submit_pending()
+        Job.objects.filter(tipo=CONTROLLA_BATCH).delete()
+
+        with mock.patch.object(self.backend, 'is_ended', return_value=False):
+            self.assertFalse(check_batch(batch_id))
+
+        self.assertTrue(Job.objects.filter(tipo=CONTROLLA_BATCH).exists())
+        self.assertEqual(RichiestaBatch.objects.get().stato, RichiestaBatch.STATO_INVIATA)
@@ -0,0 +1,87 @@
+from django.test import SimpleTestCase, TestCase
+
+from home.content_fingerprint import (
+    SIMHASH_BITS, find_near_duplicate, hamming_distance, normalize_text, shingles, similarity, simhash,
+)
+from home.models import Articolo
+
+
+COMUNICATO = (
+    "Il Comune di Carpi informa che da lunedì 20 ottobre iniziano i lavori di rifacimento "
+    "della pavimentazione in piazza Martiri. Durante i lavori la circolazione sarà deviata "
+    "lungo corso Alberto Pio e via Berengario, mentre il mercato del giovedì si sposterà "
+    "temporaneamente nel parcheggio di via Cattani. I lavori dureranno circa sei settimane "
+    "e saranno eseguiti per lotti per ridurre i disagi ai residenti e ai commercianti del centro."
+)
+
+ALTRA_NOTIZIA = (
+    "La biblioteca Loria organizza un ciclo di incontri dedicati alla lettura per ragazzi "
+    "con autori e illustratori ospiti ogni sabato pomeriggio fino a dicembre. La partecipazione "
+    "è gratuita con prenotazione obbligatoria presso il banco prestiti oppure sul sito del "
+    "Comune, e i posti disponibili per ciascun incontro sono limitati a trenta partecipanti."
+)
+
+
+class SimhashTests(SimpleTestCase):
+    def test_normalize_text(self):
+        self.assertEqual(
+            normalize_text('<p>Città di <b>Carpi</b>: info su https://comune.carpi.mo.it!</p>'),
+            'citta di carpi info su',
+        )
+
+    def test_shingles(self):
+        self.assertEqual(shingles('uno due tre quattro cinque', size=4),
+                         {'uno due tre quattro', 'due tre quattro cinque'})
+        self.assertEqual(shingles('uno due', size=4), {'uno due'})
+        self.assertEqual(shingles(''), set())
+
+    def test_short_text_has_no_fingerprint(self):
+        self.assertIsNone(simhash('Avviso: chiusura uffici'))
+
+    def test_deterministic_signed_64_bit(self):
+        fingerprint = simhash(COMUNICATO)
+
+        self.assertEqual(fingerprint, simhash(COMUNICATO))
+        self.assertGreaterEqual(fingerprint, -(1 << (SIMHASH_BITS - 1)))
+        self.assertLess(fingerprint, 1 << (SIMHASH_BITS - 1))
+
+    def test_formatting_does_not_change_fingerprint(self):
+        formatted = '<div><p>' + COMUNICATO.upper().replace('.', '.</p><p>') + '</p></div>'
+
+        self.assertEqual(simhash(formatted), simhash(COMUNICATO))
+
+    def test_near_duplicate_closer_than_different_text(self):
+        original = simhash(COMUNICATO)
+        edited = simhash(COMUNICATO.replace('sei settimane', 'sette settimane'))
+        different = simhash(ALTRA_NOTIZIA)
+
+        self.assertGreaterEqual(similarity(original, edited), 0.85)
+        self.assertLess(similarity(original, different), similarity(original, edited))
+
+    def test_hamming_distance_on_signed_values(self):
+        self.assertEqual(hamming_distance(-1, 0), SIMHASH_BITS)
+        self.assertEqual(hamming_distance(0b1011, 0b0001), 2)
+        self.assertEqual(similarity(5, 5), 1.0)
+
+
+class FindNearDuplicateTests(TestCase):
+    def create(self, slug, testo, **kwargs):
+        return Articolo.objects.create(titolo=slug, slug=slug, contenuto=testo,
+                                       impronta_fonte=simhash(testo), **kwargs)
+
+    def test_finds_original_above_threshold(self):
+        original = self.create('lavori-piazza', COMUNICATO)
+        self.create('biblioteca', ALTRA_NOTIZIA)
+
+        article, score = find_near_duplicate(simhash(COMUNICATO + ' Fine del comunicato.'))
+
+        self.assertEqual(article, original)
+        self.assertGreaterEqual(score, 0.85)
+
+    def test_ignores_duplicates_and_drafts(self):
+        original = self.create('lavori-piazza', ALTRA_NOTIZIA)
+        self.create('lavori-piazza-2', COMUNICATO, duplicato_di=original)
+        self.create('lavori-piazza-bozza', COMUNICATO, in_generazione=True)
+
+        self.assertIsNone(find_near_duplicate(simhash(COMUNICATO), threshold=0.95))
+        self.assertIsNone(find_near_duplicate(None))
@@ -0,0 +1,143 @@
+from django.test import SimpleTestCase
+
+from home.imap_fetch import (
+    EmailBody, fetch_body, fetch_summaries, parse_fetch_response, select_text_part,
+)
+
+
+HEADERS = b'Subject: Consiglio comunale\r\nFrom: ufficio.stampa@comune.carpi.mo.it\r\n\r\n'
+
+# multipart/mixed: (multipart/alternative: text/plain, text/html), application/pdf allegato
+MIXED_STRUCTURE = (
+    b'((("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 12 1 NIL NIL NIL)'
+    b'("TEXT" "HTML" ("CHARSET" "iso-8859-1") NIL NIL "QUOTED-PRINTABLE" 40 2 NIL NIL NIL)'
+    b' "ALTERNATIVE" ("BOUNDARY" "b2") NIL NIL)'
+    b'("APPLICATION" "PDF" ("NAME" "delibera.pdf") NIL NIL "BASE64" 5000 NIL'
+    b' ("ATTACHMENT" ("FILENAME" "delibera.pdf")) NIL)'
+    b' "MIXED" ("BOUNDARY" "b1") NIL NIL)'
+)
+
+
+class FakeMail:
+    """Risponde ai FETCH con risposte registrate in formato imaplib"""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.commands = []
+
+    def fetch(self, message_set, items):
+        self.commands.append(('FETCH', message_set, items))
+        return self.responses.pop(0)
+
+    def uid(self, command, message_set, items):
+        self.commands.append(('UID ' + command, message_set, items))
+        return self.responses.pop(0)
+
+
+class ParseFetchResponseTests(SimpleTestCase):
+    def test_literal_and_bodystructure(self):
+        data = [
+            (b'1 (UID 345 BODY[HEADER.FIELDS (SUBJECT FROM DATE)] {%d}' % len(HEADERS), HEADERS),
+            b' BODYSTRUCTURE ' + MIXED_STRUCTURE + b')',
+        ]
+        items = parse_fetch_response(data)[b'1']
+
+        self.assertEqual(items['UID'], b'345')
+        self.assertEqual(items['BODY[HEADER.FIELDS (SUBJECT FROM DATE)]'], HEADERS)
+        structure = items['BODYSTRUCTURE']
+        self.assertEqual(structure[-4], b'MIXED')
+        self.assertEqual(structure[1][0], b'APPLICATION')
+
+    def test_nil_and_quoted_strings(self):
+        data = [b'7 (BODYSTRUCTURE ("TEXT" "PLAIN" ("NAME" "a \\"b\\"") NIL NIL "7BIT" 3 1))']
+        structure = parse_fetch_response(data)[b'7']['BODYSTRUCTURE']
+
+        self.assertEqual(structure[2], [b'NAME', b'a "b"'])
+        self.assertIsNone(structure[3])
+
+    def test_several_messages(self):
+        data = [b'1 (UID 10 FLAGS (\\Seen))', b'2 (UID 11 FLAGS ())']
+        messages = parse_fetch_response(data)
+
+        self.assertEqual(messages[b'1']['UID'], b'10')
+        self.assertEqual(messages[b'2']['FLAGS'], [])
+
+
+class SelectTextPartTests(SimpleTestCase):
+    def structure(self, raw):
+        return parse_fetch_response([b'1 (BODYSTRUCTURE ' + raw + b')'])[b'1']['BODYSTRUCTURE']
+
+    def test_html_preferred_in_nested_multipart(self):
+        part = select_text_part(self.structure(MIXED_STRUCTURE))
+
+        self.assertEqual(part.section, '1.2')
+        self.assertEqual(part.subtype, 'html')
+        self.assertEqual(part.charset, 'iso-8859-1')
+        self.assertEqual(part.encoding, 'quoted-printable')
+
+    def test_single_part_message(self):
+        part = select_text_part(self.structure(b'("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "BASE64" 20 1)'))
+
+        self.assertEqual(part.section, '1')
+        self.assertEqual(part.subtype, 'plain')
+
+    def test_text_attachment_skipped(self):
+        raw = (
+            b'(("TEXT" "PLAIN" NIL NIL NIL "7BIT" 5 1 NIL NIL NIL)'
+            b'("TEXT" "HTML" NIL NIL NIL "7BIT" 5 1 NIL ("ATTACHMENT" ("FILENAME" "a.html")) NIL)'
+            b' "MIXED" ("BOUNDARY" "x") NIL NIL)'
+        )
+        part = select_text_part(self.structure(raw))
+
+        self.assertEqual((part.section, part.subtype), ('1', 'plain'))
+
+    def test_no_text_parts(self):
+        raw = b'(("IMAGE" "JPEG" NIL NIL NIL "BASE64" 100) "MIXED" ("BOUNDARY" "x") NIL NIL)'
+
+        self.assertIsNone(select_text_part(self.structure(raw)))
+        self.assertIsNone(select_text_part(None))
+
+
+class FetchTests(SimpleTestCase):
+    def test_fetch_summaries_by_uid(self):
+        mail = FakeMail([('OK', [
+            (b'1 (UID 345 BODY[HEADER.FIELDS (SUBJECT FROM DATE)] {%d}' % len(HEADERS), HEADERS),
+            b' BODYSTRUCTURE ' + MIXED_STRUCTURE + b')',
+        ])])
+        summaries = fetch_summaries(mail, [b'345', b'346'], uid=True)
+
+        self.assertEqual(mail.commands[0][:2], ('UID FETCH', b'345,346'))
+        self.assertNotIn(b'346', summaries)
+        summary = summaries[b'345']
+        self.assertEqual(summary.headers['Subject'], 'Consiglio comunale')
+        self.assertEqual(select_text_part(summary.bodystructure).section, '1.2')
+
+    def test_fetch_body_downloads_only_selected_part(self):
+        structure = parse_fetch_response([b'1 (BODYSTRUCTURE ' + MIXED_STRUCTURE + b')'])[b'1']['BODYSTRUCTURE']
+        payload = b'<p>Citt=E0 di Carpi</p>'
+        mail = FakeMail([('OK', [(b'1 (BODY[1.2] {%d}' % len(payload), payload), b')'])])
+
+        body = fetch_body(mail, b'1', structure)
+
+        self.assertEqual(mail.commands, [('FETCH', b'1', '(BODY.PEEK[1.2])')])
+        self.assertEqual(body.html, '<p>Città di Carpi</p>')
+        self.assertEqual(body.text, '')
+
+    def test_fetch_body_falls_back_to_full_message(self):
+        message = b'Content-Type: text/plain; charset=utf-8\r\n\r\nTesto completo\r\n'
+        mail = FakeMail([('OK', [(b'1 (BODY[] {%d}' % len(message), message), b')'])])
+
+        body = fetch_body(mail, b'1', None)
+
+        self.assertEqual(mail.commands[0][2], '(BODY.PEEK[])')
+        self.assertEqual(body.text.strip(), 'Testo completo')
+
+    def test_fetch_body_attachments_only(self):
+        structure = [[b'IMAGE', b'JPEG', None, None, None, b'BASE64', b'100'], b'MIXED']
+        mail = FakeMail([])
+
+        body = fetch_body(mail, b'1', structure)
+
+        self.assertIsInstance(body, EmailBody)
+        self.assertEqual((body.html, body.text), ('', ''))
+        self.assertEqual(mail.commands, [])
@@ -0,0 +1,101 @@
+from django.test import SimpleTestCase, TestCase
+
+from home.imap_sync import MailboxCursor, cursor_key, mailbox_status, uid_set
+
+
+class FakeMail:
+    """Casella con UID e flag \\Seen; risponde a UID SEARCH e alle risposte del SELECT"""
+
+    def __init__(self, uids, seen=(), uidvalidity=b'7', uidnext=None):
+        self.uids = sorted(uids)
+        self.seen = set(seen)
+        self.select_responses = {'UIDVALIDITY': [uidvalidity], 'UIDNEXT': [uidnext]}
+        self.searches = []
+
+    def response(self, code):
+        return code, self.select_responses.get(code, [None])
+
+    def uid(self, command, charset, *criteria):
+        self.searches.append(criteria)
+        uids = self.uids
+        if criteria[0] == 'UID':
+            start, end = criteria[1].split(':')
+            start = int(start)
+            if end == '*':
+                # Come da RFC 3501 "n:*" include sempre l'UID più alto
+                uids = [uid for uid in uids if uid >= start] or uids[-1:]
+            else:
+                uids = [uid for uid in uids if start <= uid <= int(end)]
+            if 'UNSEEN' in criteria:
+                uids = [uid for uid in uids if uid not in self.seen]
+        return 'OK', [' '.join(str(uid) for uid in uids).encode()]
+
+
+class UidSetTests(SimpleTestCase):
+    def test_ranges(self):
+        self.assertEqual(uid_set([7, 1, 3, 2]), b'1:3,7')
+        self.assertEqual(uid_set([5]), b'5')
+        self.assertEqual(uid_set([4, 4, 5, 9, 10, 12]), b'4:5,9:10,12')
+        self.assertEqual(uid_set([]), b'')
+
+
+class MailboxStatusTests(SimpleTestCase):
+    def test_values(self):
+        self.assertEqual(mailbox_status(FakeMail([], uidvalidity=b'42', uidnext=b'100')), (42, 100))
+        self.assertEqual(mailbox_status(FakeMail([], uidvalidity=None, uidnext=None)), (None, None))
+
+
+class MailboxCursorTests(SimpleTestCase):
+    key = cursor_key('redazione@example.com', 'imap.example.com', 'INBOX')
+
+    def test_bootstrap_reads_only_unseen_backlog(self):
+        mail = FakeMail([1, 2, 3, 4], seen={1, 3})
+        cursor = MailboxCursor(self.key).for_mailbox(mail, uidvalidity=7, uidnext=5)
+
+        self.assertEqual((cursor.uidvalidity, cursor.last_uid, cursor.bootstrap_until), (7, 0, 4))
+        self.assertEqual(cursor.pending_uids(mail), [2, 4])
+
+        # Arriva un nuovo messaggio (già letto da un client): va elaborato comunque
+        mail.uids.append(5)
+        mail.seen.add(5)
+        self.assertEqual(cursor.pending_uids(mail), [2, 4, 5])
+
+    def test_valid_cursor_is_kept(self):
+        cursor = MailboxCursor(self.key, uidvalidity=7, last_uid=10)
+
+        self.assertIs(cursor.for_mailbox(FakeMail([]), 7, 20), cursor)
+
+    def test_uidvalidity_change_restarts(self):
+        mail = FakeMail([3, 8])
+        cursor = MailboxCursor(self.key, uidvalidity=7, last_uid=10).for_mailbox(mail, 9, None)
+
+        self.assertEqual((cursor.uidvalidity, cursor.last_uid, cursor.bootstrap_until), (9, 0, 8))
+
+    def test_star_range_does_not_return_processed_uid(self):
+        mail = FakeMail([1, 2, 3])
+        cursor = MailboxCursor(self.key, uidvalidity=7, last_uid=3)
+
+        self.assertEqual(cursor.pending_uids(mail), [])
+
+    def test_advanced(self):
+        cursor = MailboxCursor(self.key, uidvalidity=7, last_uid=0, bootstrap_until=4)
+
+        step = cursor.advanced(2)
+        self.assertEqual((step.last_uid, step.bootstrap_until), (2, 4))
+        self.assertEqual(cursor.last_uid, 0)
+
+        done = step.advanced(4)
+        self.assertEqual((done.last_uid, done.bootstrap_until), (4, None))
+        self.assertEqual(done.advanced(1).last_uid, 4)
+
+
+class MailboxCursorPersistenceTests(TestCase):
+    def test_save_and_load(self):
+        key = cursor_key('a@example.com', 'imap.example.com', 'INBOX')
+        MailboxCursor(key, uidvalidity=7, last_uid=12, bootstrap_until=20).save()
+
+        cursor = MailboxCursor.load(key)
+        self.assertEqual((cursor.uidvalidity, cursor.last_uid, cursor.bootstrap_until), (7, 12, 20))
+
+        empty = MailboxCursor.load('imap:altro')
+        self.assertEqual((empty.uidvalidity, empty.last_uid), (None, 0))
@@ -0,0 +1,262 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from home import job_queue
+from home.job_queue import (
+    LeaseHeartbeat, QueueFull, claim_job, dispatch, enqueue, reclaim_expired_jobs, register_handler, run_job,
+)
+from home.models import Job
+
+CODA_TEST = 'test'
+calls = []
+
+
+@register_handler('test_ok', coda=CODA_TEST)
+def handler_ok(payload):
+    calls.append(payload)
+
+
+@register_handler('test_errore', coda=CODA_TEST)
+def handler_errore(payload):
+    raise RuntimeError('servizio non raggiungibile')
+
+
+QUEUE_SETTINGS = {
+    'AUTOSTART': False,
+    'MAX_PENDING': 3,
+    'BACKOFF_BASE': 10,
+    'BACKOFF_MAX': 100,
+    'LEASE_TIMEOUT': 60,
+}
+
+
+@override_settings(JOB_QUEUE=QUEUE_SETTINGS)
+class JobQueueTestCase(TestCase):
+    def setUp(self):
+        calls.clear()
+
+
+class EnqueueTests(JobQueueTestCase):
+    def test_unknown_type(self):
+        with self.assertRaises(ValueError):
+            enqueue('tipo_sconosciuto')
+
+    def test_job_saved_in_handler_queue(self):
+        job = enqueue('test_ok', {'id': 1}, priorita=2, ritardo=30, max_tentativi=2)
+
+        self.assertEqual((job.coda, job.stato, job.priorita, job.max_tentativi), (CODA_TEST, Job.STATO_IN_ATTESA, 2, 2))
+        self.assertGreater(job.disponibile_da, timezone.now() + timedelta(seconds=20))
+
+    def test_dedup_pending_job_by_key(self):
+        first = enqueue('test_ok', {'id': 1}, chiave='articolo:1')
+
+        self.assertEqual(enqueue('test_ok', {'id': 1}, chiave='articolo:1'), first)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_queue_full(self):
+        for i in range(3):
+            enqueue('test_ok', {'id': i})
+
+        with self.assertRaises(QueueFull):
+            enqueue('test_ok', {'id': 3})
+        self.assertEqual(Job.objects.count(), 3)
+
+    def test_dispatch_saves_job_when_queue_full(self):
+        for i in range(3):
+            enqueue('test_ok', {'id': i})
+
+        job = dispatch('test_ok', {'id': 3})
+
+        self.assertEqual(job.stato, Job.STATO_IN_ATTESA)
+        self.assertEqual(Job.objects.filter(stato=Job.STATO_IN_ATTESA).count(), 4)
+        self.assertEqual(calls, [])
+
+
+class ClaimAndRunTests(JobQueueTestCase):
+    def test_claim_order_and_availability(self):
+        later = enqueue('test_ok', {'id': 'dopo'}, ritardo=600)
+        low = enqueue('test_ok', {'id': 'bassa'})
+        high = enqueue('test_ok', {'id': 'alta'}, priorita=5)
+
+        self.assertEqual(claim_job('w1', CODA_TEST), Job.objects.get(pk=high.pk))
+        claimed = claim_job('w2', CODA_TEST)
+        self.assertEqual(claimed.pk, low.pk)
+        self.assertEqual((claimed.stato, claimed.bloccato_da, claimed.tentativi), (Job.STATO_IN_CORSO, 'w2', 1))
+        self.assertIsNone(claim_job('w3', CODA_TEST))
+        self.assertEqual(Job.objects.get(pk=later.pk).stato, Job.STATO_IN_ATTESA)
+
+    def test_claim_only_own_queue(self):
+        enqueue('test_ok', {})
+
+        self.assertIsNone(claim_job('w1', 'altra_coda'))
+
+    def test_successful_run(self):
+        enqueue('test_ok', {'id': 7})
+        job = claim_job('w1', CODA_TEST)
+
+        self.assertTrue(run_job(job, 'w1'))
+
+        job.refresh_from_db()
+        self.assertEqual((job.stato, job.bloccato_da), (Job.STATO_COMPLETATO, None))
+        self.assertEqual(calls, [{'id': 7}])
+
+    def test_failure_retried_with_backoff(self):
+        enqueue('test_errore', {}, max_tentativi=2)
+        job = claim_job('w1', CODA_TEST)
+
+        with mock.patch('home.job_queue.random.uniform', return_value=1.0):
+            self.assertFalse(run_job(job, 'w1'))
+
+        job.refresh_from_db()
+        self.assertEqual(job.stato, Job.STATO_IN_ATTESA)
+        self.assertIn('servizio non raggiungibile', job.ultimo_errore)
+        self.assertAlmostEqual((job.disponibile_da - timezone.now()).total_seconds(), 10, delta=2)
+        self.assertIsNone(claim_job('w1', CODA_TEST))
+
+        Job.objects.filter(pk=job.pk).update(disponibile_da=timezone.now())
+        job = claim_job('w1', CODA_TEST)
+        self.assertEqual(job.tentativi, 2)
+        self.assertFalse(run_job(job, 'w1'))
+        job.refresh_from_db()
+        self.assertEqual(job.stato, Job.STATO_FALLITO)
+
+    def test_backoff_is_exponential_and_capped(self):
+        with mock.patch('home.job_queue.random.uniform', return_value=1.0):
+            delays = [job_queue._backoff_seconds(n) for n in range(1, 7)]
+
+        self.assertEqual(delays, [10, 20, 40, 80, 100, 100])
+
+    def test_missing_handler_fails_job(self):
+        job = Job.objects.create(tipo='rimosso', coda=CODA_TEST)
+        job = claim_job('w1', CODA_TEST)
+
+        self.assertFalse(run_job(job, 'w1'))
+        job.refresh_from_db()
+        self.assertEqual((job.stato, job.ultimo_errore), (Job.STATO_FALLITO, 'Handler non registrato'))
+
+    def test_expired_lease_reclaimed(self):
+        enqueue('test_ok', {})
+        job = claim_job('w1', CODA_TEST)
+        Job.objects.filter(pk=job.pk).update(bloccato_il=timezone.now() - timedelta(seconds=120))
+
+        self.assertEqual(reclaim_expired_jobs(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual((job.stato, job.bloccato_da), (Job.STATO_IN_ATTESA, None))
+        self.assertEqual(reclaim_expired_jobs(), 0)
+
+    def test_run_pending(self):
+        for i in range(3):
+            enqueue('test_ok', {'id': i})
+
+        self.assertEqual(job_queue.get_worker_pool(CODA_TEST).run_pending('w1'), 3)
+        self.assertEqual(sorted(call['id'] for call in calls), [0, 1, 2])
+        self.assertEqual(Job.objects.filter(stato=Job.STATO_COMPLETATO).count(), 3)
+
+
+class LeaseTests(JobQueueTestCase):
+    def heartbeat_once(self, job, worker_id):
+        """Esegue un ciclo del thread di heartbeat nel thread del test"""
+        heartbeat = LeaseHeartbeat(job.pk, worker_id, interval=1)
+        heartbeat._stop_event = mock.Mock(wait=mock.Mock(side_effect=[False, True]))
+        # Il thread chiude la propria connessione: qui è quella del test
+        with mock.patch('home.job_queue.connection'):
+            heartbeat._run()
+        return heartbeat
+
+    def test_heartbeat_renews_lease(self):
+        enqueue('test_ok', {})
+        job = claim_job('w1', CODA_TEST)
+        Job.objects.filter(pk=job.pk).update(bloccato_il=timezone.now() - timedelta(seconds=50))
+
+        heartbeat = self.heartbeat_once(job, 'w1')
+
+        self.assertFalse(heartbeat.lost)
+        self.assertEqual(reclaim_expired_jobs(), 0)
+        self.assertGreater(Job.objects.get(pk=job.pk).bloccato_il, timezone.now() - timedelta(seconds=5))
+
+    def test_heartbeat_detects_lost_lease(self):
+        enqueue('test_ok', {})
+        job = claim_job('w1', CODA_TEST)
+        Job.objects.filter(pk=job.pk).update(bloccato_il=timezone.now() - timedelta(seconds=120))
+        reclaim_expired_jobs()
+        claim_job('w2', CODA_TEST)
+
+        heartbeat = self.heartbeat_once(job, 'w1')
+
+        self.assertTrue(heartbeat.lost)
+        self.assertEqual(Job.objects.get(pk=job.pk).bloccato_da, 'w2')
+
+    def test_outcome_of_lost_lease_not_recorded(self):
+        enqueue('test_ok', {'id': 1})
+        job = claim_job('w1', CODA_TEST)
+        Job.objects.filter(pk=job.pk).update(bloccato_il=timezone.now() - timedelta(seconds=120))
+        reclaim_expired_jobs()
+        claim_job('w2', CODA_TEST)
+
+        with mock.patch('home.job_queue.LeaseHeartbeat'):
+            self.assertFalse(run_job(job, 'w1'))
+
+        job.refresh_from_db()
+        self.assertEqual((job.stato, job.bloccato_da), (Job.STATO_IN_CORSO, 'w2'))
+
+
+class DedupTests(JobQueueTestCase):
+    def test_follow_up_job_waits_while_key_is_running(self):
+        enqueue('test_ok', {}, chiave='feed')
+        running = claim_job('w1', CODA_TEST)
+
+        follow_up = enqueue('test_ok', {}, chiave='feed')
+        self.assertNotEqual(follow_up.pk, running.pk)
+        self.assertEqual(enqueue('test_ok', {}, chiave='feed'), follow_up)
+
+        # Un solo lavoro in corso per chiave: il successivo parte dopo
+        self.assertIsNone(claim_job('w2', CODA_TEST))
+
+    def test_dedup_in_corso(self):
+        enqueue('test_ok', {}, chiave='ai:1')
+        running = claim_job('w1', CODA_TEST)
+
+        self.assertEqual(enqueue('test_ok', {}, chiave='ai:1', dedup_in_corso=True), running)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_database_rejects_second_pending_job(self):
+        Job.objects.create(tipo='test_ok', coda=CODA_TEST, chiave='feed')
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Job.objects.create(tipo='test_ok', coda=CODA_TEST, chiave='feed')
+
+    def test_enqueue_race_returns_existing_job(self):
+        existing = Job.objects.create(tipo='test_ok', coda=CODA_TEST, chiave='feed')
+        # Il controllo preliminare non lo vede: un altro processo lo ha inserito subito dopo
+        no_match = mock.Mock(**{'first.return_value': None})
+        with mock.patch.object(Job.objects, 'filter', side_effect=[no_match, Job.objects.none(),
+                                                                    Job.objects.filter(pk=existing.pk)]):
+            self.assertEqual(enqueue('test_ok', {}, chiave='feed'), existing)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_retry_replaced_by_pending_job_with_same_key(self):
+        enqueue('test_errore', {}, chiave='feed')
+        running = claim_job('w1', CODA_TEST)
+        pending = enqueue('test_errore', {}, chiave='feed')
+
+        self.assertFalse(run_job(running, 'w1'))
+
+        running.refresh_from_db()
+        self.assertEqual(running.stato, Job.STATO_FALLITO)
+        self.assertIn('Sostituito dal lavoro in attesa', running.ultimo_errore)
+        self.assertEqual(Job.objects.get(pk=pending.pk).stato, Job.STATO_IN_ATTESA)
+
+    def test_reclaim_with_pending_duplicate(self):
+        enqueue('test_ok', {}, chiave='feed')
+        running = claim_job('w1', CODA_TEST)
+        enqueue('test_ok', {}, chiave='feed')
+        Job.objects.filter(pk=running.pk).update(bloccato_il=timezone.now() - timedelta(seconds=120))
+
+        self.assertEqual(reclaim_expired_jobs(), 1)
+        self.assertEqual(Job.objects.get(pk=running.pk).stato, Job.STATO_FALLITO)
+        self.assertEqual(Job.objects.filter(chiave='feed', stato=Job.STATO_IN_ATTESA).count(), 1)
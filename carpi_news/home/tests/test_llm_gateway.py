@@ -0,0 +1,244 @@
+from types import SimpleNamespace
+from unittest import mock
+
+import anthropic
+import httpx
+from django.test import SimpleTestCase, override_settings
+
+from home.llm_gateway import CACHE_CONTROL, LLMGateway, TokenBucket, apply_prompt_cache, estimate_tokens
+
+
+class FakeClock:
+    """Sostituisce time nel modulo: sleep avanza l'orologio invece di attendere"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('home.llm_gateway.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_acquire_within_capacity_does_not_wait(self):
+        bucket = TokenBucket(600)
+        bucket.acquire(400)
+        bucket.acquire(200)
+
+        self.assertEqual(self.clock.sleeps, [])
+        self.assertEqual(bucket.tokens, 0)
+
+    def test_acquire_waits_for_refill(self):
+        bucket = TokenBucket(600)  # 10 token al secondo
+        bucket.acquire(600)
+        bucket.acquire(30)
+
+        self.assertAlmostEqual(sum(self.clock.sleeps), 3.0)
+        self.assertTrue(all(s <= 5 for s in self.clock.sleeps))
+
+    def test_request_larger_than_bucket_is_capped(self):
+        bucket = TokenBucket(100)
+        bucket.acquire(10_000)
+
+        self.assertEqual(self.clock.sleeps, [])
+        self.assertEqual(bucket.tokens, 0)
+
+    def test_adjust(self):
+        bucket = TokenBucket(100)
+        bucket.acquire(50)
+
+        bucket.adjust(-80)  # stima eccessiva: i token tornano, fino alla capacità
+        self.assertEqual(bucket.tokens, 100)
+
+        bucket.adjust(150)  # consumo sottostimato: il saldo va in negativo
+        self.assertEqual(bucket.tokens, -50)
+
+    def test_refill_is_capped(self):
+        bucket = TokenBucket(60)
+        bucket.acquire(60)
+        self.clock.now += 3600
+        bucket.acquire(1)
+
+        self.assertEqual(bucket.tokens, 59)
+
+
+def usage(input_tokens=100, output_tokens=50, cache_read=0, cache_write=0):
+    return SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens,
+                           cache_read_input_tokens=cache_read, cache_creation_input_tokens=cache_write)
+
+
+def connection_error():
+    return anthropic.APIConnectionError(request=httpx.Request('POST', 'https://api.anthropic.com/v1/messages'))
+
+
+def rate_limit_error(retry_after='7'):
+    request = httpx.Request('POST', 'https://api.anthropic.com/v1/messages')
+    response = httpx.Response(429, headers={'retry-after': retry_after}, request=request)
+    return anthropic.RateLimitError('rate limited', response=response, body=None)
+
+
+class FakeClient:
+    def __init__(self, results):
+        self.results = list(results)
+        self.requests = []
+        self.messages = self
+
+    def create(self, **params):
+        self.requests.append(params)
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+@override_settings(LLM_GATEWAY={'MAX_RETRIES': 2, 'BACKOFF_BASE': 1, 'BACKOFF_MAX': 10, 'METRICS_LOG_INTERVAL': 3600})
+class LLMGatewayTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('home.llm_gateway.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def gateway(self, results):
+        client = FakeClient(results)
+        patcher = mock.patch('home.llm_gateway.get_client', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return LLMGateway(max_concurrency=2, tokens_per_minute=100_000), client
+
+    def test_success_records_usage(self):
+        message = SimpleNamespace(usage=usage(input_tokens=120, output_tokens=30))
+        gateway, client = self.gateway([message])
+
+        result = gateway.create_message(messages=[{'role': 'user', 'content': 'ciao'}], max_tokens=10)
+
+        self.assertIs(result, message)
+        self.assertIn('model', client.requests[0])
+        metrics = gateway.get_metrics()
+        self.assertEqual((metrics['richieste'], metrics['in_corso'], metrics['in_attesa']), (1, 0, 0))
+        self.assertEqual((metrics['token_input'], metrics['token_output']), (120, 30))
+
+    def test_retries_temporary_errors(self):
+        message = SimpleNamespace(usage=usage())
+        gateway, client = self.gateway([connection_error(), message])
+
+        self.assertIs(gateway.create_message(messages=[]), message)
+        self.assertEqual(len(client.requests), 2)
+        self.assertEqual(gateway.get_metrics()['retry'], 1)
+
+    def test_rate_limit_pauses_whole_gateway(self):
+        gateway, client = self.gateway([rate_limit_error('7'), SimpleNamespace(usage=usage())])
+
+        gateway.create_message(messages=[])
+
+        metrics = gateway.get_metrics()
+        self.assertEqual(metrics['rate_limited'], 1)
+        self.assertAlmostEqual(sum(self.clock.sleeps), 7.0)
+
+    def test_gives_up_after_max_retries(self):
+        gateway, client = self.gateway([connection_error() for _ in range(3)])
+
+        with self.assertRaises(anthropic.APIConnectionError):
+            gateway.create_message(messages=[])
+        self.assertEqual(len(client.requests), 3)
+        self.assertEqual(gateway.get_metrics()['in_corso'], 0)
+
+    def test_non_retryable_error_raised_immediately(self):
+        gateway, client = self.gateway([ValueError('richiesta non valida'), None])
+
+        with self.assertRaises(ValueError):
+            gateway.create_message(messages=[])
+        self.assertEqual(len(client.requests), 1)
+
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens(messages=[]), 1)
+        self.assertGreater(estimate_tokens(system='x' * 3000), 900)
+
+
+def count_breakpoints(request):
+    blocks = []
+    if isinstance(request.get('system'), list):
+        blocks.extend(request['system'])
+    blocks.extend(request.get('tools') or [])
+    for message in request.get('messages') or []:
+        if isinstance(message['content'], list):
+            blocks.extend(message['content'])
+    return sum(1 for block in blocks if isinstance(block, dict) and 'cache_control' in block)
+
+
+class PromptCacheTests(SimpleTestCase):
+    tools = [{'name': 'web_search', 'input_schema': {}}, {'name': 'fetch', 'input_schema': {}}]
+
+    def test_breakpoints_on_system_tools_and_last_message(self):
+        request = {
+            'system': 'Sei un giornalista',
+            'tools': self.tools,
+            'messages': [{'role': 'user', 'content': 'Scrivi un articolo'}],
+        }
+        cached = apply_prompt_cache(request)
+
+        self.assertEqual(cached['system'], [{'type': 'text', 'text': 'Sei un giornalista', 'cache_control': CACHE_CONTROL}])
+        self.assertNotIn('cache_control', cached['tools'][0])
+        self.assertEqual(cached['tools'][1]['cache_control'], CACHE_CONTROL)
+        self.assertEqual(cached['messages'][0]['content'][0]['cache_control'], CACHE_CONTROL)
+        self.assertEqual(count_breakpoints(cached), 3)
+
+    def test_original_request_not_modified(self):
+        request = {
+            'system': [{'type': 'text', 'text': 'a'}, {'type': 'text', 'text': 'b'}],
+            'tools': self.tools,
+            'messages': [{'role': 'user', 'content': [{'type': 'text', 'text': 'ciao'}]}],
+        }
+        apply_prompt_cache(request)
+
+        self.assertEqual(count_breakpoints(request), 0)
+        self.assertEqual(request['system'][1], {'type': 'text', 'text': 'b'})
+
+    def test_breakpoints_do_not_accumulate_across_tool_iterations(self):
+        request = {'system': 'Sei un giornalista', 'tools': self.tools,
+                   'messages': [{'role': 'user', 'content': 'Scrivi un articolo'}]}
+        for iteration in range(5):
+            cached = apply_prompt_cache(request)
+            self.assertLessEqual(count_breakpoints(cached), 3)
+            # Ciclo dei tool: la conversazione cresce sulla richiesta originale
+            request['messages'] = request['messages'] + [
+                {'role': 'assistant', 'content': [{'type': 'tool_use', 'id': f't{iteration}', 'name': 'fetch', 'input': {}}]},
+                {'role': 'user', 'content': [{'type': 'tool_result', 'tool_use_id': f't{iteration}', 'content': 'ok'}]},
+            ]
+
+    def test_sdk_blocks_are_serialized(self):
+        block = mock.Mock(spec=['model_dump'])
+        block.model_dump.return_value = {'type': 'text', 'text': 'risposta'}
+        cached = apply_prompt_cache({'messages': [{'role': 'assistant', 'content': [block]}]})
+
+        self.assertEqual(cached['messages'][0]['content'][0],
+                         {'type': 'text', 'text': 'risposta', 'cache_control': CACHE_CONTROL})
+
+    def test_empty_request(self):
+        self.assertEqual(apply_prompt_cache({'model': 'm'}), {'model': 'm'})
+
+    @override_settings(LLM_GATEWAY={'METRICS_LOG_INTERVAL': 3600})
+    def test_cache_hit_and_miss_metrics(self):
+        client = FakeClient([
+            SimpleNamespace(usage=usage(cache_write=2000)),
+            SimpleNamespace(usage=usage(cache_read=2000)),
+        ])
+        with mock.patch('home.llm_gateway.get_client', return_value=client):
+            gateway = LLMGateway(max_concurrency=1, tokens_per_minute=100_000)
+            for _ in range(2):
+                gateway.create_message(cache=True, system='Sei un giornalista', messages=[{'role': 'user', 'content': 'x'}])
+
+        self.assertEqual(count_breakpoints(client.requests[0]), 2)
+        metrics = gateway.get_metrics()
+        self.assertEqual((metrics['cache_hit'], metrics['cache_miss']), (1, 1))
+        self.assertEqual(metrics['token_cache_letti'], 2000)
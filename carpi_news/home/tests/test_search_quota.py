@@ -0,0 +1,102 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+
+from home.models import QuotaServizio
+from home.search_quota import QuotaGovernor, quota_day
+
+
+class FakeClock:
+    """Sostituisce time nel modulo: sleep avanza l'orologio invece di attendere"""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class QuotaGovernorTests(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('home.search_quota.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def governor(self, **kwargs):
+        options = {'daily_limit': 10, 'reserve': 2, 'rate_per_second': 1.0, 'burst': 3, 'max_wait': 15}
+        options.update(kwargs)
+        return QuotaGovernor('test', **options)
+
+    def test_burst_then_rate_limited(self):
+        governor = self.governor()
+        for _ in range(3):
+            self.assertTrue(governor.acquire())
+        self.assertEqual(self.clock.sleeps, [])
+
+        self.assertTrue(governor.acquire())
+        self.assertAlmostEqual(sum(self.clock.sleeps), 1.0)
+
+    def test_wait_over_limit_goes_to_fallback(self):
+        governor = self.governor(burst=1, rate_per_second=0.01)
+        self.assertTrue(governor.acquire())
+
+        self.assertFalse(governor.acquire(max_wait=5))
+        self.assertEqual(self.clock.sleeps, [])
+        self.assertEqual(governor.rifiutate, 1)
+
+    def test_reserve_is_kept(self):
+        governor = self.governor(rate_per_second=1000, burst=100)
+        granted = sum(governor.acquire() for _ in range(12))
+
+        self.assertEqual(granted, 8)
+        self.assertEqual(governor.remaining(), 2)
+        self.assertFalse(governor.has_budget())
+        self.assertEqual(governor.rifiutate, 4)
+
+    def test_shared_between_instances(self):
+        first, second = self.governor(), self.governor()
+        first.acquire()
+        first.acquire()
+
+        self.assertEqual(second.remaining(), 8)
+        self.assertEqual(QuotaServizio.objects.get(servizio='test').richieste, 2)
+
+    def test_mark_exhausted_until_next_day(self):
+        governor = self.governor()
+        governor.acquire()
+        governor.mark_exhausted()
+
+        self.assertEqual(governor.remaining(), 0)
+        self.assertFalse(governor.acquire())
+        self.assertTrue(governor.get_metrics()['esaurita'])
+
+        QuotaServizio.objects.filter(servizio='test').update(giorno=quota_day() - timedelta(days=1))
+        self.assertEqual(governor.remaining(), 10)
+        self.assertTrue(governor.acquire())
+        self.assertEqual(governor.get_metrics()['richieste'], 1)
+
+    def test_conditional_update_detects_concurrent_change(self):
+        governor = self.governor()
+        row = governor._row()
+        QuotaServizio.objects.filter(pk=row.pk).update(richieste=5)
+
+        self.assertFalse(governor._save(row, 1, False, 0, self.clock.now))
+        self.assertEqual(QuotaServizio.objects.get(pk=row.pk).richieste, 5)
+
+    def test_metrics(self):
+        governor = self.governor()
+        governor.acquire()
+        metrics = governor.get_metrics()
+
+        self.assertEqual((metrics['richieste'], metrics['rimanenti'], metrics['limite']), (1, 9, 10))
+        self.assertEqual(metrics['token'], 2)
@@ -0,0 +1,178 @@
+import time
+
+from django.test import SimpleTestCase, TestCase
+
+from home.models import Articolo
+from home.story_clustering import (
+    BANDS, NUM_PERM, StoryIndex, estimated_jaccard, merge_source, minhash, source_signature, tokenize,
+)
+
+
+TITOLO = "Incendio in un capannone della zona industriale di Fossoli"
+TESTO = (
+    "Nella notte i vigili del fuoco sono intervenuti in via Remesina per un incendio "
+    "scoppiato in un capannone artigianale. Le fiamme hanno coinvolto macchinari e "
+    "materiale plastico, una densa colonna di fumo era visibile dalla tangenziale. "
+    "Nessun ferito, l'Arpae ha avviato i controlli sulla qualità dell'aria."
+)
+TESTO_ALTRA_FONTE = (
+    "Vigili del fuoco al lavoro tutta la notte in via Remesina a Fossoli: un incendio "
+    "ha distrutto un capannone artigianale con macchinari e materiale plastico. "
+    "La colonna di fumo era visibile dalla tangenziale. Nessun ferito, Arpae ha avviato "
+    "i controlli sulla qualità dell'aria nella zona industriale."
+)
+ALTRA_STORIA = (
+    "Presentato il programma della stagione teatrale al Comunale: dodici spettacoli "
+    "di prosa, sei concerti sinfonici e una rassegna di danza contemporanea. Gli "
+    "abbonamenti saranno in vendita dalla prossima settimana alla biglietteria del "
+    "teatro e online, con riduzioni per studenti e over sessantacinque."
+)
+
+
+class MinHashTests(SimpleTestCase):
+    def test_tokenize_drops_short_words_and_stopwords(self):
+        self.assertEqual(tokenize('Carpi, la città', 'della 2025 piazza'), {'citta', 'piazza'})
+
+    def test_short_text_has_no_signature(self):
+        self.assertIsNone(minhash({'uno', 'due'}))
+        self.assertIsNone(source_signature('Avviso', 'chiusura uffici'))
+
+    def test_signature_is_deterministic(self):
+        signature = source_signature(TITOLO, TESTO)
+
+        self.assertEqual(len(signature), NUM_PERM)
+        self.assertEqual(signature, source_signature(TITOLO, TESTO))
+        self.assertEqual(tuple(signature), minhash(tokenize(TITOLO, TESTO)))
+
+    def test_estimated_jaccard(self):
+        same = minhash(tokenize(TITOLO, TESTO))
+        close = minhash(tokenize(TITOLO, TESTO_ALTRA_FONTE))
+        far = minhash(tokenize('Stagione teatrale', ALTRA_STORIA))
+
+        self.assertEqual(estimated_jaccard(same, same), 1.0)
+        self.assertGreater(estimated_jaccard(same, close), estimated_jaccard(same, far))
+        self.assertLess(estimated_jaccard(same, far), 0.2)
+
+
+class StoryIndexTests(SimpleTestCase):
+    def index(self, **kwargs):
+        index = StoryIndex(window_hours=kwargs.pop('window_hours', 48),
+                           max_entries=kwargs.pop('max_entries', 100), refresh_seconds=3600)
+        # Indice vuoto già "caricato": niente accesso al database
+        index._loaded = True
+        index._refreshed = time.monotonic()
+        return index
+
+    def test_matches_same_story_only(self):
+        index = self.index()
+        index.add(1, source_signature(TITOLO, TESTO), urls=['https://www.ansa.it/incendio'])
+        index.add(2, source_signature('Stagione teatrale', ALTRA_STORIA))
+
+        matches = index.matches(TITOLO, TESTO_ALTRA_FONTE, threshold=0.3)
+
+        self.assertEqual([article_id for article_id, _ in matches], [1])
+        self.assertEqual(index.find(TITOLO, TESTO_ALTRA_FONTE, threshold=0.3)[0], 1)
+        self.assertIsNone(index.find('Avviso', 'testo breve'))
+        self.assertEqual(index.article_for_url('https://www.ansa.it/incendio'), 1)
+
+    def test_matches_sorted_by_score(self):
+        index = self.index()
+        index.add(1, source_signature(TITOLO, TESTO_ALTRA_FONTE))
+        index.add(2, source_signature(TITOLO, TESTO))
+
+        matches = index.matches(TITOLO, TESTO, threshold=0.3)
+
+        self.assertEqual(matches[0], (2, 1.0))
+        self.assertEqual([article_id for article_id, _ in matches], [2, 1])
+
+    def test_invalid_signature_not_indexed(self):
+        index = self.index()
+        index.add(1, None)
+        index.add(2, [1, 2, 3])
+
+        self.assertEqual(len(index), 0)
+
+    def test_remove_clears_buckets_and_urls(self):
+        index = self.index()
+        index.add(1, source_signature(TITOLO, TESTO), urls=['https://a.example/1'])
+        index.add_url(1, 'https://b.example/1')
+        self.assertEqual(index.article_for_url('https://b.example/1'), 1)
+
+        index.remove(1)
+
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index._buckets, {})
+        self.assertIsNone(index.article_for_url('https://a.example/1'))
+        self.assertIsNone(index.article_for_url('https://b.example/1'))
+
+    def test_eviction_by_size_and_age(self):
+        index = self.index(max_entries=1)
+        index.add(1, source_signature(TITOLO, TESTO))
+        index.add(2, source_signature('Stagione teatrale', ALTRA_STORIA))
+        self.assertEqual(list(index._entries), [2])
+
+        old = self.index(window_hours=1)
+        old.add(1, source_signature(TITOLO, TESTO), timestamp=time.time() - 7200)
+        self.assertEqual(len(old), 0)
+
+    def test_lsh_bands(self):
+        self.assertEqual(NUM_PERM % BANDS, 0)
+
+
+class StoryIndexDatabaseTests(TestCase):
+    def create(self, slug, testo, **kwargs):
+        return Articolo.objects.create(titolo=TITOLO, slug=slug, contenuto='Articolo riscritto',
+                                       fonte=f'https://example.com/{slug}',
+                                       firma_fonte=source_signature(TITOLO, testo), **kwargs)
+
+    def test_load_skips_drafts_duplicates_and_unsigned(self):
+        original = self.create('incendio', TESTO)
+        self.create('incendio-bozza', TESTO, in_generazione=True)
+        self.create('incendio-dup', TESTO, duplicato_di=original)
+        Articolo.objects.create(titolo='Vecchio', slug='vecchio', contenuto='x')
+
+        index = StoryIndex(window_hours=48, max_entries=100, refresh_seconds=0)
+
+        self.assertEqual([article_id for article_id, _ in index.matches(TITOLO, TESTO)], [original.id])
+        self.assertEqual(index.article_for_url('https://example.com/incendio'), original.id)
+
+    def test_refresh_picks_up_rows_from_other_processes(self):
+        index = StoryIndex(window_hours=48, max_entries=100, refresh_seconds=0)
+        self.assertEqual(index.matches(TITOLO, TESTO), [])
+
+        articolo = self.create('incendio', TESTO)
+
+        self.assertEqual(index.find(TITOLO, TESTO)[0], articolo.id)
+
+    def test_completed_draft_enters_index(self):
+        index = StoryIndex(window_hours=48, max_entries=100, refresh_seconds=0)
+        draft = self.create('incendio', TESTO, in_generazione=True)
+        self.assertEqual(index.matches(TITOLO, TESTO), [])
+
+        Articolo.objects.filter(pk=draft.pk).update(in_generazione=False)
+
+        self.assertEqual(index.find(TITOLO, TESTO)[0], draft.id)
+
+
+class MergeSourceTests(TestCase):
+    def test_merges_into_approved_article_once(self):
+        articolo = Articolo.objects.create(titolo=TITOLO, slug='incendio', contenuto='x',
+                                           fonte='https://example.com/a', approvato=True)
+        data = {'url': 'https://example.com/b', 'title': 'Incendio a Fossoli'}
+
+        self.assertTrue(merge_source(articolo.id, data))
+        self.assertFalse(merge_source(articolo.id, data))
+        self.assertFalse(merge_source(articolo.id, {'url': 'https://example.com/a'}))
+
+        articolo.refresh_from_db()
+        self.assertEqual(len(articolo.fonti_web), 1)
+        self.assertEqual(articolo.fonti_web[0]['url'], 'https://example.com/b')
+        self.assertTrue(articolo.fonti_web[0]['fonte_aggiuntiva'])
+
+    def test_unapproved_or_missing_article(self):
+        articolo = Articolo.objects.create(titolo=TITOLO, slug='incendio', contenuto='x', approvato=False)
+
+        self.assertIsNone(merge_source(articolo.id, {'url': 'https://example.com/b'}))
+        self.assertIsNone(merge_source(articolo.id + 1000, {'url': 'https://example.com/b'}))
+        articolo.refresh_from_db()
+        self.assertIsNone(articolo.fonti_web)
@@ -0,0 +1,97 @@
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from home.persistent_cache import PersistentCache
+from home.transcripts import (
+    MISSING, condense_transcript, is_known_missing, remember_missing, split_chunks,
+)
+
+
+def seduta(sentences):
+    return ' '.join(f"Intervento numero {i} sulla delibera del bilancio comunale." for i in range(sentences))
+
+
+class SplitChunksTests(SimpleTestCase):
+    def test_short_text_single_chunk(self):
+        self.assertEqual(split_chunks('Breve testo.', 100), ['Breve testo.'])
+        self.assertEqual(split_chunks('', 100), [])
+
+    def test_chunks_respect_size_and_cut_at_sentence_end(self):
+        text = seduta(200)
+        chunks = split_chunks(text, 1000)
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), 1000)
+        for chunk in chunks[:-1]:
+            self.assertTrue(chunk.endswith('.'), chunk[-30:])
+
+    def test_without_overlap_text_is_preserved(self):
+        text = seduta(120)
+        chunks = split_chunks(text, 700)
+
+        self.assertEqual(' '.join(chunks), text)
+
+    def test_overlap_repeats_end_of_previous_chunk(self):
+        text = seduta(120)
+        chunks = split_chunks(text, 700, overlap=100)
+
+        for previous, chunk in zip(chunks, chunks[1:]):
+            self.assertIn(chunk[:40], previous)
+
+    def test_text_without_sentences_cut_at_spaces(self):
+        text = ' '.join(['parola'] * 500)
+        chunks = split_chunks(text, 300)
+
+        self.assertTrue(all(chunk.split(' ') == ['parola'] * len(chunk.split(' ')) for chunk in chunks))
+        self.assertEqual(sum(len(chunk.split(' ')) for chunk in chunks), 500)
+
+    def test_text_without_spaces_terminates(self):
+        chunks = split_chunks('x' * 1050, 100, overlap=20)
+
+        self.assertEqual(len(chunks), 13)
+        self.assertTrue(all(len(chunk) <= 100 for chunk in chunks))
+        self.assertEqual(len(chunks[-1]), 90)
+
+
+@override_settings(TRANSCRIPTS={'CHUNK_CHARS': 700, 'OVERLAP_CHARS': 0, 'WORKERS': 3})
+class CondenseTranscriptTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = PersistentCache(os.path.join(directory.name, 'cache.sqlite3'), max_entries=1000,
+                                     max_bytes=10 ** 7, default_ttl=3600, stale_seconds=0, compress_min_bytes=512)
+        patcher = mock.patch('home.persistent_cache.get_cache', return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def summarize(self, **request):
+        part = request['messages'][0]['content'].split('\n')[1]
+        return SimpleNamespace(content=[SimpleNamespace(type='text', text=f"Note: {part}")])
+
+    def test_chunks_summarized_in_order_and_cached(self):
+        text = seduta(120)
+        total = len(split_chunks(text, 700))
+
+        with mock.patch('home.llm_gateway.create_message', side_effect=self.summarize) as create:
+            condensed = condense_transcript(text, title='Consiglio comunale', model='modello')
+            self.assertEqual(create.call_count, total)
+
+            # I riassunti in cache non vengono richiesti di nuovo
+            self.assertEqual(condense_transcript(text, title='Consiglio comunale', model='modello'), condensed)
+            self.assertEqual(create.call_count, total)
+
+        positions = [condensed.index(f"--- Parte {i} di {total} ---") for i in range(1, total + 1)]
+        self.assertEqual(positions, sorted(positions))
+        self.assertIn(f"Note: Parte 1 di {total} della trascrizione:", condensed)
+
+    def test_missing_transcripts_remembered(self):
+        self.assertFalse(is_known_missing('abc'))
+        remember_missing('abc')
+
+        self.assertTrue(is_known_missing('abc'))
+        self.assertEqual(self.cache.get('trascrizioni', 'abc'), MISSING)
@@ -0,0 +1,211 @@
+"""
+Trascrizioni dei video YouTube: cache persistente ed elaborazione a blocchi
+
+Le sedute del consiglio comunale durano ore. Due problemi:
+
+- ogni controllo del monitor (in modalità fallback tutti gli ID configurati,
+  a ogni giro) richiedeva di nuovo lista e testo dei sottotitoli a YouTube,
+  con il rischio di blocchi per troppe richieste. fetch_transcript() legge
+  la lista una volta sola, scarica il testo dalla voce trovata e lo salva
+  nella cache persistente per video; anche l'assenza di sottotitoli viene
+  ricordata per MISSING_TTL secondi
+- la trascrizione intera finiva in un solo prompt, lento e vicino al limite
+  di contesto. condense_transcript() (map-reduce) la divide in blocchi che
+  vengono riassunti in parallelo tramite il gateway LLM; le note, in ordine
+  cronologico, sostituiscono la trascrizione nel prompt dell'articolo, che
+  le unisce. I riassunti sono in cache per hash del blocco: una rigenerazione
+  non ripete la fase di map
+"""
+import hashlib
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'CACHE_TTL': 180 * 24 * 3600,
+    'MISSING_TTL': 6 * 3600,
+    'MAP_REDUCE_THRESHOLD': 60000,   # caratteri oltre i quali si riassume a blocchi
+    'CHUNK_CHARS': 24000,
+    'OVERLAP_CHARS': 400,
+    'WORKERS': 4,
+    'SUMMARY_MAX_TOKENS': 1500,
+    'SUMMARY_TTL': 30 * 24 * 3600,
+}
+
+# Namespace della cache persistente
+TRANSCRIPT_NAMESPACE = 'trascrizioni'
+SUMMARY_NAMESPACE = 'trascrizioni_riassunti'
+
+# Valore in cache per i video senza sottotitoli
+MISSING = {'mancante': True}
+
+# Da cambiare se cambia il prompt di riassunto, per non riusare riassunti vecchi
+SUMMARY_PROMPT_VERSION = 1
+
+SUMMARY_SYSTEM_PROMPT = """Ricevi una parte della trascrizione automatica di una seduta del consiglio comunale di Carpi.
+Scrivi note dettagliate e fedeli di questa parte, in italiano, che verranno unite a quelle delle altre parti per scrivere un articolo.
+
+- Riporta argomenti, interventi (con il nome o il ruolo di chi parla, se menzionato), proposte, votazioni ed esiti
+- Conserva cifre, date, luoghi e le frasi più significative tra virgolette
+- Segnala i momenti polemici o ironici
+- USA SOLO informazioni presenti nel testo: non inventare nomi o dettagli
+- Niente introduzioni o conclusioni: solo le note, in elenco puntato"""
+
+_SENTENCE_END_RE = re.compile(r'[.!?]\s')
+
+
+def get_transcript_setting(name: str):
+    """Legge un'impostazione da settings.TRANSCRIPTS con fallback ai default"""
+    return getattr(settings, 'TRANSCRIPTS', {}).get(name, DEFAULT_SETTINGS[name])
+
+
+# --- Cache delle trascrizioni ------------------------------------------------
+
+def cached_transcript(video_id: str) -> Optional[str]:
+    """Trascrizione in cache, o None (non in cache o video senza sottotitoli)"""
+    from .persistent_cache import get_cache
+
+    value = get_cache().get(TRANSCRIPT_NAMESPACE, video_id)
+    return value if isinstance(value, str) else None
+
+
+def is_known_missing(video_id: str) -> bool:
+    """True se di recente il video risultava senza sottotitoli"""
+    from .persistent_cache import get_cache
+
+    return get_cache().get(TRANSCRIPT_NAMESPACE, video_id) == MISSING
+
+
+def remember_missing(video_id: str):
+    """Ricorda per MISSING_TTL secondi che il video non ha sottotitoli"""
+    from .persistent_cache import get_cache
+
+    get_cache().set(TRANSCRIPT_NAMESPACE, video_id, MISSING, ttl=get_transcript_setting('MISSING_TTL'))
+
+
+def fetch_transcript(video_id: str, languages: Sequence[str] = ('it',)) -> str:
+    """
+    Testo della trascrizione di un video, dalla cache o da YouTube
+
+    Una sola lettura della lista dei sottotitoli: il testo viene scaricato
+    dalla voce trovata, senza che fetch() ripeta la lista.
+
+    Raises:
+        TranscriptsDisabled, NoTranscriptFound: sottotitoli non disponibili
+        (il chiamante decide se ricordarlo con remember_missing)
+    """
+    from youtube_transcript_api import YouTubeTranscriptApi
+    from .persistent_cache import get_cache
+
+    cached = cached_transcript(video_id)
+    if cached is not None:
+        logger.info(f"Trascrizione di {video_id} dalla cache ({len(cached)} caratteri)")
+        return cached
+
+    api = YouTubeTranscriptApi()
+    # youtube-transcript-api >= 1.0 ha list(); le versioni precedenti list_transcripts()
+    list_transcripts = getattr(api, 'list', None) or YouTubeTranscriptApi.list_transcripts
+    transcript = list_transcripts(video_id).find_transcript(list(languages))
+    text = " ".join(snippet.text if hasattr(snippet, 'text') else snippet['text']
+                    for snippet in transcript.fetch())
+
+    get_cache().set(TRANSCRIPT_NAMESPACE, video_id, text, ttl=get_transcript_setting('CACHE_TTL'))
+    return text
+
+
+# --- Map-reduce --------------------------------------------------------------
+
+def needs_condensing(text: str) -> bool:
+    return len(text) > get_transcript_setting('MAP_REDUCE_THRESHOLD')
+
+
+def split_chunks(text: str, chunk_chars: int, overlap: int = 0) -> List[str]:
+    """
+    Divide il testo in blocchi di circa chunk_chars caratteri, tagliando a
+    fine frase quando possibile; ogni blocco riprende gli ultimi overlap
+    caratteri del precedente per non perdere il contesto al confine
+    """
+    chunks = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + chunk_chars, length)
+        if end < length:
+            # Ultima fine frase nella seconda metà del blocco
+            window = text[start + chunk_chars // 2:end]
+            matches = list(_SENTENCE_END_RE.finditer(window))
+            if matches:
+                end = start + chunk_chars // 2 + matches[-1].end()
+            else:
+                space = text.rfind(' ', start + chunk_chars // 2, end)
+                if space > 0:
+                    end = space + 1
+        chunks.append(text[start:end].strip())
+        if end >= length:
+            break
+        start = max(end - overlap, start + 1)
+    return [chunk for chunk in chunks if chunk]
+
+
+def _summarize_chunk(chunk: str, index: int, total: int, title: str, api_key: Optional[str], model: str) -> str:
+    from . import llm_gateway
+    from .persistent_cache import get_cache
+
+    key = hashlib.sha256(f"{SUMMARY_PROMPT_VERSION}:{model}:{chunk}".encode('utf-8')).hexdigest()
+    cached = get_cache().get(SUMMARY_NAMESPACE, key)
+    if cached is not None:
+        return cached
+
+    message = llm_gateway.create_message(
+        api_key=api_key,
+        system=SUMMARY_SYSTEM_PROMPT,
+        max_tokens=get_transcript_setting('SUMMARY_MAX_TOKENS'),
+        messages=[{
+            "role": "user",
+            "content": f"Video: {title}\nParte {index} di {total} della trascrizione:\n\n{chunk}",
+        }],
+        model=model,
+    )
+    summary = "".join(block.text for block in message.content if getattr(block, 'type', None) == 'text').strip()
+    if summary:
+        get_cache().set(SUMMARY_NAMESPACE, key, summary, ttl=get_transcript_setting('SUMMARY_TTL'))
+    return summary
+
+
+def condense_transcript(text: str, title: str = '', api_key: Optional[str] = None,
+                        model: Optional[str] = None) -> str:
+    """
+    Note della seduta al posto della trascrizione completa (fase di map)
+
+    I blocchi sono riassunti in parallelo, al massimo WORKERS alla volta e
+    comunque entro i limiti del gateway LLM. La fase di reduce è la normale
+    generazione dell'articolo sulle note restituite.
+
+    Raises:
+        Le eccezioni del gateway se un blocco non può essere riassunto: meglio
+        ritentare il lavoro che scrivere un articolo su una seduta incompleta
+    """
+    from . import llm_gateway
+
+    model = model or llm_gateway.DEFAULT_MODEL
+    chunks = split_chunks(text, get_transcript_setting('CHUNK_CHARS'), get_transcript_setting('OVERLAP_CHARS'))
+    total = len(chunks)
+    logger.info(f"Trascrizione di {len(text)} caratteri divisa in {total} blocchi per il riassunto")
+
+    workers = max(1, min(total, get_transcript_setting('WORKERS')))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='riassunto') as executor:
+        summaries = list(executor.map(
+            lambda item: _summarize_chunk(item[1], item[0], total, title, api_key, model),
+            enumerate(chunks, 1),
+        ))
+
+    notes = "\n\n".join(f"--- Parte {i} di {total} ---\n{summary}" for i, summary in enumerate(summaries, 1))
+    condensed = (f"Note della seduta, riassunte in ordine cronologico dalle {total} parti "
+                 f"della trascrizione completa ({len(text)} caratteri):\n\n{notes}")
+    logger.info(f"Trascrizione condensata: {len(text)} -> {len(condensed)} caratteri")
+    return condensed
@@ -3,12 +3,13 @@ import time
 import threading
 import logging
 import os
-import tempfile
 import platform
 import uuid
 import subprocess
 import hashlib
 import io
+import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from bs4 import BeautifulSoup
 from django.utils import timezone
@@ -16,9 +17,22 @@ from urllib.parse import urljoin, urlparse
 from abc import ABC, abstractmethod
 from typing import Dict, List, Optional, Any
 from django.conf import settings
+from django.db import connection
 from PIL import Image
 
-from home.models import Articolo
+from home.models import Articolo, TentativoProgrammato
+from home.image_health import describe_image_bytes, remember_image_metadata
+from home import llm_gateway
+from home import content_fingerprint
+from home import story_clustering
+from home import article_drafts
+from home.content_extractor import find_main_content, element_text
+from home.link_resolver import get_resolver
+from home import imap_idle
+from home import imap_fetch
+from home import imap_sync
+from home import transcripts
+from home import retry_queue
 
 # Import platform-specific locking
 if platform.system() == 'Windows':
@@ -73,6 +87,30 @@ class BaseScraper(ABC):
         """Ottiene il contenuto completo di un articolo"""
         pass
 
+    def wait_for_new_content(self, timeout: float) -> bool:
+        """
+        Attende fino al prossimo controllo; gli scraper con notifiche push
+        ritornano prima, appena la sorgente segnala nuovi contenuti
+
+        Returns:
+            True se la sorgente ha segnalato nuovi contenuti
+        """
+        time.sleep(timeout)
+        return False
+
+    def acknowledge(self, failed: List[Dict[str, Any]] = ()):
+        """
+        Conferma l'elaborazione degli articoli dell'ultimo scrape_articles (es. per salvare un cursore)
+
+        Args:
+            failed: Articoli la cui elaborazione è fallita, da riproporre al prossimo controllo
+        """
+        pass
+
+    def close(self):
+        """Rilascia eventuali connessioni persistenti"""
+        pass
+
 
 class HTMLScraper(BaseScraper):
     """Scraper per siti HTML generici"""
@@ -447,11 +485,15 @@ class HTMLScraper(BaseScraper):
                     content = content_elem.get_text(strip=True)
                     break
             
-            # Fallback
+            # Fallback: contenitore con la maggiore densità di testo, poi tutto il body
             if not content or len(content) < 100:
-                body = soup.find('body')
-                if body:
-                    content = body.get_text(strip=True)
+                main_content = find_main_content(soup, min_length=100)
+                if main_content:
+                    content = element_text(main_content)
+                else:
+                    body = soup.find('body')
+                    if body:
+                        content = body.get_text(strip=True)
             
             return content if len(content) > 100 else None
             
@@ -708,10 +750,11 @@ class YouTubeAPIScraper(BaseScraper):
         articles = []
 
         # Controlla prima i video in attesa di retry
-        pending_videos = self._check_pending_retries()
-        if pending_videos:
-            self.logger.info(f"Processando {len(pending_videos)} video in retry")
-            for video_id in pending_videos:
+        pending = self._check_pending_retries()
+        if pending:
+            self.logger.info(f"Processando {len(pending)} video in retry")
+            for item in pending:
+                video_id = item.chiave
                 try:
                     article_data = {
                         'title': f"Consiglio Comunale Carpi - Video {video_id} (Retry)",
@@ -727,12 +770,15 @@ class YouTubeAPIScraper(BaseScraper):
                     if transcript:
                         article_data['full_content'] = transcript
                         articles.append(article_data)
+                        retry_queue.complete(item)
                         self.logger.info(f"Retry riuscito per video {video_id}")
                     else:
                         self.logger.warning(f"Retry fallito per video {video_id}")
+                        retry_queue.retry_later(item, "Trascrizione non ancora disponibile")
 
                 except Exception as e:
                     self.logger.error(f"Errore nel retry video {video_id}: {e}")
+                    retry_queue.retry_later(item, str(e))
 
         # Se abbiamo API key e playlist, usa YouTube API
         if self.api_key and self.playlist_id and not self.api_key.startswith("AIzaSyDummy"):
@@ -788,8 +834,15 @@ class YouTubeAPIScraper(BaseScraper):
         try:
             self.logger.info(f"Usando modalità fallback con {len(self.fallback_video_ids)} video IDs")
             articles = []
-            
+
+            # Gli ID configurati sono sempre gli stessi: salta quelli già pubblicati
+            # e quelli senza sottotitoli, senza riproporli a ogni controllo
+            urls = {video_id: f"https://www.youtube.com/watch?v={video_id}" for video_id in self.fallback_video_ids}
+            published = set(Articolo.objects.filter(fonte__in=urls.values()).values_list('fonte', flat=True))
+
             for video_id in self.fallback_video_ids:
+                if urls[video_id] in published or transcripts.is_known_missing(video_id):
+                    continue
                 try:
                     article_data = {
                         'title': f"Consiglio Comunale Carpi - Video {video_id}",
@@ -820,45 +873,40 @@ class YouTubeAPIScraper(BaseScraper):
             return None
     
     def get_video_transcript(self, video_id: str) -> Optional[str]:
-        """Estrae trascrizione da video YouTube con rate limiting e gestione dirette"""
+        """Estrae trascrizione da video YouTube con cache, rate limiting e gestione dirette"""
         try:
-            from youtube_transcript_api import YouTubeTranscriptApi
             from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound
 
+            # Trascrizione già scaricata (o video noto senza sottotitoli): nessuna richiesta
+            cached = transcripts.cached_transcript(video_id)
+            if cached is not None:
+                self.logger.info(f"Transcript di {video_id} dalla cache: {len(cached)} caratteri")
+                return cached
+            if transcripts.is_known_missing(video_id):
+                self.logger.debug(f"Video {video_id} senza sottotitoli (verificato di recente)")
+                return None
+
             # Applica rate limiting se configurato
             delay = self.config.config.get('transcript_delay', 0)
             if delay > 0:
                 self.logger.info(f"Applicando pausa di {delay} secondi prima della richiesta transcript")
                 time.sleep(delay)
 
-            # Controlla prima se i sottotitoli sono disponibili
-            self.logger.info(f"Verifica disponibilità sottotitoli per video {video_id}")
-            api = YouTubeTranscriptApi()
-
+            self.logger.info(f"Estrazione transcript per video {video_id}")
             try:
-                # Prova a ottenere la lista dei transcript disponibili
-                transcript_list = api.list_transcripts(video_id)
-                # Cerca transcript in italiano
-                transcript_list.find_transcript(['it'])
-                self.logger.info(f"Sottotitoli disponibili per video {video_id}")
+                text = transcripts.fetch_transcript(video_id, languages=['it'])
             except (TranscriptsDisabled, NoTranscriptFound):
                 self.logger.info(f"Sottotitoli non disponibili per video {video_id} - probabilmente una diretta in corso")
                 if self._is_live_stream(video_id):
                     self.logger.info(f"Video {video_id} confermato come diretta - sarà riprovato più tardi")
                     self._schedule_retry(video_id)
+                else:
+                    transcripts.remember_missing(video_id)
                 return None
 
-            # Se i sottotitoli sono disponibili, procedi con l'estrazione
-            self.logger.info(f"Estrazione transcript per video {video_id}")
-            transcript_data = api.fetch(video_id, languages=['it'])
-            text = " ".join([snippet.text for snippet in transcript_data])
             self.logger.info(f"Transcript estratto: {len(text)} caratteri")
             return text
 
-        except (TranscriptsDisabled, NoTranscriptFound) as e:
-            self.logger.error(f"Transcript non disponibile per video {video_id}: {e}")
-            return None
-
         except Exception as e:
             self.logger.error(f"Errore nell'estrazione transcript per {video_id}: {e}")
             return None
@@ -883,51 +931,17 @@ class YouTubeAPIScraper(BaseScraper):
             return True
 
     def _schedule_retry(self, video_id: str):
-        """Programma un retry per il video"""
+        """Programma un retry per il video nella coda persistente"""
         try:
             retry_delay = self.config.config.get('live_stream_retry_delay', 3600)  # 1 ora default
-            retry_file = f"youtube_retry_{video_id}.txt"
-            retry_path = os.path.join(tempfile.gettempdir(), retry_file)
-
-            # Salva timestamp per il retry
-            retry_time = time.time() + retry_delay
-            with open(retry_path, 'w') as f:
-                f.write(str(retry_time))
-
-            self.logger.info(f"Scheduled retry for video {video_id} in {retry_delay} seconds")
-
+            retry_queue.schedule(retry_queue.YOUTUBE_TRANSCRIPT, video_id, retry_delay)
         except Exception as e:
             self.logger.error(f"Errore scheduling retry per {video_id}: {e}")
 
-    def _check_pending_retries(self) -> List[str]:
-        """Controlla se ci sono video da riprovare"""
+    def _check_pending_retries(self) -> List[TentativoProgrammato]:
+        """Video il cui retry è scaduto, presi in carico dalla coda persistente"""
         try:
-            import glob
-            retry_files = glob.glob(os.path.join(tempfile.gettempdir(), "youtube_retry_*.txt"))
-            ready_videos = []
-
-            current_time = time.time()
-
-            for retry_file in retry_files:
-                try:
-                    with open(retry_file, 'r') as f:
-                        retry_time = float(f.read().strip())
-
-                    if current_time >= retry_time:
-                        # È ora di riprovare
-                        video_id = os.path.basename(retry_file).replace('youtube_retry_', '').replace('.txt', '')
-                        ready_videos.append(video_id)
-                        os.unlink(retry_file)  # Rimuovi il file di retry
-
-                except Exception as e:
-                    # File corrotto, rimuovilo
-                    try:
-                        os.unlink(retry_file)
-                    except:
-                        pass
-
-            return ready_videos
-
+            return retry_queue.claim_due(retry_queue.YOUTUBE_TRANSCRIPT)
         except Exception as e:
             self.logger.error(f"Errore checking pending retries: {e}")
             return []
@@ -1400,6 +1414,9 @@ class GraphQLScraper(BaseScraper):
             # Restituisci l'URL media Django
             media_url = f"{settings.MEDIA_URL}images/downloaded/{filename}"
 
+            # Registra byte, MIME e dimensioni per enclosure RSS e og:image
+            remember_image_metadata(media_url, describe_image_bytes(image_content, content_type))
+
             self.logger.info(f"Nuova immagine salvata: {filename} (hash: {image_hash[:12]}...)")
             return media_url
             
@@ -1504,64 +1521,252 @@ class EmailScraper(BaseScraper):
         self.imaplib = imaplib
         self.email_lib = email_lib
 
+        # Connessione persistente con notifiche push IDLE (fallback al polling
+        # se il server non lo supporta); il monitor ricontrolla comunque la
+        # casella alla scadenza di ogni sessione IDLE
+        self.use_idle = config.config.get('imap_idle', getattr(settings, 'EMAIL_IMAP_IDLE', True))
+        self.idle_timeout = config.config.get('idle_timeout', imap_idle.MAX_IDLE_SECONDS - 4 * 60)
+        self.reconnect_delay = config.config.get('reconnect_delay', 30)
+        self._mail = None
+        self._mail_lock = threading.RLock()
+
+        # Sincronizzazione per UID: al massimo max_per_check email per controllo,
+        # scaricate a gruppi di fetch_batch; con un arretrato il controllo
+        # successivo parte dopo backlog_delay secondi
+        self.max_per_check = config.config.get('max_per_check', 50)
+        self.fetch_batch = config.config.get('fetch_batch', 10)
+        self.backlog_delay = config.config.get('backlog_delay', 10)
+        self._mailbox_status = (None, None)
+        self._cursor = None
+        self._pending_cursor = None
+        self._scraped_cursor = None
+        self._backlog = False
+
+    def _connect(self):
+        """Apre una connessione IMAP autenticata con la mailbox selezionata"""
+        # Connessione IMAP (prova SSL prima, poi normale)
+        self.logger.info(f"Connessione a {self.imap_server}:{self.imap_port}")
+
+        try:
+            mail = self.imaplib.IMAP4_SSL(self.imap_server, self.imap_port)
+        except Exception as e:
+            self.logger.info(f"SSL fallito, provo connessione normale: {e}")
+            mail = self.imaplib.IMAP4(self.imap_server, 143)
+            mail.starttls()
+
+        mail.login(self.email, self.password)
+        mail.select(self.mailbox)
+        self._mailbox_status = imap_sync.mailbox_status(mail)
+        return mail
+
+    def _get_connection(self):
+        """Connessione persistente (modalità IDLE) o nuova connessione per il polling"""
+        if not self.use_idle:
+            return self._connect()
+        if self._mail is None:
+            mail = self._connect()
+            if not imap_idle.supports_idle(mail):
+                self.logger.warning(f"Il server {self.imap_server} non supporta IDLE, uso il polling")
+                self.use_idle = False
+                return mail
+            self._mail = mail
+        return self._mail
+
+    def _disconnect(self, mail):
+        """Chiude una connessione ignorando gli errori (può essere già caduta)"""
+        if mail is self._mail:
+            self._mail = None
+        try:
+            mail.close()
+            mail.logout()
+        except Exception:
+            try:
+                mail.shutdown()
+            except Exception:
+                pass
+
     def scrape_articles(self) -> List[Dict[str, Any]]:
         """Scrape articoli dalle email"""
         articles = []
 
-        try:
-            # Connessione IMAP (prova SSL prima, poi normale)
-            self.logger.info(f"Connessione a {self.imap_server}:{self.imap_port}")
-
+        with self._mail_lock:
+            mail = None
+            self._pending_cursor = None
+            self._scraped_cursor = None
             try:
-                mail = self.imaplib.IMAP4_SSL(self.imap_server, self.imap_port)
+                mail = self._get_connection()
+
+                # Email con UID successivo al cursore, le più vecchie per prime
+                uidvalidity, uidnext = imap_sync.mailbox_status(mail)
+                if uidvalidity is not None:
+                    self._mailbox_status = (uidvalidity, uidnext)
+                cursor = self._get_cursor().for_mailbox(mail, *self._mailbox_status)
+                pending_uids = cursor.pending_uids(mail)
+
+                # Limite per controllo: l'arretrato viene smaltito nei controlli successivi
+                batch = pending_uids[:self.max_per_check]
+                self._backlog = len(pending_uids) > len(batch)
+                if pending_uids:
+                    self.logger.info(f"Trovate {len(pending_uids)} nuove email"
+                                     + (f", elaboro le prime {len(batch)}" if self._backlog else ""))
+
+                for start in range(0, len(batch), self.fetch_batch):
+                    email_ids = [str(uid).encode() for uid in batch[start:start + self.fetch_batch]]
+
+                    # Header e struttura di tutte le email in un solo UID FETCH, senza allegati
+                    summaries = imap_fetch.fetch_summaries(mail, email_ids, uid=True)
+
+                    # Lettura dalla connessione IMAP (non thread-safe): una email alla volta
+                    parsed_emails = []
+                    for email_id in email_ids:
+                        try:
+                            parsed = self._parse_email(mail, email_id, summaries.get(email_id))
+                            if parsed:
+                                parsed['source_id'] = f"{cursor.uidvalidity}.{email_id.decode()}"
+                                parsed_emails.append(parsed)
+                        except Exception as e:
+                            self.logger.error(f"Errore processamento email {email_id}: {e}")
+
+                    # Risoluzione di link, t.co e immagini dei tweet in parallelo tra le email
+                    resolved = get_resolver().map_concurrent(self._resolve_email, parsed_emails)
+                    for article in resolved:
+                        if article:
+                            articles.append(article)
+
+                    # Marca come lette le email esaminate, per chi legge la casella (i FETCH usano BODY.PEEK)
+                    mail.uid('STORE', imap_sync.uid_set(int(uid) for uid in email_ids), '+FLAGS', '\\Seen')
+
+                # Il cursore avanza quando il monitor ha elaborato gli articoli (acknowledge)
+                self._scraped_cursor = cursor
+                if batch:
+                    cursor = cursor.advanced(batch[-1])
+                if not self._backlog and cursor.bootstrap_until:
+                    cursor = cursor.advanced(cursor.bootstrap_until)
+                self._pending_cursor = cursor
+
+                if mail is not self._mail:
+                    self._disconnect(mail)
+
             except Exception as e:
-                self.logger.info(f"SSL fallito, provo connessione normale: {e}")
-                mail = self.imaplib.IMAP4(self.imap_server, 143)
-                mail.starttls()
+                self.logger.error(f"Errore connessione IMAP: {e}")
+                self._backlog = False
+                if mail is not None:
+                    # Connessione persistente in stato incerto: riaperta al prossimo controllo
+                    self._disconnect(mail)
 
-            mail.login(self.email, self.password)
-            mail.select(self.mailbox)
+        return articles
 
-            # Cerca email non lette
-            status, messages = mail.search(None, 'UNSEEN')
+    def _get_cursor(self) -> imap_sync.MailboxCursor:
+        if self._cursor is None:
+            self._cursor = imap_sync.MailboxCursor.load(
+                imap_sync.cursor_key(self.email, self.imap_server, self.mailbox)
+            )
+        return self._cursor
 
-            if status == 'OK':
-                email_ids = messages[0].split()
-                self.logger.info(f"Trovate {len(email_ids)} email non lette")
+    def acknowledge(self, failed: List[Dict[str, Any]] = ()):
+        """
+        Salva il cursore UID dopo che il monitor ha elaborato le email dell'ultimo controllo
 
-                for email_id in email_ids[-10:]:  # Prendi massimo ultime 10 email
-                    try:
-                        article = self._process_email(mail, email_id)
-                        if article:
-                            articles.append(article)
-                            # Marca come letta
-                            mail.store(email_id, '+FLAGS', '\\Seen')
-                    except Exception as e:
-                        self.logger.error(f"Errore processamento email {email_id}: {e}")
+        Se l'elaborazione di qualche email è fallita il cursore si ferma prima
+        della prima fallita, che torna non letta: al prossimo controllo viene
+        riletta insieme alle successive (quelle già salvate sono scartate dal
+        controllo dei duplicati sulla fonte).
+        """
+        cursor, self._pending_cursor = self._pending_cursor, None
+        scraped, self._scraped_cursor = self._scraped_cursor, None
+        if cursor is None:
+            return
+
+        failed_uids = sorted(article['email_uid'] for article in failed if article.get('email_uid'))
+        if failed_uids and scraped is not None:
+            self.logger.warning(f"Elaborazione fallita per {len(failed_uids)} email, "
+                                f"cursore fermo prima dell'UID {failed_uids[0]}")
+            self._mark_unseen(failed_uids)
+            cursor = scraped.advanced(failed_uids[0] - 1)
+
+        current = self._get_cursor()
+        if (cursor.uidvalidity, cursor.last_uid, cursor.bootstrap_until) != \
+                (current.uidvalidity, current.last_uid, current.bootstrap_until):
+            cursor.save()
+        self._cursor = cursor
+
+    def _mark_unseen(self, uids: List[int]):
+        """Toglie il flag \\Seen alle email da rileggere (i messaggi del bootstrap sono cercati come UNSEEN)"""
+        with self._mail_lock:
+            mail = None
+            try:
+                mail = self._get_connection()
+                mail.uid('STORE', imap_sync.uid_set(uids), '-FLAGS', '\\Seen')
+                if mail is not self._mail:
+                    self._disconnect(mail)
+            except Exception as e:
+                self.logger.error(f"Errore nel ripristino delle email non lette {uids}: {e}")
+                if mail is not None:
+                    self._disconnect(mail)
 
-            mail.close()
-            mail.logout()
+    def wait_for_new_content(self, timeout: float) -> bool:
+        """
+        In modalità IDLE attende la notifica push di nuove email sulla
+        connessione persistente, al massimo idle_timeout secondi; senza IDLE
+        attende timeout secondi come gli altri scraper. Con un arretrato da
+        smaltire attende solo backlog_delay secondi.
+        """
+        if self._backlog:
+            time.sleep(self.backlog_delay)
+            return True
 
-        except Exception as e:
-            self.logger.error(f"Errore connessione IMAP: {e}")
+        if not self.use_idle:
+            return super().wait_for_new_content(timeout)
 
-        return articles
+        with self._mail_lock:
+            try:
+                mail = self._get_connection()
+                if not self.use_idle:
+                    self._disconnect(mail)
+                    return super().wait_for_new_content(timeout)
+
+                if imap_idle.has_pending_mail(mail):
+                    return True
+                new_mail = imap_idle.wait_for_mail(mail, self.idle_timeout)
+                if new_mail:
+                    self.logger.info("Notifica IDLE: nuove email nella casella")
+                return new_mail
 
-    def _process_email(self, mail, email_id) -> Optional[Dict[str, Any]]:
-        """Processa singola email"""
+            except Exception as e:
+                self.logger.warning(f"Sessione IDLE interrotta, riconnessione: {e}")
+                if self._mail is not None:
+                    self._disconnect(self._mail)
+
+        # Pausa prima della riconnessione, per non martellare un server irraggiungibile
+        time.sleep(self.reconnect_delay)
+        return False
+
+    def close(self):
+        """Chiude la connessione persistente, interrompendo una sessione IDLE in corso"""
+        if self._mail_lock.acquire(blocking=False):
+            try:
+                if self._mail is not None:
+                    self._disconnect(self._mail)
+            finally:
+                self._mail_lock.release()
+        elif self._mail is not None:
+            # Il thread del monitor è in IDLE: la chiusura del socket lo sblocca
+            try:
+                self._mail.shutdown()
+            except Exception:
+                pass
+
+    def _parse_email(self, mail, email_id: bytes, summary: Optional[imap_fetch.MessageSummary]) -> Optional[Dict[str, Any]]:
+        """Filtra una email sugli header e scarica solo la parte di testo (solo IMAP, nessuna richiesta HTTP)"""
         try:
-            # Fetch email
-            status, msg_data = mail.fetch(email_id, '(RFC822)')
-            if status != 'OK':
+            if summary is None:
+                self.logger.warning(f"Header dell'email {email_id} non disponibili")
                 return None
 
-            # Parse email
-            email_message = self.email_lib.message_from_bytes(msg_data[0][1])
-
             # Estrai informazioni base
-            subject = email_message.get('Subject', '')
-            sender = email_message.get('From', '')
-            date_received = email_message.get('Date', '')
+            subject = summary.headers.get('Subject', '')
+            sender = summary.headers.get('From', '')
+            date_received = summary.headers.get('Date', '')
 
             # Applica filtri se configurati
             if self.sender_filter and not any(s.lower() in sender.lower() for s in self.sender_filter):
@@ -1570,32 +1775,58 @@ class EmailScraper(BaseScraper):
             if self.subject_filter and not any(s.lower() in subject.lower() for s in self.subject_filter):
                 return None
 
+            # Solo la parte text/html (o text/plain) indicata dalla BODYSTRUCTURE
+            body = imap_fetch.fetch_body(mail, email_id, summary.bodystructure, uid=True)
+            if body is None:
+                return None
+
             # Estrai contenuto
-            content = self._extract_email_content(email_message)
+            content = self._extract_email_content(body)
             if not content:
                 return None
 
-            # Prima estrai il contenuto HTML grezzo per le immagini (prima della conversione a testo)
-            raw_html_content = self._get_raw_html_content(email_message)
+            return {
+                'email_id': email_id,
+                'subject': subject,
+                'sender': sender,
+                'date_received': date_received,
+                'content': content,
+                # Contenuto HTML grezzo per le immagini (prima della conversione a testo)
+                'raw_html': self._get_raw_html_content(body),
+            }
+
+        except Exception as e:
+            self.logger.error(f"Errore processing email: {e}")
+            return None
+
+    def _resolve_email(self, parsed: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Completa una email analizzata con tipo, immagine e contenuto dei link (richieste HTTP)"""
+        try:
+            content = parsed['content']
+            subject = parsed['subject']
+            email_id = parsed['email_id']
 
             # Rileva tipo di contenuto automaticamente
-            content_type, category, image_url, source_url = self._detect_content_type(content, sender, subject, raw_html_content)
+            content_type, category, image_url, source_url = self._detect_content_type(
+                content, parsed['sender'], subject, parsed['raw_html']
+            )
 
             # Estrai e verifica link nel contenuto
             links_content = self._extract_and_fetch_links(content)
 
             self.logger.info(f"Email processata: {subject[:50]}... (Tipo: {content_type})")
 
-            # Per tweet usa l'URL del tweet, per comunicati usa email://
-            article_url = source_url if source_url else f"email://{email_id}"
+            # Per tweet usa l'URL del tweet, per comunicati usa email://<uidvalidity>.<uid>
+            article_url = source_url if source_url else f"email://{parsed.get('source_id', email_id)}"
 
             return {
                 'title': subject,
                 'content': content,
+                'email_uid': int(email_id),  # per fermare il cursore se l'elaborazione fallisce
                 'preview': content[:300] + '...' if len(content) > 300 else content,
                 'url': article_url,
-                'date': self._parse_email_date(date_received),
-                'sender': sender,
+                'date': self._parse_email_date(parsed['date_received']),
+                'sender': parsed['sender'],
                 'image': image_url,
                 'content_type': content_type,  # 'twitter' o 'comunicato'
                 'category_override': category,  # Categoria specifica
@@ -1676,10 +1907,12 @@ class EmailScraper(BaseScraper):
         t_co_matches = re.findall(t_co_pattern, content)
 
         if t_co_matches:
+            # Espansione di tutti i link t.co in parallelo (con cache persistente)
+            expanded_urls = get_resolver().expand_many(t_co_matches)
             for t_co_url in t_co_matches:
                 try:
                     # Espandi il link t.co per trovare l'URL del tweet originale
-                    expanded_url = self._expand_short_url(t_co_url)
+                    expanded_url = expanded_urls.get(t_co_url)
                     if expanded_url and ('twitter.com' in expanded_url or 'x.com' in expanded_url):
                         # Estrai l'immagine dal tweet originale
                         tweet_image = self._fetch_tweet_image(expanded_url)
@@ -1718,9 +1951,10 @@ class EmailScraper(BaseScraper):
         t_co_matches = re.findall(t_co_pattern, content)
 
         if t_co_matches:
+            expanded_urls = get_resolver().expand_many(t_co_matches)
             for t_co_url in t_co_matches:
                 try:
-                    expanded_url = self._expand_short_url(t_co_url)
+                    expanded_url = expanded_urls.get(t_co_url)
                     if expanded_url and ('twitter.com' in expanded_url or 'x.com' in expanded_url):
                         # Converti twitter.com in x.com se necessario
                         if 'twitter.com' in expanded_url:
@@ -1745,13 +1979,8 @@ class EmailScraper(BaseScraper):
         return None
 
     def _expand_short_url(self, short_url: str) -> Optional[str]:
-        """Espande un URL accorciato (t.co) per ottenere l'URL originale"""
-        try:
-            response = requests.head(short_url, allow_redirects=True, timeout=10)
-            return response.url
-        except Exception as e:
-            self.logger.debug(f"Errore espansione URL {short_url}: {e}")
-            return None
+        """Espande un URL accorciato (t.co) per ottenere l'URL originale (con cache persistente)"""
+        return get_resolver().expand(short_url)
 
     def _fetch_tweet_image(self, tweet_url: str) -> Optional[str]:
         """Estrae l'immagine da un tweet usando web scraping semplice"""
@@ -1761,7 +1990,8 @@ class EmailScraper(BaseScraper):
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
             }
 
-            response = requests.get(tweet_url, headers=headers, timeout=10)
+            with get_resolver().hosts.slot(tweet_url):
+                response = requests.get(tweet_url, headers=headers, timeout=10)
             if response.status_code != 200:
                 return None
 
@@ -1794,27 +2024,13 @@ class EmailScraper(BaseScraper):
 
         return None
 
-    def _get_raw_html_content(self, email_message) -> str:
-        """Estrae contenuto HTML grezzo senza conversioni per l'estrazione link/immagini"""
-        if email_message.is_multipart():
-            for part in email_message.walk():
-                if part.get_content_type() == "text/html":
-                    try:
-                        return part.get_payload(decode=True).decode('utf-8', errors='replace')
-                    except (UnicodeDecodeError, AttributeError):
-                        return str(part.get_payload(decode=True), errors='replace')
-        else:
-            if email_message.get_content_type() == "text/html":
-                try:
-                    return email_message.get_payload(decode=True).decode('utf-8', errors='replace')
-                except (UnicodeDecodeError, AttributeError):
-                    return str(email_message.get_payload(decode=True), errors='replace')
-        return ""
+    def _get_raw_html_content(self, body: imap_fetch.EmailBody) -> str:
+        """Contenuto HTML grezzo senza conversioni per l'estrazione link/immagini"""
+        return body.html
 
     def _extract_and_fetch_links(self, content: str) -> List[Dict[str, str]]:
         """Estrae link dal contenuto e ne scarica il contenuto"""
         import re
-        import requests
         from urllib.parse import urlparse
 
         links_content = []
@@ -1863,91 +2079,65 @@ class EmailScraper(BaseScraper):
                     not url.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.pdf'))):
                     relevant_urls.append(url)
 
-            # Limita a massimo 3 link per evitare overhead
-            for url in relevant_urls[:3]:
-                try:
-                    self.logger.info(f"Scaricando contenuto da: {url}")
-
-                    headers = {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                    }
+            # Limita a massimo 3 link per evitare overhead, scaricati in parallelo
+            fetched = get_resolver().map_concurrent(self._fetch_link_content, relevant_urls[:3])
+            links_content = [link for link in fetched if link]
 
-                    response = requests.get(url, headers=headers, timeout=10, allow_redirects=True)
-                    response.raise_for_status()
+        except Exception as e:
+            self.logger.error(f"Errore estrazione link: {e}")
 
-                    # Parse HTML e estrai contenuto testuale
-                    soup = BeautifulSoup(response.content, 'html.parser')
+        return links_content
 
-                    # Rimuovi script, style, nav, footer
-                    for tag in soup(["script", "style", "nav", "footer", "header"]):
-                        tag.decompose()
+    def _fetch_link_content(self, url: str) -> Optional[Dict[str, str]]:
+        """Scarica un link citato nell'email e ne estrae titolo e testo (max 1000 caratteri)"""
+        try:
+            self.logger.info(f"Scaricando contenuto da: {url}")
 
-                    # Estrai titolo
-                    title = ""
-                    if soup.title:
-                        title = soup.title.string.strip()
+            headers = {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            }
 
-                    # Estrai contenuto principale
-                    content_tags = soup.find_all(['p', 'h1', 'h2', 'h3', 'article', 'main'])
-                    text_content = ' '.join(tag.get_text(strip=True) for tag in content_tags)
+            with get_resolver().hosts.slot(url):
+                response = requests.get(url, headers=headers, timeout=10, allow_redirects=True)
+            response.raise_for_status()
 
-                    # Pulisci e limita il contenuto
-                    clean_content = ' '.join(text_content.split())[:1000]  # Max 1000 caratteri
+            # Parse HTML e estrai contenuto testuale
+            soup = BeautifulSoup(response.content, 'html.parser')
 
-                    if clean_content and len(clean_content) > 100:  # Solo se ha contenuto significativo
-                        links_content.append({
-                            'url': url,
-                            'title': title,
-                            'content': clean_content
-                        })
+            # Rimuovi script, style, nav, footer
+            for tag in soup(["script", "style", "nav", "footer", "header"]):
+                tag.decompose()
 
-                except Exception as e:
-                    self.logger.warning(f"Impossibile scaricare {url}: {e}")
-                    continue
+            # Estrai titolo
+            title = ""
+            if soup.title and soup.title.string:
+                title = soup.title.string.strip()
 
-        except Exception as e:
-            self.logger.error(f"Errore estrazione link: {e}")
+            # Estrai contenuto principale
+            content_tags = soup.find_all(['p', 'h1', 'h2', 'h3', 'article', 'main'])
+            text_content = ' '.join(tag.get_text(strip=True) for tag in content_tags)
 
-        return links_content
+            # Pulisci e limita il contenuto
+            clean_content = ' '.join(text_content.split())[:1000]  # Max 1000 caratteri
 
-    def _extract_email_content(self, email_message) -> str:
-        """Estrai contenuto dall'email (HTML o testo)"""
-        content = ""
+            if clean_content and len(clean_content) > 100:  # Solo se ha contenuto significativo
+                return {
+                    'url': url,
+                    'title': title,
+                    'content': clean_content
+                }
+            return None
 
-        if email_message.is_multipart():
-            for part in email_message.walk():
-                if part.get_content_type() == "text/html":
-                    try:
-                        content = part.get_payload(decode=True).decode('utf-8', errors='replace')
-                        # Converti HTML in testo leggibile, preservando il contenuto HTML per estrazione immagini
-                        content = self._html_to_text(content)
-                        break
-                    except (UnicodeDecodeError, AttributeError):
-                        # Fallback con encoding più permissivo
-                        content = str(part.get_payload(decode=True), errors='replace')
-                        content = self._html_to_text(content)
-                        break
-                elif part.get_content_type() == "text/plain" and not content:
-                    try:
-                        content = part.get_payload(decode=True).decode('utf-8', errors='replace')
-                    except (UnicodeDecodeError, AttributeError):
-                        content = str(part.get_payload(decode=True), errors='replace')
-        else:
-            content_type = email_message.get_content_type()
-            if content_type == "text/html":
-                try:
-                    content = email_message.get_payload(decode=True).decode('utf-8', errors='replace')
-                    content = self._html_to_text(content)
-                except (UnicodeDecodeError, AttributeError):
-                    content = str(email_message.get_payload(decode=True), errors='replace')
-                    content = self._html_to_text(content)
-            elif content_type == "text/plain":
-                try:
-                    content = email_message.get_payload(decode=True).decode('utf-8', errors='replace')
-                except (UnicodeDecodeError, AttributeError):
-                    content = str(email_message.get_payload(decode=True), errors='replace')
+        except Exception as e:
+            self.logger.warning(f"Impossibile scaricare {url}: {e}")
+            return None
 
-        return content.strip()
+    def _extract_email_content(self, body: imap_fetch.EmailBody) -> str:
+        """Estrai contenuto dall'email (HTML convertito in testo, o testo semplice)"""
+        if body.html:
+            # Converti HTML in testo leggibile; l'HTML resta in body per l'estrazione immagini
+            return self._html_to_text(body.html).strip()
+        return body.text.strip()
 
     def _html_to_text(self, html_content: str) -> str:
         """Converti HTML in testo pulito con gestione migliorata per tweet"""
@@ -2063,6 +2253,10 @@ class EmailScraper(BaseScraper):
 
 class UniversalNewsMonitor:
     """Monitor universale per diversi tipi di siti news"""
+
+    # Monitor del processo per nome di configurazione (vedi get_for_config)
+    _registry: Dict[str, 'UniversalNewsMonitor'] = {}
+    _registry_lock = threading.Lock()
     
     def __init__(self, site_config: SiteConfig, check_interval: int = 900):
         self.config = site_config
@@ -2096,6 +2290,37 @@ class UniversalNewsMonitor:
         
         # Crea scraper appropriato
         self.scraper = self._create_scraper()
+
+        # Registra il monitor: i lavori di generazione AI lo ritrovano per nome
+        self.config_name = self._find_config_name(site_config)
+        if self.config_name:
+            with UniversalNewsMonitor._registry_lock:
+                UniversalNewsMonitor._registry[self.config_name] = self
+
+    @staticmethod
+    def _find_config_name(site_config: SiteConfig) -> Optional[str]:
+        """Nome della configurazione in MONITOR_CONFIGS (None per configurazioni personalizzate)"""
+        from home.monitor_configs import MONITOR_CONFIGS
+        for name, config in MONITOR_CONFIGS.items():
+            if config is site_config:
+                return name
+        return None
+
+    @classmethod
+    def get_for_config(cls, config_name: str) -> 'UniversalNewsMonitor':
+        """
+        Restituisce il monitor attivo per una configurazione, o ne crea uno
+
+        Un worker in un altro processo (es. run_job_workers) non ha monitor
+        attivi: ricostruisce il monitor dalla configurazione, senza avviarlo.
+        """
+        with cls._registry_lock:
+            monitor = cls._registry.get(config_name)
+        if monitor is not None:
+            return monitor
+
+        from home.monitor_configs import get_config
+        return cls(get_config(config_name))
     
     def _create_scraper(self) -> BaseScraper:
         """Crea il scraper appropriato basato sulla configurazione"""
@@ -2207,6 +2432,7 @@ class UniversalNewsMonitor:
     
     def check_for_new_articles(self):
         """Controlla per nuovi articoli"""
+        failed = []
         try:
             new_articles = self.scraper.scrape_articles()
             
@@ -2218,13 +2444,19 @@ class UniversalNewsMonitor:
                     article_hash = self.get_article_hash(article_data['title'], article_data['url'])
                     
                     if article_hash not in self.seen_articles:
-                        self.process_new_article(article_data)
+                        if not self.process_new_article(article_data):
+                            # Non segnato come visto: riproposto al prossimo controllo
+                            failed.append(article_data)
+                            continue
                         self.seen_articles[article_hash] = datetime.now().isoformat()
                         processed_count += 1
                 
-                self.logger.info(f"Processati {processed_count} nuovi articoli")
+                self.logger.info(f"Processati {processed_count} nuovi articoli"
+                                 + (f", {len(failed)} falliti" if failed else ""))
             else:
                 self.logger.debug("Nessun nuovo articolo trovato")
+
+            self.scraper.acknowledge(failed)
                 
         except Exception as e:
             self.logger.error(f"Errore nel controllo articoli: {e}")
@@ -2234,16 +2466,21 @@ class UniversalNewsMonitor:
         # Solo la configurazione specifica del sito determina l'auto-approvazione
         return self.config.config.get('auto_approve', False)
     
-    def process_new_article(self, article_data: Dict[str, Any]):
-        """Processa un nuovo articolo"""
+    def process_new_article(self, article_data: Dict[str, Any]) -> bool:
+        """
+        Processa un nuovo articolo
+
+        Returns:
+            False se l'elaborazione è fallita (True anche per gli articoli già presenti)
+        """
         try:
             self.logger.info(f"Processando nuovo articolo: {article_data['title']}")
             
             # Controllo duplicati
             existing = Articolo.objects.filter(fonte=article_data['url']).exists()
-            if existing:
-                # Articolo già esistente - non logga per evitare spam
-                return
+            if existing or story_clustering.story_index.article_for_url(article_data['url']):
+                # Articolo già esistente (o fonte già unita a un altro) - non logga per evitare spam
+                return True
             
             # Ottieni contenuto completo se necessario
             if not article_data.get('full_content'):
@@ -2252,107 +2489,200 @@ class UniversalNewsMonitor:
                     article_data['full_content'] = full_content
                 else:
                     article_data['full_content'] = article_data['preview']
+
+            # Stessa storia già pubblicata da un'altra fonte: si aggiunge solo la fonte
+            if self.merge_into_existing_story(article_data):
+                return True
             
             # Genera articolo con AI se configurato
             if self.config.config.get('use_ai_generation', False):
-                result = self.generate_ai_article(article_data)
-                self.logger.info(f"Articolo AI generato: {result}")
+                if self.config_name and self.use_batch_generation(article_data):
+                    # Categoria non urgente: generazione differita con la Batches API
+                    self.enqueue_batch_generation(article_data)
+                elif self.config_name:
+                    # In coda: la generazione non blocca il polling del monitor
+                    self.enqueue_ai_generation(article_data)
+                else:
+                    # Configurazione personalizzata: un worker non potrebbe ricostruirla
+                    result = self.generate_ai_article(article_data)
+                    self.logger.info(f"Articolo AI generato: {result}")
             else:
                 # Salva direttamente senza AI
                 self.save_article_directly(article_data)
+            return True
             
         except Exception as e:
             self.logger.error(f"Errore nel processare articolo: {e}")
+            return False
     
-    def generate_ai_article(self, article_data: Dict[str, Any]) -> str:
-        """Genera articolo con AI con ricerca web conversazionale integrata"""
-        try:
-            from anthropic import Anthropic
+    def get_generation_priority(self, article_data: Dict[str, Any]) -> int:
+        """Priorità della generazione AI in base alla categoria (AI_GENERATION_PRIORITIES)"""
+        category = article_data.get('category_override', self.config.category)
+        priorities = getattr(settings, 'AI_GENERATION_PRIORITIES', {})
+        return priorities.get(category, getattr(settings, 'AI_GENERATION_DEFAULT_PRIORITY', 10))
 
-            api_key = self.config.config.get('ai_api_key')
-            if not api_key:
-                raise ValueError("API key mancante per generazione AI")
+    def enqueue_ai_generation(self, article_data: Dict[str, Any]):
+        """
+        Accoda la generazione AI di un articolo
 
-            client = Anthropic(api_key=api_key)
+        La chiave del lavoro è l'hash dell'URL sorgente: la stessa notizia non
+        viene accodata due volte, nemmeno mentre è in generazione.
+        """
+        from home.job_queue import dispatch
+        from home.jobs import GENERA_ARTICOLO
 
-            # Scegli prompt in base al tipo di contenuto (MANTENIAMO IDENTICI)
-            content_type = article_data.get('content_type', 'comunicato')
-            if content_type == 'twitter':
-                system_prompt = self.config.config.get('ai_twitter_prompt',
-                    self.config.config.get('ai_system_prompt',
-                    """Sei un giornalista esperto. Rielabora questa notizia per il giornale locale."""))
-            else:
-                system_prompt = self.config.config.get('ai_system_prompt',
-                    """Sei un giornalista esperto. Rielabora questa notizia per il giornale locale.""")
-
-            # Costruisci contenuto con eventuali link (MANTENIAMO)
-            links_section = ""
-            if article_data.get('links_content'):
-                links_section = "\n\nContenuto aggiuntivo dai link riferiti:\n"
-                for i, link_data in enumerate(article_data['links_content'], 1):
-                    links_section += f"\n--- Link {i}: {link_data['url']} ---\n"
-                    if link_data.get('title'):
-                        links_section += f"Titolo: {link_data['title']}\n"
-                    links_section += f"Contenuto: {link_data['content']}\n"
-
-            # Setup per Tool Use conversazionale autonomo
-            enable_web_search = self.config.config.get('enable_web_search', False)
-            web_sources = []  # Lista delle fonti web utilizzate da Claude
+        # Il payload è JSON: converte eventuali date e oggetti non serializzabili
+        payload = {
+            'config': self.config_name,
+            'article_data': json.loads(json.dumps(article_data, default=str)),
+        }
+        priority = self.get_generation_priority(article_data)
+        job = dispatch(
+            GENERA_ARTICOLO,
+            payload,
+            priorita=priority,
+            chiave=f"{GENERA_ARTICOLO}:{self.get_article_hash(article_data['title'], article_data['url'])}",
+            max_tentativi=3,
+            dedup_in_corso=True,
+        )
+        self.logger.info(f"Generazione AI accodata (lavoro #{job.pk}, priorità {priority}): {article_data['title']}")
 
+    def use_batch_generation(self, article_data: Dict[str, Any]) -> bool:
+        """Indica se la notizia va generata in differita (AI_BATCH['CATEGORIES'] o ai_batch_mode)"""
+        from home.ai_batch import should_use_batch
+        return should_use_batch(self.config, article_data.get('category_override', self.config.category))
 
-            # Tool definition per ricerca web (aggiuntiva, opzionale)
-            web_search_tool_def = None
-            if enable_web_search:
-                web_search_tool_def = {
-                    "name": "web_search",
-                    "description": """MANDATORY: Always search the web to verify facts and enrich articles with additional information.
-
-                    You MUST use this tool for EVERY article to:
-                    - VERIFY dates, names, places, and facts mentioned in the article
-                    - FIND additional details about people, organizations, or events
-                    - DISCOVER related context, background, or recent developments
-                    - CHECK for updates or corrections to the information provided
-                    - ENRICH the article with relevant statistics, quotes, or related news
-
-                    ALWAYS perform at least one search to fact-check the article content.
-                    Then decide whether the search results are relevant enough to include as sources.
-                    Focus on factual verification and content enrichment, not just style improvements.
-                    Search for specific details that can make the article more informative and accurate.""",
-                    "input_schema": {
-                        "type": "object",
-                        "properties": {
-                            "query": {
-                                "type": "string",
-                                "description": "Specific search query related to the article content"
-                            },
-                            "max_results": {
-                                "type": "integer",
-                                "default": 3,
-                                "description": "Numero massimo di risultati (1-5)"
-                            }
-                        },
-                        "required": ["query"]
-                    }
-                }
+    def enqueue_batch_generation(self, article_data: Dict[str, Any]):
+        """
+        Registra la generazione differita di un articolo tramite Batches API
 
-            # Contenuto iniziale per Claude con ricerca forzata
-            user_content = f"""Fonte: {article_data['url']}
-Titolo originale: {article_data['title']}
+        Le richieste in batch sono a turno singolo, quindi senza ricerca web:
+        il modello lavora solo sul contenuto fornito. Le trascrizioni da
+        condensare passano prima da un lavoro sulla coda AI, per non bloccare
+        il polling del monitor con i riassunti a blocchi.
+        """
+        from home.job_queue import dispatch
+        from home.jobs import PREPARA_BATCH
+
+        impronta = content_fingerprint.simhash(f"{article_data['title']}\n{article_data['full_content']}")
+        duplicate_result = self.handle_duplicate_source(article_data, impronta)
+        if duplicate_result:
+            self.logger.info(duplicate_result)
+            return
+
+        article_data = json.loads(json.dumps(article_data, default=str))
+        if self.needs_source_condensing(article_data):
+            job = dispatch(
+                PREPARA_BATCH,
+                {'config': self.config_name, 'article_data': article_data},
+                chiave=f"{PREPARA_BATCH}:{self.get_article_hash(article_data['title'], article_data['url'])}",
+                max_tentativi=3,
+                dedup_in_corso=True,
+            )
+            self.logger.info(f"Trascrizione da condensare prima del batch (lavoro #{job.pk}): {article_data['title']}")
+            return
 
-Contenuto principale da rielaborare:
-{article_data['full_content']}
-{links_section}
+        self.queue_batch_request(article_data)
 
-Rielabora questa notizia creando un articolo coinvolgente e ben strutturato.
-{f"OBBLIGATORIO: Devi SEMPRE usare web_search almeno una volta per verificare fatti e approfondire l'articolo. Cerca informazioni specifiche sui nomi, luoghi, date, organizzazioni e eventi menzionati. Dopo aver fatto le ricerche, decidi autonomamente se i risultati sono abbastanza rilevanti e specifici da includere come fonti, oppure se è meglio non includere fonti generiche o poco pertinenti." if enable_web_search else "Lavora solo con il contenuto fornito."}"""
+    def queue_batch_request(self, article_data: Dict[str, Any]):
+        """Costruisce la richiesta senza ricerca web e la registra per il prossimo batch"""
+        from home.ai_batch import queue_request
+
+        params = self.build_generation_request(article_data, enable_web_search=False)
+        richiesta = queue_request(self.config_name, article_data, params)
+        self.logger.info(f"Generazione AI differita in batch (richiesta {richiesta.custom_id}): {article_data['title']}")
 
-            # Tools da includere
-            tools = [web_search_tool_def] if web_search_tool_def else None
+    def generate_queued_article(self, article_data: Dict[str, Any]):
+        """
+        Genera l'articolo di un lavoro in coda
+
+        Idempotente: se il lavoro viene ripreso dopo un crash e l'articolo
+        risulta già salvato, non viene generato di nuovo; una bozza rimasta
+        in_generazione viene invece ripresa e completata.
+        """
+        if Articolo.objects.filter(fonte=article_data['url'], in_generazione=False).exists():
+            self.logger.info(f"Articolo già generato per {article_data['url']}, lavoro saltato")
+            return
+
+        # Nel frattempo potrebbe essere stato generato l'articolo della stessa storia
+        if self.merge_into_existing_story(article_data):
+            return
+
+        result = self.generate_ai_article(article_data, raise_errors=True)
+        self.logger.info(f"Articolo AI generato: {result}")
+
+    def merge_into_existing_story(self, article_data: Dict[str, Any]) -> bool:
+        """
+        Unisce la notizia all'articolo della stessa storia, se già presente
+
+        La fonte viene aggiunta a fonti_web dell'articolo approvato più simile
+        trovato dall'indice MinHash/LSH (story_clustering), senza generare un
+        nuovo articolo.
+
+        Returns:
+            True se la notizia è stata unita a un articolo esistente
+        """
+        if not getattr(settings, 'STORY_CLUSTER_ENABLED', True):
+            return False
+        try:
+            matches = story_clustering.story_index.matches(article_data['title'], article_data.get('full_content', ''))
+            for article_id, score in matches:
+                merged = story_clustering.merge_source(article_id, article_data)
+                if merged is None:
+                    # Articolo in revisione (o eliminato): si prova il candidato successivo
+                    continue
+                if merged:
+                    self.logger.info(f"Notizia '{article_data['title']}' unita all'articolo {article_id} "
+                                     f"(similarità {score:.0%}), aggiunta fonte {article_data['url']}")
+                return True
+            return False
+        except Exception as e:
+            self.logger.error(f"Errore nel raggruppamento della notizia {article_data['url']}: {e}")
+            return False
+
+    def generate_ai_article(self, article_data: Dict[str, Any], raise_errors: bool = False) -> str:
+        """
+        Genera articolo con AI con ricerca web conversazionale integrata
+
+        Args:
+            article_data: Dati della notizia sorgente
+            raise_errors: Se True propaga le eccezioni (per i lavori in coda che
+                          devono essere ritentati) invece di restituire un messaggio
+        """
+        try:
+            api_key = self.config.config.get('ai_api_key')
+            if not api_key:
+                raise ValueError("API key mancante per generazione AI")
+
+            # Stessa notizia già generata da un'altra fonte: niente nuova chiamata AI
+            impronta = content_fingerprint.simhash(f"{article_data['title']}\n{article_data['full_content']}")
+            duplicate_result = self.handle_duplicate_source(article_data, impronta)
+            if duplicate_result:
+                return duplicate_result
+
+            enable_web_search = self.config.config.get('enable_web_search', False)
+            web_sources = []  # Lista delle fonti web utilizzate da Claude
+            request = self.build_generation_request(article_data, enable_web_search)
+            system_prompt = request['system']
+            user_content = request['messages'][0]['content']
+            tools = request['tools']
+
+            # In streaming la bozza viene salvata appena arriva il titolo
+            draft = None
+            if article_drafts.streaming_enabled():
+                draft = article_drafts.StreamingDraft({
+                    'fonte': article_data['url'],
+                    'categoria': article_data.get('category_override', self.config.category),
+                    'foto': article_data.get('image_url'),
+                    'impronta_fonte': impronta,
+                    'firma_fonte': story_clustering.source_signature(article_data['title'], article_data['full_content']),
+                }, articolo=article_drafts.find_draft(article_data['url']))
 
             self.logger.info(f"Inizio generazione AI articolo: '{article_data['title']}' (web search: {enable_web_search})")
 
-            # Prima chiamata ad Anthropic
-            message = client.messages.create(
+            # Prima chiamata ad Anthropic (tramite il gateway condiviso)
+            message = self._call_model(
+                api_key, draft,
                 system=system_prompt,
                 max_tokens=4096,
                 messages=[{"role": "user", "content": user_content}],
@@ -2362,54 +2692,325 @@ Rielabora questa notizia creando un articolo coinvolgente e ben strutturato.
 
             # Processa risposta e gestisci tool use conversazionale
             articolo_testo, used_sources = self._process_conversational_response(
-                client, message, system_prompt, user_content, tools, web_sources
+                api_key, message, system_prompt, user_content, tools, web_sources, draft=draft
             )
 
             if not articolo_testo:
                 raise Exception("Nessun contenuto ricevuto dalla conversazione AI")
 
-            # Estrai titolo e contenuto usando il content polisher
-            titolo, contenuto = content_polisher.extract_clean_title_from_ai_response(articolo_testo)
-
-            # Se l'estrazione fallisce, usa il metodo fallback
-            if not titolo:
-                titolo = content_polisher.clean_title(article_data['title'])[:200]
-            if not contenuto:
-                contenuto = content_polisher.clean_content(articolo_testo)
-
-            # Applica polishing finale
-            polished_data = content_polisher.polish_article({
-                'titolo': titolo,
-                'contenuto': contenuto
-            })
-
-            # Salva nel database
-            # Usa categoria override se disponibile, altrimenti quella di default
-            category = article_data.get('category_override', self.config.category)
-
-            # Determina se deve essere auto-approvato
-            auto_approve = self.should_auto_approve(category)
-
-            articolo = Articolo(
-                titolo=polished_data['titolo'],
-                contenuto=polished_data['contenuto'],
-                categoria=category,
-                fonte=article_data['url'],
-                foto=article_data.get('image_url'),
-                fonti_web=used_sources if used_sources else None,  # Salva fonti web utilizzate
-                approvato=auto_approve,  # Auto-approva se configurato
-                data_pubblicazione=timezone.now()
-            )
-            articolo.save()
+            articolo = self.save_generated_article(article_data, articolo_testo, used_sources, impronta,
+                                                   articolo=draft.articolo if draft else None)
 
             search_status = f" (fonti web: {len(used_sources)})" if enable_web_search and used_sources else ""
             return f"Articolo AI salvato con ID: {articolo.id}{search_status}"
 
         except Exception as e:
+            if raise_errors:
+                raise
             return f"Errore nella generazione AI: {e}"
 
-    def _process_conversational_response(self, client, message, system_prompt: str,
-                                       initial_user_content: str, tools, web_sources: List) -> tuple[str, List[Dict]]:
+    def _call_model(self, api_key: str, draft: Optional['article_drafts.StreamingDraft'], **request):
+        """Chiamata al modello tramite il gateway, in streaming se c'è una bozza da aggiornare"""
+        if draft is not None:
+            return llm_gateway.stream_message(draft.on_text, api_key=api_key, cache=True,
+                                              on_tool_use=draft.on_tool_use, **request)
+        return llm_gateway.create_message(api_key=api_key, cache=True, **request)
+
+    def needs_source_condensing(self, article_data: Dict[str, Any]) -> bool:
+        """True se la notizia è la trascrizione di un video troppo lunga per un solo prompt"""
+        return bool(article_data.get('video_id') and self.config.config.get('transcript_map_reduce', True)
+                    and transcripts.needs_condensing(article_data['full_content']))
+
+    def prepare_source_content(self, article_data: Dict[str, Any]) -> str:
+        """
+        Contenuto sorgente per il prompt: le trascrizioni lunghe dei video sono
+        sostituite dalle note riassunte a blocchi in parallelo (map-reduce)
+        """
+        content = article_data['full_content']
+        if self.needs_source_condensing(article_data):
+            content = transcripts.condense_transcript(
+                content, article_data['title'], api_key=self.config.config.get('ai_api_key')
+            )
+        return content
+
+    def build_generation_request(self, article_data: Dict[str, Any], enable_web_search: bool) -> Dict[str, Any]:
+        """
+        Parametri di messages.create per generare l'articolo di una notizia
+
+        Args:
+            article_data: Dati della notizia sorgente
+            enable_web_search: Se True include il tool web_search e l'istruzione di usarlo
+        """
+        # Scegli prompt in base al tipo di contenuto (MANTENIAMO IDENTICI)
+        content_type = article_data.get('content_type', 'comunicato')
+        if content_type == 'twitter':
+            system_prompt = self.config.config.get('ai_twitter_prompt',
+                self.config.config.get('ai_system_prompt',
+                """Sei un giornalista esperto. Rielabora questa notizia per il giornale locale."""))
+        else:
+            system_prompt = self.config.config.get('ai_system_prompt',
+                """Sei un giornalista esperto. Rielabora questa notizia per il giornale locale.""")
+
+        # Costruisci contenuto con eventuali link (MANTENIAMO)
+        links_section = ""
+        if article_data.get('links_content'):
+            links_section = "\n\nContenuto aggiuntivo dai link riferiti:\n"
+            for i, link_data in enumerate(article_data['links_content'], 1):
+                links_section += f"\n--- Link {i}: {link_data['url']} ---\n"
+                if link_data.get('title'):
+                    links_section += f"Titolo: {link_data['title']}\n"
+                links_section += f"Contenuto: {link_data['content']}\n"
+
+        # Tool definition per ricerca web (aggiuntiva, opzionale)
+        web_search_tool_def = None
+        if enable_web_search:
+            web_search_tool_def = {
+                "name": "web_search",
+                "description": """MANDATORY: Always search the web to verify facts and enrich articles with additional information.
+
+                You MUST use this tool for EVERY article to:
+                - VERIFY dates, names, places, and facts mentioned in the article
+                - FIND additional details about people, organizations, or events
+                - DISCOVER related context, background, or recent developments
+                - CHECK for updates or corrections to the information provided
+                - ENRICH the article with relevant statistics, quotes, or related news
+
+                ALWAYS perform at least one search to fact-check the article content.
+                Then decide whether the search results are relevant enough to include as sources.
+                Focus on factual verification and content enrichment, not just style improvements.
+                Search for specific details that can make the article more informative and accurate.""",
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "query": {
+                            "type": "string",
+                            "description": "Specific search query related to the article content"
+                        },
+                        "max_results": {
+                            "type": "integer",
+                            "default": 3,
+                            "description": "Numero massimo di risultati (1-5)"
+                        }
+                    },
+                    "required": ["query"]
+                }
+            }
+
+        # Contenuto iniziale per Claude con ricerca forzata
+        user_content = f"""Fonte: {article_data['url']}
+Titolo originale: {article_data['title']}
+
+Contenuto principale da rielaborare:
+{self.prepare_source_content(article_data)}
+{links_section}
+
+Rielabora questa notizia creando un articolo coinvolgente e ben strutturato.
+{f"OBBLIGATORIO: Devi SEMPRE usare web_search almeno una volta per verificare fatti e approfondire l'articolo. Cerca informazioni specifiche sui nomi, luoghi, date, organizzazioni e eventi menzionati. Dopo aver fatto le ricerche, decidi autonomamente se i risultati sono abbastanza rilevanti e specifici da includere come fonti, oppure se è meglio non includere fonti generiche o poco pertinenti." if enable_web_search else "Lavora solo con il contenuto fornito."}"""
+
+        # Tools da includere
+        tools = [web_search_tool_def] if web_search_tool_def else None
+
+        return {
+            'system': system_prompt,
+            'max_tokens': 4096,
+            'messages': [{"role": "user", "content": user_content}],
+            'tools': tools,
+            'model': "claude-sonnet-4-20250514",
+        }
+
+    def save_generated_article(self, article_data: Dict[str, Any], articolo_testo: str,
+                               used_sources: List[Dict], impronta: Optional[int],
+                               articolo: Optional[Articolo] = None) -> Articolo:
+        """
+        Estrae titolo e contenuto dalla risposta AI, li rifinisce e salva l'articolo
+
+        Se viene passata la bozza salvata durante lo streaming, questa viene
+        completata invece di creare un nuovo articolo.
+        """
+        # Estrai titolo e contenuto usando il content polisher
+        titolo, contenuto = content_polisher.extract_clean_title_from_ai_response(articolo_testo)
+
+        # Se l'estrazione fallisce, usa il metodo fallback
+        if not titolo:
+            titolo = content_polisher.clean_title(article_data['title'])[:200]
+        if not contenuto:
+            contenuto = content_polisher.clean_content(articolo_testo)
+
+        # Applica polishing finale
+        polished_data = content_polisher.polish_article({
+            'titolo': titolo,
+            'contenuto': contenuto
+        })
+
+        # Salva nel database
+        # Usa categoria override se disponibile, altrimenti quella di default
+        category = article_data.get('category_override', self.config.category)
+
+        # Determina se deve essere auto-approvato
+        auto_approve = self.should_auto_approve(category)
+
+        fields = dict(
+            titolo=polished_data['titolo'],
+            contenuto=polished_data['contenuto'],
+            categoria=category,
+            fonte=article_data['url'],
+            foto=article_data.get('image_url'),
+            fonti_web=used_sources if used_sources else None,  # Salva fonti web utilizzate
+            impronta_fonte=impronta,
+            firma_fonte=story_clustering.source_signature(article_data['title'], article_data['full_content']),
+            approvato=auto_approve,  # Auto-approva se configurato
+            data_pubblicazione=timezone.now()
+        )
+
+        if articolo is None:
+            articolo = Articolo(**fields)
+        else:
+            # Completa la bozza: slug e sommario vengono rigenerati dal testo finale
+            for name, value in fields.items():
+                setattr(articolo, name, value)
+            articolo.in_generazione = False
+            articolo.slug = ''
+            articolo.sommario = ''
+        articolo.save()
+        return articolo
+
+    def handle_duplicate_source(self, article_data: Dict[str, Any], impronta: Optional[int]) -> Optional[str]:
+        """
+        Gestisce una fonte quasi identica a quella di un articolo già generato
+
+        Con AI_DUPLICATE_ACTION = 'reuse' (default) viene salvata una copia non
+        approvata dell'articolo originale collegata tramite duplicato_di, visibile
+        in admin; con 'skip' la fonte viene solo registrata nel log.
+
+        Returns:
+            Messaggio di esito se la fonte è un duplicato, altrimenti None
+        """
+        match = content_fingerprint.find_near_duplicate(impronta)
+        if not match:
+            return None
+
+        originale, score = match
+        action = getattr(settings, 'AI_DUPLICATE_ACTION', 'reuse')
+        self.logger.info(f"Fonte {article_data['url']} simile al {score:.0%} all'articolo {originale.id} "
+                         f"'{originale.titolo}', generazione AI saltata ({action})")
+
+        if action == 'skip':
+            return f"Duplicato dell'articolo {originale.id}, generazione saltata"
+
+        # Copia mai approvata automaticamente: l'originale è già pubblicato o in revisione
+        duplicato = Articolo(
+            titolo=originale.titolo,
+            contenuto=originale.contenuto,
+            categoria=article_data.get('category_override', self.config.category),
+            fonte=article_data['url'],
+            foto=article_data.get('image_url') or originale.foto,
+            fonti_web=originale.fonti_web,
+            impronta_fonte=impronta,
+            duplicato_di=originale,
+            # Stesso titolo dell'originale: lo slug deve comunque essere unico
+            slug=f"{originale.slug[:180]}-dup-{hashlib.md5(article_data['url'].encode()).hexdigest()[:8]}",
+            approvato=False,
+            data_pubblicazione=timezone.now()
+        )
+        duplicato.save()
+        return f"Duplicato dell'articolo {originale.id} salvato con ID: {duplicato.id} (nessuna chiamata AI)"
+
+    def _execute_web_search_tool_in_thread(self, tool_use) -> tuple[Dict, List[Dict]]:
+        """_execute_web_search_tool in un thread del pool: chiude la connessione al database aperta dalla quota"""
+        try:
+            return self._execute_web_search_tool(tool_use)
+        finally:
+            connection.close()
+
+    def _execute_web_search_tool(self, tool_use) -> tuple[Dict, List[Dict]]:
+        """
+        Esegue un tool use web_search con retry e gestione errori robusta
+
+        Returns:
+            (tool_result per Claude, fonti web trovate)
+        """
+        query = tool_use.input.get("query", "")
+        max_results = tool_use.input.get("max_results", 3)
+
+        self.logger.info(f"Claude richiede ricerca web: '{query}'")
+
+        search_results = []
+        error_message = None
+
+        try:
+            from home.web_search_tool import web_search_tool
+
+            # Retry con backoff esponenziale
+            max_retries = 2
+            retry_delay = 1  # secondi
+
+            for attempt in range(max_retries):
+                try:
+                    search_results = web_search_tool.search_with_content(
+                        query, max_results, fetch_content=True
+                    )
+
+                    # Successo - esci dal loop
+                    if search_results:
+                        break
+
+                    # Nessun risultato ma nessun errore - prova ancora
+                    if attempt < max_retries - 1:
+                        self.logger.warning(f"Tentativo {attempt + 1}: nessun risultato, riprovo in {retry_delay}s")
+                        time.sleep(retry_delay)
+                        retry_delay *= 2  # Backoff esponenziale
+
+                except Exception as search_error:
+                    self.logger.warning(f"Tentativo {attempt + 1} web search fallito: {search_error}")
+
+                    if attempt < max_retries - 1:
+                        time.sleep(retry_delay)
+                        retry_delay *= 2
+                    else:
+                        # Ultimo tentativo fallito
+                        error_message = str(search_error)
+
+        except Exception as e:
+            self.logger.error(f"Errore critico web search per '{query}': {e}")
+            error_message = str(e)
+
+        if search_results:
+            sources = [{
+                'url': result['url'],
+                'title': result.get('page_title', result['title']),
+                'query_used': query
+            } for result in search_results]
+
+            # Formatta per Claude con contenuto completo
+            formatted_results = web_search_tool.format_results_with_content_for_ai(search_results)
+            self.logger.info(f"Forniti {len(search_results)} risultati con contenuto completo a Claude")
+            return {
+                "type": "tool_result",
+                "tool_use_id": tool_use.id,
+                "content": formatted_results
+            }, sources
+
+        # Nessun risultato o errore - comunica a Claude di continuare senza
+        error_msg = f"Ricerca web non disponibile al momento"
+        if error_message:
+            if "quota" in error_message.lower() or "429" in error_message:
+                error_msg = "Quota API Google esaurita. Procedi con le informazioni disponibili."
+            elif "timeout" in error_message.lower():
+                error_msg = "Timeout ricerca web. Procedi con le informazioni disponibili."
+            else:
+                error_msg = f"Ricerca web non disponibile ({error_message[:100]}). Procedi con le informazioni disponibili."
+
+        self.logger.warning(f"Web search fallita per '{query}', ma continuo senza bloccare: {error_msg}")
+        return {
+            "type": "tool_result",
+            "tool_use_id": tool_use.id,
+            "content": error_msg,
+            "is_error": False  # Non è un errore bloccante
+        }, []
+
+    def _process_conversational_response(self, api_key, message, system_prompt: str,
+                                       initial_user_content: str, tools, web_sources: List,
+                                       draft=None) -> tuple[str, List[Dict]]:
         """Processa la risposta conversazionale di Anthropic gestendo tool use"""
         try:
             conversation = [{"role": "user", "content": initial_user_content}]
@@ -2436,103 +3037,32 @@ Rielabora questa notizia creando un articolo coinvolgente e ben strutturato.
                 # Aggiungi la risposta assistant alla conversazione
                 conversation.append({"role": "assistant", "content": current_message.content})
 
-                # Processa i tool use
-                tool_results = []
-                for tool_use in tool_uses:
-                    if tool_use.name == "web_search":
-                        query = tool_use.input.get("query", "")
-                        max_results = tool_use.input.get("max_results", 3)
-
-                        self.logger.info(f"Claude richiede ricerca web: '{query}'")
-
-                        # Effettua ricerca con contenuto completo con retry e gestione errori robusta
-                        search_results = []
-                        error_message = None
-
-                        try:
-                            from home.web_search_tool import web_search_tool
-
-                            # Retry con backoff esponenziale
-                            max_retries = 2
-                            retry_delay = 1  # secondi
-
-                            for attempt in range(max_retries):
-                                try:
-                                    search_results = web_search_tool.search_with_content(
-                                        query, max_results, fetch_content=True
-                                    )
-
-                                    # Successo - esci dal loop
-                                    if search_results:
-                                        break
-
-                                    # Nessun risultato ma nessun errore - prova ancora
-                                    if attempt < max_retries - 1:
-                                        self.logger.warning(f"Tentativo {attempt + 1}: nessun risultato, riprovo in {retry_delay}s")
-                                        time.sleep(retry_delay)
-                                        retry_delay *= 2  # Backoff esponenziale
-
-                                except Exception as search_error:
-                                    self.logger.warning(f"Tentativo {attempt + 1} web search fallito: {search_error}")
-
-                                    if attempt < max_retries - 1:
-                                        time.sleep(retry_delay)
-                                        retry_delay *= 2
-                                    else:
-                                        # Ultimo tentativo fallito
-                                        error_message = str(search_error)
+                # Processa i tool use: le ricerche dello stesso turno sono eseguite in parallelo,
+                # la latenza dell'iterazione è quella della ricerca più lenta
+                web_search_uses = [t for t in tool_uses if t.name == "web_search"]
+                if len(web_search_uses) > 1:
+                    from home.web_search_tool import get_search_setting
+                    max_workers = min(len(web_search_uses), get_search_setting('MAX_PARALLEL_TOOLS'))
+                    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='web_search') as executor:
+                        outcomes = list(executor.map(self._execute_web_search_tool_in_thread, web_search_uses))
+                else:
+                    outcomes = [self._execute_web_search_tool(t) for t in web_search_uses]
 
-                        except Exception as e:
-                            self.logger.error(f"Errore critico web search per '{query}': {e}")
-                            error_message = str(e)
-
-                        # Gestione risultati o errori
-                        if search_results:
-                            # Salva le fonti utilizzate
-                            for result in search_results:
-                                if result['url'] not in [s['url'] for s in web_sources]:
-                                    web_sources.append({
-                                        'url': result['url'],
-                                        'title': result.get('page_title', result['title']),
-                                        'query_used': query
-                                    })
-
-                            # Formatta per Claude con contenuto completo
-                            formatted_results = web_search_tool.format_results_with_content_for_ai(search_results)
-
-                            tool_results.append({
-                                "type": "tool_result",
-                                "tool_use_id": tool_use.id,
-                                "content": formatted_results
-                            })
-
-                            self.logger.info(f"Forniti {len(search_results)} risultati con contenuto completo a Claude")
-                        else:
-                            # Nessun risultato o errore - comunica a Claude di continuare senza
-                            error_msg = f"Ricerca web non disponibile al momento"
-                            if error_message:
-                                if "quota" in error_message.lower() or "429" in error_message:
-                                    error_msg = "Quota API Google esaurita. Procedi con le informazioni disponibili."
-                                elif "timeout" in error_message.lower():
-                                    error_msg = "Timeout ricerca web. Procedi con le informazioni disponibili."
-                                else:
-                                    error_msg = f"Ricerca web non disponibile ({error_message[:100]}). Procedi con le informazioni disponibili."
-
-                            tool_results.append({
-                                "type": "tool_result",
-                                "tool_use_id": tool_use.id,
-                                "content": error_msg,
-                                "is_error": False  # Non è un errore bloccante
-                            })
-
-                            self.logger.warning(f"Web search fallita per '{query}', ma continuo senza bloccare: {error_msg}")
+                # Risultati e fonti uniti nell'ordine dei tool use
+                tool_results = []
+                for tool_result, sources in outcomes:
+                    tool_results.append(tool_result)
+                    for source in sources:
+                        if source['url'] not in [s['url'] for s in web_sources]:
+                            web_sources.append(source)
 
                 # Se abbiamo tool results, continua la conversazione
                 if tool_results:
                     conversation.append({"role": "user", "content": tool_results})
 
                     # Nuova chiamata ad Anthropic
-                    current_message = client.messages.create(
+                    current_message = self._call_model(
+                        api_key, draft,
                         system=system_prompt,
                         max_tokens=4096,
                         messages=conversation,
@@ -2585,6 +3115,8 @@ Rielabora questa notizia creando un articolo coinvolgente e ben strutturato.
             categoria=self.config.category,
             fonte=article_data['url'],
             foto=article_data.get('image_url'),
+            impronta_fonte=content_fingerprint.simhash(f"{article_data['title']}\n{article_data['full_content']}"),
+            firma_fonte=story_clustering.source_signature(article_data['title'], article_data['full_content']),
             approvato=auto_approve,  # Auto-approva se configurato
             data_pubblicazione=timezone.now()
         )
@@ -2610,6 +3142,7 @@ Rielabora questa notizia creando un articolo coinvolgente e ben strutturato.
     def stop_monitoring(self):
         """Ferma il monitoraggio"""
         self.is_running = False
+        self.scraper.close()
         self.release_lock()
         self.logger.info("Monitor fermato")
     
@@ -2627,7 +3160,8 @@ Rielabora questa notizia creando un articolo coinvolgente e ben strutturato.
             while self.is_running:
                 try:
                     self.logger.debug(f"Controllo alle {datetime.now().strftime('%H:%M:%S')}")
-                    time.sleep(self.check_interval)
+                    # Pausa tra i controlli, interrotta dalle notifiche push (email IDLE)
+                    self.scraper.wait_for_new_content(self.check_interval)
                     if self.is_running:
                         self.check_for_new_articles()
                 except Exception as e:
@@ -4,11 +4,10 @@ import os
 import random
 from django.shortcuts import render, get_object_or_404
 from django.core.paginator import Paginator
-from django.http import JsonResponse, HttpResponse
-from django.template import loader
+from django.http import JsonResponse
 from django.conf import settings
-from datetime import datetime, timedelta
 from .models import Articolo
+from . import sitemaps
 
 
 logger = logging.getLogger(__name__)
@@ -148,19 +147,16 @@ def privacy_policy(request):
     return render(request, "privacy_policy.html", context)
 
 def news_sitemap(request):
-    """Vista per la sitemap Google News"""
-    # Solo articoli approvati degli ultimi 2 giorni
-    cutoff_date = datetime.now() - timedelta(days=2)
-    articles = Articolo.objects.filter(
-        approvato=True,
-        data_pubblicazione__gte=cutoff_date
-    ).order_by('-data_pubblicazione')
+    """Vista per la sitemap Google News (servita da file pre-renderizzato)"""
+    return sitemaps.serve_news_sitemap(request)
 
-    logger.info(f"Generata sitemap news con {len(articles)} articoli")
+def sitemap_index(request):
+    """Vista per l'indice delle sitemap mensili"""
+    return sitemaps.serve_sitemap_index(request)
 
-    template = loader.get_template('sitemap_news.xml')
-    context = {'articles': articles}
-    return HttpResponse(template.render(context, request), content_type='application/xml')
+def sitemap_mese(request, year, month):
+    """Vista per la sitemap degli articoli di un mese"""
+    return sitemaps.serve_month_sitemap(request, int(year), int(month))
 
 def fonti_articolo(request, slug):
     """Vista per mostrare tutte le fonti di un articolo"""
@@ -3,14 +3,60 @@ Sistema di ricerca web semplificato usando Tool Use di Anthropic
 """
 import os
 import requests
-import time
 import logging
 from typing import Dict, List, Any, Optional
 from urllib.parse import quote_plus, urljoin, urlparse
 from bs4 import BeautifulSoup
 import re
-import io
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
 from home.logger_config import get_monitor_logger
+from home.content_extractor import ContentDensity
+from home import pdf_extractor
+from home.search_quota import get_search_governor
+from home.link_resolver import HostLimiter
+
+DEFAULT_SETTINGS = {
+    'MIN_DELAY': 1,                     # secondi tra richieste allo stesso host
+    'MAX_PER_HOST': 2,
+    'FETCH_WORKERS': 6,
+    'FALLBACK_MIN_DELAY': 2,            # secondi tra ricerche di fallback sullo stesso motore
+    'MAX_PARALLEL_TOOLS': 4,            # ricerche dello stesso turno AI eseguite insieme
+    'CONTENT_TTL': 7 * 24 * 3600,
+    'CACHE_TTL': 24 * 3600,
+    'FALLBACK_CACHE_TTL': 3600,
+}
+
+
+def get_search_setting(name: str):
+    """Legge un'impostazione da settings.WEB_SEARCH con fallback ai default"""
+    return getattr(settings, 'WEB_SEARCH', {}).get(name, DEFAULT_SETTINGS[name])
+
+
+# Namespace della cache persistente per le pagine scaricate e i risultati di ricerca
+CONTENT_CACHE_NAMESPACE = 'pagine'
+SEARCH_CACHE_NAMESPACE = 'ricerche'
+
+# Parole ignorate nella chiave di cache delle ricerche
+QUERY_STOPWORDS = frozenset("""
+    il lo la i gli le un uno una l un di a da in con su per tra fra e ed o od
+    del dello della dei degli delle al allo alla ai agli alle dal dallo dalla dai dagli dalle
+    nel nello nella nei negli nelle sul sullo sulla sui sugli sulle col coi
+    che chi cui come cosa quale quali quando dove perche anche non piu
+    the of and or in on at to for
+""".split())
+
+
+def normalize_query(query: str) -> str:
+    """
+    Chiave di cache di una query: minuscole, senza accenti e punteggiatura,
+    senza parole vuote, token unici in ordine alfabetico
+
+    "Comune di Carpi, sindaco Righi" e "sindaco righi comune carpi" hanno la stessa chiave.
+    """
+    from home.content_fingerprint import normalize_text
+    tokens = {t for t in normalize_text(query).split() if t not in QUERY_STOPWORDS}
+    return ' '.join(sorted(tokens))
 
 
 class WebSearchTool:
@@ -21,12 +67,24 @@ class WebSearchTool:
         self.api_key = os.getenv('GOOGLE_SEARCH_API_KEY')
         self.custom_search_id = os.getenv('GOOGLE_CUSTOM_SEARCH_ID')
 
-        # Rate limiting
-        self.last_request = 0
-        self.min_delay = 1
-
-        # Cache per contenuti scaricati (in memoria per questa sessione)
-        self.content_cache = {}
+        # Rate limiting: intervallo minimo tra richieste verso lo stesso host e
+        # download simultanei per host (l'API di ricerca ha il proprio governatore)
+        self.min_delay = get_search_setting('MIN_DELAY')
+        self.max_per_host = get_search_setting('MAX_PER_HOST')
+        self.max_fetch_workers = get_search_setting('FETCH_WORKERS')
+        self._hosts = HostLimiter(self.max_per_host, self.min_delay)
+        # Ricerche di fallback (DuckDuckGo, pagine di Google): una alla volta per
+        # motore e con un intervallo più lungo, per non farsi bloccare
+        self.fallback_min_delay = get_search_setting('FALLBACK_MIN_DELAY')
+        self._search_hosts = HostLimiter(1, self.fallback_min_delay)
+
+        # Cache persistente dei contenuti scaricati, condivisa tra processi e riavvii
+        self.content_cache_ttl = get_search_setting('CONTENT_TTL')
+
+        # Cache dei risultati di ricerca: più lunga per Google, breve per i fallback
+        # (quando la quota torna disponibile conviene rifare la ricerca)
+        self.search_cache_ttl = get_search_setting('CACHE_TTL')
+        self.fallback_cache_ttl = get_search_setting('FALLBACK_CACHE_TTL')
 
         # Headers per web scraping
         self.scraping_headers = {
@@ -39,7 +97,55 @@ class WebSearchTool:
             'Upgrade-Insecure-Requests': '1'
         }
 
+    def _host_slot(self, url: str):
+        """Limita i download simultanei e la frequenza delle richieste verso lo stesso host"""
+        return self._hosts.slot(url)
+
     def search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+        """
+        Effettua ricerca web mirata, con cache per query normalizzata
+
+        I risultati in cache non consumano quota Custom Search. Con la quota
+        giornaliera esaurita vengono usati anche i risultati scaduti, prima di
+        ripiegare sulla ricerca di fallback.
+
+        Args:
+            query: Query di ricerca
+            max_results: Numero massimo di risultati
+
+        Returns:
+            Lista di risultati con title, snippet, url (lista vuota in caso di errore)
+        """
+        from home.persistent_cache import get_cache
+
+        cache_key = normalize_query(query) or query.strip().lower()
+        entry = get_cache().get_entry(SEARCH_CACHE_NAMESPACE, cache_key, allow_expired=True)
+        if (entry is not None and entry['value']['max_results'] >= max_results
+                and (not entry['expired'] or self._quota_exhausted())):
+            self.logger.info(f"Search cache hit per '{query}'" + (" (scaduto, quota esaurita)" if entry['expired'] else ""))
+            return entry['value']['results'][:max_results]
+
+        results = self._search_uncached(query, max_results)
+
+        if results:
+            from_google = all(r.get('source') == 'google_search' for r in results)
+            get_cache().set(SEARCH_CACHE_NAMESPACE, cache_key, {'max_results': max_results, 'results': results},
+                            ttl=self.search_cache_ttl if from_google else self.fallback_cache_ttl)
+        elif entry is not None:
+            # Meglio i risultati di una ricerca precedente (anche scaduti o più corti) che nessuno
+            self.logger.info(f"Nessun risultato per '{query}', uso i risultati in cache precedenti")
+            return entry['value']['results'][:max_results]
+        return results
+
+    def _quota_exhausted(self) -> bool:
+        """Quota Custom Search esaurita o ridotta alla riserva (vedi search_quota)"""
+        try:
+            return not get_search_governor().has_budget()
+        except Exception as e:
+            self.logger.warning(f"Stato quota Google Search non disponibile: {e}")
+            return False
+
+    def _search_uncached(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
         """
         Effettua ricerca web mirata con gestione errori robusta
 
@@ -55,11 +161,6 @@ class WebSearchTool:
             return self._fallback_search(query, max_results)
 
         try:
-            # Rate limiting
-            current_time = time.time()
-            if current_time - self.last_request < self.min_delay:
-                time.sleep(self.min_delay - (current_time - self.last_request))
-
             self.logger.info(f"Ricerca: '{query}'")
 
             # Controlla se usare Custom Search o API diretta
@@ -86,8 +187,13 @@ class WebSearchTool:
             self.logger.info(f"Chiamata API Google: {url}")
             self.logger.info(f"Query: '{query}'")
 
+            # Quota giornaliera e frequenza condivise tra thread e processi:
+            # con quota bassa o attesa troppo lunga si passa subito al fallback
+            if not get_search_governor().acquire():
+                self.logger.info("Quota Google Search sotto la riserva o limite di frequenza, uso fallback")
+                return self._fallback_search(query, max_results)
+
             response = requests.get(url, params=params, timeout=10)
-            self.last_request = time.time()
 
             self.logger.info(f"Status Code API: {response.status_code}")
 
@@ -97,6 +203,7 @@ class WebSearchTool:
                 # Gestione specifica per quota esaurita
                 if response.status_code == 429:
                     self.logger.error(f"Google Search API - Quota esaurita (429). Uso fallback.")
+                    get_search_governor().mark_exhausted()
                 elif response.status_code == 403:
                     self.logger.error(f"Google Search API - Accesso negato (403). Verifica credenziali.")
                 else:
@@ -188,7 +295,8 @@ class WebSearchTool:
                 'skip_disambig': '1'
             }
 
-            response = requests.get(search_url, params=params, timeout=5)
+            with self._search_hosts.slot(search_url):
+                response = requests.get(search_url, params=params, timeout=5)
             data = response.json()
 
             results = []
@@ -254,7 +362,8 @@ class WebSearchTool:
                     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
                 }
 
-                response = requests.get(search_url, headers=headers, timeout=5)
+                with self._search_hosts.slot(search_url):
+                    response = requests.get(search_url, headers=headers, timeout=5)
                 if response.status_code == 200:
                     soup = BeautifulSoup(response.text, 'html.parser')
 
@@ -394,39 +503,49 @@ class WebSearchTool:
             Dict con title, content, url originale, o None se errore
         """
         # Controlla cache
-        if url in self.content_cache:
+        from home.persistent_cache import get_cache
+        cached = get_cache().get(CONTENT_CACHE_NAMESPACE, url)
+        if cached is not None:
             self.logger.info(f"Content cache hit per: {url}")
-            return self.content_cache[url]
+            return cached
 
         try:
             self.logger.info(f"Scaricando contenuto completo da: {url}")
 
-            # Rate limiting
-            current_time = time.time()
-            if current_time - self.last_request < self.min_delay:
-                time.sleep(self.min_delay - (current_time - self.last_request))
-
-            response = requests.get(url, headers=self.scraping_headers, timeout=15, allow_redirects=True)
-            self.last_request = time.time()
-
-            if response.status_code != 200:
-                self.logger.warning(f"Status code {response.status_code} per {url}")
-                return None
+            # Rate limiting per host: host diversi vengono scaricati in parallelo
+            pdf_download = None
+            with self._host_slot(url):
+                response = requests.get(url, headers=self.scraping_headers, timeout=15,
+                                        allow_redirects=True, stream=True)
+                try:
+                    if response.status_code != 200:
+                        self.logger.warning(f"Status code {response.status_code} per {url}")
+                        return None
+
+                    # Controlla se è un PDF: scaricato in streaming su file, con limite di dimensione
+                    content_type = response.headers.get('Content-Type', '').lower()
+                    is_pdf = 'application/pdf' in content_type or url.lower().endswith('.pdf')
+                    if is_pdf:
+                        self.logger.info(f"Rilevato PDF: {url}")
+                        pdf_download = pdf_extractor.download_pdf(response, url)
+                        if pdf_download is None:
+                            return None
+                    else:
+                        html = response.text
+                finally:
+                    response.close()
 
-            # Controlla se è un PDF
-            content_type = response.headers.get('Content-Type', '').lower()
-            if 'application/pdf' in content_type or url.lower().endswith('.pdf'):
-                self.logger.info(f"Rilevato PDF: {url}")
-                content_data = self._extract_pdf_content(response.content, url)
+            if is_pdf:
+                content_data = self._extract_pdf_content(pdf_download, url)
             else:
                 # Parse HTML
-                soup = BeautifulSoup(response.text, 'html.parser')
+                soup = BeautifulSoup(html, 'html.parser')
                 # Estrai contenuto principale
                 content_data = self._extract_main_content(soup, url)
 
             if content_data:
                 # Cache il risultato
-                self.content_cache[url] = content_data
+                get_cache().set(CONTENT_CACHE_NAMESPACE, url, content_data, ttl=self.content_cache_ttl)
                 self.logger.info(f"Contenuto estratto: {len(content_data['content'])} caratteri da {url}")
                 return content_data
             else:
@@ -443,71 +562,23 @@ class WebSearchTool:
             self.logger.error(f"Errore generico scaricamento contenuto da {url}: {e}")
             return None
 
-    def _extract_pdf_content(self, pdf_bytes: bytes, url: str) -> Optional[Dict[str, Any]]:
+    def _extract_pdf_content(self, pdf_download: 'pdf_extractor.DownloadedPDF', url: str) -> Optional[Dict[str, Any]]:
         """
-        Estrae testo da un PDF
+        Estrae testo da un PDF scaricato (in un processo separato, con cache per hash)
 
         Args:
-            pdf_bytes: Contenuto del PDF in bytes
+            pdf_download: PDF scaricato da pdf_extractor.download_pdf
             url: URL del PDF
 
         Returns:
             Dict con title, content, url o None se errore
         """
         try:
-            # Prova prima con pdfplumber (migliore per testo strutturato)
-            try:
-                import pdfplumber
-
-                pdf_file = io.BytesIO(pdf_bytes)
-                text_parts = []
-                title = None
-
-                with pdfplumber.open(pdf_file) as pdf:
-                    # Prendi il titolo dalla prima pagina se possibile
-                    if pdf.pages:
-                        first_page_text = pdf.pages[0].extract_text()
-                        if first_page_text:
-                            # Prima riga come titolo
-                            lines = first_page_text.split('\n')
-                            title = lines[0].strip() if lines else "PDF Document"
-
-                    # Estrai testo da tutte le pagine (max 20 per performance)
-                    for page in pdf.pages[:20]:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text_parts.append(page_text)
-
-                content = '\n\n'.join(text_parts)
-
-            except ImportError:
-                # Fallback a PyPDF2 se pdfplumber non disponibile
-                self.logger.info("pdfplumber non disponibile, uso PyPDF2")
-                import PyPDF2
-
-                pdf_file = io.BytesIO(pdf_bytes)
-                reader = PyPDF2.PdfReader(pdf_file)
-
-                text_parts = []
-                title = None
-
-                # Prova a ottenere il titolo dai metadati
-                if reader.metadata and reader.metadata.get('/Title'):
-                    title = reader.metadata['/Title']
-
-                # Estrai testo dalle pagine (max 20)
-                for page_num, page in enumerate(reader.pages[:20]):
-                    page_text = page.extract_text()
-                    if page_text:
-                        text_parts.append(page_text)
-
-                        # Se non abbiamo titolo, usa prima riga della prima pagina
-                        if page_num == 0 and not title and page_text:
-                            lines = page_text.split('\n')
-                            title = lines[0].strip() if lines else "PDF Document"
-
-                content = '\n\n'.join(text_parts)
+            extracted = pdf_extractor.extract_text(pdf_download, url)
+            if not extracted:
+                return None
 
+            content = extracted['text']
             if not content or len(content) < 50:
                 self.logger.warning(f"PDF troppo breve o vuoto: {url}")
                 return None
@@ -516,7 +587,7 @@ class WebSearchTool:
             content = self._clean_pdf_text(content)
 
             return {
-                'title': title or "PDF Document",
+                'title': extracted['title'] or "PDF Document",
                 'content': content,
                 'url': url,
                 'length': len(content),
@@ -564,22 +635,13 @@ class WebSearchTool:
                 '.content'
             ]
 
-            main_content = None
-            for selector in content_selectors:
-                elements = soup.select(selector)
-                if elements:
-                    # Prendi il primo che ha abbastanza testo
-                    for element in elements:
-                        text = element.get_text(strip=True)
-                        if len(text) > 200:  # Almeno 200 caratteri
-                            main_content = element
-                            break
-                    if main_content:
-                        break
+            # Un solo passaggio sul documento per selettori ed euristica
+            density = ContentDensity(soup)
+            main_content = density.first_matching(content_selectors)
 
             # Se non troviamo selettori specifici, usa euristica
             if not main_content:
-                main_content = self._find_content_by_heuristics(soup)
+                main_content = self._find_content_by_heuristics(soup, density)
 
             if not main_content:
                 return None
@@ -604,28 +666,11 @@ class WebSearchTool:
             self.logger.error(f"Errore estrazione contenuto da {url}: {e}")
             return None
 
-    def _find_content_by_heuristics(self, soup: BeautifulSoup) -> Optional[BeautifulSoup]:
-        """Trova contenuto principale usando euristiche quando i selettori falliscono"""
+    def _find_content_by_heuristics(self, soup: BeautifulSoup,
+                                    density: Optional[ContentDensity] = None) -> Optional[BeautifulSoup]:
+        """Trova contenuto principale per densità di testo quando i selettori falliscono"""
         try:
-            # Cerca il div/section con più testo
-            candidates = []
-
-            for tag in soup.find_all(['div', 'section', 'main']):
-                text = tag.get_text(strip=True)
-                if len(text) > 200:
-                    # Calcola score basato su lunghezza e presenza di paragrafi
-                    paragraphs = len(tag.find_all('p'))
-                    score = len(text) + (paragraphs * 50)
-                    candidates.append((score, tag))
-
-            if candidates:
-                # Prendi quello con score più alto
-                # Ordina solo per score (primo elemento della tupla) per evitare errori di confronto tra Tag
-                candidates.sort(key=lambda x: x[0], reverse=True)
-                return candidates[0][1]
-
-            return None
-
+            return (density or ContentDensity(soup)).best_candidate()
         except Exception as e:
             self.logger.error(f"Errore euristica contenuto: {e}")
             return None
@@ -694,6 +739,35 @@ class WebSearchTool:
             self.logger.error(f"Errore pulizia testo: {e}")
             return element.get_text(strip=True) if element else ""
 
+    def _enhance_result(self, result: Dict[str, Any]) -> tuple[Dict[str, Any], bool]:
+        """
+        Aggiunge a un risultato il contenuto completo della pagina, o lo snippet se il download fallisce
+
+        Returns:
+            (risultato arricchito, True se il contenuto completo è stato scaricato)
+        """
+        enhanced_result = result.copy()
+
+        try:
+            # Scarica contenuto completo (già con gestione errori interna)
+            content_data = self.fetch_page_content(result['url'])
+            if content_data:
+                enhanced_result.update({
+                    'full_content': content_data['content'],
+                    'page_title': content_data['title'],
+                    'content_length': content_data['length']
+                })
+                return enhanced_result, True
+        except Exception as e:
+            # Errore durante il download - usa il fallback
+            self.logger.warning(f"Errore download {result['url']}, uso snippet: {e}")
+
+        # Fallback al snippet
+        enhanced_result['full_content'] = result['snippet']
+        enhanced_result['page_title'] = result['title']
+        enhanced_result['content_length'] = len(result['snippet'])
+        return enhanced_result, False
+
     def search_with_content(self, query: str, max_results: int = 3, fetch_content: bool = True) -> List[Dict[str, Any]]:
         """
         Ricerca web con download opzionale del contenuto completo
@@ -718,37 +792,12 @@ class WebSearchTool:
             if not fetch_content:
                 return search_results
 
-            # Seconda fase: scarica contenuto completo (con gestione errori per ogni URL)
-            enhanced_results = []
-            successful_downloads = 0
-
-            for result in search_results:
-                enhanced_result = result.copy()
-
-                try:
-                    # Scarica contenuto completo (già con gestione errori interna)
-                    content_data = self.fetch_page_content(result['url'])
-                    if content_data:
-                        enhanced_result.update({
-                            'full_content': content_data['content'],
-                            'page_title': content_data['title'],
-                            'content_length': content_data['length']
-                        })
-                        successful_downloads += 1
-                    else:
-                        # Fallback al snippet se il download fallisce
-                        enhanced_result['full_content'] = result['snippet']
-                        enhanced_result['page_title'] = result['title']
-                        enhanced_result['content_length'] = len(result['snippet'])
-
-                except Exception as e:
-                    # Errore durante il download - usa il fallback
-                    self.logger.warning(f"Errore download {result['url']}, uso snippet: {e}")
-                    enhanced_result['full_content'] = result['snippet']
-                    enhanced_result['page_title'] = result['title']
-                    enhanced_result['content_length'] = len(result['snippet'])
-
-                enhanced_results.append(enhanced_result)
+            # Seconda fase: scarica contenuto completo in parallelo (con gestione errori per ogni URL)
+            workers = max(1, min(len(search_results), self.max_fetch_workers))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fetch_page') as executor:
+                outcomes = list(executor.map(self._enhance_result, search_results))
+            enhanced_results = [result for result, _ in outcomes]
+            successful_downloads = sum(1 for _, downloaded in outcomes if downloaded)
 
             self.logger.info(f"Ricerca completata: {len(enhanced_results)} risultati ({successful_downloads} con contenuto completo)")
             return enhanced_results
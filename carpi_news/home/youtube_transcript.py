@@ -1,15 +1,12 @@
 import logging
-from youtube_transcript_api import YouTubeTranscriptApi
 from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound
-import time
-import tempfile
-import os
 import requests
-from anthropic import Anthropic
 import django
-from django.conf import settings
 
 from home.models import Articolo
+from home import llm_gateway
+from home import transcripts
+from home import retry_queue
 
 logger = logging.getLogger(__name__)
 
@@ -18,15 +15,9 @@ def trascrivi(video_id):
     try:
         logger.info(f"Inizio trascrizione per video ID: {video_id}")
 
-        # Controlla prima se i sottotitoli sono disponibili
-        api = YouTubeTranscriptApi()
-
         try:
-            # Prova a ottenere la lista dei transcript disponibili
-            transcript_list = api.list_transcripts(video_id)
-            # Cerca transcript in italiano
-            transcript_list.find_transcript(['it'])
-            logger.info(f"Sottotitoli disponibili per video {video_id}")
+            # Lista dei sottotitoli e testo in italiano, dalla cache se già scaricati
+            text = transcripts.fetch_transcript(video_id, languages=['it'])
         except (TranscriptsDisabled, NoTranscriptFound):
             logger.info(f"Sottotitoli non disponibili per video {video_id} - probabilmente una diretta in corso")
             if _is_live_stream(video_id):
@@ -34,11 +25,6 @@ def trascrivi(video_id):
                 _schedule_retry(video_id)
             return None
 
-        # Se i sottotitoli sono disponibili, procedi con l'estrazione
-        transcript_data = api.fetch(video_id, languages=['it'])
-
-        # Concatena tutto il testo dalla trascrizione fetchata
-        text = " ".join([snippet.text for snippet in transcript_data])
         logger.info(f"Trascrizione completata: {len(text)} caratteri")
 
         return text
@@ -70,76 +56,56 @@ def _is_live_stream(video_id):
         return True
 
 def _schedule_retry(video_id):
-    """Programma un retry per il video"""
+    """Programma un retry per il video nella coda persistente"""
     try:
         retry_delay = 3600  # 1 ora
-        retry_file = f"youtube_retry_{video_id}.txt"
-        retry_path = os.path.join(tempfile.gettempdir(), retry_file)
-
-        # Salva timestamp per il retry
-        retry_time = time.time() + retry_delay
-        with open(retry_path, 'w') as f:
-            f.write(str(retry_time))
-
-        logger.info(f"Scheduled retry for video {video_id} in {retry_delay} seconds")
-
+        retry_queue.schedule(retry_queue.YOUTUBE_TRANSCRIPT, video_id, retry_delay)
     except Exception as e:
         logger.error(f"Errore scheduling retry per {video_id}: {e}")
 
 def check_and_process_retries():
     """Controlla e processa i video in attesa di retry"""
     try:
-        import glob
-        retry_files = glob.glob(os.path.join(tempfile.gettempdir(), "youtube_retry_*.txt"))
-        current_time = time.time()
-
-        for retry_file in retry_files:
+        for item in retry_queue.claim_due(retry_queue.YOUTUBE_TRANSCRIPT):
+            video_id = item.chiave
+            logger.info(f"Processando retry per video {video_id}")
             try:
-                with open(retry_file, 'r') as f:
-                    retry_time = float(f.read().strip())
-
-                if current_time >= retry_time:
-                    # È ora di riprovare
-                    video_id = os.path.basename(retry_file).replace('youtube_retry_', '').replace('.txt', '')
-                    logger.info(f"Processando retry per video {video_id}")
-
-                    # Prova di nuovo la trascrizione
-                    transcript = trascrivi(video_id)
-                    if transcript:
-                        logger.info(f"Retry riuscito per video {video_id}")
-                        # Qui potresti chiamare genera_e_salva_articolo con il video_id specifico
-                        # o processare diversamente
-
-                    # Rimuovi il file di retry
-                    os.unlink(retry_file)
-
+                # Prova di nuovo la trascrizione
+                transcript = trascrivi(video_id)
             except Exception as e:
-                # File corrotto, rimuovilo
-                try:
-                    os.unlink(retry_file)
-                except:
-                    pass
+                retry_queue.retry_later(item, str(e))
+                continue
+
+            if transcript:
+                logger.info(f"Retry riuscito per video {video_id}")
+                # Qui potresti chiamare genera_e_salva_articolo con il video_id specifico
+                # o processare diversamente
+                retry_queue.complete(item)
+            else:
+                retry_queue.retry_later(item, "Trascrizione non ancora disponibile")
 
     except Exception as e:
         logger.error(f"Errore checking pending retries: {e}")
+
 def genera_e_salva_articolo():
     """Genera un articolo usando AI da un video YouTube hardcoded"""
     try:
         logger.info("Inizio generazione articolo")
         
-        client = Anthropic(
-            api_key=settings.ANTHROPIC_API_KEY
-        )
-        
         video_id = "MG7eulhZZqk"
         logger.info(f"Generazione articolo per video ID: {video_id}")
-        
-        message = client.messages.create(
+
+        # Sedute lunghe: note riassunte a blocchi invece della trascrizione completa
+        trascrizione = trascrivi(video_id)
+        if trascrizione and transcripts.needs_condensing(trascrizione):
+            trascrizione = transcripts.condense_transcript(trascrizione, f"Consiglio comunale {video_id}")
+
+        message = llm_gateway.create_message(
             system='Sei Umberto Eco che dopo aver assistito al consiglio comunale deve scrivere un articolo che lo riassuma e lo commenti, con toni anche ironici',
             max_tokens=4096,
             messages=[{
                 "role": "user",
-                "content": f"{trascrivi(video_id)}"
+                "content": f"{trascrizione}"
             }],
             model="claude-sonnet-4-20250514",
         )